@@ -8,20 +8,28 @@ Cambios sobre v4.0:
   - Panel visual de bloqueos automáticos en tab Resultados
 """
 
-import os, json, csv, io, re, hashlib, random, logging
+import os, sys, json, csv, io, re, gzip, zlib, hashlib, random, logging, threading, queue, time, socket, uuid
 from datetime import datetime, timedelta, timezone
-from functools import wraps
-from flask import Flask, render_template_string, request, session, redirect, jsonify, Response
-from collections import defaultdict
+from functools import wraps, lru_cache
+from flask import Flask, render_template, render_template_string, request, session, redirect, jsonify, Response, stream_with_context, g, has_request_context
+from flask.json.provider import DefaultJSONProvider
+from collections import defaultdict, OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor as EjecutorHilos
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 import atexit
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
-_db_ready = False
 app.secret_key = os.environ.get('SECRET_KEY', 'zoolo_local_2025_seguro')
 DATABASE_URL = os.environ.get('DATABASE_URL', '')
 if DATABASE_URL.startswith('postgres://'):
@@ -30,20 +38,15 @@ if DATABASE_URL.startswith('postgres://'):
 USE_SQLITE = not DATABASE_URL
 if USE_SQLITE:
     import sqlite3
+    ErrorIntegridadDB = sqlite3.IntegrityError
     SQLITE_PATH = os.path.join(os.path.dirname(__file__), 'zoolo_local.db')
     logger.info("[DB] Modo LOCAL — SQLite: " + SQLITE_PATH)
 else:
     import psycopg2
     import psycopg2.extras
+    ErrorIntegridadDB = psycopg2.IntegrityError
     logger.info("[DB] Modo PRODUCCIÓN — PostgreSQL")
 
-@app.before_request
-def setup():
-    global _db_ready
-    if not _db_ready:
-        init_db()
-        _db_ready = True
-
 PAGO_ANIMAL_NORMAL = 35
 PAGO_LECHUZA       = 70
 PAGO_ESPECIAL      = 2
@@ -51,24 +54,56 @@ PAGO_TRIPLETA      = 60
 COMISION_AGENCIA   = 0.15
 MINUTOS_BLOQUEO    = 3
 
-HORARIOS_PERU = [
-    "08:00 AM","09:00 AM","10:00 AM","11:00 AM","12:00 PM",
-    "01:00 PM","02:00 PM","03:00 PM","04:00 PM","05:00 PM","06:00 PM"
-]
+# ─── Registro de loterías ─────────────────────────────────────────────────────
+# Cada lotería define su zona horaria (offset UTC fijo), sus horarios locales y
+# sus pagos. De aquí se generan los crons, la guardia de recuperación, los
+# cierres de venta y las fechas por lotería. LOTERIAS_JSON (texto JSON o ruta
+# a un archivo) permite añadir o sobrescribir loterías sin tocar el código.
+PAGOS_BASE = {'animal': PAGO_ANIMAL_NORMAL, 'lechuza': PAGO_LECHUZA,
+              'especial': PAGO_ESPECIAL, 'tripleta': PAGO_TRIPLETA}
+
+LOTERIAS = {
+    'peru': {
+        'codigo': 1,
+        'etiqueta': 'PERU',
+        'offset_utc': -5,
+        'horarios': ["08:00 AM","09:00 AM","10:00 AM","11:00 AM","12:00 PM",
+                     "01:00 PM","02:00 PM","03:00 PM","04:00 PM","05:00 PM","06:00 PM"],
+        'pagos': dict(PAGOS_BASE),
+    },
+    'plus': {
+        'codigo': 2,
+        'etiqueta': 'PLUS',
+        'offset_utc': -4,
+        'horarios': ["08:00 AM","09:00 AM","10:00 AM","11:00 AM","12:00 PM",
+                     "01:00 PM","02:00 PM","03:00 PM","04:00 PM","05:00 PM","06:00 PM","07:00 PM"],
+        'pagos': dict(PAGOS_BASE),
+    },
+}
 
-HORARIOS_PLUS = [
-    "08:00 AM","09:00 AM","10:00 AM","11:00 AM","12:00 PM",
-    "01:00 PM","02:00 PM","03:00 PM","04:00 PM","05:00 PM","06:00 PM","07:00 PM"
-]
+def _cargar_loterias_extra():
+    fuente = os.environ.get('LOTERIAS_JSON', '').strip()
+    if not fuente:
+        return
+    try:
+        if not fuente.startswith('{'):
+            with open(fuente) as f:
+                fuente = f.read()
+        for lot, cfg in json.loads(fuente).items():
+            base = LOTERIAS.get(lot, {'etiqueta': lot.upper(), 'offset_utc': -5, 'horarios': []})
+            base = dict(base, **cfg)
+            base['pagos'] = dict(PAGOS_BASE, **cfg.get('pagos', {}))
+            if 'codigo' not in base:
+                base['codigo'] = max(c['codigo'] for c in LOTERIAS.values()) + 1
+                logger.warning(f"[LOTERIAS] {lot} sin 'codigo'; asignado {base['codigo']} (fijarlo en LOTERIAS_JSON)")
+            LOTERIAS[lot] = base
+    except Exception as e:
+        logger.error(f"[LOTERIAS] LOTERIAS_JSON inválido: {e}")
 
-HORARIOS_PERU_CRON = [
-    (13,0),(14,0),(15,0),(16,0),(17,0),(18,0),
-    (19,0),(20,0),(21,0),(22,0),(23,0)
-]
-HORARIOS_PLUS_CRON = [
-    (12,0),(13,0),(14,0),(15,0),(16,0),(17,0),
-    (18,0),(19,0),(20,0),(21,0),(22,0),(23,0)
-]
+_cargar_loterias_extra()
+
+HORARIOS_PERU = LOTERIAS['peru']['horarios']
+HORARIOS_PLUS = LOTERIAS['plus']['horarios']
 
 ANIMALES = {
     "00":"Ballena","0":"Delfin","1":"Carnero","2":"Toro","3":"Ciempies",
@@ -154,28 +189,212 @@ COLORES = {
 ROJOS = ["1","3","5","7","9","12","14","16","18","19",
          "21","23","25","27","30","32","34","36","37","39"]
 
+# ─── Códigos enteros de jugadas ──────────────────────────────────────────────
+# jugadas guarda, junto al texto, lot_cod / tipo_cod / sel_cod y hora_min para
+# que los índices y agregados trabajen con enteros pequeños. Los catálogos
+# cat_* y la vista v_jugadas permiten leer los códigos como texto. Los códigos
+# son fijos: no reordenar estas listas, solo añadir al final.
+TIPOS_JUGADA = ['animal', 'especial']
+SELECCIONES  = ['00'] + [str(i) for i in range(41)] + ['ROJO', 'NEGRO', 'PAR', 'IMPAR']
+TIPO_COD = {t: i + 1 for i, t in enumerate(TIPOS_JUGADA)}
+SEL_COD  = {s: i for i, s in enumerate(SELECCIONES)}
+LOT_COD  = {lot: cfg['codigo'] for lot, cfg in LOTERIAS.items()}
+
+def sel_txt(cod):
+    return SELECCIONES[cod] if cod is not None and 0 <= cod < len(SELECCIONES) else '?'
+
+def tipo_txt(cod):
+    return TIPOS_JUGADA[cod - 1] if cod and cod <= len(TIPOS_JUGADA) else '?'
+
+def codigos_jugada(loteria, tipo, seleccion):
+    """(lot_cod, tipo_cod, sel_cod) de una jugada; None si el texto no tiene código."""
+    return LOT_COD.get(loteria), TIPO_COD.get(tipo), SEL_COD.get(str(seleccion))
+
 def hash_password(plain):
     return hashlib.sha256((plain + app.secret_key).encode()).hexdigest()
 
-def get_db():
+# Filas por viaje al servidor en las consultas de db.stream()
+STREAM_ITERSIZE = int(os.environ.get('STREAM_ITERSIZE', '2000'))
+
+# ─── Perfil SQLite ────────────────────────────────────────────────────────────
+# Las conexiones SQLite se reutilizan por hilo (hasta SQLITE_POOL_MAX libres),
+# así que los PRAGMA de conexión se aplican una sola vez al abrirla. WAL es
+# persistente en el archivo y se fija una vez por proceso. SQLITE_PERFIL elige
+# la base ('rendimiento' para agencias de un solo equipo, 'seguro' para fsync
+# en cada commit) y SQLITE_PRAGMAS="clave=valor,..." ajusta valores sueltos.
+SQLITE_PERFILES = {
+    'rendimiento': {'synchronous': 'NORMAL', 'cache_size': -65536, 'mmap_size': 268435456,
+                    'temp_store': 'MEMORY', 'wal_autocheckpoint': 2000, 'journal_size_limit': 67108864},
+    'seguro':      {'synchronous': 'FULL', 'cache_size': -8000, 'mmap_size': 0,
+                    'temp_store': 'DEFAULT', 'wal_autocheckpoint': 1000, 'journal_size_limit': 67108864},
+}
+SQLITE_PERFIL           = os.environ.get('SQLITE_PERFIL', 'rendimiento')
+SQLITE_BUSY_MS          = int(os.environ.get('SQLITE_BUSY_MS', '5000'))
+SQLITE_CACHE_SENTENCIAS = int(os.environ.get('SQLITE_CACHE_SENTENCIAS', '256'))
+SQLITE_POOL_MAX         = int(os.environ.get('SQLITE_POOL_MAX', '4'))
+
+def pragmas_sqlite():
+    pragmas = dict(SQLITE_PERFILES.get(SQLITE_PERFIL, SQLITE_PERFILES['rendimiento']))
+    for par in os.environ.get('SQLITE_PRAGMAS', '').split(','):
+        if '=' in par:
+            k, v = par.split('=', 1)
+            pragmas[k.strip()] = v.strip()
+    pragmas['busy_timeout'] = SQLITE_BUSY_MS
+    return pragmas
+
+_sqlite_local = threading.local()
+_sqlite_wal = {'pid': None}
+
+def _conectar_sqlite():
+    libres = getattr(_sqlite_local, 'libres', None)
+    if libres and _sqlite_local.pid == os.getpid():
+        return libres.pop()
+    conn = sqlite3.connect(SQLITE_PATH, timeout=SQLITE_BUSY_MS / 1000,
+                           cached_statements=SQLITE_CACHE_SENTENCIAS)
+    if _sqlite_wal['pid'] != os.getpid():
+        conn.execute("PRAGMA journal_mode=WAL")
+        _sqlite_wal['pid'] = os.getpid()
+    for k, v in pragmas_sqlite().items():
+        conn.execute(f"PRAGMA {k}={v}")
+    return conn
+
+def _devolver_sqlite(conn):
+    if getattr(_sqlite_local, 'pid', None) != os.getpid():
+        _sqlite_local.pid, _sqlite_local.libres = os.getpid(), []
+    if len(_sqlite_local.libres) < SQLITE_POOL_MAX:
+        _sqlite_local.libres.append(conn)
+    else:
+        conn.close()
+
+@lru_cache(maxsize=2048)
+def _sql_sqlite(sql):
+    return sql.replace('%s', '?')
+
+# ─── Réplica de lectura ───────────────────────────────────────────────────────
+# Las rutas marcadas con @solo_lectura (reportes admin, resultados públicos)
+# leen de la réplica (DATABASE_URL_REPLICA en PostgreSQL, SQLITE_REPLICA_PATH
+# en SQLite) mientras esté al día, para no competir con las ventas. El retraso
+# se mide con replica_latido: el líder del scheduler escribe la hora en la
+# primaria cada REPLICA_LATIDO_SEG y se lee en la réplica como mucho cada
+# REPLICA_CHEQUEO_SEG. Si pasa de REPLICA_RETRASO_MAX o la réplica no responde,
+# la petición va a la primaria. La decisión se toma una vez por petición. En
+# SQLite la réplica es una copia que el mismo job refresca con la API de backup.
+# Las pantallas que leen lo que acaban de escribir (resultados-fecha-admin, donde
+# se cargan y corrigen resultados) no se marcan: siempre van a la primaria.
+DATABASE_URL_REPLICA = os.environ.get('DATABASE_URL_REPLICA', '')
+if DATABASE_URL_REPLICA.startswith('postgres://'):
+    DATABASE_URL_REPLICA = DATABASE_URL_REPLICA.replace('postgres://', 'postgresql://', 1)
+SQLITE_REPLICA_PATH = os.environ.get('SQLITE_REPLICA_PATH', '')
+REPLICA_ACTIVA      = bool(SQLITE_REPLICA_PATH if USE_SQLITE else DATABASE_URL_REPLICA)
+REPLICA_LATIDO_SEG  = int(os.environ.get('REPLICA_LATIDO_SEG', '60' if USE_SQLITE else '10'))
+REPLICA_RETRASO_MAX = float(os.environ.get('REPLICA_RETRASO_MAX', str(3 * REPLICA_LATIDO_SEG)))
+REPLICA_CHEQUEO_SEG = float(os.environ.get('REPLICA_CHEQUEO_SEG', '5'))
+_estado_replica = {'t': 0.0, 'retraso': None, 'al_dia': False, 'error': None, 'replica': 0, 'primaria': 0}
+_replica_lock = threading.Lock()
+
+def solo_lectura(f):
+    """Marca la ruta como de solo lectura: sus get_db() pueden ir a la réplica."""
+    @wraps(f)
+    def d(*a, **k):
+        g.solo_lectura = True
+        return f(*a, **k)
+    return d
+
+def _conectar_replica():
     if USE_SQLITE:
-        conn = sqlite3.connect(SQLITE_PATH)
-        conn.row_factory = sqlite3.Row
-        return _DBWrap(conn, sqlite_mode=True)
+        if not os.path.exists(SQLITE_REPLICA_PATH):
+            raise FileNotFoundError(f"réplica aún no copiada: {SQLITE_REPLICA_PATH}")
+        conn = sqlite3.connect(SQLITE_REPLICA_PATH, timeout=SQLITE_BUSY_MS / 1000,
+                               cached_statements=SQLITE_CACHE_SENTENCIAS)
+        return _DBWrap(conn, sqlite_mode=True, replica=True)
+    conn = psycopg2.connect(DATABASE_URL_REPLICA, connect_timeout=3)
+    conn.autocommit = False
+    return _DBWrap(conn, sqlite_mode=False, replica=True)
+
+def replica_al_dia():
+    """True si el último latido visto en la réplica tiene menos de REPLICA_RETRASO_MAX segundos."""
+    with _replica_lock:
+        if time.time() - _estado_replica['t'] < REPLICA_CHEQUEO_SEG:
+            return _estado_replica['al_dia']
+        _estado_replica['t'] = time.time()
+    retraso, error = None, None
+    try:
+        with _conectar_replica() as db:
+            r = db.execute("SELECT ts FROM replica_latido WHERE id=1").fetchone()
+        if r:
+            retraso = max(0.0, time.time() - float(r['ts']))
+        else:
+            error = 'sin latido'
+    except Exception as e:
+        error = str(e)
+    al_dia = retraso is not None and retraso <= REPLICA_RETRASO_MAX
+    with _replica_lock:
+        if al_dia != _estado_replica['al_dia']:
+            logger.warning(f"[REPLICA] {'Al día' if al_dia else 'Desfasada'}: retraso={retraso} error={error}")
+        _estado_replica.update(retraso=retraso, al_dia=al_dia, error=error)
+    return al_dia
+
+def destino_lectura():
+    """'replica' o 'primaria' para la petición en curso."""
+    if not (REPLICA_ACTIVA and has_request_context() and g.get('solo_lectura')):
+        return 'primaria'
+    if 'destino_db' not in g:
+        g.destino_db = 'replica' if replica_al_dia() else 'primaria'
+        _estado_replica[g.destino_db] += 1
+    return g.destino_db
+
+def job_latido_replica():
+    """Escribe el latido en la primaria; en SQLite además refresca la copia de lectura."""
+    try:
+        with get_db(primaria=True) as db:
+            if USE_SQLITE:
+                db.execute("INSERT OR REPLACE INTO replica_latido (id, ts) VALUES (1, %s)", (time.time(),))
+            else:
+                db.execute("""INSERT INTO replica_latido (id, ts) VALUES (1, %s)
+                    ON CONFLICT (id) DO UPDATE SET ts=EXCLUDED.ts""", (time.time(),))
+        if USE_SQLITE:
+            copiar_replica_sqlite()
+    except Exception as e:
+        logger.error(f"[REPLICA] Error en latido: {e}")
+
+def copiar_replica_sqlite():
+    """Copia consistente de la base a SQLITE_REPLICA_PATH (temporal + os.replace)."""
+    tmp = SQLITE_REPLICA_PATH + '.tmp'
+    origen = sqlite3.connect(SQLITE_PATH, timeout=SQLITE_BUSY_MS / 1000)
+    destino = sqlite3.connect(tmp)
+    try:
+        origen.backup(destino)
+        destino.execute("PRAGMA journal_mode=DELETE")
+        destino.commit()
+    finally:
+        destino.close()
+        origen.close()
+    os.replace(tmp, SQLITE_REPLICA_PATH)
+
+def get_db(primaria=False):
+    if not primaria and destino_lectura() == 'replica':
+        try:
+            return _conectar_replica()
+        except Exception as e:
+            logger.error(f"[REPLICA] Sin conexión, se usa la primaria: {e}")
+            g.destino_db = 'primaria'
+            with _replica_lock:
+                _estado_replica.update(al_dia=False, error=str(e), t=time.time())
+    if USE_SQLITE:
+        return aplicar_limite_sorteo(_DBWrap(_conectar_sqlite(), sqlite_mode=True))
     else:
         conn = psycopg2.connect(DATABASE_URL)
         conn.autocommit = False
-        return _DBWrap(conn, sqlite_mode=False)
+        return aplicar_limite_sorteo(_DBWrap(conn, sqlite_mode=False))
 
 class _DBWrap:
-    def __init__(self, conn, sqlite_mode=False):
+    def __init__(self, conn, sqlite_mode=False, replica=False):
         self._c = conn
         self._sqlite = sqlite_mode
-        if sqlite_mode:
-            self._c.execute("PRAGMA journal_mode=WAL")
-            self._cur = conn.cursor()
-        else:
-            self._cur = conn.cursor()
+        self.replica = replica
+        self._tablas = {}
+        self._bloqueos = {}
+        self._cur = conn.cursor()
 
     def __enter__(self):
         return self
@@ -185,13 +404,12 @@ class _DBWrap:
                 self._c.rollback()
         else:
             self._c.commit()
-        self._cur.close()
-        self._c.close()
+        self.close()
         return False
 
     def _adapt_sql(self, sql):
         if self._sqlite:
-            return sql.replace('%s', '?')
+            return _sql_sqlite(sql)
         return sql
 
     def execute(self, sql, params=None):
@@ -213,23 +431,37 @@ class _DBWrap:
                         self._c.rollback()
         return self
 
+    def _indice(self):
+        return _indice_columnas(tuple(d[0] for d in self._cur.description))
+
     def fetchone(self):
         row = self._cur.fetchone()
         if row is None:
             return None
-        if self._sqlite:
-            return _Row(dict(zip(row.keys(), tuple(row))))
-        cols = [d[0] for d in self._cur.description]
-        return _Row(dict(zip(cols, row)))
+        return _Row(row, self._indice())
 
     def fetchall(self):
         rows = self._cur.fetchall()
         if not rows:
             return []
-        if self._sqlite:
-            return [_Row(dict(zip(r.keys(), tuple(r)))) for r in rows]
-        cols = [d[0] for d in self._cur.description]
-        return [_Row(dict(zip(cols, r))) for r in rows]
+        idx = self._indice()
+        return [_Row(r, idx) for r in rows]
+
+    def iter_rows(self, lote=500):
+        """Itera el resultado por lotes de fetchmany sin cargarlo completo en memoria."""
+        if self._cur.description is None:
+            return
+        idx = self._indice()
+        while True:
+            lote_filas = self._cur.fetchmany(lote)
+            if not lote_filas:
+                break
+            for r in lote_filas:
+                yield _Row(r, idx)
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
 
     @property
     def lastrowid(self):
@@ -240,37 +472,164 @@ class _DBWrap:
 
     def commit(self):
         self._c.commit()
+        self._soltar()
 
     def rollback(self):
         if not self._sqlite:
             self._c.rollback()
+        self._soltar()
+
+    def bloquear(self, clave, espera=None):
+        """Serializa entre procesos el trabajo sobre `clave` hasta el próximo commit, rollback
+        o cierre: pg_advisory_xact_lock en PG, flock sobre un archivo junto a la base en SQLite.
+        Con `espera` (segundos) lanza TimeoutError si no lo obtiene a tiempo."""
+        if clave in self._bloqueos:
+            return self
+        hasta = time.time() + espera if espera is not None else None
+        if not self._sqlite:
+            llave = zlib.crc32(clave.encode()) & 0x7fffffff
+            if hasta is None:
+                self.execute("SELECT pg_advisory_xact_lock(%s)", (llave,))
+            else:
+                while not self.execute("SELECT pg_try_advisory_xact_lock(%s) as ok", (llave,)).fetchone()['ok']:
+                    if time.time() > hasta:
+                        raise TimeoutError(f'Lock {clave} ocupado')
+                    time.sleep(0.2)
+            self._bloqueos[clave] = None
+        elif fcntl is not None:
+            f = open(SQLITE_PATH + '.' + re.sub(r'[^\w-]', '_', clave) + '.lock', 'a+')
+            try:
+                if hasta is None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                else:
+                    while True:
+                        try:
+                            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                            break
+                        except OSError:
+                            if time.time() > hasta:
+                                raise TimeoutError(f'Lock {clave} ocupado')
+                            time.sleep(0.2)
+            except BaseException:
+                f.close()
+                raise
+            self._bloqueos[clave] = f
+        return self
+
+    def _soltar(self):
+        for f in self._bloqueos.values():
+            if f:
+                f.close()
+        self._bloqueos = {}
 
     def close(self):
         self._cur.close()
-        self._c.close()
+        if self._sqlite and not self._tablas and not self.replica:
+            # Vuelve al pool limpia: lo no confirmado se descarta como al cerrar
+            self._c.rollback()
+            self._c.set_progress_handler(None, 0)
+            _devolver_sqlite(self._c)
+        else:
+            self._c.close()
+        self._soltar()
 
     def __iter__(self):
+        return self.iter_rows()
+
+    def tabla(self, nombre):
+        """Nombre a consultar para tickets/jugadas/tripletas: la tabla caliente o,
+        tras con_archivo(), la vista que la une con los meses archivados."""
+        return self._tablas.get(nombre, nombre)
+
+    def con_archivo(self, desde=None, hasta=None):
+        """Hace visibles en db.tabla() los meses archivados que tocan el rango ISO."""
+        meses = [r['mes'] for r in self.execute(
+            "SELECT mes FROM archivo_meses WHERE mes >= %s AND mes <= %s ORDER BY mes",
+            ((desde or '0000-00')[:7], (hasta or '9999-99')[:7])).fetchall()]
+        if meses:
+            if self._sqlite:
+                vistas_archivo_sqlite(self, meses)
+            self._tablas = {t: f'{t}_todos' for t in TABLAS_ARCHIVO}
+        return self
+
+    def stream(self, sql, params=None, itersize=None):
+        """SELECT grande leído por tramos: cursor con nombre (lado servidor) en PG,
+        cursor propio con fetchmany en SQLite. Usa su propio cursor, así que se
+        pueden hacer otras consultas con db.execute mientras se itera."""
+        itersize = itersize or STREAM_ITERSIZE
         if self._sqlite:
-            for row in self._cur:
-                yield _Row(dict(zip(row.keys(), tuple(row))))
+            cur = self._c.cursor()
         else:
-            cols = [d[0] for d in self._cur.description]
-            for row in self._cur:
-                yield _Row(dict(zip(cols, row)))
-
-
-class _Row(dict):
+            cur = self._c.cursor(name=f'zoolo_stream_{threading.get_ident()}_{time.monotonic_ns()}')
+            cur.itersize = itersize
+        try:
+            cur.execute(self._adapt_sql(sql), params or ())
+            idx = None
+            while True:
+                filas = cur.fetchmany(itersize)
+                if not filas:
+                    break
+                if idx is None:
+                    idx = _indice_columnas(tuple(d[0] for d in cur.description))
+                for r in filas:
+                    yield _Row(r, idx)
+        finally:
+            cur.close()
+
+
+# Filas compactas: una tupla por fila y un único índice (columnas, mapa
+# columna→posición) compartido por todas las filas con las mismas columnas.
+# Las columnas se guardan aparte del mapa porque un SELECT puede repetir
+# nombres (p. ej. `tr.*, tk.agencia_id`) y el mapa solo tiene uno de cada.
+_IDX_CACHE = {}
+
+def _indice_columnas(cols):
+    idx = _IDX_CACHE.get(cols)
+    if idx is None:
+        if len(_IDX_CACHE) > 1024:
+            _IDX_CACHE.clear()
+        idx = (cols, {c: i for i, c in enumerate(cols)})
+        _IDX_CACHE[cols] = idx
+    return idx
+
+class _Row(Mapping):
+    __slots__ = ('_v', '_cols', '_idx')
+    def __init__(self, valores, indice):
+        self._v = tuple(valores)
+        self._cols, self._idx = indice
     def __getitem__(self, key):
         if isinstance(key, int):
-            return list(self.values())[key]
-        return super().__getitem__(key)
+            return self._v[key]
+        return self._v[self._idx[key]]
     def get(self, key, default=None):
         try:
             return self[key]
         except (KeyError, IndexError):
             return default
-    def keys(self):
-        return super().keys()
+    def __contains__(self, key):
+        return key in self._idx
+    def __iter__(self):
+        return iter(self._cols)
+    def __len__(self):
+        return len(self._cols)
+    def values(self):
+        return list(self._v)
+    def items(self):
+        return list(zip(self._cols, self._v))
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class _JSONProvider(DefaultJSONProvider):
+    @staticmethod
+    def default(o):
+        if isinstance(o, _Row):
+            return dict(o.items())
+        return DefaultJSONProvider.default(o)
+
+app.json_provider_class = _JSONProvider
+app.json = _JSONProvider(app)
 
 
 def _sql(pg_sql, sqlite_sql=None):
@@ -281,138 +640,343 @@ def _sql(pg_sql, sqlite_sql=None):
 TS_DEFAULT_PG = "DEFAULT (to_char(now(), 'YYYY-MM-DD HH24:MI:SS'))"
 TS_DEFAULT_SQ = "DEFAULT (datetime('now'))"
 
-def init_db():
-    with get_db() as db:
-        ts = TS_DEFAULT_SQ if USE_SQLITE else TS_DEFAULT_PG
-        pk = "INTEGER PRIMARY KEY AUTOINCREMENT" if USE_SQLITE else "SERIAL PRIMARY KEY"
-        db.execute(f"""CREATE TABLE IF NOT EXISTS agencias (
-            id {pk}, usuario TEXT UNIQUE NOT NULL, password TEXT NOT NULL,
-            nombre_agencia TEXT NOT NULL, nombre_banco TEXT DEFAULT '',
-            es_admin INTEGER DEFAULT 0, comision REAL DEFAULT 0.15,
-            activa INTEGER DEFAULT 1, tope_taquilla REAL DEFAULT 0,
-            admin_id INTEGER DEFAULT 0, es_superadmin INTEGER DEFAULT 0,
-            creado TEXT {ts})""")
-        db.execute(f"""CREATE TABLE IF NOT EXISTS tickets (
-            id {pk}, serial TEXT UNIQUE NOT NULL,
-            agencia_id INTEGER NOT NULL, fecha TEXT NOT NULL, total REAL NOT NULL,
-            pagado INTEGER DEFAULT 0, anulado INTEGER DEFAULT 0,
-            creado TEXT {ts})""")
-        db.execute(f"""CREATE TABLE IF NOT EXISTS jugadas (
-            id {pk}, ticket_id INTEGER NOT NULL, hora TEXT NOT NULL,
-            seleccion TEXT NOT NULL, monto REAL NOT NULL, tipo TEXT NOT NULL,
-            loteria TEXT NOT NULL DEFAULT 'peru')""")
-        db.execute("""CREATE TABLE IF NOT EXISTS numeros_bloqueados (
-            id INTEGER PRIMARY KEY,
-            numero TEXT NOT NULL,
-            loteria TEXT NOT NULL DEFAULT 'peru',
-            UNIQUE(numero, loteria))""" if USE_SQLITE else """CREATE TABLE IF NOT EXISTS numeros_bloqueados (
-            id SERIAL PRIMARY KEY,
-            numero TEXT NOT NULL,
-            loteria TEXT NOT NULL DEFAULT 'peru',
-            UNIQUE(numero, loteria))""")
-        db.commit()
-
-        db.execute(f"""CREATE TABLE IF NOT EXISTS tripletas (
-            id {pk}, ticket_id INTEGER NOT NULL, animal1 TEXT NOT NULL,
-            animal2 TEXT NOT NULL, animal3 TEXT NOT NULL, monto REAL NOT NULL,
-            fecha TEXT NOT NULL, pagado INTEGER DEFAULT 0,
-            loteria TEXT NOT NULL DEFAULT 'peru')""")
-        db.execute(f"""CREATE TABLE IF NOT EXISTS resultados (
-            id {pk}, fecha TEXT NOT NULL, hora TEXT NOT NULL,
-            animal TEXT NOT NULL, loteria TEXT NOT NULL DEFAULT 'peru',
-            UNIQUE(fecha, hora, loteria))""")
-        db.execute(f"""CREATE TABLE IF NOT EXISTS topes (
-            id {pk}, hora TEXT NOT NULL, numero TEXT NOT NULL,
-            monto_tope REAL NOT NULL, loteria TEXT NOT NULL DEFAULT 'peru',
-            UNIQUE(hora, numero, loteria))""")
-        db.execute(f"""CREATE TABLE IF NOT EXISTS audit_logs (
-            id {pk}, agencia_id INTEGER, usuario TEXT,
-            accion TEXT NOT NULL, detalle TEXT, ip TEXT,
-            creado TEXT {ts})""")
-        db.execute(f"""CREATE TABLE IF NOT EXISTS config_sistema (
-            clave TEXT PRIMARY KEY,
-            valor TEXT NOT NULL,
-            actualizado TEXT {ts})""")
-        db.execute(f"""CREATE TABLE IF NOT EXISTS sorteo_acumulado (
-            id {pk},
-            fecha TEXT NOT NULL,
-            hora TEXT NOT NULL,
-            loteria TEXT NOT NULL DEFAULT 'peru',
-            total_vendido REAL DEFAULT 0,
-            presupuesto_70 REAL DEFAULT 0,
-            premio_pagado REAL DEFAULT 0,
-            acumulado_recibido REAL DEFAULT 0,
-            acumulado_generado REAL DEFAULT 0,
-            animal_ganador TEXT,
-            modo TEXT DEFAULT 'auto',
-            UNIQUE(fecha, hora, loteria))""")
-
-        # ── NUEVAS TABLAS v4.1 ────────────────────────────────────────────────
-        db.execute(f"""CREATE TABLE IF NOT EXISTS bloqueos_historicos (
-            id {pk},
-            numero TEXT NOT NULL,
-            loteria TEXT NOT NULL DEFAULT 'peru',
-            fecha_bloqueo TEXT NOT NULL,
-            UNIQUE(numero, loteria, fecha_bloqueo))""")
-        db.execute(f"""CREATE TABLE IF NOT EXISTS bloqueos_tripleta (
-            id {pk},
-            numero TEXT NOT NULL,
-            loteria TEXT NOT NULL DEFAULT 'peru',
-            fecha TEXT NOT NULL,
-            tripleta_id INTEGER,
-            UNIQUE(numero, loteria, fecha))""")
-        # ─────────────────────────────────────────────────────────────────────
-
-        for idx in [
-            "CREATE INDEX IF NOT EXISTS idx_tickets_agencia ON tickets(agencia_id)",
-            "CREATE INDEX IF NOT EXISTS idx_tickets_fecha ON tickets(fecha)",
-            "CREATE INDEX IF NOT EXISTS idx_jugadas_ticket ON jugadas(ticket_id)",
-            "CREATE INDEX IF NOT EXISTS idx_tripletas_ticket ON tripletas(ticket_id)",
-            "CREATE INDEX IF NOT EXISTS idx_resultados_fecha ON resultados(fecha)",
-            "CREATE INDEX IF NOT EXISTS idx_audit_logs_fecha ON audit_logs(creado)",
-            "CREATE INDEX IF NOT EXISTS idx_sorteo_acum_fecha ON sorteo_acumulado(fecha, loteria)",
-            "CREATE INDEX IF NOT EXISTS idx_bloq_hist_fecha ON bloqueos_historicos(fecha_bloqueo, loteria)",
-            "CREATE INDEX IF NOT EXISTS idx_bloq_trip_fecha ON bloqueos_tripleta(fecha, loteria)",
-        ]:
-            db.execute(idx)
-        db.commit()
-
-        migraciones = [
-            "ALTER TABLE agencias ADD COLUMN tope_taquilla REAL DEFAULT 0",
-            "ALTER TABLE agencias ADD COLUMN nombre_banco TEXT DEFAULT ''",
-            "ALTER TABLE agencias ADD COLUMN admin_id INTEGER DEFAULT 0",
-            "ALTER TABLE agencias ADD COLUMN es_superadmin INTEGER DEFAULT 0",
-            "ALTER TABLE resultados ADD COLUMN loteria TEXT NOT NULL DEFAULT 'peru'",
-            "ALTER TABLE topes ADD COLUMN loteria TEXT NOT NULL DEFAULT 'peru'",
-            "ALTER TABLE jugadas ADD COLUMN loteria TEXT NOT NULL DEFAULT 'peru'",
-            "ALTER TABLE tripletas ADD COLUMN loteria TEXT NOT NULL DEFAULT 'peru'",
-        ]
-        for sql in migraciones:
-            try:
-                with get_db() as db_mig:
-                    db_mig.execute(sql)
-                    db_mig.commit()
-            except Exception:
-                pass
+# ─── Migraciones de esquema ───────────────────────────────────────────────────
+# Cada paso se aplica una sola vez y queda anotado en schema_version. migrar()
+# corre al desplegar (`python app.py migrar`) o una vez por proceso al importar,
+# bajo un lock (advisory lock en PG, flock en SQLite) para que varios workers
+# no migren a la vez; si la versión ya está al día solo cuesta un SELECT.
+# Los pasos son idempotentes: una BD creada antes de schema_version los repite
+# sin efecto y queda registrada en la versión actual.
+def _mig_tablas_base(db):
+    ts = TS_DEFAULT_SQ if USE_SQLITE else TS_DEFAULT_PG
+    pk = "INTEGER PRIMARY KEY AUTOINCREMENT" if USE_SQLITE else "SERIAL PRIMARY KEY"
+    db.execute(f"""CREATE TABLE IF NOT EXISTS agencias (
+        id {pk}, usuario TEXT UNIQUE NOT NULL, password TEXT NOT NULL,
+        nombre_agencia TEXT NOT NULL, nombre_banco TEXT DEFAULT '',
+        es_admin INTEGER DEFAULT 0, comision REAL DEFAULT 0.15,
+        activa INTEGER DEFAULT 1, tope_taquilla REAL DEFAULT 0,
+        admin_id INTEGER DEFAULT 0, es_superadmin INTEGER DEFAULT 0,
+        creado TEXT {ts})""")
+    db.execute(f"""CREATE TABLE IF NOT EXISTS tickets (
+        id {pk}, serial TEXT UNIQUE NOT NULL,
+        agencia_id INTEGER NOT NULL, fecha TEXT NOT NULL, total REAL NOT NULL,
+        pagado INTEGER DEFAULT 0, anulado INTEGER DEFAULT 0,
+        creado TEXT {ts})""")
+    db.execute(f"""CREATE TABLE IF NOT EXISTS jugadas (
+        id {pk}, ticket_id INTEGER NOT NULL, hora TEXT NOT NULL,
+        seleccion TEXT NOT NULL, monto REAL NOT NULL, tipo TEXT NOT NULL,
+        loteria TEXT NOT NULL DEFAULT 'peru')""")
+    db.execute("""CREATE TABLE IF NOT EXISTS numeros_bloqueados (
+        id INTEGER PRIMARY KEY,
+        numero TEXT NOT NULL,
+        loteria TEXT NOT NULL DEFAULT 'peru',
+        UNIQUE(numero, loteria))""" if USE_SQLITE else """CREATE TABLE IF NOT EXISTS numeros_bloqueados (
+        id SERIAL PRIMARY KEY,
+        numero TEXT NOT NULL,
+        loteria TEXT NOT NULL DEFAULT 'peru',
+        UNIQUE(numero, loteria))""")
+
+    db.execute(f"""CREATE TABLE IF NOT EXISTS tripletas (
+        id {pk}, ticket_id INTEGER NOT NULL, animal1 TEXT NOT NULL,
+        animal2 TEXT NOT NULL, animal3 TEXT NOT NULL, monto REAL NOT NULL,
+        fecha TEXT NOT NULL, pagado INTEGER DEFAULT 0,
+        loteria TEXT NOT NULL DEFAULT 'peru')""")
+    db.execute(f"""CREATE TABLE IF NOT EXISTS resultados (
+        id {pk}, fecha TEXT NOT NULL, hora TEXT NOT NULL,
+        animal TEXT NOT NULL, loteria TEXT NOT NULL DEFAULT 'peru',
+        UNIQUE(fecha, hora, loteria))""")
+    db.execute(f"""CREATE TABLE IF NOT EXISTS topes (
+        id {pk}, hora TEXT NOT NULL, numero TEXT NOT NULL,
+        monto_tope REAL NOT NULL, loteria TEXT NOT NULL DEFAULT 'peru',
+        UNIQUE(hora, numero, loteria))""")
+    db.execute(f"""CREATE TABLE IF NOT EXISTS audit_logs (
+        id {pk}, agencia_id INTEGER, usuario TEXT,
+        accion TEXT NOT NULL, detalle TEXT, ip TEXT,
+        creado TEXT {ts})""")
+    db.execute(f"""CREATE TABLE IF NOT EXISTS config_sistema (
+        clave TEXT PRIMARY KEY,
+        valor TEXT NOT NULL,
+        actualizado TEXT {ts})""")
+    db.execute(f"""CREATE TABLE IF NOT EXISTS sorteo_acumulado (
+        id {pk},
+        fecha TEXT NOT NULL,
+        hora TEXT NOT NULL,
+        loteria TEXT NOT NULL DEFAULT 'peru',
+        total_vendido REAL DEFAULT 0,
+        presupuesto_70 REAL DEFAULT 0,
+        premio_pagado REAL DEFAULT 0,
+        acumulado_recibido REAL DEFAULT 0,
+        acumulado_generado REAL DEFAULT 0,
+        animal_ganador TEXT,
+        modo TEXT DEFAULT 'auto',
+        UNIQUE(fecha, hora, loteria))""")
+
+    # ── NUEVAS TABLAS v4.1 ────────────────────────────────────────────────
+    db.execute(f"""CREATE TABLE IF NOT EXISTS bloqueos_historicos (
+        id {pk},
+        numero TEXT NOT NULL,
+        loteria TEXT NOT NULL DEFAULT 'peru',
+        fecha_bloqueo TEXT NOT NULL,
+        UNIQUE(numero, loteria, fecha_bloqueo))""")
+    db.execute(f"""CREATE TABLE IF NOT EXISTS bloqueos_tripleta (
+        id {pk},
+        numero TEXT NOT NULL,
+        loteria TEXT NOT NULL DEFAULT 'peru',
+        fecha TEXT NOT NULL,
+        tripleta_id INTEGER,
+        UNIQUE(numero, loteria, fecha))""")
+    # ─────────────────────────────────────────────────────────────────────
+    db.execute(f"""CREATE TABLE IF NOT EXISTS eventos (
+        id {pk},
+        tipo TEXT NOT NULL,
+        datos TEXT,
+        creado TEXT {ts})""")
+
+    db.execute("""CREATE TABLE IF NOT EXISTS scheduler_lock (
+        id INTEGER PRIMARY KEY,
+        pid INTEGER,
+        started TEXT,
+        host TEXT,
+        heartbeat TEXT)""")
+
+    db.execute(f"""CREATE TABLE IF NOT EXISTS ventas_idempotencia (
+        agencia_id INTEGER NOT NULL,
+        clave TEXT NOT NULL,
+        ticket_id INTEGER NOT NULL,
+        serial TEXT NOT NULL,
+        total REAL NOT NULL,
+        creado TEXT {ts},
+        PRIMARY KEY (agencia_id, clave))""")
+
+    db.execute(f"""CREATE TABLE IF NOT EXISTS archivo_meses (
+        mes TEXT PRIMARY KEY,
+        tickets INTEGER,
+        jugadas INTEGER,
+        tripletas INTEGER,
+        archivado TEXT {ts})""")
+
+    for idx in [
+        "CREATE INDEX IF NOT EXISTS idx_tickets_agencia ON tickets(agencia_id)",
+        "CREATE INDEX IF NOT EXISTS idx_tickets_fecha ON tickets(fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_jugadas_ticket ON jugadas(ticket_id)",
+        "CREATE INDEX IF NOT EXISTS idx_tripletas_ticket ON tripletas(ticket_id)",
+        "CREATE INDEX IF NOT EXISTS idx_resultados_fecha ON resultados(fecha)",
+        "CREATE INDEX IF NOT EXISTS idx_audit_logs_fecha ON audit_logs(creado)",
+        "CREATE INDEX IF NOT EXISTS idx_sorteo_acum_fecha ON sorteo_acumulado(fecha, loteria)",
+        "CREATE INDEX IF NOT EXISTS idx_bloq_hist_fecha ON bloqueos_historicos(fecha_bloqueo, loteria)",
+        "CREATE INDEX IF NOT EXISTS idx_bloq_trip_fecha ON bloqueos_tripleta(fecha, loteria)",
+        "CREATE INDEX IF NOT EXISTS idx_eventos_tipo ON eventos(tipo, id)",
+    ]:
+        db.execute(idx)
+
+def _mig_columnas(db):
+    """Columnas añadidas con el tiempo; se saltan las que ya existen."""
+    for sql in [
+        "ALTER TABLE agencias ADD COLUMN tope_taquilla REAL DEFAULT 0",
+        "ALTER TABLE agencias ADD COLUMN nombre_banco TEXT DEFAULT ''",
+        "ALTER TABLE agencias ADD COLUMN admin_id INTEGER DEFAULT 0",
+        "ALTER TABLE agencias ADD COLUMN es_superadmin INTEGER DEFAULT 0",
+        "ALTER TABLE resultados ADD COLUMN loteria TEXT NOT NULL DEFAULT 'peru'",
+        "ALTER TABLE topes ADD COLUMN loteria TEXT NOT NULL DEFAULT 'peru'",
+        "ALTER TABLE jugadas ADD COLUMN loteria TEXT NOT NULL DEFAULT 'peru'",
+        "ALTER TABLE tripletas ADD COLUMN loteria TEXT NOT NULL DEFAULT 'peru'",
+        "ALTER TABLE scheduler_lock ADD COLUMN host TEXT",
+        "ALTER TABLE scheduler_lock ADD COLUMN heartbeat TEXT",
+        "ALTER TABLE jugadas ADD COLUMN hora_min INTEGER",
+        "ALTER TABLE resultados ADD COLUMN hora_min INTEGER",
+        "ALTER TABLE jugadas ADD COLUMN lot_cod SMALLINT",
+        "ALTER TABLE jugadas ADD COLUMN tipo_cod SMALLINT",
+        "ALTER TABLE jugadas ADD COLUMN sel_cod SMALLINT",
+        "ALTER TABLE jugadas ADD COLUMN fecha_dia TEXT",
+        "ALTER TABLE jugadas ADD COLUMN agencia_id INTEGER",
+        "ALTER TABLE jugadas ADD COLUMN anulado INTEGER DEFAULT 0",
+        "ALTER TABLE tripletas ADD COLUMN fecha_dia TEXT",
+        "ALTER TABLE tripletas ADD COLUMN agencia_id INTEGER",
+        "ALTER TABLE tripletas ADD COLUMN anulado INTEGER DEFAULT 0",
+        "ALTER TABLE tickets ADD COLUMN fecha_dia TEXT",
+    ]:
+        tabla, columna = sql.split()[2], sql.split()[5]
+        if columna not in _columnas(db, tabla):
+            db.execute(sql)
+
+def _mig_hora_min(db):
+    rellenar_hora_min(db)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_jugadas_lot_hora_min ON jugadas(loteria, hora_min)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_resultados_fecha_min ON resultados(fecha, loteria, hora_min)")
+
+def _mig_codigos_jugadas(db):
+    sincronizar_catalogos(db)
+    rellenar_codigos_jugadas(db)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_jugadas_cod ON jugadas(lot_cod, hora_min, tipo_cod, sel_cod)")
+    db.execute("""CREATE VIEW IF NOT EXISTS v_jugadas AS
+        SELECT jg.id, jg.ticket_id, jg.monto, jg.hora, jg.hora_min,
+               cl.loteria, ct.tipo, cs.seleccion,
+               jg.lot_cod, jg.tipo_cod, jg.sel_cod
+        FROM jugadas jg
+        LEFT JOIN cat_loterias cl ON cl.codigo = jg.lot_cod
+        LEFT JOIN cat_tipos_jugada ct ON ct.codigo = jg.tipo_cod
+        LEFT JOIN cat_selecciones cs ON cs.codigo = jg.sel_cod""" if USE_SQLITE else
+        """CREATE OR REPLACE VIEW v_jugadas AS
+        SELECT jg.id, jg.ticket_id, jg.monto, jg.hora, jg.hora_min,
+               cl.loteria, ct.tipo, cs.seleccion,
+               jg.lot_cod, jg.tipo_cod, jg.sel_cod
+        FROM jugadas jg
+        LEFT JOIN cat_loterias cl ON cl.codigo = jg.lot_cod
+        LEFT JOIN cat_tipos_jugada ct ON ct.codigo = jg.tipo_cod
+        LEFT JOIN cat_selecciones cs ON cs.codigo = jg.sel_cod""")
+
+def _mig_datos_ticket(db):
+    rellenar_datos_ticket(db)
+    incluye = "" if USE_SQLITE else " INCLUDE (monto)"
+    monto = ", monto" if USE_SQLITE else ""
+    for idx in [
+        f"CREATE INDEX IF NOT EXISTS idx_jugadas_dia_cod ON jugadas(fecha_dia, lot_cod, hora_min, tipo_cod, sel_cod{monto}){incluye} WHERE anulado=0",
+        f"CREATE INDEX IF NOT EXISTS idx_jugadas_ag_dia ON jugadas(agencia_id, fecha_dia, hora_min, tipo_cod, sel_cod{monto}){incluye} WHERE anulado=0",
+        "CREATE INDEX IF NOT EXISTS idx_tripletas_dia ON tripletas(fecha_dia, loteria) WHERE anulado=0",
+        "CREATE INDEX IF NOT EXISTS idx_tickets_dia ON tickets(fecha_dia, agencia_id)",
+    ]:
+        db.execute(idx)
+
+def _mig_archivo_pg(db):
+    if not USE_SQLITE:
+        preparar_archivo_pg(db)
+
+def _mig_datos_iniciales(db):
+    db.execute("""INSERT OR IGNORE INTO config_sistema (clave, valor)
+        VALUES ('auto_sorteo', 'off')""" if USE_SQLITE else """INSERT INTO config_sistema (clave, valor)
+        VALUES ('auto_sorteo', 'off')
+        ON CONFLICT(clave) DO NOTHING""")
+
+    admin = db.execute("SELECT id FROM agencias WHERE es_admin=1").fetchone()
+    if not admin:
+        ph_admin = hash_password('15821462')
+        db.execute("INSERT INTO agencias (usuario,password,nombre_agencia,es_admin,es_superadmin,comision,activa) VALUES (%s,%s,%s,1,1,0,1)",
+                   ('cuborubi', ph_admin, 'ADMINISTRADOR'))
+    db.execute("UPDATE agencias SET es_superadmin=1 WHERE usuario='cuborubi'")
+
+def _mig_replica_latido(db):
+    db.execute("CREATE TABLE IF NOT EXISTS replica_latido (id INTEGER PRIMARY KEY, ts DOUBLE PRECISION)")
+
+def _mig_trabajos_reporte(db):
+    db.execute("""CREATE TABLE IF NOT EXISTS trabajos_reporte (
+        id TEXT PRIMARY KEY,
+        tipo TEXT NOT NULL,
+        parametros TEXT,
+        usuario_id INTEGER,
+        estado TEXT NOT NULL,
+        progreso INTEGER DEFAULT 0,
+        error TEXT,
+        resultado TEXT,
+        mimetype TEXT,
+        creado DOUBLE PRECISION,
+        terminado DOUBLE PRECISION,
+        expira DOUBLE PRECISION)""")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_trabajos_usuario ON trabajos_reporte(usuario_id, creado)")
+
+def _mig_post_sorteo(db):
+    pk = "INTEGER PRIMARY KEY AUTOINCREMENT" if USE_SQLITE else "SERIAL PRIMARY KEY"
+    ts = TS_DEFAULT_SQ if USE_SQLITE else TS_DEFAULT_PG
+    db.execute(f"""CREATE TABLE IF NOT EXISTS liquidaciones (
+        fecha_dia TEXT NOT NULL, loteria TEXT NOT NULL, hora TEXT NOT NULL,
+        agencia_id INTEGER NOT NULL, animal TEXT,
+        apostado REAL DEFAULT 0, premios REAL DEFAULT 0, ganadoras INTEGER DEFAULT 0,
+        calculado TEXT {ts},
+        PRIMARY KEY (fecha_dia, loteria, hora, agencia_id))""")
+    db.execute(f"""CREATE TABLE IF NOT EXISTS post_sorteo_etapas (
+        id {pk}, fecha TEXT NOT NULL, loteria TEXT NOT NULL, hora TEXT,
+        motivo TEXT, etapa TEXT NOT NULL, estado TEXT NOT NULL,
+        intentos INTEGER DEFAULT 1, ms REAL, error TEXT,
+        creado TEXT {ts})""")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_post_sorteo_fecha ON post_sorteo_etapas(fecha, loteria)")
+
+def _mig_sorteo_ejecuciones(db):
+    pk = "INTEGER PRIMARY KEY AUTOINCREMENT" if USE_SQLITE else "SERIAL PRIMARY KEY"
+    db.execute(f"""CREATE TABLE IF NOT EXISTS sorteo_ejecuciones (
+        id {pk}, fecha TEXT NOT NULL, loteria TEXT NOT NULL, hora TEXT NOT NULL,
+        origen TEXT, inicio TEXT, fin TEXT, ms REAL, resultado TEXT, animal TEXT,
+        total_vendido REAL, premio REAL, error TEXT, pid INTEGER, host TEXT)""")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_sorteo_ejec_fecha ON sorteo_ejecuciones(fecha, loteria)")
+
+def _mig_riesgo_tripletas(db):
+    existentes = _columnas(db, 'tripletas')
+    for col, tipo in [('min_compra', 'INTEGER'), ('aciertos', 'INTEGER DEFAULT 0'), ('faltante', 'TEXT')]:
+        if col not in existentes:
+            db.execute(f"ALTER TABLE tripletas ADD COLUMN {col} {tipo}")
+    db.execute("""CREATE TABLE IF NOT EXISTS riesgo_tripletas (
+        fecha_dia TEXT NOT NULL, loteria TEXT NOT NULL, animal TEXT NOT NULL,
+        tripletas INTEGER DEFAULT 0, apostado REAL DEFAULT 0, premio REAL DEFAULT 0,
+        PRIMARY KEY (fecha_dia, loteria, animal))""")
+    # Minuto de compra desde la hora del ticket ('dd/mm/YYYY hh:mm AM').
+    db.execute("""UPDATE tripletas SET min_compra = (
+        SELECT (CAST(SUBSTR(tk.fecha, 12, 2) AS INTEGER)
+                - CASE WHEN SUBSTR(tk.fecha, 12, 2) = '12' THEN 12 ELSE 0 END
+                + CASE WHEN SUBSTR(tk.fecha, 18, 2) = 'PM' THEN 12 ELSE 0 END) * 60
+               + CAST(SUBSTR(tk.fecha, 15, 2) AS INTEGER)
+        FROM tickets tk WHERE tk.id = tripletas.ticket_id AND LENGTH(tk.fecha) >= 19)
+        WHERE min_compra IS NULL""")
+    hoy = ahora_peru().strftime("%d/%m/%Y")
+    for lot in LOTERIAS:
+        reconstruir_riesgo_tripletas(db, hoy, lot)
+
+MIGRACIONES = [
+    (1, 'tablas base e índices',               _mig_tablas_base),
+    (2, 'columnas añadidas',                   _mig_columnas),
+    (3, 'hora_min en jugadas y resultados',    _mig_hora_min),
+    (4, 'códigos enteros de jugadas',          _mig_codigos_jugadas),
+    (5, 'día, agencia y anulado en jugadas',   _mig_datos_ticket),
+    (6, 'tablas de archivo (PostgreSQL)',      _mig_archivo_pg),
+    (7, 'configuración y administrador',       _mig_datos_iniciales),
+    (8, 'latido de réplica',                   _mig_replica_latido),
+    (9, 'trabajos de reporte',                 _mig_trabajos_reporte),
+    (10, 'liquidaciones y pipeline post-sorteo', _mig_post_sorteo),
+    (11, 'registro de ejecuciones de sorteo',  _mig_sorteo_ejecuciones),
+    (12, 'riesgo de tripletas',                _mig_riesgo_tripletas),
+]
+ESQUEMA_LOCK_ID   = 7241002
+MIGRAR_AL_INICIAR = os.environ.get('MIGRAR_AL_INICIAR', '1') == '1'
 
-        db.execute("""INSERT OR IGNORE INTO config_sistema (clave, valor)
-            VALUES ('auto_sorteo', 'off')""" if USE_SQLITE else """INSERT INTO config_sistema (clave, valor)
-            VALUES ('auto_sorteo', 'off')
-            ON CONFLICT(clave) DO NOTHING""")
-        db.commit()
+def version_esquema(db):
+    r = db.execute("SELECT MAX(version) as v FROM schema_version").fetchone()
+    return (r['v'] if r else None) or 0
 
-        admin = db.execute("SELECT id FROM agencias WHERE es_admin=1").fetchone()
-        if not admin:
-            ph_admin = hash_password('15821462')
-            db.execute("INSERT INTO agencias (usuario,password,nombre_agencia,es_admin,es_superadmin,comision,activa) VALUES (%s,%s,%s,1,1,0,1)",
-                       ('cuborubi', ph_admin, 'ADMINISTRADOR'))
-            db.commit()
+def migrar():
+    """Aplica las migraciones pendientes; devuelve la versión final."""
+    ultima = MIGRACIONES[-1][0]
+    with get_db() as db:
+        # El lock va primero: dos workers creando schema_version a la vez chocan en pg_type
+        archivo = None
+        if USE_SQLITE:
+            if fcntl is not None:
+                archivo = open(SQLITE_PATH + '.migrar.lock', 'a+')
+                fcntl.flock(archivo.fileno(), fcntl.LOCK_EX)
+        else:
+            db.execute("SELECT pg_advisory_lock(%s)", (ESQUEMA_LOCK_ID,))
         try:
-            db.execute("UPDATE agencias SET es_superadmin=1 WHERE usuario='cuborubi'")
+            ts = TS_DEFAULT_SQ if USE_SQLITE else TS_DEFAULT_PG
+            db.execute(f"""CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                descripcion TEXT,
+                aplicada TEXT {ts})""")
             db.commit()
-        except Exception:
-            pass
-
+            actual = version_esquema(db)
+            if actual >= ultima:
+                return ultima
+            for version, descripcion, paso in MIGRACIONES:
+                if version <= actual:
+                    continue
+                t0 = time.time()
+                paso(db)
+                db.execute("INSERT INTO schema_version (version, descripcion) VALUES (%s,%s)", (version, descripcion))
+                db.commit()
+                logger.info(f"[MIGRAR] v{version} {descripcion} ({(time.time()-t0)*1000:.0f} ms)")
+            return ultima
+        finally:
+            if archivo:
+                archivo.close()
+            elif not USE_SQLITE:
+                db.rollback()
+                db.execute("SELECT pg_advisory_unlock(%s)", (ESQUEMA_LOCK_ID,))
+                db.commit()
 
 # ─── Helpers de tiempo ────────────────────────────────────────────────────────
 def ahora_peru():
@@ -428,8 +992,84 @@ def parse_fecha(f):
         except: pass
     return None
 
+# ── Seriales de ticket ────────────────────────────────────────────────────────
+# serial = ms desde SERIAL_EPOCH_MS + nodo (1 dígito) + ranura del proceso en el
+# host (2 dígitos) + secuencia dentro del ms (2 dígitos) + dígito Luhn.
+# La ranura se toma con flock sobre SERIAL_DIR/zoolo_serial_NN.lock, así que dos
+# workers del mismo host nunca comparten ranura; SERIAL_NODO separa hosts.
+# Si se agota la secuencia en un ms se toma el ms siguiente: sin esperas ni BD.
+# Los seriales antiguos (13 dígitos de ms, sin control) siguen siendo válidos.
+SERIAL_EPOCH_MS = 1735689600000   # 2025-01-01 UTC
+SERIAL_NODO     = int(os.environ.get('SERIAL_NODO', '0')) % 10
+SERIAL_DIR      = os.environ.get('SERIAL_DIR', '/tmp')
+
+def digito_luhn(numero):
+    total = 0
+    for i, d in enumerate(reversed(numero)):
+        n = int(d)
+        if i % 2 == 0:
+            n *= 2
+            if n > 9: n -= 9
+        total += n
+    return str((10 - total % 10) % 10)
+
+def serial_valido(serial):
+    """Descarta seriales mal digitados antes de ir a la BD."""
+    serial = str(serial or '').strip()
+    if not serial.isdigit():
+        return False
+    if len(serial) == 13:
+        return True
+    return len(serial) >= 15 and digito_luhn(serial[:-1]) == serial[-1]
+
+class _AsignadorSerial:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._ranura = 0
+        self._archivo = None
+        self._ultimo = 0
+        self._seq = 0
+
+    def _tomar_ranura(self):
+        self._pid = os.getpid()
+        if self._archivo:
+            self._archivo.close()
+            self._archivo = None
+        if fcntl is not None:
+            for n in range(100):
+                try:
+                    f = open(os.path.join(SERIAL_DIR, f'zoolo_serial_{n:02d}.lock'), 'a+')
+                except OSError:
+                    break
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    f.close()
+                    continue
+                self._archivo, self._ranura = f, n
+                return
+        self._ranura = self._pid % 100
+        logger.warning(f"[SERIAL] Sin ranura exclusiva; usando pid%100={self._ranura}")
+
+    def siguiente(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._tomar_ranura()
+            ms = int(time.time() * 1000) - SERIAL_EPOCH_MS
+            if ms > self._ultimo:
+                self._ultimo, self._seq = ms, 0
+            elif self._seq < 99:
+                self._seq += 1
+            else:
+                self._ultimo, self._seq = self._ultimo + 1, 0
+            base = f"{self._ultimo}{SERIAL_NODO}{self._ranura:02d}{self._seq:02d}"
+        return base + digito_luhn(base)
+
+_asignador_serial = _AsignadorSerial()
+
 def generar_serial():
-    return str(int(ahora_peru().timestamp() * 1000))
+    return _asignador_serial.siguiente()
 
 def fmt(m):
     try:
@@ -437,6 +1077,7 @@ def fmt(m):
         return str(int(v)) if v == int(v) else str(v)
     except: return str(m)
 
+@lru_cache(maxsize=512)
 def hora_a_min(h):
     try:
         p = h.replace(':',' ').split()
@@ -446,18 +1087,126 @@ def hora_a_min(h):
         return hr*60+mn
     except: return 0
 
+# Minutos locales de cada sorteo, precalculados por lotería.
+_MIN_SORTEO = {lot: {h: hora_a_min(h) for h in cfg['horarios']} for lot, cfg in LOTERIAS.items()}
+
+def loteria_cfg(loteria):
+    """Configuración de la lotería; las desconocidas caen en 'peru' como antes."""
+    return LOTERIAS.get(loteria) or LOTERIAS['peru']
+
+def horarios_de(loteria):
+    return loteria_cfg(loteria)['horarios']
+
+def pagos_de(loteria):
+    return loteria_cfg(loteria)['pagos']
+
+def etiqueta_loteria(loteria):
+    return loteria_cfg(loteria)['etiqueta']
+
+def ahora_loteria(loteria):
+    return datetime.now(timezone.utc) + timedelta(hours=loteria_cfg(loteria)['offset_utc'])
+
+# ─── Reloj de sorteos ─────────────────────────────────────────────────────────
+# Los horarios ya están parseados en _MIN_SORTEO; el estado abierto/cerrado de
+# cada lotería se recalcula como mucho una vez por minuto (los offsets son de
+# horas enteras, así que el minuto UTC y el local cambian a la vez).
+class _RelojSorteos:
+    def __init__(self):
+        self._snap = {}
+
+    def estado(self, loteria):
+        """{'minuto': minuto local, 'abiertas': frozenset, 'cerradas': [...]} del minuto actual."""
+        clave = int(time.time() // 60)
+        snap = self._snap.get(loteria)
+        if snap and snap['clave'] == clave:
+            return snap
+        ahora = ahora_loteria(loteria)
+        am = ahora.hour*60 + ahora.minute
+        mins = _MIN_SORTEO.get(loteria) or _MIN_SORTEO['peru']
+        horarios = horarios_de(loteria)
+        abiertas = frozenset(h for h in horarios if mins[h] - am > MINUTOS_BLOQUEO)
+        snap = {'clave': clave, 'minuto': am, 'abiertas': abiertas,
+                'cerradas': [h for h in horarios if h not in abiertas]}
+        self._snap[loteria] = snap
+        return snap
+
+    def minuto(self, loteria):
+        return self.estado(loteria)['minuto']
+
+reloj_sorteos = _RelojSorteos()
+
+def puede_vender_en(loteria, hora_sorteo):
+    if hora_sorteo in _MIN_SORTEO.get(loteria, ()):
+        return hora_sorteo in reloj_sorteos.estado(loteria)['abiertas']
+    return hora_a_min(hora_sorteo) - reloj_sorteos.minuto(loteria) > MINUTOS_BLOQUEO
+
+def sincronizar_catalogos(db):
+    """Crea y actualiza cat_loterias / cat_tipos_jugada / cat_selecciones desde el código."""
+    for tabla, col, pares in (
+        ('cat_loterias', 'loteria', [(c, l) for l, c in LOT_COD.items()]),
+        ('cat_tipos_jugada', 'tipo', [(c, t) for t, c in TIPO_COD.items()]),
+        ('cat_selecciones', 'seleccion', [(c, s) for s, c in SEL_COD.items()]),
+    ):
+        db.execute(f"CREATE TABLE IF NOT EXISTS {tabla} (codigo SMALLINT PRIMARY KEY, {col} TEXT NOT NULL UNIQUE)")
+        if USE_SQLITE:
+            db.executemany(f"INSERT OR REPLACE INTO {tabla} (codigo, {col}) VALUES (?,?)", pares)
+        else:
+            db.executemany(f"""INSERT INTO {tabla} (codigo, {col}) VALUES (%s,%s)
+                ON CONFLICT(codigo) DO UPDATE SET {col}=EXCLUDED.{col}""", pares)
+
+def rellenar_codigos_jugadas(db):
+    """Completa lot_cod / tipo_cod / sel_cod de las jugadas que aún no los tienen."""
+    for col_txt, col_cod, mapa in (('loteria', 'lot_cod', LOT_COD),
+                                   ('tipo', 'tipo_cod', TIPO_COD),
+                                   ('seleccion', 'sel_cod', SEL_COD)):
+        casos = ' '.join(['WHEN %s THEN %s'] * len(mapa))
+        params = [v for par in mapa.items() for v in par]
+        db.execute(f"UPDATE jugadas SET {col_cod} = CASE {col_txt} {casos} END "
+                   f"WHERE {col_cod} IS NULL AND {col_txt} IN ({','.join(['%s']*len(mapa))})",
+                   tuple(params + list(mapa)))
+
+def a_dia_iso(fecha):
+    """'dd/mm/YYYY[ ...]' -> 'YYYY-MM-DD' (valor de fecha_dia)."""
+    return f"{fecha[6:10]}-{fecha[3:5]}-{fecha[0:2]}"
+
+def rellenar_datos_ticket(db):
+    """Copia día ISO, agencia y anulado del ticket a jugadas y tripletas que no los tienen."""
+    dia_sql = "SUBSTR(tk.fecha,7,4) || '-' || SUBSTR(tk.fecha,4,2) || '-' || SUBSTR(tk.fecha,1,2)"
+    db.execute("UPDATE tickets SET fecha_dia = SUBSTR(fecha,7,4) || '-' || SUBSTR(fecha,4,2) || '-' || SUBSTR(fecha,1,2) "
+               "WHERE fecha_dia IS NULL")
+    for tabla in ('jugadas', 'tripletas'):
+        db.execute(f"""UPDATE {tabla} SET
+                fecha_dia  = (SELECT {dia_sql} FROM tickets tk WHERE tk.id = {tabla}.ticket_id),
+                agencia_id = (SELECT tk.agencia_id FROM tickets tk WHERE tk.id = {tabla}.ticket_id),
+                anulado    = (SELECT tk.anulado FROM tickets tk WHERE tk.id = {tabla}.ticket_id)
+            WHERE fecha_dia IS NULL""")
+
+def rellenar_hora_min(db):
+    """Completa hora_min en jugadas y resultados a partir del texto de hora."""
+    minutos = {h: m for mins in _MIN_SORTEO.values() for h, m in mins.items()}
+    casos = ' '.join(['WHEN %s THEN %s'] * len(minutos))
+    params = [v for par in minutos.items() for v in par]
+    for tabla in ('jugadas', 'resultados'):
+        db.execute(f"UPDATE {tabla} SET hora_min = CASE hora {casos} END "
+                   f"WHERE hora_min IS NULL AND hora IN ({','.join(['%s']*len(minutos))})",
+                   tuple(params + list(minutos)))
+
 def puede_vender(hora_sorteo):
-    ahora = ahora_peru()
-    diff = hora_a_min(hora_sorteo) - (ahora.hour*60+ahora.minute)
-    return diff > MINUTOS_BLOQUEO
+    return puede_vender_en('peru', hora_sorteo)
 
 def puede_vender_plus(hora_sorteo):
-    ahora = ahora_venezuela()
-    diff = hora_a_min(hora_sorteo) - (ahora.hour*60+ahora.minute)
-    return diff > MINUTOS_BLOQUEO
+    return puede_vender_en('plus', hora_sorteo)
+
+def calcular_premio_animal(monto, num, loteria='peru'):
+    pagos = pagos_de(loteria)
+    return monto * (pagos['lechuza'] if str(num)=="40" else pagos['animal'])
 
-def calcular_premio_animal(monto, num):
-    return monto * (PAGO_LECHUZA if str(num)=="40" else PAGO_ANIMAL_NORMAL)
+def resultados_por_loteria(db, fecha_str):
+    """{lotería: {hora: animal}} de una fecha en una sola consulta."""
+    out = defaultdict(dict)
+    for r in db.execute("SELECT hora, animal, loteria FROM resultados WHERE fecha=%s", (fecha_str,)).fetchall():
+        out[r['loteria']][r['hora']] = r['animal']
+    return out
 
 def resultados_validos_para_tripleta(resultados_dia, hora_compra_ticket):
     if hora_compra_ticket is None:
@@ -470,48 +1219,38 @@ def calcular_premio_ticket(ticket_id, db=None):
     if db is None:
         db = get_db(); close = True
     try:
-        t = db.execute("SELECT fecha FROM tickets WHERE id=%s", (ticket_id,)).fetchone()
+        t = db.execute(f"SELECT fecha FROM {db.tabla('tickets')} WHERE id=%s", (ticket_id,)).fetchone()
         if not t: return 0
         fecha_ticket = parse_fecha(t['fecha'])
         if not fecha_ticket: return 0
         fecha_str = fecha_ticket.strftime("%d/%m/%Y")
 
-        res_rows_peru = db.execute(
-            "SELECT hora, animal FROM resultados WHERE fecha=%s AND loteria='peru'", (fecha_str,)
-        ).fetchall()
-        res_rows_plus = db.execute(
-            "SELECT hora, animal FROM resultados WHERE fecha=%s AND loteria='plus'", (fecha_str,)
-        ).fetchall()
-        resultados_peru = {r['hora']: r['animal'] for r in res_rows_peru}
-        resultados_plus = {r['hora']: r['animal'] for r in res_rows_plus}
+        resultados = resultados_por_loteria(db, fecha_str)
 
         total = 0
-        jugadas = db.execute("SELECT * FROM jugadas WHERE ticket_id=%s", (ticket_id,)).fetchall()
+        jugadas = db.execute(f"SELECT * FROM {db.tabla('jugadas')} WHERE ticket_id=%s", (ticket_id,)).fetchall()
         for j in jugadas:
             lot_j = j['loteria'] if 'loteria' in j.keys() else 'peru'
-            res_dia = resultados_plus if lot_j == 'plus' else resultados_peru
-            wa = res_dia.get(j['hora'])
+            wa = resultados[lot_j].get(j['hora'])
             if not wa: continue
             if j['tipo']=='animal' and str(wa)==str(j['seleccion']):
-                total += calcular_premio_animal(j['monto'], wa)
+                total += calcular_premio_animal(j['monto'], wa, lot_j)
             elif j['tipo']=='especial' and str(wa) not in ["0","00"]:
                 sel, num = j['seleccion'], int(wa)
                 if (sel=='ROJO' and str(wa) in ROJOS) or \
                    (sel=='NEGRO' and str(wa) not in ROJOS) or \
                    (sel=='PAR' and num%2==0) or \
                    (sel=='IMPAR' and num%2!=0):
-                    total += j['monto'] * PAGO_ESPECIAL
+                    total += j['monto'] * pagos_de(lot_j)['especial']
 
-        res_validos_peru = resultados_validos_para_tripleta(resultados_peru, fecha_ticket)
-        res_validos_plus = resultados_validos_para_tripleta(resultados_plus, fecha_ticket)
-        trips = db.execute("SELECT * FROM tripletas WHERE ticket_id=%s", (ticket_id,)).fetchall()
+        trips = db.execute(f"SELECT * FROM {db.tabla('tripletas')} WHERE ticket_id=%s", (ticket_id,)).fetchall()
         for tr in trips:
             lot_tr = tr['loteria'] if 'loteria' in tr.keys() else 'peru'
-            res_validos = res_validos_plus if lot_tr == 'plus' else res_validos_peru
+            res_validos = resultados_validos_para_tripleta(resultados[lot_tr], fecha_ticket)
             nums = {tr['animal1'], tr['animal2'], tr['animal3']}
             salidos = {a for a in res_validos.values() if a in nums}
             if len(salidos)==3:
-                total += tr['monto'] * PAGO_TRIPLETA
+                total += tr['monto'] * pagos_de(lot_tr)['tripleta']
         return total
     finally:
         if close: db.close()
@@ -545,7 +1284,7 @@ def set_config(clave, valor):
 def registrar_bloqueos_historicos(fecha_sorteo, loteria):
     """
     Toma todos los animales que salieron HOY y los bloquea para MAÑANA.
-    Se llama al final de cada resultado guardado (auto o manual).
+    Etapa del pipeline post-sorteo (resultado auto, manual o borrado).
     """
     try:
         with get_db() as db:
@@ -575,6 +1314,7 @@ def registrar_bloqueos_historicos(fecha_sorteo, loteria):
             logger.info(f"[BLOQUEOS_HIST] {len(res)} animales bloqueados para {manana} ({loteria.upper()})")
     except Exception as e:
         logger.error(f"[BLOQUEOS_HIST] Error: {e}")
+        raise
 
 
 def get_bloqueos_historicos_hoy(loteria):
@@ -621,11 +1361,10 @@ def verificar_y_bloquear_tripletas(fecha, loteria):
                 return
 
             trips = db.execute("""
-                SELECT tr.id, tr.animal1, tr.animal2, tr.animal3
-                FROM tripletas tr
-                JOIN tickets tk ON tr.ticket_id = tk.id
-                WHERE tr.fecha=%s AND tr.loteria=%s AND tk.anulado=0 AND tr.pagado=0
-            """, (fecha, loteria)).fetchall()
+                SELECT id, animal1, animal2, animal3
+                FROM tripletas
+                WHERE fecha_dia=%s AND loteria=%s AND anulado=0 AND pagado=0
+            """, (a_dia_iso(fecha), loteria)).fetchall()
 
             nuevos_bloqueos = []
             for tr in trips:
@@ -651,9 +1390,11 @@ def verificar_y_bloquear_tripletas(fecha, loteria):
 
             if nuevos_bloqueos:
                 db.commit()
+                publicar_evento('bloqueos', {'loteria': loteria})
 
     except Exception as e:
         logger.error(f"[BLOQUEO_TRIP] Error: {e}")
+        raise
 
 
 def get_bloqueos_tripleta_hoy(loteria):
@@ -670,6 +1411,90 @@ def get_bloqueos_tripleta_hoy(loteria):
         return set()
 
 
+# ─── Riesgo de tripletas ──────────────────────────────────────────────────────
+# riesgo_tripletas guarda por (día, lotería, animal) lo que se pagaría en
+# tripletas si ese animal saliera: la suma de las tripletas vivas con 2 de 3
+# aciertos (solo cuentan sorteos desde la hora de compra, min_compra) a las que
+# les falta ese animal. Cada tripleta guarda sus aciertos y su faltante; un
+# resultado nuevo solo recalcula las que lo contienen, una corrección o borrado
+# rehace el día y la anulación limpia su faltante. Tras cada cambio los totales
+# del día se reescriben completos con una consulta agrupada, todo bajo el lock
+# de la lotería en la base (db.bloquear), así varios workers no se pisan.
+
+def _estado_tripleta(tr, salidos):
+    """(aciertos, faltante) de una tripleta según {hora_min: animal} del día."""
+    validos = {a for m, a in salidos.items() if m >= (tr['min_compra'] or 0)}
+    nums = {tr['animal1'], tr['animal2'], tr['animal3']}
+    faltan = nums - validos
+    faltante = next(iter(faltan)) if len(nums) == 3 and len(faltan) == 1 else None
+    return len(nums) - len(faltan), faltante
+
+def _resultados_min(db, fecha, loteria):
+    return {hora_a_min(r['hora']): r['animal'] for r in db.execute(
+        "SELECT hora, animal FROM resultados WHERE fecha=%s AND loteria=%s", (fecha, loteria)).fetchall()}
+
+def escribir_riesgo_tripletas(db, dia, loteria):
+    """Reescribe los totales del día desde las tripletas con faltante. Llamar con el lock de la lotería."""
+    pago = pagos_de(loteria)['tripleta']
+    filas = [(dia, loteria, r['faltante'], r['n'], round(float(r['apostado']), 2), round(float(r['apostado']) * pago, 2))
+             for r in db.execute("""
+        SELECT faltante, COUNT(*) as n, COALESCE(SUM(monto),0) as apostado
+        FROM tripletas
+        WHERE fecha_dia=%s AND loteria=%s AND anulado=0 AND faltante IS NOT NULL
+        GROUP BY faltante
+    """, (dia, loteria)).fetchall()]
+    db.execute("DELETE FROM riesgo_tripletas WHERE fecha_dia=%s AND loteria=%s", (dia, loteria))
+    if filas:
+        db.executemany("""INSERT INTO riesgo_tripletas (fecha_dia, loteria, animal, tripletas, apostado, premio)
+            VALUES (%s,%s,%s,%s,%s,%s)""", filas)
+
+def actualizar_riesgo_tripletas(db, fecha, loteria, animal=None):
+    """Recalcula las tripletas vivas del día que contienen `animal` (todas si es None) y
+    reescribe los totales. Idempotente: solo escribe valores absolutos, bajo el lock de la lotería."""
+    db.bloquear(f'riesgo_{loteria}')
+    dia = a_dia_iso(fecha)
+    salidos = _resultados_min(db, fecha, loteria)
+    sql = """SELECT id, animal1, animal2, animal3, min_compra, aciertos, faltante
+             FROM tripletas WHERE fecha_dia=%s AND loteria=%s AND anulado=0"""
+    params = (dia, loteria)
+    if animal is not None:
+        sql += " AND %s IN (animal1, animal2, animal3)"
+        params += (animal,)
+    cambios = []
+    for tr in db.execute(sql, params).fetchall():
+        aciertos, faltante = _estado_tripleta(tr, salidos)
+        if (aciertos, faltante) != ((tr['aciertos'] or 0), tr['faltante']):
+            cambios.append((aciertos, faltante, tr['id']))
+    if cambios:
+        db.executemany("UPDATE tripletas SET aciertos=%s, faltante=%s WHERE id=%s", cambios)
+    escribir_riesgo_tripletas(db, dia, loteria)
+    return len(cambios)
+
+def reconstruir_riesgo_tripletas(db, fecha, loteria):
+    """Rehace desde cero el riesgo de tripletas de un día (corrección o borrado de resultados)."""
+    db.bloquear(f'riesgo_{loteria}')
+    db.execute("UPDATE tripletas SET aciertos=0, faltante=NULL WHERE fecha_dia=%s AND loteria=%s",
+               (a_dia_iso(fecha), loteria))
+    return actualizar_riesgo_tripletas(db, fecha, loteria)
+
+def get_riesgo_tripletas(db, fecha, loteria):
+    """{animal: {'tripletas', 'apostado', 'premio'}} con premio > 0, sin recorrer tripletas."""
+    return {r['animal']: {'tripletas': r['tripletas'], 'apostado': round(float(r['apostado']), 2),
+                          'premio': round(float(r['premio']), 2)}
+            for r in db.execute("""SELECT animal, tripletas, apostado, premio FROM riesgo_tripletas
+                WHERE fecha_dia=%s AND loteria=%s AND tripletas > 0""", (a_dia_iso(fecha), loteria)).fetchall()}
+
+def _etapa_riesgo_tripletas(fecha, loteria, hora, motivo):
+    with get_db() as db:
+        if motivo in ('auto', 'manual'):
+            r = db.execute("SELECT animal FROM resultados WHERE fecha=%s AND hora=%s AND loteria=%s",
+                           (fecha, hora, loteria)).fetchone()
+            if r:
+                actualizar_riesgo_tripletas(db, fecha, loteria, r['animal'])
+                return
+        reconstruir_riesgo_tripletas(db, fecha, loteria)
+
+
 def get_todos_bloqueos(loteria):
     """Retorna set unificado de TODOS los números bloqueados hoy para una lotería."""
     b_manuales = set()
@@ -686,6 +1511,202 @@ def get_todos_bloqueos(loteria):
     return b_manuales | b_historicos | b_tripleta
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# EVENTOS EN VIVO (SSE) — resultados, cierres de venta, bloqueos, auto-sorteo
+# ═══════════════════════════════════════════════════════════════════════════════
+# Cada worker de gunicorn tiene un hub que lee la tabla `eventos` cada
+# EVENTOS_POLL_SEG y reparte lo nuevo a sus suscriptores. Así un resultado
+# guardado en un worker llega a los POS conectados a cualquier otro.
+# Los streams mantienen la conexión abierta y con workers sync cada terminal
+# ocuparía un worker entero: solo se activan con EVENTOS_SSE=1, que pone el
+# gunicorn.conf.py del repo junto con worker_class='gthread'. Sin él, POS y
+# panel admin siguen con el polling de siempre.
+
+EVENTOS_SSE            = os.environ.get('EVENTOS_SSE', '0') == '1'
+EVENTOS_POLL_SEG       = float(os.environ.get('EVENTOS_POLL_SEG', '1.5'))
+EVENTOS_HEARTBEAT_SEG  = 20
+EVENTOS_STREAM_MAX_SEG = int(os.environ.get('EVENTOS_STREAM_MAX_SEG', '300'))
+EVENTOS_SOLO_ADMIN     = {'autosorteo', 'bloqueos', 'ticket', 'reporte', 'post_sorteo'}
+
+def publicar_evento(tipo, datos=None):
+    """Registra un evento para todos los workers. Nunca rompe al llamador."""
+    try:
+        with get_db() as db:
+            db.execute("INSERT INTO eventos (tipo, datos) VALUES (%s,%s)",
+                       (tipo, json.dumps(datos or {})))
+            db.commit()
+        if tipo == 'resultado':
+            _version_res.clear()
+    except Exception as e:
+        logger.error(f"[EVENTOS] Error publicando {tipo}: {e}")
+
+def horas_cerradas():
+    """Sorteos cuya venta ya cerró, por lotería (lo mismo que /api/hora-actual)."""
+    return {('bloqueadas' if lot == 'peru' else f'bloqueadas_{lot}'): reloj_sorteos.estado(lot)['cerradas']
+            for lot in LOTERIAS}
+
+class _HubEventos:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = {}
+        self._ultimo_id = None
+        self._cierres = None
+        self._hilo = None
+        self._ultima_purga = 0
+
+    def suscribir(self, es_admin):
+        q = queue.Queue(maxsize=100)
+        with self._lock:
+            self._subs[q] = es_admin
+            if self._hilo is None or not self._hilo.is_alive():
+                self._hilo = threading.Thread(target=self._bucle, name='hub-eventos', daemon=True)
+                self._hilo.start()
+        return q
+
+    def cancelar(self, q):
+        with self._lock:
+            self._subs.pop(q, None)
+
+    def cierres(self):
+        if self._cierres is None:
+            self._cierres = horas_cerradas()
+        return self._cierres
+
+    def _repartir(self, ev_id, tipo, datos):
+        with self._lock:
+            subs = list(self._subs.items())
+        for q, es_admin in subs:
+            if tipo in EVENTOS_SOLO_ADMIN and not es_admin:
+                continue
+            try:
+                q.put_nowait((ev_id, tipo, datos))
+            except queue.Full:
+                pass
+
+    def _bucle(self):
+        while True:
+            time.sleep(EVENTOS_POLL_SEG)
+            with self._lock:
+                activo = bool(self._subs)
+            if not activo:
+                self._ultimo_id = None
+                continue
+            try:
+                self._leer_eventos()
+            except Exception as e:
+                logger.error(f"[EVENTOS] Error leyendo eventos: {e}")
+            cierres = horas_cerradas()
+            if cierres != self._cierres:
+                self._cierres = cierres
+                self._repartir(None, 'cierre', cierres)
+
+    def _leer_eventos(self):
+        with get_db() as db:
+            if self._ultimo_id is None:
+                row = db.execute("SELECT COALESCE(MAX(id),0) as m FROM eventos").fetchone()
+                self._ultimo_id = row['m']
+                return
+            rows = db.execute(
+                "SELECT id, tipo, datos FROM eventos WHERE id>%s ORDER BY id LIMIT 200",
+                (self._ultimo_id,)
+            ).fetchall()
+            if time.time() - self._ultima_purga > 3600:
+                self._ultima_purga = time.time()
+                limite = (datetime.now(timezone.utc) - timedelta(days=2)).strftime("%Y-%m-%d %H:%M:%S")
+                db.execute("DELETE FROM eventos WHERE creado < %s", (limite,))
+                db.commit()
+        for r in rows:
+            self._ultimo_id = r['id']
+            if r['tipo'] == 'resultado':
+                _version_res.clear()
+            self._repartir(r['id'], r['tipo'], json.loads(r['datos'] or '{}'))
+
+_hub_eventos = _HubEventos()
+
+def _sse(tipo, datos, ev_id=None):
+    cab = f"id: {ev_id}\n" if ev_id else ""
+    return f"{cab}event: {tipo}\ndata: {json.dumps(datos)}\n\n"
+
+
+# ─── Cache HTTP de resultados (ETag / Last-Modified) ─────────────────────────
+# La versión de resultados es el id del último evento 'resultado'. Cada worker
+# la consulta como mucho una vez cada RESULTADOS_VERSION_TTL segundos, así un
+# 304 no toca las tablas de resultados.
+
+RESULTADOS_VERSION_TTL    = 2.0
+RESULTADOS_MAX_AGE_HOY    = int(os.environ.get('RESULTADOS_MAX_AGE_HOY', '600'))
+RESULTADOS_MAX_AGE_PASADO = int(os.environ.get('RESULTADOS_MAX_AGE_PASADO', '86400'))
+_version_res = {}
+
+def version_resultados():
+    """(id, datetime UTC) del último evento 'resultado' en la base que atiende la petición."""
+    ver = _version_res.setdefault(destino_lectura(), {'t': 0.0, 'valor': (0, None)})
+    if time.time() - ver['t'] < RESULTADOS_VERSION_TTL:
+        return ver['valor']
+    valor = (0, None)
+    try:
+        with get_db() as db:
+            row = db.execute(
+                "SELECT id, creado FROM eventos WHERE tipo='resultado' ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+        if row:
+            creado = datetime.strptime(row['creado'][:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+            valor = (row['id'], creado)
+    except Exception as e:
+        logger.error(f"[CACHE] Error leyendo versión de resultados: {e}")
+    ver['t'] = time.time()
+    ver['valor'] = valor
+    return valor
+
+def segundos_hasta_proximo_resultado(loterias=('peru', 'plus')):
+    """Segundos hasta el próximo sorteo (+2 min del auto-sorteo) o hasta medianoche."""
+    mejor = None
+    for lot in loterias:
+        ahora = ahora_loteria(lot)
+        seg = ahora.hour*3600 + ahora.minute*60 + ahora.second
+        horarios = horarios_de(lot)
+        faltan = 86400 - seg
+        for h in horarios:
+            objetivo = hora_a_min(h)*60 + 120
+            if objetivo > seg:
+                faltan = objetivo - seg
+                break
+        mejor = faltan if mejor is None else min(mejor, faltan)
+    return mejor
+
+def responder_resultados(clave, fecha_dt, loterias, construir, publico=False, revalidar=False):
+    """
+    Respuesta condicional para endpoints de resultados. `construir` solo se
+    llama si el cliente no tiene ya la versión vigente; si la tiene, 304.
+    Fechas pasadas se cachean largo; hoy, hasta el próximo sorteo.
+    Con revalidar=True (pantallas que editan resultados) siempre se pregunta.
+    """
+    ver_id, ver_ts = version_resultados()
+    etag = hashlib.md5(f"{clave}|{ver_id}".encode()).hexdigest()
+    if fecha_dt.date() < ahora_peru().date():
+        max_age = RESULTADOS_MAX_AGE_PASADO
+    else:
+        max_age = max(1, min(segundos_hasta_proximo_resultado(loterias), RESULTADOS_MAX_AGE_HOY))
+    if request.if_none_match:
+        vigente = request.if_none_match.contains_weak(etag)
+    else:
+        vigente = bool(ver_ts and request.if_modified_since and ver_ts <= request.if_modified_since)
+    resp = Response(status=304) if vigente else construir()
+    resp.set_etag(etag)
+    if ver_ts:
+        resp.last_modified = ver_ts
+    if revalidar:
+        resp.cache_control.no_cache = True
+    else:
+        resp.cache_control.max_age = max_age
+    if publico:
+        resp.cache_control.public = True
+        resp.headers['Access-Control-Allow-Origin'] = '*'
+    else:
+        resp.cache_control.private = True
+    return resp
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # LÓGICA CENTRAL DEL AUTO-SORTEO 70/30
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -697,20 +1718,27 @@ def ejecutar_auto_sorteo(hora_str, loteria):
         logger.info(f"[AUTO-SORTEO] {loteria.upper()} {hora_str} — {fecha_hoy}")
 
         with get_db() as db:
+            # Lock de la lotería en la base: cubre otros procesos (forzado desde un worker web)
+            try:
+                db.bloquear(f'sorteo_{loteria}', espera=SORTEO_ESPERA_LOCK_SEG)
+            except TimeoutError:
+                logger.warning(f"[AUTO-SORTEO] Otro proceso sortea {loteria.upper()}; se omite {hora_str}")
+                return {'resultado': 'omitido', 'error': f'Otro sorteo de {loteria.upper()} sigue en curso'}
             ya_existe = db.execute(
                 "SELECT id FROM resultados WHERE fecha=%s AND hora=%s AND loteria=%s",
                 (fecha_hoy, hora_str, loteria)
             ).fetchone()
             if ya_existe:
                 logger.info(f"[AUTO-SORTEO] Ya existe resultado para {hora_str} {loteria}, saltando.")
-                return
+                return {'resultado': 'existente'}
 
+            lot_cod, hora_min = LOT_COD.get(loteria), hora_a_min(hora_str)
+            dia = a_dia_iso(fecha_hoy)
             apostado_row = db.execute("""
-                SELECT COALESCE(SUM(jg.monto), 0) as total
-                FROM jugadas jg
-                JOIN tickets tk ON jg.ticket_id = tk.id
-                WHERE jg.hora=%s AND jg.loteria=%s AND tk.anulado=0 AND SUBSTR(tk.fecha, 1, 10) = %s
-            """, (hora_str, loteria, fecha_hoy)).fetchone()
+                SELECT COALESCE(SUM(monto), 0) as total
+                FROM jugadas
+                WHERE fecha_dia=%s AND lot_cod=%s AND hora_min=%s AND anulado=0
+            """, (dia, lot_cod, hora_min)).fetchone()
             total_vendido = float(apostado_row['total'])
             presupuesto_70 = round(total_vendido * 0.70, 2)
 
@@ -739,27 +1767,19 @@ def ejecutar_auto_sorteo(hora_str, loteria):
             ).fetchall()
             animales_ya_salidos = {r['animal'] for r in salidos_hoy}
 
-            apostado_por_animal = db.execute("""
-                SELECT jg.seleccion, COALESCE(SUM(jg.monto), 0) as apostado
-                FROM jugadas jg
-                JOIN tickets tk ON jg.ticket_id = tk.id
-                WHERE jg.hora=%s AND jg.tipo='animal' AND jg.loteria=%s
-                  AND tk.anulado=0 AND SUBSTR(tk.fecha, 1, 10) = %s
-                GROUP BY jg.seleccion
-            """, (hora_str, loteria, fecha_hoy)).fetchall()
-
-            apostado_map = {r['seleccion']: float(r['apostado']) for r in apostado_por_animal}
-
-            especiales = db.execute("""
-                SELECT jg.seleccion, COALESCE(SUM(jg.monto), 0) as apostado
-                FROM jugadas jg
-                JOIN tickets tk ON jg.ticket_id = tk.id
-                WHERE jg.hora=%s AND jg.tipo='especial' AND jg.loteria=%s
-                  AND tk.anulado=0 AND SUBSTR(tk.fecha, 1, 10) = %s
-                GROUP BY jg.seleccion
-            """, (hora_str, loteria, fecha_hoy)).fetchall()
+            apostado_por_sel = db.execute("""
+                SELECT tipo_cod, sel_cod, COALESCE(SUM(monto), 0) as apostado
+                FROM jugadas
+                WHERE fecha_dia=%s AND lot_cod=%s AND hora_min=%s AND anulado=0
+                GROUP BY tipo_cod, sel_cod
+            """, (dia, lot_cod, hora_min)).fetchall()
 
-            esp_map = {r['seleccion']: float(r['apostado']) for r in especiales}
+            apostado_map = {sel_txt(r['sel_cod']): float(r['apostado'])
+                            for r in apostado_por_sel if r['tipo_cod'] == TIPO_COD['animal']}
+            esp_map = {sel_txt(r['sel_cod']): float(r['apostado'])
+                       for r in apostado_por_sel if r['tipo_cod'] == TIPO_COD['especial']}
+            pagos = pagos_de(loteria)
+            riesgo_trip = {a: r['premio'] for a, r in get_riesgo_tripletas(db, fecha_hoy, loteria).items()}
 
             def pago_especial_para(num_str):
                 if num_str in ["0", "00"]:
@@ -767,35 +1787,36 @@ def ejecutar_auto_sorteo(hora_str, loteria):
                 num = int(num_str)
                 total_esp = 0
                 if str(num_str) in ROJOS:
-                    total_esp += esp_map.get('ROJO', 0) * PAGO_ESPECIAL
+                    total_esp += esp_map.get('ROJO', 0) * pagos['especial']
                 else:
-                    total_esp += esp_map.get('NEGRO', 0) * PAGO_ESPECIAL
+                    total_esp += esp_map.get('NEGRO', 0) * pagos['especial']
                 if num % 2 == 0:
-                    total_esp += esp_map.get('PAR', 0) * PAGO_ESPECIAL
+                    total_esp += esp_map.get('PAR', 0) * pagos['especial']
                 else:
-                    total_esp += esp_map.get('IMPAR', 0) * PAGO_ESPECIAL
+                    total_esp += esp_map.get('IMPAR', 0) * pagos['especial']
                 return total_esp
 
             def pago_total_si_sale(num_str):
                 ap = apostado_map.get(num_str, 0)
-                mult = PAGO_LECHUZA if num_str == "40" else PAGO_ANIMAL_NORMAL
+                mult = pagos['lechuza'] if num_str == "40" else pagos['animal']
                 return round(ap * mult + pago_especial_para(num_str), 2)
 
             ultimo_animal = None
             if animales_ya_salidos:
-                todos_hoy = db.execute(
-                    "SELECT animal, hora FROM resultados WHERE fecha=%s AND loteria=%s",
+                ultimo = db.execute(
+                    "SELECT animal FROM resultados WHERE fecha=%s AND loteria=%s ORDER BY hora_min DESC LIMIT 1",
                     (fecha_hoy, loteria)
-                ).fetchall()
-                ultimos = sorted(todos_hoy, key=lambda r: hora_a_min(r['hora']), reverse=True)
-                if ultimos:
-                    ultimo_animal = ultimos[0]['animal']
+                ).fetchone()
+                if ultimo:
+                    ultimo_animal = ultimo['animal']
 
             secuencia_prioritaria = get_secuencia(ultimo_animal) if ultimo_animal else []
             secuencia_valida = [n for n in secuencia_prioritaria
                                 if n in ANIMALES_AUTO and n not in animales_ya_salidos]
 
             logger.info(f"[SECUENCIA] Último:{ultimo_animal} → Prioridad:{secuencia_valida}")
+            if riesgo_trip:
+                logger.info(f"[RIESGO_TRIP] {loteria.upper()} tripletas a 1 acierto: {riesgo_trip}")
 
             # ── NUEVO v4.1: cargar TODOS los bloqueos unificados ─────────────
             numeros_bloqueados = get_todos_bloqueos(loteria)
@@ -809,7 +1830,7 @@ def ejecutar_auto_sorteo(hora_str, loteria):
                 if num in numeros_bloqueados:
                     continue
                 pago = pago_total_si_sale(num)
-                if pago <= presupuesto_total:
+                if pago + riesgo_trip.get(num, 0) <= presupuesto_total:
                     candidatos_jugados.append((num, pago))
 
             animal_elegido = None
@@ -862,22 +1883,22 @@ def ejecutar_auto_sorteo(hora_str, loteria):
                         disponibles = [(n, pago_total_si_sale(n)) for n in ANIMALES_AUTO
                                        if n not in animales_ya_salidos and n not in solo_criticos]
                     if disponibles:
-                        disponibles.sort(key=lambda x: x[1])
+                        disponibles.sort(key=lambda x: x[1] + riesgo_trip.get(x[0], 0))
                         animal_elegido = disponibles[0][0]
                         premio_a_pagar = disponibles[0][1]
 
             if not animal_elegido:
                 logger.error(f"[AUTO-SORTEO] No se pudo elegir animal para {hora_str} {loteria}")
-                return
+                return {'resultado': 'sin_animal', 'total_vendido': total_vendido}
 
-            if USE_SQLITE:
-                db.execute("INSERT OR REPLACE INTO resultados (fecha,hora,animal,loteria) VALUES (?,?,?,?)",
-                    (fecha_hoy, hora_str, animal_elegido, loteria))
-            else:
-                db.execute("""INSERT INTO resultados (fecha,hora,animal,loteria)
-                    VALUES (%s,%s,%s,%s)
-                    ON CONFLICT(fecha,hora,loteria) DO UPDATE SET animal=EXCLUDED.animal""",
-                    (fecha_hoy, hora_str, animal_elegido, loteria))
+            db.execute("""INSERT INTO resultados (fecha,hora,animal,loteria,hora_min)
+                VALUES (%s,%s,%s,%s,%s)
+                ON CONFLICT(fecha,hora,loteria) DO NOTHING""",
+                (fecha_hoy, hora_str, animal_elegido, loteria, hora_a_min(hora_str)))
+            if db.rowcount == 0:
+                db.rollback()
+                logger.info(f"[AUTO-SORTEO] {hora_str} {loteria} ya tenía resultado al guardar, no se sobrescribe.")
+                return {'resultado': 'existente'}
 
             acumulado_generado = round(max(0, presupuesto_total - premio_a_pagar), 2)
 
@@ -914,120 +1935,403 @@ def ejecutar_auto_sorteo(hora_str, loteria):
                 f"Acum.generado:S/{acumulado_generado}"
             )
 
-        # ── NUEVO v4.1: registrar bloqueos después de cada sorteo ─────────────
-        registrar_bloqueos_historicos(fecha_hoy, loteria)
-        verificar_y_bloquear_tripletas(fecha_hoy, loteria)
+        publicar_evento('resultado', {'fecha': fecha_hoy, 'hora': hora_str, 'loteria': loteria,
+                                      'animal': animal_elegido, 'modo': 'auto'})
+        encolar_post_sorteo(fecha_hoy, loteria, hora_str, 'auto')
+        return {'resultado': 'ok', 'animal': animal_elegido, 'total_vendido': total_vendido,
+                'premio': premio_a_pagar}
 
     except Exception as e:
         import traceback
         logger.error(f"[AUTO-SORTEO] Error en {hora_str} {loteria}: {e}")
         logger.error(traceback.format_exc())
+        return {'resultado': 'error', 'error': str(e)}
 
 
 def job_auto_sorteo(hora_str, loteria):
     estado = get_config('auto_sorteo', 'off')
     if estado == 'on':
-        ejecutar_auto_sorteo(hora_str, loteria)
+        correr_sorteo(hora_str, loteria, 'cron')
     else:
         logger.info(f"[AUTO-SORTEO] Desactivado, saltando {hora_str} {loteria}")
 
 
+# ─── Ejecución de sorteos: serializada por lotería, con tiempo límite ────────
+# Loterías distintas corren en paralelo (ejecutor 'sorteos' del scheduler); la
+# misma lotería nunca, sea cron, recuperación o forzado: un lock por lotería en
+# el proceso y, dentro de ejecutar_auto_sorteo, otro en la base (db.bloquear)
+# que cubre al forzado desde un worker web. El resultado se inserta con
+# ON CONFLICT DO NOTHING: un sorteo nunca pisa a otro ya guardado.
+# SORTEO_TIMEOUT_SEG es duro para la base: pasado el plazo, SQLite interrumpe
+# la consulta en curso (progress handler) y PostgreSQL corta por
+# statement_timeout, así la transacción se deshace y el lock se libera. El
+# llamador deja de esperar en ese momento y registra 'timeout'. Cada ejecución
+# queda en sorteo_ejecuciones (inicio, fin, resultado y animal elegido).
+
+SORTEO_TIMEOUT_SEG     = int(os.environ.get('SORTEO_TIMEOUT_SEG', '60'))
+SORTEO_ESPERA_LOCK_SEG = int(os.environ.get('SORTEO_ESPERA_LOCK_SEG', '30'))
+_locks_sorteo = defaultdict(threading.Lock)
+_limite_sorteo = threading.local()
+
+def aplicar_limite_sorteo(db):
+    """Si el hilo corre un sorteo con plazo, lo traslada a la conexión."""
+    limite = getattr(_limite_sorteo, 'hasta', None)
+    if not limite:
+        return db
+    if db._sqlite:
+        db._c.set_progress_handler(lambda: 1 if time.time() > limite else 0, 200)
+    else:
+        db.execute(f"SET statement_timeout = {max(1, int((limite - time.time()) * 1000))}")
+    return db
+
+def _registrar_ejecucion(fecha, loteria, hora, origen, inicio, fin, res):
+    try:
+        with get_db(primaria=True) as db:
+            db.execute("""INSERT INTO sorteo_ejecuciones
+                (fecha, loteria, hora, origen, inicio, fin, ms, resultado, animal, total_vendido, premio, error, pid, host)
+                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)""",
+                (fecha, loteria, hora, origen,
+                 datetime.fromtimestamp(inicio, timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:23],
+                 datetime.fromtimestamp(fin, timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:23],
+                 round((fin - inicio) * 1000, 1), res.get('resultado'), res.get('animal'),
+                 res.get('total_vendido'), res.get('premio'), res.get('error'), os.getpid(), socket.gethostname()))
+    except Exception as e:
+        logger.error(f"[AUTO-SORTEO] No se pudo registrar la ejecución {loteria} {hora}: {e}")
+
+def correr_sorteo(hora_str, loteria, origen):
+    """ejecutar_auto_sorteo bajo el lock de la lotería y con SORTEO_TIMEOUT_SEG; devuelve el resultado."""
+    fecha = ahora_peru().strftime("%d/%m/%Y")
+    inicio = time.time()
+    lock = _locks_sorteo[loteria]
+    if not lock.acquire(timeout=SORTEO_ESPERA_LOCK_SEG):
+        res = {'resultado': 'omitido', 'error': f'Otro sorteo de {loteria.upper()} sigue en curso'}
+        logger.warning(f"[AUTO-SORTEO] {res['error']}; se omite {hora_str} ({origen})")
+        _registrar_ejecucion(fecha, loteria, hora_str, origen, inicio, time.time(), res)
+        return res
+    hasta = time.time() + SORTEO_TIMEOUT_SEG
+    salida = {}
+    def correr():
+        _limite_sorteo.hasta = hasta
+        try:
+            salida.update(ejecutar_auto_sorteo(hora_str, loteria) or {})
+        finally:
+            _limite_sorteo.hasta = None
+            lock.release()
+    hilo = threading.Thread(target=correr, name=f'sorteo-{loteria}', daemon=True)
+    hilo.start()
+    hilo.join(SORTEO_TIMEOUT_SEG + 5)
+    res = dict(salida)
+    if hilo.is_alive() or (res.get('resultado') == 'error' and time.time() > hasta):
+        res = {'resultado': 'timeout', 'error': f'Superó {SORTEO_TIMEOUT_SEG}s' + (f": {res['error']}" if res.get('error') else '')}
+        logger.error(f"[AUTO-SORTEO] Timeout en {loteria.upper()} {hora_str} ({origen})")
+    _registrar_ejecucion(fecha, loteria, hora_str, origen, inicio, time.time(), res)
+    return res
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# PIPELINE POST-SORTEO
+# ═══════════════════════════════════════════════════════════════════════════════
+# Guardar o borrar un resultado solo escribe el resultado y publica el evento
+# 'resultado' (visible al instante); el trabajo derivado se encola aquí. Cada
+# (fecha, lotería) cae siempre en la misma cola de POST_SORTEO_HILOS, así sus
+# tareas corren en orden de llegada y nunca a la vez; claves distintas sí van
+# en paralelo. Una tarea recorre ETAPAS_POST_SORTEO; la etapa que falla se
+# reintenta POST_SORTEO_REINTENTOS veces con espera creciente y, si sigue
+# fallando, se registra y se pasa a la siguiente. Todas las etapas son
+# idempotentes. Tiempos y errores quedan en post_sorteo_etapas.
+# Las colas viven en memoria, así que cada tarea deja además una fila
+# etapa='tarea' al encolarse ('pendiente') y otra al terminar ('ok' o 'error').
+# El líder del scheduler corre reanudar_post_sorteo() al asumir y cada
+# POST_SORTEO_REANUDAR_MIN: vuelve a encolar los sorteos de hoy y ayer cuya
+# última tarea quedó pendiente (proceso reciclado) o en error, y los resultados
+# sin tarea registrada. Una tarea en error se reintenta hasta
+# POST_SORTEO_REANUDACIONES veces.
+
+POST_SORTEO_HILOS         = int(os.environ.get('POST_SORTEO_HILOS', '2'))
+POST_SORTEO_REINTENTOS    = int(os.environ.get('POST_SORTEO_REINTENTOS', '3'))
+POST_SORTEO_REANUDAR_MIN  = int(os.environ.get('POST_SORTEO_REANUDAR_MIN', '10'))
+POST_SORTEO_REANUDACIONES = int(os.environ.get('POST_SORTEO_REANUDACIONES', '5'))
+_metricas_post_sorteo = defaultdict(lambda: {'ok': 0, 'error': 0, 'reintentos': 0, 'ms': 0.0})
+
+def liquidar_sorteo(fecha, loteria, hora):
+    """Premios por agencia del sorteo (animales y especiales) y de las tripletas completadas en el día."""
+    dia = a_dia_iso(fecha)
+    pagos = pagos_de(loteria)
+    with get_db() as db:
+        res = db.execute("SELECT animal FROM resultados WHERE fecha=%s AND hora=%s AND loteria=%s",
+                         (fecha, hora, loteria)).fetchone()
+        filas = {}
+        if res:
+            wa = str(res['animal'])
+            ganan = {(TIPO_COD['animal'], SEL_COD.get(wa)): pagos['lechuza'] if wa == "40" else pagos['animal']}
+            if wa not in ("0", "00"):
+                ganan[(TIPO_COD['especial'], SEL_COD['ROJO' if wa in ROJOS else 'NEGRO'])] = pagos['especial']
+                ganan[(TIPO_COD['especial'], SEL_COD['PAR' if int(wa) % 2 == 0 else 'IMPAR'])] = pagos['especial']
+            for r in db.execute("""
+                SELECT agencia_id, tipo_cod, sel_cod, COALESCE(SUM(monto),0) as apostado, COUNT(*) as cnt
+                FROM jugadas
+                WHERE fecha_dia=%s AND lot_cod=%s AND hora_min=%s AND anulado=0
+                GROUP BY agencia_id, tipo_cod, sel_cod
+            """, (dia, LOT_COD.get(loteria), hora_a_min(hora))).fetchall():
+                f = filas.setdefault(r['agencia_id'], [0.0, 0.0, 0])
+                f[0] += float(r['apostado'])
+                mult = ganan.get((r['tipo_cod'], r['sel_cod']))
+                if mult:
+                    f[1] += float(r['apostado']) * mult
+                    f[2] += r['cnt']
+        trips = {}
+        salidos = _resultados_min(db, fecha, loteria)
+        for tr in db.execute("""SELECT agencia_id, animal1, animal2, animal3, monto, min_compra FROM tripletas
+                WHERE fecha_dia=%s AND loteria=%s AND anulado=0""", (dia, loteria)).fetchall():
+            f = trips.setdefault(tr['agencia_id'], [0.0, 0.0, 0])
+            f[0] += float(tr['monto'])
+            if _estado_tripleta(tr, salidos)[0] == 3:
+                f[1] += float(tr['monto']) * pagos['tripleta']
+                f[2] += 1
+        db.execute("DELETE FROM liquidaciones WHERE fecha_dia=%s AND loteria=%s AND hora IN (%s,'TRIPLETA')",
+                   (dia, loteria, hora))
+        filas_ins = [(dia, loteria, hora, aid, res['animal'], round(a, 2), round(p, 2), n)
+                     for aid, (a, p, n) in filas.items()]
+        filas_ins += [(dia, loteria, 'TRIPLETA', aid, None, round(a, 2), round(p, 2), n)
+                      for aid, (a, p, n) in trips.items()]
+        if filas_ins:
+            db.executemany("""INSERT INTO liquidaciones (fecha_dia, loteria, hora, agencia_id, animal, apostado, premios, ganadoras)
+                VALUES (%s,%s,%s,%s,%s,%s,%s,%s)""", filas_ins)
+    logger.info(f"[LIQUIDACION] {loteria.upper()} {fecha} {hora}: {len(filas)} agencias, "
+                f"premios S/{round(sum(f[1] for f in filas.values()), 2)}")
+
+def _etapa_caches(fecha, loteria, hora, motivo):
+    _version_res.clear()
+    _version_ventas.clear()
+    publicar_evento('post_sorteo', {'fecha': fecha, 'loteria': loteria, 'hora': hora, 'motivo': motivo})
+
+ETAPAS_POST_SORTEO = [
+    ('bloqueos_historicos', lambda fecha, loteria, hora, motivo: registrar_bloqueos_historicos(fecha, loteria)),
+    ('bloqueos_tripleta',   lambda fecha, loteria, hora, motivo: verificar_y_bloquear_tripletas(fecha, loteria)),
+    ('riesgo_tripletas',    _etapa_riesgo_tripletas),
+    ('liquidacion',         lambda fecha, loteria, hora, motivo: liquidar_sorteo(fecha, loteria, hora)),
+    ('caches',              _etapa_caches),
+]
+
+def _registrar_etapa(tarea, etapa, estado, intentos, ms, error=None):
+    m = _metricas_post_sorteo[etapa]
+    m['ok' if estado == 'ok' else 'error'] += 1
+    m['reintentos'] += intentos - 1
+    m['ms'] += ms
+    try:
+        with get_db(primaria=True) as db:
+            db.execute("""INSERT INTO post_sorteo_etapas (fecha, loteria, hora, motivo, etapa, estado, intentos, ms, error)
+                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)""", (*tarea, etapa, estado, intentos, round(ms, 1), error))
+    except Exception as e:
+        logger.error(f"[POST-SORTEO] No se pudo registrar la etapa {etapa}: {e}")
+
+def _marcar_tarea(tarea, estado, error=None):
+    try:
+        with get_db(primaria=True) as db:
+            db.execute("""INSERT INTO post_sorteo_etapas (fecha, loteria, hora, motivo, etapa, estado, error)
+                VALUES (%s,%s,%s,%s,'tarea',%s,%s)""", (*tarea, estado, error))
+    except Exception as e:
+        logger.error(f"[POST-SORTEO] No se pudo marcar la tarea {tarea} como {estado}: {e}")
+
+def ejecutar_post_sorteo(fecha, loteria, hora, motivo):
+    """Corre las etapas en orden, con reintentos por etapa."""
+    tarea = (fecha, loteria, hora, motivo)
+    fallidas = []
+    for etapa, fn in ETAPAS_POST_SORTEO:
+        t0 = time.time()
+        for intento in range(1, POST_SORTEO_REINTENTOS + 1):
+            try:
+                fn(*tarea)
+                _registrar_etapa(tarea, etapa, 'ok', intento, (time.time() - t0) * 1000)
+                break
+            except Exception as e:
+                if intento == POST_SORTEO_REINTENTOS:
+                    logger.error(f"[POST-SORTEO] {etapa} falló para {loteria.upper()} {fecha} {hora}: {e}")
+                    _registrar_etapa(tarea, etapa, 'error', intento, (time.time() - t0) * 1000, str(e))
+                    fallidas.append(etapa)
+                else:
+                    time.sleep(2 ** (intento - 1))
+    _marcar_tarea(tarea, 'error' if fallidas else 'ok', ', '.join(fallidas) or None)
+
+class _PipelinePostSorteo:
+    def __init__(self, hilos):
+        self._hilos = hilos
+        self._lock = threading.Lock()
+        self._pid = None
+        self._colas = []
+
+    def _arrancar(self):
+        self._pid = os.getpid()
+        self._colas = [queue.Queue() for _ in range(self._hilos)]
+        for i, q in enumerate(self._colas):
+            threading.Thread(target=self._bucle, args=(q,), name=f'post-sorteo-{i}', daemon=True).start()
+
+    def encolar(self, fecha, loteria, hora, motivo):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._arrancar()
+            q = self._colas[zlib.crc32(f'{fecha}|{loteria}'.encode()) % self._hilos]
+        q.put((fecha, loteria, hora, motivo))
+
+    def _bucle(self, q):
+        while True:
+            tarea = q.get()
+            try:
+                ejecutar_post_sorteo(*tarea)
+            except Exception as e:
+                logger.error(f"[POST-SORTEO] Error en {tarea}: {e}")
+            finally:
+                q.task_done()
+
+    def estado(self):
+        return {'pendientes': sum(q.qsize() for q in self._colas) if self._pid == os.getpid() else 0,
+                'etapas': {k: dict(v, ms=round(v['ms'], 1)) for k, v in _metricas_post_sorteo.items()}}
+
+_pipeline_post_sorteo = _PipelinePostSorteo(POST_SORTEO_HILOS)
+
+def encolar_post_sorteo(fecha, loteria, hora, motivo):
+    _marcar_tarea((fecha, loteria, hora, motivo), 'pendiente')
+    _pipeline_post_sorteo.encolar(fecha, loteria, hora, motivo)
+    logger.info(f"[POST-SORTEO] Encolado {loteria.upper()} {fecha} {hora} ({motivo})")
+
+_tareas_pendientes_vistas = set()
+
+def reanudar_post_sorteo(al_asumir=False):
+    """Vuelve a encolar las tareas post-sorteo de hoy y ayer que no terminaron bien.
+    Una tarea 'pendiente' se da por perdida si ya lo estaba en la pasada anterior
+    o si el líder acaba de asumir (al_asumir)."""
+    global _tareas_pendientes_vistas
+    try:
+        hoy = ahora_peru()
+        vistas, nuevas = _tareas_pendientes_vistas, set()
+        reencoladas = 0
+        for fecha in ((hoy - timedelta(days=1)).strftime("%d/%m/%Y"), hoy.strftime("%d/%m/%Y")):
+            with get_db(primaria=True) as db:
+                ultima, errores = {}, defaultdict(int)
+                for r in db.execute("""SELECT id, loteria, hora, estado FROM post_sorteo_etapas
+                        WHERE fecha=%s AND etapa='tarea' ORDER BY id""", (fecha,)).fetchall():
+                    ultima[(r['loteria'], r['hora'])] = r
+                    if r['estado'] == 'error':
+                        errores[(r['loteria'], r['hora'])] += 1
+                con_resultado = {(r['loteria'], r['hora']) for r in db.execute(
+                    "SELECT loteria, hora FROM resultados WHERE fecha=%s", (fecha,)).fetchall()}
+            for clave in sorted(con_resultado | set(ultima)):
+                r = ultima.get(clave)
+                if r is not None and r['estado'] == 'ok':
+                    continue
+                if r is not None and r['estado'] == 'pendiente' and not al_asumir and r['id'] not in vistas:
+                    nuevas.add(r['id'])
+                    continue
+                if r is not None and r['estado'] == 'error' and errores[clave] >= POST_SORTEO_REANUDACIONES:
+                    continue
+                encolar_post_sorteo(fecha, clave[0], clave[1], 'reanudacion')
+                reencoladas += 1
+        _tareas_pendientes_vistas = nuevas
+        if reencoladas:
+            logger.warning(f"[POST-SORTEO] Reanudadas {reencoladas} tareas pendientes o fallidas")
+        return reencoladas
+    except Exception as e:
+        logger.error(f"[POST-SORTEO] Error reanudando tareas: {e}")
+        return 0
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # SCHEDULER
 # ═══════════════════════════════════════════════════════════════════════════════
 
+# Tabla única de sorteos: (lotería, hora local, hora UTC, minuto UTC), generada
+# desde LOTERIAS. De ella salen los jobs del scheduler y la guardia de recuperación.
+RECUPERACION_GRACIA_MIN = 3
+
+def tabla_sorteos():
+    tabla = []
+    for lot, cfg in LOTERIAS.items():
+        for h in cfg['horarios']:
+            m_utc = (_MIN_SORTEO[lot][h] - cfg['offset_utc'] * 60) % 1440
+            tabla.append((lot, h, m_utc // 60, m_utc % 60))
+    return tabla
+
+_metricas_recuperacion = {'ultima': None, 'pendientes': 0, 'recuperados': 0,
+                          'lag_ultimo_seg': None, 'lag_max_seg': 0}
+
+def sorteos_pendientes(now_utc=None):
+    """[(vencimiento_utc, lotería, hora, fecha)] de sorteos de hoy ya vencidos y sin resultado, en orden."""
+    now_utc = now_utc or datetime.now(timezone.utc)
+    fechas = {lot: (now_utc + timedelta(hours=cfg['offset_utc'])).strftime("%d/%m/%Y")
+              for lot, cfg in LOTERIAS.items()}
+    vencidos = []
+    for lot, hora_str, _, _ in tabla_sorteos():
+        offset = timedelta(hours=LOTERIAS[lot]['offset_utc'])
+        m = _MIN_SORTEO[lot][hora_str]
+        programado = (now_utc + offset).replace(hour=m // 60, minute=m % 60, second=0, microsecond=0) - offset
+        if now_utc >= programado + timedelta(minutes=RECUPERACION_GRACIA_MIN):
+            vencidos.append((programado, lot, hora_str, fechas[lot]))
+    if not vencidos:
+        return []
+    dias = sorted(set(fechas.values()))
+    ph = ','.join(['%s'] * len(dias))
+    with get_db() as db:
+        rows = db.execute(f"SELECT fecha, hora, loteria FROM resultados WHERE fecha IN ({ph})",
+                          tuple(dias)).fetchall()
+    existentes = {(r['fecha'], r['hora'], r['loteria']) for r in rows}
+    return sorted(v for v in vencidos if (v[3], v[2], v[1]) not in existentes)
+
 def recuperar_sorteos_perdidos():
     try:
         estado = get_config('auto_sorteo', 'off')
         if estado != 'on':
             return
-
         now_utc = datetime.now(timezone.utc)
-        now_peru = now_utc - timedelta(hours=5)
-        now_ven = now_utc - timedelta(hours=4)
-        fecha_peru = now_peru.strftime("%d/%m/%Y")
-
-        import time as _time
-        for hora_str, hora_utc in [
-            ("08:00 AM", 13), ("09:00 AM", 14), ("10:00 AM", 15),
-            ("11:00 AM", 16), ("12:00 PM", 17), ("01:00 PM", 18),
-            ("02:00 PM", 19), ("03:00 PM", 20), ("04:00 PM", 21),
-            ("05:00 PM", 22), ("06:00 PM", 23),
-        ]:
-            if now_utc.hour > hora_utc or (now_utc.hour == hora_utc and now_utc.minute > 2):
-                with get_db() as db:
-                    existe = db.execute(
-                        "SELECT id FROM resultados WHERE fecha=%s AND hora=%s AND loteria='peru'",
-                        (fecha_peru, hora_str)
-                    ).fetchone()
-                if not existe:
-                    logger.info(f"[RECUPERACION] Ejecutando sorteo perdido PERU {hora_str}")
-                    ejecutar_auto_sorteo(hora_str, 'peru')
-                    _time.sleep(0.5)
-
-        fecha_ven = now_ven.strftime("%d/%m/%Y")
-        for hora_str, hora_utc in [
-            ("08:00 AM", 12), ("09:00 AM", 13), ("10:00 AM", 14),
-            ("11:00 AM", 15), ("12:00 PM", 16), ("01:00 PM", 17),
-            ("02:00 PM", 18), ("03:00 PM", 19), ("04:00 PM", 20),
-            ("05:00 PM", 21), ("06:00 PM", 22), ("07:00 PM", 23),
-        ]:
-            if now_utc.hour > hora_utc or (now_utc.hour == hora_utc and now_utc.minute > 2):
-                with get_db() as db:
-                    existe = db.execute(
-                        "SELECT id FROM resultados WHERE fecha=%s AND hora=%s AND loteria='plus'",
-                        (fecha_ven, hora_str)
-                    ).fetchone()
-                if not existe:
-                    logger.info(f"[RECUPERACION] Ejecutando sorteo perdido PLUS {hora_str}")
-                    ejecutar_auto_sorteo(hora_str, 'plus')
-                    _time.sleep(0.5)
+        pendientes = sorteos_pendientes(now_utc)
+        m = _metricas_recuperacion
+        m['ultima'] = now_utc.strftime("%Y-%m-%d %H:%M:%S")
+        m['pendientes'] = len(pendientes)
+        for programado, lot, hora_str, fecha in pendientes:
+            lag = int((datetime.now(timezone.utc) - programado).total_seconds())
+            logger.info(f"[RECUPERACION] Ejecutando sorteo perdido {lot.upper()} {hora_str} {fecha} (retraso {lag}s)")
+            correr_sorteo(hora_str, lot, 'recuperacion')
+            m['recuperados'] += 1
+            m['lag_ultimo_seg'] = lag
+            m['lag_max_seg'] = max(m['lag_max_seg'], lag)
     except Exception as e:
         logger.error(f"[RECUPERACION] Error: {e}")
 
-def iniciar_scheduler():
+SQLITE_MANTENIMIENTO = os.environ.get('SQLITE_MANTENIMIENTO', '1') == '1'
+SQLITE_MANT_MIN      = int(os.environ.get('SQLITE_MANT_MIN', '20'))
+_metricas_sqlite = {'ultimo_mantenimiento': None, 'checkpoint': None, 'ms': None}
+
+def mantenimiento_sqlite():
+    """Checkpoint TRUNCATE del WAL, ANALYZE y PRAGMA optimize fuera de horas de venta."""
+    t0 = time.time()
     try:
-        with get_db() as db:
-            db.execute("""CREATE TABLE IF NOT EXISTS scheduler_lock (
-                id INTEGER PRIMARY KEY,
-                pid INTEGER,
-                started TEXT
-            )""")
-            db.commit()
-    except Exception:
-        pass
+        conn = sqlite3.connect(SQLITE_PATH, timeout=60)
+        try:
+            ck = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+            conn.execute("ANALYZE")
+            conn.execute("PRAGMA optimize")
+            conn.commit()
+        finally:
+            conn.close()
+        _metricas_sqlite.update(ultimo_mantenimiento=datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                                checkpoint={'ocupado': ck[0], 'paginas_wal': ck[1], 'copiadas': ck[2]},
+                                ms=round((time.time() - t0) * 1000))
+        logger.info(f"[SQLITE] Mantenimiento: checkpoint={tuple(ck)} en {_metricas_sqlite['ms']} ms")
+    except Exception as e:
+        logger.error(f"[SQLITE] Error en mantenimiento: {e}")
 
-    scheduler = BackgroundScheduler(timezone='UTC')
-
-    horarios_peru_utc = [
-        ("08:00 AM", 13), ("09:00 AM", 14), ("10:00 AM", 15),
-        ("11:00 AM", 16), ("12:00 PM", 17), ("01:00 PM", 18),
-        ("02:00 PM", 19), ("03:00 PM", 20), ("04:00 PM", 21),
-        ("05:00 PM", 22), ("06:00 PM", 23),
-    ]
-    horarios_plus_utc = [
-        ("08:00 AM", 12), ("09:00 AM", 13), ("10:00 AM", 14),
-        ("11:00 AM", 15), ("12:00 PM", 16), ("01:00 PM", 17),
-        ("02:00 PM", 18), ("03:00 PM", 19), ("04:00 PM", 20),
-        ("05:00 PM", 21), ("06:00 PM", 22), ("07:00 PM", 23),
-    ]
-
-    for hora_str, hora_utc in horarios_peru_utc:
-        h = hora_str
-        scheduler.add_job(
-            func=lambda hs=h: job_auto_sorteo(hs, 'peru'),
-            trigger=CronTrigger(hour=hora_utc, minute=2, second=0),
-            id=f'peru_{hora_utc}',
-            replace_existing=True,
-            misfire_grace_time=300
-        )
+def crear_scheduler():
+    scheduler = BackgroundScheduler(
+        timezone='UTC',
+        executors={'default': EjecutorHilos(4), 'sorteos': EjecutorHilos(max(2, len(LOTERIAS)))},
+        job_defaults={'coalesce': True, 'max_instances': 1})
 
-    for hora_str, hora_utc in horarios_plus_utc:
-        h = hora_str
+    for lot, hora_str, hora_utc, minuto_utc in tabla_sorteos():
+        m_job = (hora_utc*60 + minuto_utc + 2) % 1440
         scheduler.add_job(
-            func=lambda hs=h: job_auto_sorteo(hs, 'plus'),
-            trigger=CronTrigger(hour=hora_utc, minute=2, second=0),
-            id=f'plus_{hora_utc}',
+            func=lambda hs=hora_str, lt=lot: job_auto_sorteo(hs, lt),
+            trigger=CronTrigger(hour=m_job // 60, minute=m_job % 60, second=0),
+            executor='sorteos',
+            id=f'{lot}_{hora_utc}' + (f'_{minuto_utc}' if minuto_utc else ''),
             replace_existing=True,
             misfire_grace_time=300
         )
@@ -1040,13 +2344,345 @@ def iniciar_scheduler():
         misfire_grace_time=60
     )
 
-    scheduler.start()
-    atexit.register(lambda: scheduler.shutdown())
-    logger.info("[SCHEDULER] APScheduler iniciado con todos los jobs de sorteo.")
-    import threading
-    threading.Thread(target=recuperar_sorteos_perdidos, daemon=True).start()
+    scheduler.add_job(
+        func=reanudar_post_sorteo,
+        trigger=IntervalTrigger(minutes=POST_SORTEO_REANUDAR_MIN),
+        id='reanudar_post_sorteo',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+
+    if USE_SQLITE and SQLITE_MANTENIMIENTO:
+        # Al terminar el último sorteo del día (hora Perú) + SQLITE_MANT_MIN
+        ultimo = max((h * 60 + m - 300) % 1440 for _, _, h, m in tabla_sorteos())
+        m_mant = (ultimo + 300 + SQLITE_MANT_MIN) % 1440
+        scheduler.add_job(
+            func=mantenimiento_sqlite,
+            trigger=CronTrigger(hour=m_mant // 60, minute=m_mant % 60),
+            id='mantenimiento_sqlite',
+            replace_existing=True,
+            misfire_grace_time=3600
+        )
+
+    if REPLICA_ACTIVA:
+        scheduler.add_job(
+            func=job_latido_replica,
+            trigger=IntervalTrigger(seconds=REPLICA_LATIDO_SEG),
+            id='latido_replica',
+            replace_existing=True,
+            max_instances=1,
+            coalesce=True
+        )
+
+    if ARCHIVO_AUTO:
+        scheduler.add_job(
+            func=job_archivo_mensual,
+            trigger=CronTrigger(day=ARCHIVO_GRACIA_DIAS + 1, hour=9, minute=30),
+            id='archivo_mensual',
+            replace_existing=True,
+            misfire_grace_time=3600
+        )
+
     return scheduler
 
+
+# ─── Elección de líder del scheduler ─────────────────────────────────────────
+# Cada worker de gunicorn importa app.py, pero solo uno debe ejecutar los
+# sorteos. Los candidatos compiten por un lock de sesión: advisory lock de
+# PostgreSQL sobre una conexión dedicada (se libera solo si el proceso muere)
+# o flock sobre un archivo junto a la base SQLite. El líder arranca
+# APScheduler y registra un latido en scheduler_lock; los demás reintentan
+# cada SCHEDULER_LATIDO_SEG, así que si el líder muere otro toma el relevo.
+# Con pgbouncer en modo transaction el advisory lock no es fiable: usar una
+# conexión directa o el proceso dedicado `python app.py scheduler`.
+
+SCHEDULER_LATIDO_SEG = int(os.environ.get('SCHEDULER_LATIDO_SEG', '15'))
+SCHEDULER_LOCK_ID    = 7241001
+SCHEDULER_EN_WEB     = os.environ.get('SCHEDULER_EN_WEB', '1') == '1'
+
+class _LiderScheduler:
+    def __init__(self):
+        self._conn = None
+        self._archivo = None
+        self.scheduler = None
+        self._desde = None
+        self._hilo = None
+        self._parar = threading.Event()
+
+    @property
+    def es_lider(self):
+        return self.scheduler is not None
+
+    def _tomar_lock(self):
+        if USE_SQLITE:
+            if fcntl is None:
+                return True
+            f = open(SQLITE_PATH + '.scheduler.lock', 'a+')
+            try:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+            self._archivo = f
+            return True
+        conn = psycopg2.connect(DATABASE_URL)
+        conn.autocommit = True
+        cur = conn.cursor()
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (SCHEDULER_LOCK_ID,))
+        if cur.fetchone()[0]:
+            self._conn = conn
+            return True
+        conn.close()
+        return False
+
+    def _lock_vivo(self):
+        """El lock de PG vive mientras viva la conexión; se comprueba en cada latido."""
+        if self._conn is None:
+            return True
+        try:
+            cur = self._conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            return True
+        except Exception:
+            return False
+
+    def _soltar_lock(self):
+        for rec in (self._conn, self._archivo):
+            if rec is not None:
+                try:
+                    rec.close()
+                except Exception:
+                    pass
+        self._conn = self._archivo = None
+
+    def _latido(self):
+        ahora = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        with get_db() as db:
+            db.execute("UPDATE scheduler_lock SET heartbeat=%s WHERE id=1 AND pid=%s AND host=%s",
+                       (ahora, os.getpid(), socket.gethostname()))
+            if db.rowcount == 0:
+                db.execute("DELETE FROM scheduler_lock WHERE id=1")
+                db.execute("INSERT INTO scheduler_lock (id, pid, started, host, heartbeat) VALUES (1,%s,%s,%s,%s)",
+                           (os.getpid(), self._desde, socket.gethostname(), ahora))
+            db.commit()
+
+    def _asumir(self):
+        self.scheduler = crear_scheduler()
+        self.scheduler.start()
+        self._desde = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        logger.info(f"[SCHEDULER] Líder pid {os.getpid()}: APScheduler iniciado con todos los jobs de sorteo.")
+        try:
+            self._latido()
+        except Exception as e:
+            logger.error(f"[SCHEDULER] Error registrando líder: {e}")
+        threading.Thread(target=recuperar_sorteos_perdidos, daemon=True).start()
+        threading.Thread(target=reanudar_post_sorteo, args=(True,), daemon=True).start()
+
+    def _renunciar(self):
+        if self.scheduler is not None:
+            try:
+                self.scheduler.shutdown(wait=False)
+            except Exception:
+                pass
+            self.scheduler = None
+            logger.warning(f"[SCHEDULER] pid {os.getpid()} deja de ser líder")
+        self._soltar_lock()
+
+    def ciclo(self):
+        """Un paso de la elección: intenta ser líder o confirma que lo sigue siendo."""
+        try:
+            if not self.es_lider:
+                if self._tomar_lock():
+                    self._asumir()
+            elif not self._lock_vivo():
+                self._renunciar()
+            else:
+                self._latido()
+        except Exception as e:
+            logger.error(f"[SCHEDULER] Error en elección de líder: {e}")
+            if not self.es_lider:
+                self._soltar_lock()
+
+    def _bucle(self):
+        while not self._parar.is_set():
+            self.ciclo()
+            self._parar.wait(SCHEDULER_LATIDO_SEG)
+
+    def iniciar(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._bucle, daemon=True, name='scheduler-lider')
+            self._hilo.start()
+            atexit.register(self.detener)
+
+    def detener(self):
+        self._parar.set()
+        self._renunciar()
+
+_lider_scheduler = _LiderScheduler()
+
+def iniciar_scheduler():
+    """Arranca la candidatura de este proceso; los jobs solo corren en el líder."""
+    _lider_scheduler.iniciar()
+    return _lider_scheduler
+
+def ejecutar_scheduler_dedicado():
+    """`python app.py scheduler`: proceso solo para sorteos, sin servidor web."""
+    migrar()
+    logger.info("[SCHEDULER] Proceso dedicado; compitiendo por el liderazgo")
+    _lider_scheduler.iniciar()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        _lider_scheduler.detener()
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# ARCHIVO MENSUAL DE TICKETS / JUGADAS / TRIPLETAS
+# ═══════════════════════════════════════════════════════════════════════════════
+# Las tablas calientes solo guardan los meses abiertos; `python app.py archivar`
+# (y el job mensual) mueve los meses cerrados a almacenamiento frío:
+#   · PostgreSQL: {tabla}_archivo particionada por rango de fecha_dia, una
+#     partición por mes, y la vista {tabla}_todos = caliente UNION ALL archivo.
+#   · SQLite: un archivo por mes ({base}_archivo_YYYYMM.db) que se adjunta
+#     solo cuando un reporte pide ese rango, con vistas TEMP {tabla}_todos.
+# Los reportes por rango llaman db.con_archivo(desde, hasta) y consultan
+# db.tabla('tickets'); si el rango no toca meses archivados siguen en caliente.
+TABLAS_ARCHIVO        = ('tickets', 'jugadas', 'tripletas')
+ARCHIVO_GRACIA_DIAS   = int(os.environ.get('ARCHIVO_GRACIA_DIAS', '7'))
+ARCHIVO_MAX_ADJUNTOS  = 8
+ARCHIVO_AUTO          = os.environ.get('ARCHIVO_AUTO', '1') == '1'
+
+class RangoArchivoError(ValueError):
+    """El rango pide más meses archivados de los que SQLite puede adjuntar a la vez."""
+_INDICES_ARCHIVO = {
+    'tickets':   [('id',), ('serial',), ('agencia_id', 'fecha_dia')],
+    'jugadas':   [('ticket_id',), ('agencia_id', 'fecha_dia')],
+    'tripletas': [('ticket_id',), ('fecha_dia', 'loteria')],
+}
+
+def _columnas(db, tabla):
+    db.execute(f"SELECT * FROM {tabla} WHERE 1=0")
+    return [d[0] for d in db._cur.description]
+
+def _rango_mes(mes):
+    a, m = int(mes[:4]), int(mes[5:7])
+    sig = f"{a + m // 12:04d}-{m % 12 + 1:02d}"
+    return f"{mes}-01", f"{sig}-01"
+
+def ruta_archivo_sqlite(mes):
+    return f"{os.path.splitext(SQLITE_PATH)[0]}_archivo_{mes.replace('-', '')}.db"
+
+def preparar_archivo_pg(db):
+    """Tablas particionadas, columnas al día con las calientes, índices y vistas _todos."""
+    for t in TABLAS_ARCHIVO:
+        db.execute(f"CREATE TABLE IF NOT EXISTS {t}_archivo (LIKE {t}) PARTITION BY RANGE (fecha_dia)")
+        tipos = {r['column_name']: r['data_type'] for r in db.execute(
+            "SELECT column_name, data_type FROM information_schema.columns WHERE table_name=%s", (t,)).fetchall()}
+        tiene = {r['column_name'] for r in db.execute(
+            "SELECT column_name FROM information_schema.columns WHERE table_name=%s", (f'{t}_archivo',)).fetchall()}
+        for col, tipo in tipos.items():
+            if col not in tiene:
+                db.execute(f"ALTER TABLE {t}_archivo ADD COLUMN {col} {tipo}")
+        for cols in _INDICES_ARCHIVO[t]:
+            db.execute(f"CREATE INDEX IF NOT EXISTS idx_{t}_archivo_{'_'.join(cols)} ON {t}_archivo({', '.join(cols)})")
+        cols = ', '.join(_columnas(db, t))
+        db.execute(f"DROP VIEW IF EXISTS {t}_todos")
+        db.execute(f"CREATE VIEW {t}_todos AS SELECT {cols} FROM {t} UNION ALL SELECT {cols} FROM {t}_archivo")
+
+def _adjuntar_mes_sqlite(db, mes):
+    """ATTACH del archivo del mes (creando tablas/columnas/índices que falten); devuelve el alias."""
+    alias = f"a{mes.replace('-', '')}"
+    db.execute(f"ATTACH DATABASE %s AS {alias}", (ruta_archivo_sqlite(mes),))
+    for t in TABLAS_ARCHIVO:
+        db.execute(f"CREATE TABLE IF NOT EXISTS {alias}.{t} AS SELECT * FROM main.{t} WHERE 0")
+        tiene = {r['name'] for r in db.execute(f"PRAGMA {alias}.table_info({t})").fetchall()}
+        for col in _columnas(db, f"main.{t}"):
+            if col not in tiene:
+                db.execute(f"ALTER TABLE {alias}.{t} ADD COLUMN {col}")
+        for cols in _INDICES_ARCHIVO[t]:
+            db.execute(f"CREATE INDEX IF NOT EXISTS {alias}.idx_{t}_{'_'.join(cols)} ON {t}({', '.join(cols)})")
+    return alias
+
+def vistas_archivo_sqlite(db, meses):
+    if len(meses) > ARCHIVO_MAX_ADJUNTOS:
+        raise RangoArchivoError(f"El rango abarca {len(meses)} meses archivados ({meses[0]} a {meses[-1]}); "
+                                f"consulte como máximo {ARCHIVO_MAX_ADJUNTOS} meses archivados a la vez")
+    alias = [_adjuntar_mes_sqlite(db, m) for m in meses]
+    for t in TABLAS_ARCHIVO:
+        cols = ', '.join(_columnas(db, f"main.{t}"))
+        partes = [f"SELECT {cols} FROM main.{t}"] + [f"SELECT {cols} FROM {a}.{t}" for a in alias]
+        db.execute(f"DROP VIEW IF EXISTS temp.{t}_todos")
+        db.execute(f"CREATE TEMP VIEW {t}_todos AS " + " UNION ALL ".join(partes))
+
+def meses_archivables(db):
+    """Meses con ventas anteriores al mes de hoy menos ARCHIVO_GRACIA_DIAS (ya vencidos)."""
+    corte = (ahora_peru() - timedelta(days=ARCHIVO_GRACIA_DIAS)).strftime('%Y-%m') + '-01'
+    return [r['mes'] for r in db.execute(
+        "SELECT DISTINCT SUBSTR(fecha_dia,1,7) as mes FROM tickets WHERE fecha_dia < %s ORDER BY 1", (corte,)).fetchall()]
+
+def archivar_mes(db, mes):
+    desde, hasta = _rango_mes(mes)
+    movidas = {}
+    if USE_SQLITE:
+        db.commit()
+        alias = _adjuntar_mes_sqlite(db, mes)
+        try:
+            # Borrar antes de copiar deja el paso repetible si se cortó a medias
+            for t in TABLAS_ARCHIVO:
+                cols = ', '.join(_columnas(db, f"main.{t}"))
+                db.execute(f"DELETE FROM {alias}.{t} WHERE id IN (SELECT id FROM main.{t} WHERE fecha_dia >= %s AND fecha_dia < %s)",
+                           (desde, hasta))
+                db.execute(f"INSERT INTO {alias}.{t} ({cols}) SELECT {cols} FROM main.{t} WHERE fecha_dia >= %s AND fecha_dia < %s",
+                           (desde, hasta))
+                movidas[t] = db.rowcount
+            db.commit()
+        except Exception:
+            db._c.rollback()
+            raise
+        finally:
+            db.execute(f"DETACH DATABASE {alias}")
+    else:
+        for t in TABLAS_ARCHIVO:
+            db.execute(f"""CREATE TABLE IF NOT EXISTS {t}_archivo_{mes.replace('-', '')} PARTITION OF {t}_archivo
+                           FOR VALUES FROM ('{desde}') TO ('{hasta}')""")
+            cols = ', '.join(_columnas(db, t))
+            db.execute(f"INSERT INTO {t}_archivo ({cols}) SELECT {cols} FROM {t} WHERE fecha_dia >= %s AND fecha_dia < %s",
+                       (desde, hasta))
+            movidas[t] = db.rowcount
+    for t in TABLAS_ARCHIVO:
+        db.execute(f"DELETE FROM {t} WHERE fecha_dia >= %s AND fecha_dia < %s", (desde, hasta))
+    db.execute("INSERT OR IGNORE INTO archivo_meses (mes, tickets, jugadas, tripletas) VALUES (%s,0,0,0)" if USE_SQLITE else
+               "INSERT INTO archivo_meses (mes, tickets, jugadas, tripletas) VALUES (%s,0,0,0) ON CONFLICT(mes) DO NOTHING", (mes,))
+    db.execute("UPDATE archivo_meses SET tickets=tickets+%s, jugadas=jugadas+%s, tripletas=tripletas+%s WHERE mes=%s",
+               (movidas['tickets'], movidas['jugadas'], movidas['tripletas'], mes))
+    db.commit()
+    return movidas
+
+def archivar_meses(meses=None):
+    """Mueve al archivo los meses indicados ('YYYY-MM') o todos los ya cerrados."""
+    with get_db() as db:
+        if not USE_SQLITE:
+            preparar_archivo_pg(db)
+            db.commit()
+        cerrados = meses_archivables(db)
+        for mes in (meses or cerrados):
+            if mes not in cerrados:
+                logger.warning(f"[ARCHIVO] {mes} sigue abierto o sin ventas; se omite")
+                continue
+            movidas = archivar_mes(db, mes)
+            logger.info(f"[ARCHIVO] {mes}: " + ", ".join(f"{t}={n}" for t, n in movidas.items()))
+        for t in TABLAS_ARCHIVO:
+            db.execute(f"ANALYZE {t}")
+        db.commit()
+
+def job_archivo_mensual():
+    try:
+        archivar_meses()
+    except Exception as e:
+        logger.error(f"[ARCHIVO] Error archivando: {e}")
+
 # ─── Decoradores ─────────────────────────────────────────────────────────────
 def login_required(f):
     @wraps(f)
@@ -1124,6 +2760,413 @@ def log_audit(accion, detalle=None):
     except: pass
 
 
+# ═══════════════════════════════════════════════════════════════════════════════
+# ASSETS ESTÁTICOS (POS / ADMIN)
+# ═══════════════════════════════════════════════════════════════════════════════
+# Los JS/CSS de static/ se sirven con huella en el nombre (pos.3f2a….js) y
+# caché inmutable, ya comprimidos en gzip (y brotli si está instalado).
+# datos.js se genera desde las constantes de Python (animales, horarios…);
+# en la plantilla solo se inyectan los datos propios de la sesión.
+
+STATIC_DIR     = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+ASSETS_MAX_AGE = 31536000
+ASSETS_MIME    = {'.js': 'application/javascript', '.css': 'text/css'}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_ASSETS = {}          # 'pos.js' -> 'pos.<huella>.js'
+_ASSETS_HUELLA = {}   # 'pos.<huella>.js' -> variantes precomprimidas
+
+def _registrar_asset(nombre, contenido):
+    huella = hashlib.sha256(contenido).hexdigest()[:12]
+    base, ext = os.path.splitext(nombre)
+    con_huella = f"{base}.{huella}{ext}"
+    _ASSETS[nombre] = con_huella
+    _ASSETS_HUELLA[con_huella] = {
+        'mime': ASSETS_MIME.get(ext, 'application/octet-stream'),
+        'huella': huella,
+        'identity': contenido,
+        'gzip': gzip.compress(contenido, 9, mtime=0),
+        'br': brotli.compress(contenido, quality=11) if brotli else None,
+    }
+
+def construir_assets():
+    for nombre in sorted(os.listdir(STATIC_DIR)):
+        if os.path.splitext(nombre)[1] in ASSETS_MIME:
+            with open(os.path.join(STATIC_DIR, nombre), 'rb') as f:
+                _registrar_asset(nombre, f.read())
+    datos = {
+        'animales': ANIMALES,
+        'colores': COLORES,
+        'horarios_peru': HORARIOS_PERU,
+        'horarios_plus': HORARIOS_PLUS,
+        'loterias': {lot: {'etiqueta': cfg['etiqueta'], 'horarios': cfg['horarios']}
+                     for lot, cfg in LOTERIAS.items()},
+    }
+    _registrar_asset('datos.js', ("window.ZOOLO_DATOS = " + json.dumps(datos, ensure_ascii=False) + ";\n").encode())
+    logger.info(f"[ASSETS] {len(_ASSETS)} assets listos (brotli: {'sí' if brotli else 'no'})")
+
+construir_assets()
+
+@app.template_global()
+def asset_url(nombre):
+    return '/assets/' + _ASSETS[nombre]
+
+@app.route('/assets/<nombre>')
+def servir_asset(nombre):
+    a = _ASSETS_HUELLA.get(nombre)
+    if not a:
+        return "No encontrado", 404
+    acepta = request.accept_encodings
+    if a['br'] and acepta['br']:
+        cuerpo, codificacion = a['br'], 'br'
+    elif acepta['gzip']:
+        cuerpo, codificacion = a['gzip'], 'gzip'
+    else:
+        cuerpo, codificacion = a['identity'], None
+    resp = Response(cuerpo, mimetype=a['mime'])
+    if codificacion:
+        resp.headers['Content-Encoding'] = codificacion
+    resp.headers['Vary'] = 'Accept-Encoding'
+    resp.headers['Cache-Control'] = f'public, max-age={ASSETS_MAX_AGE}, immutable'
+    resp.set_etag(a['huella'] + (codificacion or ''))
+    return resp.make_conditional(request)
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# COMPRESIÓN DE RESPUESTAS Y FORMATO COLUMNAR
+# ═══════════════════════════════════════════════════════════════════════════════
+# Toda respuesta de texto >= COMPRESION_MIN_BYTES sale comprimida según
+# Accept-Encoding (br/zstd si los módulos están instalados, si no gzip).
+# Las respuestas en streaming se comprimen por trozos con flush, así el
+# cliente recibe cada trozo sin esperar al final. SSE no se comprime.
+
+COMPRESION_MIN_BYTES = int(os.environ.get('COMPRESION_MIN_BYTES', '1024'))
+COMPRESION_NIVEL     = 6
+COMPRESION_TIPOS     = {'application/json', 'text/html', 'text/csv', 'text/plain',
+                        'application/javascript', 'text/css'}
+
+def _elegir_codificacion():
+    acepta = request.accept_encodings
+    if brotli and acepta['br']:
+        return 'br'
+    if zstandard and acepta['zstd']:
+        return 'zstd'
+    if acepta['gzip']:
+        return 'gzip'
+    return None
+
+def _compresor(codificacion):
+    """(comprimir, vaciar, terminar) incrementales para la codificación dada."""
+    if codificacion == 'br':
+        c = brotli.Compressor(quality=5)
+        return c.process, c.flush, c.finish
+    if codificacion == 'zstd':
+        c = zstandard.ZstdCompressor(level=3).compressobj()
+        return c.compress, lambda: c.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK), c.flush
+    c = zlib.compressobj(COMPRESION_NIVEL, zlib.DEFLATED, 31)
+    return c.compress, lambda: c.flush(zlib.Z_SYNC_FLUSH), c.flush
+
+def _comprimir(datos, codificacion):
+    if codificacion == 'br':
+        return brotli.compress(datos, quality=5)
+    if codificacion == 'zstd':
+        return zstandard.ZstdCompressor(level=3).compress(datos)
+    return gzip.compress(datos, COMPRESION_NIVEL, mtime=0)
+
+def _comprimir_stream(trozos, codificacion):
+    comprimir, vaciar, terminar = _compresor(codificacion)
+    try:
+        for trozo in trozos:
+            if isinstance(trozo, str):
+                trozo = trozo.encode('utf-8')
+            salida = comprimir(trozo) + vaciar()
+            if salida:
+                yield salida
+        yield terminar()
+    finally:
+        if hasattr(trozos, 'close'):
+            trozos.close()
+
+@app.after_request
+def comprimir_respuesta(resp):
+    if (resp.status_code < 200 or resp.status_code in (204, 304)
+            or 'Content-Encoding' in resp.headers
+            or resp.mimetype not in COMPRESION_TIPOS):
+        return resp
+    codificacion = _elegir_codificacion()
+    if not codificacion:
+        return resp
+    if resp.is_streamed:
+        resp.response = _comprimir_stream(resp.response, codificacion)
+        resp.headers.pop('Content-Length', None)
+    else:
+        datos = resp.get_data()
+        if len(datos) < COMPRESION_MIN_BYTES:
+            return resp
+        resp.set_data(_comprimir(datos, codificacion))
+    resp.headers['Content-Encoding'] = codificacion
+    resp.vary.add('Accept-Encoding')
+    if resp.get_etag()[0]:
+        resp.set_etag(resp.get_etag()[0], weak=True)
+    return resp
+
+def formato_columnar():
+    """El cliente pide tablas en columnas con ?formato=columnar o {"formato": "columnar"}."""
+    if request.args.get('formato') == 'columnar':
+        return True
+    data = request.get_json(silent=True) if request.is_json else None
+    return bool(data) and data.get('formato') == 'columnar'
+
+def a_columnas(filas):
+    """
+    Lista de dicts -> {'columnas': [...], 'datos': [[col0...], [col1...]], 'n': N}.
+    Evita repetir las claves en cada fila de las tablas grandes.
+    """
+    columnas = list(dict.fromkeys(k for f in filas for k in f.keys()))
+    return {
+        'columnas': columnas,
+        'datos': [[f.get(c) for f in filas] for c in columnas],
+        'n': len(filas),
+    }
+
+def tabla(filas):
+    return a_columnas(filas) if formato_columnar() else filas
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CACHE DE REPORTES (single-flight + TTL/LRU)
+# ═══════════════════════════════════════════════════════════════════════════════
+# Peticiones idénticas (endpoint, parámetros, alcance del admin) que llegan a la
+# vez comparten un único cálculo; el resultado queda en una cache LRU acotada
+# por REPORTES_CACHE_TTL. La clave incluye la versión de ventas (último ticket
+# + último evento de pago/anulación/resultado), así cualquier venta, pago,
+# anulación o resultado invalida las entradas. La cache es por worker.
+
+REPORTES_CACHE_TTL     = float(os.environ.get('REPORTES_CACHE_TTL', '15'))
+REPORTES_CACHE_MAX     = int(os.environ.get('REPORTES_CACHE_MAX', '64'))
+REPORTES_ESPERA_MAX    = 30
+REPORTES_VERSION_TTL   = 1.0
+_version_ventas = {}
+
+def version_ventas():
+    """(último ticket, último evento ticket/resultado/post_sorteo): cambia con cada venta, pago, anulación,
+    resultado o fin de su pipeline.
+    Se lee de la misma base (réplica o primaria) que el reporte, así la clave casa con los datos."""
+    ver = _version_ventas.setdefault(destino_lectura(), {'t': 0.0, 'valor': None})
+    if time.time() - ver['t'] < REPORTES_VERSION_TTL:
+        return ver['valor']
+    with get_db() as db:
+        tk = db.execute("SELECT MAX(id) as m FROM tickets").fetchone()
+        ev = db.execute("SELECT MAX(id) as m FROM eventos WHERE tipo IN ('ticket','resultado','post_sorteo')").fetchone()
+    ver['valor'] = ((tk['m'] if tk else 0) or 0, (ev['m'] if ev else 0) or 0)
+    ver['t'] = time.time()
+    return ver['valor']
+
+class _CacheReportes:
+    def __init__(self, max_items):
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+        self._vuelo = {}
+        self._max = max_items
+        self.metricas = defaultdict(lambda: {'hits': 0, 'misses': 0, 'coalesced': 0, 'ms_calculo': 0.0})
+
+    def obtener(self, endpoint, clave, ttl, calcular):
+        """Devuelve (cuerpo, status, mimetype) desde cache, desde un cálculo en curso o calculándolo."""
+        m = self.metricas[endpoint]
+        with self._lock:
+            item = self._items.get(clave)
+            if item and item[0] > time.time():
+                self._items.move_to_end(clave)
+                m['hits'] += 1
+                return item[1]
+            vuelo = self._vuelo.get(clave)
+            lider = vuelo is None
+            if lider:
+                vuelo = self._vuelo[clave] = {'listo': threading.Event(), 'res': None}
+                m['misses'] += 1
+            else:
+                m['coalesced'] += 1
+        if not lider:
+            if vuelo['listo'].wait(REPORTES_ESPERA_MAX) and vuelo['res'] is not None:
+                return vuelo['res']
+            return calcular()
+        t0 = time.time()
+        try:
+            res = calcular()
+            if res[1] == 200:
+                vuelo['res'] = res
+                with self._lock:
+                    self._items[clave] = (time.time() + ttl, res)
+                    self._items.move_to_end(clave)
+                    while len(self._items) > self._max:
+                        self._items.popitem(last=False)
+            return res
+        finally:
+            m['ms_calculo'] += (time.time() - t0) * 1000
+            with self._lock:
+                self._vuelo.pop(clave, None)
+            vuelo['listo'].set()
+
+    def estado(self):
+        with self._lock:
+            return {'entradas': len(self._items), 'max': self._max, 'en_vuelo': len(self._vuelo),
+                    'endpoints': {k: dict(v, ms_calculo=round(v['ms_calculo'], 1)) for k, v in self.metricas.items()}}
+
+_cache_reportes = _CacheReportes(REPORTES_CACHE_MAX)
+
+def reporte_cacheado(ttl=None):
+    """Decorador para reportes admin: coalesce y cachea la respuesta JSON."""
+    def deco(f):
+        @wraps(f)
+        def d(*a, **k):
+            try:
+                alcance = 'super' if session.get('es_superadmin') else session.get('user_id')
+                cuerpo = request.get_data(cache=True) if request.method == 'POST' else b''
+                clave = (f.__name__, request.query_string, hashlib.md5(cuerpo).hexdigest(), alcance,
+                         ahora_peru().strftime("%d/%m/%Y"), version_ventas())
+            except Exception as e:
+                logger.error(f"[CACHE] Sin cache para {f.__name__}: {e}")
+                return f(*a, **k)
+            def calcular():
+                resp = app.make_response(f(*a, **k))
+                return resp.get_data(), resp.status_code, resp.mimetype
+            datos, status, mime = _cache_reportes.obtener(
+                f.__name__, clave, REPORTES_CACHE_TTL if ttl is None else ttl, calcular)
+            return Response(datos, status=status, mimetype=mime)
+        return d
+    return deco
+
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# TRABAJOS DE REPORTE (asíncronos, pool acotado)
+# ═══════════════════════════════════════════════════════════════════════════════
+# Los reportes largos se piden como trabajo: POST /admin/reportes/trabajos
+# responde al instante con un id y el reporte corre en un pool de
+# REPORTES_HILOS hilos con nice REPORTES_NICE, nunca en los hilos que atienden
+# ventas. Como mucho REPORTES_COLA_MAX trabajos esperan por worker; más allá se
+# responde 429. Cada trabajo ejecuta la misma vista del endpoint síncrono con la
+# sesión de quien lo pidió, así respeta el alcance del admin, la cache y la
+# réplica. El estado vive en trabajos_reporte (lo ve cualquier worker), se avisa
+# con el evento SSE 'reporte' y el resultado se descarga hasta que expira.
+
+REPORTES_HILOS       = int(os.environ.get('REPORTES_HILOS', '2'))
+REPORTES_COLA_MAX    = int(os.environ.get('REPORTES_COLA_MAX', '20'))
+REPORTES_NICE        = int(os.environ.get('REPORTES_NICE', '10'))
+REPORTES_EXPIRA_MIN  = int(os.environ.get('REPORTES_EXPIRA_MIN', '60'))
+REPORTES_TIMEOUT_MIN = int(os.environ.get('REPORTES_TIMEOUT_MIN', '15'))
+TRABAJOS_REPORTE = {
+    'agencias_rango':     'reporte_agencias_rango',
+    'estadisticas_rango': 'estadisticas_rango',
+    'exportar_csv':       'exportar_csv',
+}
+_pool_reportes = {'pid': None, 'pool': None, 'cupos': None, 'en_curso': 0}
+_pool_lock = threading.Lock()
+
+def _iniciar_hilo_reporte():
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), REPORTES_NICE)
+    except (AttributeError, OSError) as e:
+        logger.warning(f"[REPORTES] Sin prioridad baja para el hilo: {e}")
+
+def pool_reportes():
+    """Pool de este proceso (se recrea tras un fork)."""
+    with _pool_lock:
+        if _pool_reportes['pid'] != os.getpid():
+            _pool_reportes.update(
+                pid=os.getpid(), en_curso=0,
+                pool=ThreadPoolExecutor(max_workers=REPORTES_HILOS, thread_name_prefix='reporte',
+                                        initializer=_iniciar_hilo_reporte),
+                cupos=threading.BoundedSemaphore(REPORTES_HILOS + REPORTES_COLA_MAX))
+        return _pool_reportes
+
+def _actualizar_trabajo(tid, **campos):
+    with get_db(primaria=True) as db:
+        db.execute(f"UPDATE trabajos_reporte SET {', '.join(f'{k}=%s' for k in campos)} WHERE id=%s",
+                   (*campos.values(), tid))
+    publicar_evento('reporte', {'id': tid, 'estado': campos.get('estado'),
+                                'progreso': campos.get('progreso'), 'error': campos.get('error')})
+
+def _ejecutar_trabajo(tid, tipo, parametros, sesion):
+    pr = pool_reportes()
+    with _pool_lock:
+        pr['en_curso'] += 1
+    t0 = time.time()
+    try:
+        _actualizar_trabajo(tid, estado='ejecutando', progreso=10)
+        with app.test_request_context(f'/admin/reportes/trabajos/{tid}', method='POST', json=parametros):
+            session.update(sesion)
+            resp = app.make_response(app.view_functions[TRABAJOS_REPORTE[tipo]]())
+            cuerpo = resp.get_data(as_text=True)
+        fin = time.time()
+        if resp.status_code == 200:
+            _actualizar_trabajo(tid, estado='listo', progreso=100, resultado=cuerpo, mimetype=resp.mimetype,
+                                terminado=fin, expira=fin + REPORTES_EXPIRA_MIN * 60)
+        else:
+            try:
+                error = json.loads(cuerpo).get('error')
+            except Exception:
+                error = None
+            _actualizar_trabajo(tid, estado='error', progreso=100, error=error or f'HTTP {resp.status_code}',
+                                terminado=fin, expira=fin + REPORTES_EXPIRA_MIN * 60)
+        logger.info(f"[REPORTES] Trabajo {tid} ({tipo}) {resp.status_code} en {fin - t0:.1f}s")
+    except Exception as e:
+        logger.error(f"[REPORTES] Error en trabajo {tid} ({tipo}): {e}")
+        try:
+            _actualizar_trabajo(tid, estado='error', progreso=100, error=str(e), terminado=time.time(),
+                                expira=time.time() + REPORTES_EXPIRA_MIN * 60)
+        except Exception:
+            pass
+    finally:
+        with _pool_lock:
+            pr['en_curso'] -= 1
+        pr['cupos'].release()
+
+def encolar_trabajo_reporte(tipo, parametros):
+    """Registra y encola el trabajo; devuelve su id o None si la cola está llena."""
+    pr = pool_reportes()
+    if not pr['cupos'].acquire(blocking=False):
+        return None
+    try:
+        tid = uuid.uuid4().hex
+        ahora = time.time()
+        with get_db() as db:
+            db.execute("DELETE FROM trabajos_reporte WHERE expira < %s", (ahora,))
+            db.execute("""INSERT INTO trabajos_reporte (id, tipo, parametros, usuario_id, estado, progreso, creado, expira)
+                VALUES (%s,%s,%s,%s,'pendiente',0,%s,%s)""",
+                (tid, tipo, json.dumps(parametros), session.get('user_id'), ahora,
+                 ahora + (REPORTES_TIMEOUT_MIN + REPORTES_EXPIRA_MIN) * 60))
+        pr['pool'].submit(_ejecutar_trabajo, tid, tipo, parametros, dict(session))
+        return tid
+    except Exception:
+        pr['cupos'].release()
+        raise
+
+def _trabajo_visible(db, tid, columnas="id, tipo, parametros, estado, progreso, error, creado, terminado, expira"):
+    """Fila del trabajo si pertenece al usuario actual (o es superadmin); marca los colgados."""
+    r = db.execute(f"SELECT usuario_id, {columnas} FROM trabajos_reporte WHERE id=%s", (tid,)).fetchone()
+    if not r or (r['usuario_id'] != session.get('user_id') and not session.get('es_superadmin')):
+        return None
+    if r['estado'] in ('pendiente', 'ejecutando') and r['creado'] < time.time() - REPORTES_TIMEOUT_MIN * 60:
+        db.execute("UPDATE trabajos_reporte SET estado='error', error=%s WHERE id=%s AND estado=%s",
+                   ('Trabajo interrumpido', tid, r['estado']))
+        db.commit()
+        return _trabajo_visible(db, tid, columnas)
+    return r
+
+def _trabajo_json(r):
+    return {'id': r['id'], 'tipo': r['tipo'], 'parametros': json.loads(r['parametros'] or '{}'),
+            'estado': r['estado'], 'progreso': r['progreso'], 'error': r['error'],
+            'creado': r['creado'], 'terminado': r['terminado'], 'expira': r['expira']}
+
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # RUTAS
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -1163,61 +3206,233 @@ def logout():
 @login_required
 def pos():
     if session.get('es_admin'): return redirect('/admin')
-    return render_template_string(POS_HTML,
-        agencia=session['nombre_agencia'],
-        animales=ANIMALES,
-        colores=COLORES,
-        horarios_peru=HORARIOS_PERU,
-        horarios_plus=HORARIOS_PLUS)
+    return render_template('pos.html', agencia=session['nombre_agencia'], agencia_id=session['user_id'],
+                           eventos_sse=EVENTOS_SSE)
 
 @app.route('/admin')
 @admin_required
 def admin():
-    return render_template_string(ADMIN_HTML, animales=ANIMALES, horarios=HORARIOS_PERU, horarios_plus=HORARIOS_PLUS, es_superadmin=session.get('es_superadmin', False))
+    es_super = bool(session.get('es_superadmin', False))
+    return render_template('admin.html', es_superadmin=es_super, sesion={'es_superadmin': es_super},
+                           eventos_sse=EVENTOS_SSE)
 
 @app.route('/api/hora-actual')
 @login_required
 def hora_actual():
-    ahora_p = ahora_peru()
-    ahora_v = ahora_venezuela()
-    bloqueadas_peru = [h for h in HORARIOS_PERU if not puede_vender(h)]
-    bloqueadas_plus = [h for h in HORARIOS_PLUS if not puede_vender_plus(h)]
-    return jsonify({
-        'hora_str': ahora_p.strftime("%I:%M %p"),
-        'hora_str_plus': ahora_v.strftime("%I:%M %p"),
-        'bloqueadas': bloqueadas_peru,
-        'bloqueadas_plus': bloqueadas_plus
-    })
+    out = horas_cerradas()
+    for lot in LOTERIAS:
+        out['hora_str' if lot == 'peru' else f'hora_str_{lot}'] = ahora_loteria(lot).strftime("%I:%M %p")
+    return jsonify(out)
+
+@app.route('/api/eventos')
+@login_required
+def eventos_stream():
+    """
+    Stream SSE: 'cierre' (horas bloqueadas), 'resultado' y, para admins,
+    'autosorteo' y 'bloqueos'. Reemplaza el polling de POS y panel admin.
+    El stream se cierra solo cada EVENTOS_STREAM_MAX_SEG con 'reconectar'
+    para no retener un worker indefinidamente. Con EVENTOS_SSE apagado
+    responde 204, que hace que EventSource no reintente.
+    """
+    if not EVENTOS_SSE:
+        return '', 204
+
+    es_admin = bool(session.get('es_admin'))
+    ultimo = request.headers.get('Last-Event-ID', '')
+    pendientes = []
+    if ultimo.isdigit():
+        with get_db() as db:
+            pendientes = db.execute(
+                "SELECT id, tipo, datos FROM eventos WHERE id>%s ORDER BY id LIMIT 100", (int(ultimo),)
+            ).fetchall()
+    estado_auto = get_config('auto_sorteo', 'off') if es_admin else None
+    q = _hub_eventos.suscribir(es_admin)
+
+    def generar():
+        try:
+            yield "retry: 5000\n\n"
+            yield _sse('cierre', _hub_eventos.cierres())
+            if es_admin:
+                yield _sse('autosorteo', {'estado': estado_auto})
+            for r in pendientes:
+                if r['tipo'] in EVENTOS_SOLO_ADMIN and not es_admin:
+                    continue
+                yield _sse(r['tipo'], json.loads(r['datos'] or '{}'), r['id'])
+            fin = time.time() + EVENTOS_STREAM_MAX_SEG
+            while time.time() < fin:
+                try:
+                    ev_id, tipo, datos = q.get(timeout=EVENTOS_HEARTBEAT_SEG)
+                except queue.Empty:
+                    yield ": ping\n\n"
+                    continue
+                yield _sse(tipo, datos, ev_id)
+            yield _sse('reconectar', {})
+        finally:
+            _hub_eventos.cancelar(q)
+
+    return Response(stream_with_context(generar()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/resultados-hoy')
 @login_required
 def resultados_hoy():
-    hoy = ahora_peru().strftime("%d/%m/%Y")
+    ahora = ahora_peru()
+    hoy = ahora.strftime("%d/%m/%Y")
     loteria = request.args.get('loteria', 'peru')
-    horarios = HORARIOS_PLUS if loteria == 'plus' else HORARIOS_PERU
-    with get_db() as db:
-        rows = db.execute("SELECT hora,animal FROM resultados WHERE fecha=%s AND loteria=%s",(hoy, loteria)).fetchall()
-    rd = {r['hora']:{'animal':r['animal'],'nombre':ANIMALES.get(r['animal'],'?')} for r in rows}
-    for h in horarios:
-        if h not in rd: rd[h]=None
-    return jsonify({'status':'ok','fecha':hoy,'resultados':rd})
-
-@app.route('/api/resultados-fecha', methods=['POST'])
+    horarios = horarios_de(loteria)
+    def construir():
+        with get_db() as db:
+            rows = db.execute("SELECT hora,animal FROM resultados WHERE fecha=%s AND loteria=%s",(hoy, loteria)).fetchall()
+        rd = {r['hora']:{'animal':r['animal'],'nombre':ANIMALES.get(r['animal'],'?')} for r in rows}
+        for h in horarios:
+            if h not in rd: rd[h]=None
+        return jsonify({'status':'ok','fecha':hoy,'resultados':rd})
+    return responder_resultados(f"hoy|{hoy}|{loteria}", ahora, (loteria,), construir)
+
+@app.route('/api/resultados-fecha', methods=['GET','POST'])
 @login_required
+@solo_lectura
 def resultados_fecha():
-    data = request.get_json() or {}
+    data = request.args if request.method == 'GET' else (request.get_json() or {})
     fs = data.get('fecha')
     loteria = data.get('loteria', 'peru')
-    horarios = HORARIOS_PLUS if loteria == 'plus' else HORARIOS_PERU
+    horarios = horarios_de(loteria)
     try: fecha_obj = datetime.strptime(fs, "%Y-%m-%d") if fs else ahora_peru()
     except: fecha_obj = ahora_peru()
     fecha_str = fecha_obj.strftime("%d/%m/%Y")
-    with get_db() as db:
-        rows = db.execute("SELECT hora,animal FROM resultados WHERE fecha=%s AND loteria=%s",(fecha_str, loteria)).fetchall()
-    rd = {r['hora']:{'animal':r['animal'],'nombre':ANIMALES.get(r['animal'],'?')} for r in rows}
-    for h in horarios:
-        if h not in rd: rd[h]=None
-    return jsonify({'status':'ok','fecha_consulta':fecha_str,'resultados':rd})
+    def construir():
+        with get_db() as db:
+            rows = db.execute("SELECT hora,animal FROM resultados WHERE fecha=%s AND loteria=%s",(fecha_str, loteria)).fetchall()
+        rd = {r['hora']:{'animal':r['animal'],'nombre':ANIMALES.get(r['animal'],'?')} for r in rows}
+        for h in horarios:
+            if h not in rd: rd[h]=None
+        return jsonify({'status':'ok','fecha_consulta':fecha_str,'resultados':rd})
+    return responder_resultados(f"fecha|{fecha_str}|{loteria}", fecha_obj, (loteria,), construir)
+
+def error_jugadas(jugadas):
+    """Mensaje de la primera jugada inválida o con sorteo cerrado; None si todas valen."""
+    for j in jugadas:
+        lot = j.get('loteria','peru')
+        if lot not in LOTERIAS:
+            return f"Lotería inválida: {lot}"
+        if j['tipo']=='tripleta':
+            if len(str(j['seleccion']).split(',')) != 3:
+                return f"Tripleta inválida: {j['seleccion']}"
+            continue
+        if j['tipo'] not in TIPO_COD or str(j['seleccion']) not in SEL_COD:
+            return f"Jugada inválida: {j['tipo']} {j['seleccion']}"
+        if not puede_vender_en(lot, j['hora']):
+            return f"{etiqueta_loteria(lot)} — Sorteo {j['hora']} ya cerró (5 min antes)"
+    return None
+
+def url_whatsapp_ticket(ticket_id, serial, fecha, jugadas, total):
+    """Enlace wa.me con el texto del ticket (agencia y banco de la sesión)."""
+    jugadas_peru = [j for j in jugadas if j.get('loteria','peru') == 'peru']
+    jugadas_plus = [j for j in jugadas if j.get('loteria','peru') == 'plus']
+
+    def fmt_h_ticket(h):
+        m2 = re.match(r'(\d+):(\d+) (AM|PM)', h.strip())
+        if m2:
+            hh, mm, ap = m2.group(1), m2.group(2), m2.group(3)
+            return f"{int(hh)}{ap}" if mm=='00' else f"{int(hh)}:{mm}{ap}"
+        return h.replace(' ','')
+
+    def fmt_h_plus_ticket(h):
+        m2 = re.match(r'(\d+):(\d+) (AM|PM)', h.strip())
+        if not m2: return h.replace(' ','')
+        hh, mm, ap = int(m2.group(1)), m2.group(2), m2.group(3)
+        ven_label = f"{hh}{ap}" if mm=='00' else f"{hh}:{mm}{ap}"
+        h24 = hh % 12 + (12 if ap=='PM' else 0)
+        peru_h24 = (h24 - 1) % 24
+        peru_ap = 'PM' if peru_h24 >= 12 else 'AM'
+        peru_hh = peru_h24 % 12 or 12
+        peru_label = f"{peru_hh}{peru_ap}" if mm=='00' else f"{peru_hh}:{mm}{peru_ap}"
+        return f"{ven_label} VEN - {peru_label} PERU"
+
+    nombre_banco = session.get('nombre_banco', '').strip()
+    sep_banco = f"-----------{nombre_banco}-----------" if nombre_banco else "------------------------"
+
+    lineas = [f"*{session['nombre_agencia']}*",
+              f"*TICKET:* #{ticket_id}",
+              f"*SERIAL:* {serial}",
+              fecha,
+              sep_banco,
+              ""]
+
+    jpoh_peru = defaultdict(list)
+    for j in jugadas_peru:
+        if j['tipo']!='tripleta': jpoh_peru[j['hora']].append(j)
+
+    for hp in HORARIOS_PERU:
+        if hp not in jpoh_peru: continue
+        hpc = fmt_h_ticket(hp)
+        lineas.append(f"*ZOOLO.PERU / {hpc}*")
+        items=[]
+        for j in jpoh_peru[hp]:
+            if j['tipo']=='animal':
+                n = ANIMALES.get(j['seleccion'],'')[0:3].upper()
+                items.append(f"{n}{j['seleccion']}x{fmt(j['monto'])}")
+            else:
+                items.append(f"{j['seleccion'][0:3]}x{fmt(j['monto'])}")
+        lineas.append(" ".join(items))
+        lineas.append("")
+
+    jpoh_plus = defaultdict(list)
+    for j in jugadas_plus:
+        if j['tipo']!='tripleta': jpoh_plus[j['hora']].append(j)
+
+    for hp in HORARIOS_PLUS:
+        if hp not in jpoh_plus: continue
+        hpc = fmt_h_plus_ticket(hp)
+        lineas.append(f"*ZOOLO.PLUS / {hpc}*")
+        items=[]
+        for j in jpoh_plus[hp]:
+            if j['tipo']=='animal':
+                n = ANIMALES.get(j['seleccion'],'')[0:3].upper()
+                items.append(f"{n}{j['seleccion']}x{fmt(j['monto'])}")
+            else:
+                items.append(f"{j['seleccion'][0:3]}x{fmt(j['monto'])}")
+        lineas.append(" ".join(items))
+        lineas.append("")
+
+    ahora_dt = ahora_peru()
+    trips_peru = [j for j in jugadas_peru if j['tipo']=='tripleta']
+    trips_plus = [j for j in jugadas_plus if j['tipo']=='tripleta']
+
+    if trips_peru or trips_plus:
+        lineas.append("-------------------------------")
+        fecha_hoy_fmt = ahora_dt.strftime("%d/%m/%Y")
+        for t in trips_peru:
+            nums = t['seleccion'].split(',')
+            hora_ini = HORARIOS_PERU[0]; hora_fin = HORARIOS_PERU[-1]
+            lineas.append(f"-------TRPLZOOL----------")
+            lineas.append(f"DESDE {fecha_hoy_fmt} Sorteo {fmt_h_ticket(hora_ini)} PERU")
+            lineas.append(f"HASTA {fecha_hoy_fmt} Sorteo {fmt_h_ticket(hora_fin)} PERU")
+            lineas.append(f"(11 sorteos fijos del dia: 8AM a 6PM)")
+            partes = [f"{n}({ANIMALES.get(n,'')[0:3].upper()})" for n in nums]
+            lineas.append(f"  TRIPLETA: " + " - ".join(partes) + f" x {fmt(t['monto'])} SL")
+        for t in trips_plus:
+            nums = t['seleccion'].split(',')
+            hora_ini = HORARIOS_PLUS[0]; hora_fin = HORARIOS_PLUS[-1]
+            lineas.append("-------TRPLZOOL+----------")
+            lineas.append(f"DESDE {fecha_hoy_fmt} Sorteo {fmt_h_plus_ticket(hora_ini)} PLUS")
+            lineas.append(f"HASTA {fecha_hoy_fmt} Sorteo {fmt_h_plus_ticket(hora_fin)} PLUS")
+            lineas.append("(12 sorteos fijos del dia: 8AM a 7PM VEN / 7AM a 6PM PERU)")
+            partes = [f"{n}({ANIMALES.get(n,'')[0:3].upper()})" for n in nums]
+            lineas.append("  TRIPLETA: " + " - ".join(partes) + f" x {fmt(t['monto'])} SL")
+        lineas.append("-------------------------------")
+
+    lineas += ["------------------------",
+               f"*TOTAL: S/{fmt(total)}*",
+               "",
+               "Buena Suerte! 🍀",
+               "El ticket vence a los 3 dias"]
+    lineas = [l for l in lineas if l != ""]
+
+    import urllib.parse
+    texto = "\n".join(lineas)
+    url_wa = f"https://wa.me/?text={urllib.parse.quote(texto)}"
+    return url_wa
 
 @app.route('/api/procesar-venta', methods=['POST'])
 @agencia_required
@@ -1227,17 +3442,13 @@ def procesar_venta():
         jugadas = data.get('jugadas', [])
         if not jugadas: return jsonify({'error':'Ticket vacío'}),400
 
+        error = error_jugadas(jugadas)
+        if error: return jsonify({'error':error}),400
         jugadas_peru = [j for j in jugadas if j.get('loteria','peru') == 'peru']
         jugadas_plus = [j for j in jugadas if j.get('loteria','peru') == 'plus']
 
-        for j in jugadas_peru:
-            if j['tipo']!='tripleta' and not puede_vender(j['hora']):
-                return jsonify({'error':f"PERU — Sorteo {j['hora']} ya cerró (5 min antes)"}),400
-        for j in jugadas_plus:
-            if j['tipo']!='tripleta' and not puede_vender_plus(j['hora']):
-                return jsonify({'error':f"PLUS — Sorteo {j['hora']} ya cerró (5 min antes)"}),400
-
         hoy = ahora_peru().strftime("%d/%m/%Y")
+        dia = a_dia_iso(hoy)
         agencia_id = session['user_id']
         total = sum(j['monto'] for j in jugadas)
 
@@ -1261,145 +3472,50 @@ def procesar_venta():
                     ).fetchone()
                     if tope_row:
                         ya_apostado = db.execute("""
-                            SELECT COALESCE(SUM(jg.monto),0) as tot
-                            FROM jugadas jg
-                            JOIN tickets tk ON jg.ticket_id=tk.id
-                            WHERE jg.hora=%s AND jg.seleccion=%s AND jg.tipo='animal' AND jg.loteria=%s
-                            AND tk.anulado=0 AND SUBSTR(tk.fecha, 1, 10) = %s
-                        """, (j['hora'], j['seleccion'], lot, hoy)).fetchone()['tot']
+                            SELECT COALESCE(SUM(monto),0) as tot
+                            FROM jugadas
+                            WHERE fecha_dia=%s AND lot_cod=%s AND hora_min=%s AND tipo_cod=%s AND sel_cod=%s
+                            AND anulado=0
+                        """, (dia, LOT_COD.get(lot), hora_a_min(j['hora']), TIPO_COD['animal'],
+                              SEL_COD.get(str(j['seleccion'])))).fetchone()['tot']
                         if ya_apostado + j['monto'] > tope_row['monto_tope']:
                             nombre = ANIMALES.get(j['seleccion'], j['seleccion'])
-                            lot_label = 'PLUS' if lot=='plus' else 'PERU'
+                            lot_label = etiqueta_loteria(lot)
                             return jsonify({'error':f'Tope alcanzado para {j["seleccion"]}-{nombre} en {j["hora"]} ({lot_label}). Disponible: S/{tope_row["monto_tope"]-ya_apostado:.2f}'}),400
 
             serial = generar_serial()
             fecha  = ahora_peru().strftime("%d/%m/%Y %I:%M %p")
 
             if USE_SQLITE:
-                db.execute("INSERT INTO tickets (serial,agencia_id,fecha,total) VALUES (?,?,?,?)",
-                    (serial, agencia_id, fecha, total))
+                db.execute("INSERT INTO tickets (serial,agencia_id,fecha,total,fecha_dia) VALUES (?,?,?,?,?)",
+                    (serial, agencia_id, fecha, total, dia))
                 ticket_id = db._cur.lastrowid
             else:
                 db._cur.execute(
-                    "INSERT INTO tickets (serial,agencia_id,fecha,total) VALUES (%s,%s,%s,%s) RETURNING id",
-                    (serial, agencia_id, fecha, total))
+                    "INSERT INTO tickets (serial,agencia_id,fecha,total,fecha_dia) VALUES (%s,%s,%s,%s,%s) RETURNING id",
+                    (serial, agencia_id, fecha, total, dia))
                 ticket_id = db._cur.fetchone()[0]
 
             for j in jugadas:
                 lot = j.get('loteria','peru')
                 if j['tipo']=='tripleta':
                     nums = j['seleccion'].split(',')
-                    db.execute("INSERT INTO tripletas (ticket_id,animal1,animal2,animal3,monto,fecha,loteria) VALUES (%s,%s,%s,%s,%s,%s,%s)",
-                        (ticket_id, nums[0], nums[1], nums[2], j['monto'], fecha.split(' ')[0], lot))
+                    db.execute("""INSERT INTO tripletas (ticket_id,animal1,animal2,animal3,monto,fecha,loteria,fecha_dia,agencia_id,anulado,
+                                                         min_compra,aciertos)
+                        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,0,%s,0)""",
+                        (ticket_id, nums[0], nums[1], nums[2], j['monto'], fecha.split(' ')[0], lot, dia, agencia_id,
+                         hora_a_min(fecha[11:])))
                 else:
-                    db.execute("INSERT INTO jugadas (ticket_id,hora,seleccion,monto,tipo,loteria) VALUES (%s,%s,%s,%s,%s,%s)",
-                        (ticket_id, j['hora'], j['seleccion'], j['monto'], j['tipo'], lot))
+                    db.execute("""INSERT INTO jugadas (ticket_id,hora,seleccion,monto,tipo,loteria,hora_min,lot_cod,tipo_cod,sel_cod,
+                                                       fecha_dia,agencia_id,anulado)
+                        VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,0)""",
+                        (ticket_id, j['hora'], j['seleccion'], j['monto'], j['tipo'], lot, hora_a_min(j['hora']))
+                        + codigos_jugada(lot, j['tipo'], j['seleccion']) + (dia, agencia_id))
             db.commit()
 
         log_audit('VENTA', f"Ticket #{ticket_id} serial:{serial} total:S/{total}")
 
-        def fmt_h_ticket(h):
-            m2 = re.match(r'(\d+):(\d+) (AM|PM)', h.strip())
-            if m2:
-                hh, mm, ap = m2.group(1), m2.group(2), m2.group(3)
-                return f"{int(hh)}{ap}" if mm=='00' else f"{int(hh)}:{mm}{ap}"
-            return h.replace(' ','')
-
-        def fmt_h_plus_ticket(h):
-            m2 = re.match(r'(\d+):(\d+) (AM|PM)', h.strip())
-            if not m2: return h.replace(' ','')
-            hh, mm, ap = int(m2.group(1)), m2.group(2), m2.group(3)
-            ven_label = f"{hh}{ap}" if mm=='00' else f"{hh}:{mm}{ap}"
-            h24 = hh % 12 + (12 if ap=='PM' else 0)
-            peru_h24 = (h24 - 1) % 24
-            peru_ap = 'PM' if peru_h24 >= 12 else 'AM'
-            peru_hh = peru_h24 % 12 or 12
-            peru_label = f"{peru_hh}{peru_ap}" if mm=='00' else f"{peru_hh}:{mm}{peru_ap}"
-            return f"{ven_label} VEN - {peru_label} PERU"
-
-        nombre_banco = session.get('nombre_banco', '').strip()
-        sep_banco = f"-----------{nombre_banco}-----------" if nombre_banco else "------------------------"
-
-        lineas = [f"*{session['nombre_agencia']}*",
-                  f"*TICKET:* #{ticket_id}",
-                  f"*SERIAL:* {serial}",
-                  fecha,
-                  sep_banco,
-                  ""]
-
-        jpoh_peru = defaultdict(list)
-        for j in jugadas_peru:
-            if j['tipo']!='tripleta': jpoh_peru[j['hora']].append(j)
-
-        for hp in HORARIOS_PERU:
-            if hp not in jpoh_peru: continue
-            hpc = fmt_h_ticket(hp)
-            lineas.append(f"*ZOOLO.PERU / {hpc}*")
-            items=[]
-            for j in jpoh_peru[hp]:
-                if j['tipo']=='animal':
-                    n = ANIMALES.get(j['seleccion'],'')[0:3].upper()
-                    items.append(f"{n}{j['seleccion']}x{fmt(j['monto'])}")
-                else:
-                    items.append(f"{j['seleccion'][0:3]}x{fmt(j['monto'])}")
-            lineas.append(" ".join(items))
-            lineas.append("")
-
-        jpoh_plus = defaultdict(list)
-        for j in jugadas_plus:
-            if j['tipo']!='tripleta': jpoh_plus[j['hora']].append(j)
-
-        for hp in HORARIOS_PLUS:
-            if hp not in jpoh_plus: continue
-            hpc = fmt_h_plus_ticket(hp)
-            lineas.append(f"*ZOOLO.PLUS / {hpc}*")
-            items=[]
-            for j in jpoh_plus[hp]:
-                if j['tipo']=='animal':
-                    n = ANIMALES.get(j['seleccion'],'')[0:3].upper()
-                    items.append(f"{n}{j['seleccion']}x{fmt(j['monto'])}")
-                else:
-                    items.append(f"{j['seleccion'][0:3]}x{fmt(j['monto'])}")
-            lineas.append(" ".join(items))
-            lineas.append("")
-
-        ahora_dt = ahora_peru()
-        trips_peru = [j for j in jugadas_peru if j['tipo']=='tripleta']
-        trips_plus = [j for j in jugadas_plus if j['tipo']=='tripleta']
-
-        if trips_peru or trips_plus:
-            lineas.append("-------------------------------")
-            fecha_hoy_fmt = ahora_dt.strftime("%d/%m/%Y")
-            for t in trips_peru:
-                nums = t['seleccion'].split(',')
-                hora_ini = HORARIOS_PERU[0]; hora_fin = HORARIOS_PERU[-1]
-                lineas.append(f"-------TRPLZOOL----------")
-                lineas.append(f"DESDE {fecha_hoy_fmt} Sorteo {fmt_h_ticket(hora_ini)} PERU")
-                lineas.append(f"HASTA {fecha_hoy_fmt} Sorteo {fmt_h_ticket(hora_fin)} PERU")
-                lineas.append(f"(11 sorteos fijos del dia: 8AM a 6PM)")
-                partes = [f"{n}({ANIMALES.get(n,'')[0:3].upper()})" for n in nums]
-                lineas.append(f"  TRIPLETA: " + " - ".join(partes) + f" x {fmt(t['monto'])} SL")
-            for t in trips_plus:
-                nums = t['seleccion'].split(',')
-                hora_ini = HORARIOS_PLUS[0]; hora_fin = HORARIOS_PLUS[-1]
-                lineas.append("-------TRPLZOOL+----------")
-                lineas.append(f"DESDE {fecha_hoy_fmt} Sorteo {fmt_h_plus_ticket(hora_ini)} PLUS")
-                lineas.append(f"HASTA {fecha_hoy_fmt} Sorteo {fmt_h_plus_ticket(hora_fin)} PLUS")
-                lineas.append("(12 sorteos fijos del dia: 8AM a 7PM VEN / 7AM a 6PM PERU)")
-                partes = [f"{n}({ANIMALES.get(n,'')[0:3].upper()})" for n in nums]
-                lineas.append("  TRIPLETA: " + " - ".join(partes) + f" x {fmt(t['monto'])} SL")
-            lineas.append("-------------------------------")
-
-        lineas += ["------------------------",
-                   f"*TOTAL: S/{fmt(total)}*",
-                   "",
-                   "Buena Suerte! 🍀",
-                   "El ticket vence a los 3 dias"]
-        lineas = [l for l in lineas if l != ""]
-
-        import urllib.parse
-        texto = "\n".join(lineas)
-        url_wa = f"https://wa.me/?text={urllib.parse.quote(texto)}"
+        url_wa = url_whatsapp_ticket(ticket_id, serial, fecha, jugadas, total)
 
         return jsonify({
             'status':'ok',
@@ -1411,6 +3527,195 @@ def procesar_venta():
     except Exception as e:
         return jsonify({'error':str(e)}),500
 
+# ── Venta en lote: terminales que venden sin conexión y envían su cola ─────────
+# Cada ticket trae una clave generada en el POS; una clave ya registrada devuelve
+# el ticket original en vez de venderlo dos veces.
+VENTA_LOTE_MAX = int(os.environ.get('VENTA_LOTE_MAX', '100'))
+
+def _registrar_lote(db, agencia_id, candidatos, resultados, claves, ahora):
+    """Aplica topes e inserta los tickets válidos del lote en una transacción."""
+    hoy = ahora.strftime("%d/%m/%Y")
+    dia = a_dia_iso(hoy)
+    fecha = ahora.strftime("%d/%m/%Y %I:%M %p")
+    previas = {}
+    if claves:
+        marcas = ','.join(['%s'] * len(claves))
+        for r in db.execute(f"""SELECT clave, ticket_id, serial, total FROM ventas_idempotencia
+                                WHERE agencia_id=%s AND clave IN ({marcas})""",
+                            tuple([agencia_id] + list(claves))).fetchall():
+            previas[r['clave']] = r
+    for i, clave, _, _ in candidatos:
+        if clave in previas:
+            r = previas[clave]
+            resultados[i].update(status='duplicado', ticket_id=r['ticket_id'], serial=r['serial'], total=r['total'])
+    candidatos = [c for c in candidatos if c[1] not in previas]
+
+    # Límites de todo el lote con una consulta por tipo de límite
+    ag = db.execute("SELECT tope_taquilla FROM agencias WHERE id=%s", (agencia_id,)).fetchone()
+    tope_taq = (ag['tope_taquilla'] if ag else 0) or 0
+    vendido = 0
+    if tope_taq > 0 and candidatos:
+        vendido = db.execute(
+            "SELECT COALESCE(SUM(total),0) as tot FROM tickets WHERE agencia_id=%s AND anulado=0 AND SUBSTR(fecha, 1, 10) = %s",
+            (agencia_id, hoy)).fetchone()['tot']
+    claves_anim = {(j.get('loteria','peru'), j['hora'], str(j['seleccion']))
+                   for _, _, jugadas, _ in candidatos for j in jugadas if j['tipo'] == 'animal'}
+    topes = {}
+    if claves_anim:
+        topes = {(r['loteria'], r['hora'], r['numero']): r['monto_tope'] for r in db.execute(
+            "SELECT loteria, hora, numero, monto_tope FROM topes").fetchall()
+            if (r['loteria'], r['hora'], r['numero']) in claves_anim}
+    apostado = defaultdict(float)
+    if topes:
+        por_cod = {(LOT_COD[l], hora_a_min(h), SEL_COD[n]): (l, h, n) for l, h, n in topes}
+        lots = sorted({k[0] for k in por_cod}); mins = sorted({k[1] for k in por_cod})
+        for r in db.execute(f"""
+            SELECT lot_cod, hora_min, sel_cod, COALESCE(SUM(monto),0) as tot
+            FROM jugadas
+            WHERE fecha_dia=%s AND tipo_cod=%s AND anulado=0
+            AND lot_cod IN ({','.join(['%s']*len(lots))}) AND hora_min IN ({','.join(['%s']*len(mins))})
+            GROUP BY lot_cod, hora_min, sel_cod
+        """, tuple([dia, TIPO_COD['animal']] + lots + mins)).fetchall():
+            k = por_cod.get((r['lot_cod'], r['hora_min'], r['sel_cod']))
+            if k: apostado[k] = float(r['tot'])
+
+    aceptados = []
+    for i, clave, jugadas, total in candidatos:
+        if tope_taq > 0 and vendido + total > tope_taq:
+            resultados[i].update(status='rechazado',
+                error=f'Tope de taquilla alcanzado. Límite: S/{tope_taq}, vendido hoy: S/{vendido:.2f}')
+            continue
+        suma = defaultdict(float)
+        for j in jugadas:
+            k = (j.get('loteria','peru'), j['hora'], str(j['seleccion']))
+            if j['tipo'] == 'animal' and k in topes:
+                suma[k] += float(j['monto'])
+        excedido = next((k for k, m in suma.items() if apostado[k] + m > topes[k]), None)
+        if excedido:
+            lot, hora, num = excedido
+            resultados[i].update(status='rechazado',
+                error=f'Tope alcanzado para {num}-{ANIMALES.get(num, num)} en {hora} ({etiqueta_loteria(lot)}). '
+                      f'Disponible: S/{topes[excedido]-apostado[excedido]:.2f}')
+            continue
+        vendido += total
+        for k, m in suma.items():
+            apostado[k] += m
+        aceptados.append((i, clave, jugadas, total))
+
+    if aceptados:
+        serials = [generar_serial() for _ in aceptados]
+        db.executemany("INSERT INTO tickets (serial,agencia_id,fecha,total,fecha_dia) VALUES (%s,%s,%s,%s,%s)",
+                       [(serials[n], agencia_id, fecha, a[3], dia) for n, a in enumerate(aceptados)])
+        marcas = ','.join(['%s'] * len(serials))
+        ids = {r['serial']: r['id'] for r in db.execute(
+            f"SELECT id, serial FROM tickets WHERE serial IN ({marcas})", tuple(serials)).fetchall()}
+        filas_jug, filas_trip, filas_idem = [], [], []
+        for n, (i, clave, jugadas, total) in enumerate(aceptados):
+            tid = ids[serials[n]]
+            for j in jugadas:
+                lot = j.get('loteria','peru')
+                if j['tipo'] == 'tripleta':
+                    nums = str(j['seleccion']).split(',')
+                    filas_trip.append((tid, nums[0], nums[1], nums[2], float(j['monto']), hoy, lot, dia, agencia_id,
+                                       ahora.hour * 60 + ahora.minute))
+                else:
+                    filas_jug.append((tid, j['hora'], str(j['seleccion']), float(j['monto']), j['tipo'], lot, hora_a_min(j['hora']))
+                                     + codigos_jugada(lot, j['tipo'], j['seleccion']) + (dia, agencia_id))
+            filas_idem.append((agencia_id, clave, tid, serials[n], total))
+            resultados[i].update(status='ok', ticket_id=tid, serial=serials[n], total=total)
+        if filas_jug:
+            db.executemany("""INSERT INTO jugadas (ticket_id,hora,seleccion,monto,tipo,loteria,hora_min,lot_cod,tipo_cod,sel_cod,
+                                                   fecha_dia,agencia_id,anulado)
+                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,%s,0)""", filas_jug)
+        if filas_trip:
+            db.executemany("""INSERT INTO tripletas (ticket_id,animal1,animal2,animal3,monto,fecha,loteria,fecha_dia,agencia_id,anulado,
+                                                     min_compra,aciertos)
+                VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,0,%s,0)""", filas_trip)
+        db.executemany("INSERT INTO ventas_idempotencia (agencia_id,clave,ticket_id,serial,total) VALUES (%s,%s,%s,%s,%s)",
+                       filas_idem)
+    db.commit()
+
+@app.route('/api/procesar-ventas-lote', methods=['POST'])
+@agencia_required
+def procesar_ventas_lote():
+    try:
+        data = request.get_json() or {}
+        lote = data.get('tickets') or []
+        if not lote: return jsonify({'error':'Lote vacío'}),400
+        if len(lote) > VENTA_LOTE_MAX:
+            return jsonify({'error':f'Máximo {VENTA_LOTE_MAX} tickets por lote'}),400
+
+        agencia_id = session['user_id']
+        ahora = ahora_peru()
+        fecha = ahora.strftime("%d/%m/%Y %I:%M %p")
+        resultados = []
+        candidatos = []
+        vistas = {}
+        for i, t in enumerate(lote):
+            clave = str(t.get('clave') or '')[:64]
+            jugadas = t.get('jugadas') or []
+            res = {'clave': clave}
+            resultados.append(res)
+            if not clave:
+                res.update(status='rechazado', error='Clave de idempotencia requerida'); continue
+            if clave in vistas:
+                res.update(status='duplicado', _de=vistas[clave]); continue
+            vistas[clave] = i
+            if not jugadas:
+                res.update(status='rechazado', error='Ticket vacío'); continue
+            try:
+                error = error_jugadas(jugadas)
+                total = sum(float(j['monto']) for j in jugadas)
+            except (KeyError, TypeError, ValueError):
+                error = 'Ticket mal formado'
+            if error:
+                res.update(status='rechazado', error=error); continue
+            candidatos.append((i, clave, jugadas, total))
+
+        # Dos envíos simultáneos de la misma cola pueden pasar los dos la consulta
+        # de claves previas; el segundo choca con la clave primaria al insertar.
+        # Se deshace todo y se vuelve a registrar: ahora la clave sale duplicada.
+        for intento in range(3):
+            try:
+                with get_db() as db:
+                    _registrar_lote(db, agencia_id, candidatos, resultados, list(vistas), ahora)
+                break
+            except ErrorIntegridadDB:
+                if intento == 2:
+                    raise
+                for i, clave, _, _ in candidatos:
+                    resultados[i].clear()
+                    resultados[i]['clave'] = clave
+
+        for res in resultados:
+            if '_de' in res:
+                orig = resultados[res.pop('_de')]
+                if orig.get('status') in ('ok', 'duplicado'):
+                    res.update(ticket_id=orig['ticket_id'], serial=orig['serial'], total=orig['total'])
+                else:
+                    res.update(status='rechazado', error=orig.get('error'))
+        recibos = [r for r in resultados if r.get('status') in ('ok', 'duplicado')]
+        if recibos:
+            ids = sorted({r['ticket_id'] for r in recibos})
+            with get_db() as db:
+                fechas = {t['id']: t['fecha'] for t in db.execute(
+                    f"SELECT id, fecha FROM tickets WHERE id IN ({','.join(['%s'] * len(ids))})", tuple(ids)).fetchall()}
+            for i, r in enumerate(resultados):
+                if r.get('status') in ('ok', 'duplicado'):
+                    r['url_whatsapp'] = url_whatsapp_ticket(r['ticket_id'], r['serial'], fechas.get(r['ticket_id'], fecha),
+                                                            [dict(j, seleccion=str(j['seleccion'])) for j in lote[i].get('jugadas') or []], r['total'])
+        nuevos = [r for r in resultados if r.get('status') == 'ok']
+        if nuevos:
+            log_audit('VENTA_LOTE', f"{len(nuevos)} tickets: " + ", ".join(f"#{r['ticket_id']} {r['serial']}" for r in nuevos)[:900])
+        return jsonify({
+            'status':'ok',
+            'resultados':resultados,
+            'aceptados':len(nuevos),
+            'rechazados':sum(1 for r in resultados if r.get('status') == 'rechazado')
+        })
+    except Exception as e:
+        return jsonify({'error':str(e)}),500
+
 
 @app.route('/api/repetir-ticket', methods=['POST'])
 @agencia_required
@@ -1468,8 +3773,11 @@ def mis_tickets():
         dti = datetime.strptime(fi,"%Y-%m-%d") if fi else None
         dtf = datetime.strptime(ff,"%Y-%m-%d").replace(hour=23,minute=59) if ff else None
         with get_db() as db:
-            rows = db.execute("SELECT * FROM tickets WHERE agencia_id=%s AND anulado=0 ORDER BY id DESC LIMIT 500",
-                            (session['user_id'],)).fetchall()
+            if fi or ff:
+                db.con_archivo(fi, ff)
+            rows = db.execute(f"""SELECT * FROM {db.tabla('tickets')} WHERE agencia_id=%s AND anulado=0
+                                  AND fecha_dia >= %s AND fecha_dia <= %s ORDER BY id DESC LIMIT 500""",
+                            (session['user_id'], fi or '0000-00-00', ff or '9999-99-99')).fetchall()
             resultado_cache = {}
             tickets_out = []
             for t in rows:
@@ -1480,34 +3788,26 @@ def mis_tickets():
                 if est=='pagados' and not t['pagado']: continue
                 if est=='pendientes' and t['pagado']: continue
                 fecha_str = dt.strftime("%d/%m/%Y")
-                cache_key_peru = fecha_str + '_peru'
-                cache_key_plus = fecha_str + '_plus'
-                if cache_key_peru not in resultado_cache:
-                    rr = db.execute("SELECT hora,animal FROM resultados WHERE fecha=%s AND loteria='peru'",(fecha_str,)).fetchall()
-                    resultado_cache[cache_key_peru] = {r['hora']:r['animal'] for r in rr}
-                if cache_key_plus not in resultado_cache:
-                    rr = db.execute("SELECT hora,animal FROM resultados WHERE fecha=%s AND loteria='plus'",(fecha_str,)).fetchall()
-                    resultado_cache[cache_key_plus] = {r['hora']:r['animal'] for r in rr}
-                res_dia_peru = resultado_cache[cache_key_peru]
-                res_dia_plus = resultado_cache[cache_key_plus]
-                jugadas_raw = db.execute("SELECT * FROM jugadas WHERE ticket_id=%s",(t['id'],)).fetchall()
-                tripletas_raw = db.execute("SELECT * FROM tripletas WHERE ticket_id=%s",(t['id'],)).fetchall()
+                if fecha_str not in resultado_cache:
+                    resultado_cache[fecha_str] = resultados_por_loteria(db, fecha_str)
+                res_fecha = resultado_cache[fecha_str]
+                jugadas_raw = db.execute(f"SELECT * FROM {db.tabla('jugadas')} WHERE ticket_id=%s",(t['id'],)).fetchall()
+                tripletas_raw = db.execute(f"SELECT * FROM {db.tabla('tripletas')} WHERE ticket_id=%s",(t['id'],)).fetchall()
                 premio_total = 0
                 jugadas_det = []
                 for j in jugadas_raw:
                     lot_j = j['loteria'] if 'loteria' in j.keys() else 'peru'
-                    res_dia = res_dia_plus if lot_j == 'plus' else res_dia_peru
-                    wa = res_dia.get(j['hora']); gano=False; pj=0
+                    wa = res_fecha[lot_j].get(j['hora']); gano=False; pj=0
                     if wa:
                         if j['tipo']=='animal' and str(wa)==str(j['seleccion']):
-                            pj=calcular_premio_animal(j['monto'],wa); gano=True
+                            pj=calcular_premio_animal(j['monto'],wa,lot_j); gano=True
                         elif j['tipo']=='especial' and str(wa) not in ["0","00"]:
                             sel,num=j['seleccion'],int(wa)
                             if (sel=='ROJO' and str(wa) in ROJOS) or \
                                (sel=='NEGRO' and str(wa) not in ROJOS) or \
                                (sel=='PAR' and num%2==0) or \
                                (sel=='IMPAR' and num%2!=0):
-                                pj=j['monto']*PAGO_ESPECIAL; gano=True
+                                pj=j['monto']*pagos_de(lot_j)['especial']; gano=True
                     if gano: premio_total+=pj
                     jugadas_det.append({
                         'tipo':j['tipo'],'hora':j['hora'],'seleccion':j['seleccion'],
@@ -1518,14 +3818,12 @@ def mis_tickets():
                         'loteria': lot_j
                     })
                 trips_det = []
-                res_validos_trip_peru = resultados_validos_para_tripleta(res_dia_peru, dt)
-                res_validos_trip_plus = resultados_validos_para_tripleta(res_dia_plus, dt)
                 for tr in tripletas_raw:
                     lot_tr = tr['loteria'] if 'loteria' in tr.keys() else 'peru'
-                    res_validos_trip = res_validos_trip_plus if lot_tr == 'plus' else res_validos_trip_peru
+                    res_validos_trip = resultados_validos_para_tripleta(res_fecha[lot_tr], dt)
                     nums={tr['animal1'],tr['animal2'],tr['animal3']}
                     salidos=list(dict.fromkeys([a for a in res_validos_trip.values() if a in nums]))
-                    gano_t=len(salidos)==3; pt=tr['monto']*PAGO_TRIPLETA if gano_t else 0
+                    gano_t=len(salidos)==3; pt=tr['monto']*pagos_de(lot_tr)['tripleta'] if gano_t else 0
                     if gano_t: premio_total+=pt
                     trips_det.append({
                         'animal1':tr['animal1'],'nombre1':ANIMALES.get(tr['animal1'],tr['animal1']),
@@ -1544,9 +3842,11 @@ def mis_tickets():
         tv = sum(t['total'] for t in tickets_out)
         return jsonify({
             'status':'ok',
-            'tickets':tickets_out,
+            'tickets':tabla(tickets_out),
             'totales':{'cantidad':len(tickets_out),'ventas':round(tv,2)}
         })
+    except RangoArchivoError as e:
+        return jsonify({'error':str(e)}),400
     except Exception as e:
         return jsonify({'error':str(e)}),500
 
@@ -1565,27 +3865,23 @@ def consultar_ticket_detalle():
             if not t: return jsonify({'error':'Ticket no encontrado'})
             t = dict(t)
             fecha_str = parse_fecha(t['fecha']).strftime("%d/%m/%Y")
-            res_rows_peru = db.execute("SELECT hora,animal FROM resultados WHERE fecha=%s AND loteria='peru'",(fecha_str,)).fetchall()
-            res_rows_plus = db.execute("SELECT hora,animal FROM resultados WHERE fecha=%s AND loteria='plus'",(fecha_str,)).fetchall()
-            res_dia_peru = {r['hora']:r['animal'] for r in res_rows_peru}
-            res_dia_plus = {r['hora']:r['animal'] for r in res_rows_plus}
+            res_fecha = resultados_por_loteria(db, fecha_str)
             jugadas_raw = db.execute("SELECT * FROM jugadas WHERE ticket_id=%s",(t['id'],)).fetchall()
             tripletas_raw = db.execute("SELECT * FROM tripletas WHERE ticket_id=%s",(t['id'],)).fetchall()
         premio_total=0; jdet=[]
         for j in jugadas_raw:
             lot_j = j['loteria'] if 'loteria' in j.keys() else 'peru'
-            res_dia = res_dia_plus if lot_j == 'plus' else res_dia_peru
-            wa=res_dia.get(j['hora']); gano=False; pj=0
+            wa=res_fecha[lot_j].get(j['hora']); gano=False; pj=0
             if wa:
                 if j['tipo']=='animal' and str(wa)==str(j['seleccion']):
-                    pj=calcular_premio_animal(j['monto'],wa); gano=True
+                    pj=calcular_premio_animal(j['monto'],wa,lot_j); gano=True
                 elif j['tipo']=='especial' and str(wa) not in ["0","00"]:
                     sel,num=j['seleccion'],int(wa)
                     if (sel=='ROJO' and str(wa) in ROJOS) or \
                        (sel=='NEGRO' and str(wa) not in ROJOS) or \
                        (sel=='PAR' and num%2==0) or \
                        (sel=='IMPAR' and num%2!=0):
-                        pj=j['monto']*PAGO_ESPECIAL; gano=True
+                        pj=j['monto']*pagos_de(lot_j)['especial']; gano=True
             if gano: premio_total+=pj
             jdet.append({
                 'tipo':j['tipo'],'hora':j['hora'],'seleccion':j['seleccion'],
@@ -1597,14 +3893,12 @@ def consultar_ticket_detalle():
             })
         tdet=[]
         fecha_ticket_dt = parse_fecha(t['fecha'])
-        res_validos_trip_peru = resultados_validos_para_tripleta(res_dia_peru, fecha_ticket_dt)
-        res_validos_trip_plus = resultados_validos_para_tripleta(res_dia_plus, fecha_ticket_dt)
         for tr in tripletas_raw:
             lot_tr = tr['loteria'] if 'loteria' in tr.keys() else 'peru'
-            res_validos_trip = res_validos_trip_plus if lot_tr == 'plus' else res_validos_trip_peru
+            res_validos_trip = resultados_validos_para_tripleta(res_fecha[lot_tr], fecha_ticket_dt)
             nums={tr['animal1'],tr['animal2'],tr['animal3']}
             salidos=list(dict.fromkeys([a for a in res_validos_trip.values() if a in nums]))
-            gano_t=len(salidos)==3; pt=tr['monto']*PAGO_TRIPLETA if gano_t else 0
+            gano_t=len(salidos)==3; pt=tr['monto']*pagos_de(lot_tr)['tripleta'] if gano_t else 0
             if gano_t: premio_total+=pt
             tdet.append({
                 'tipo':'tripleta',
@@ -1630,7 +3924,8 @@ def consultar_ticket_detalle():
 @login_required
 def verificar_ticket():
     try:
-        serial = request.json.get('serial')
+        serial = str(request.json.get('serial') or '').strip()
+        if not serial_valido(serial): return jsonify({'error':'Serial inválido, revise los dígitos'})
         with get_db() as db:
             t = db.execute("SELECT * FROM tickets WHERE serial=%s",(serial,)).fetchone()
             if not t: return jsonify({'error':'Ticket no existe'})
@@ -1657,6 +3952,7 @@ def pagar_ticket():
             db.execute("UPDATE tripletas SET pagado=1 WHERE ticket_id=%s",(tid,))
             db.commit()
         log_audit('PAGO', f"Ticket id:{tid} pagado")
+        publicar_evento('ticket', {'id': tid, 'accion': 'pago'})
         return jsonify({'status':'ok','mensaje':'Ticket pagado'})
     except Exception as e:
         return jsonify({'error':str(e)}),500
@@ -1665,7 +3961,8 @@ def pagar_ticket():
 @login_required
 def anular_ticket():
     try:
-        serial = request.json.get('serial')
+        serial = str(request.json.get('serial') or '').strip()
+        if not serial_valido(serial): return jsonify({'error':'Serial inválido, revise los dígitos'})
         with get_db() as db:
             t = db.execute("SELECT * FROM tickets WHERE serial=%s",(serial,)).fetchone()
             if not t: return jsonify({'error':'Ticket no existe'})
@@ -1679,13 +3976,22 @@ def anular_ticket():
                 jugs = db.execute("SELECT hora, loteria FROM jugadas WHERE ticket_id=%s",(t['id'],)).fetchall()
                 for j in jugs:
                     lot_j = j['loteria'] if 'loteria' in j.keys() else 'peru'
-                    cerrado = not puede_vender_plus(j['hora']) if lot_j == 'plus' else not puede_vender(j['hora'])
+                    cerrado = not puede_vender_en(lot_j, j['hora'])
                     if cerrado:
-                        lot_label = 'PLUS' if lot_j == 'plus' else 'PERÚ'
+                        lot_label = etiqueta_loteria(lot_j)
                         return jsonify({'error':f"No se puede anular: el sorteo {j['hora']} ({lot_label}) ya cerró"})
             db.execute("UPDATE tickets SET anulado=1 WHERE id=%s",(t['id'],))
+            db.execute("UPDATE jugadas SET anulado=1 WHERE ticket_id=%s",(t['id'],))
+            en_riesgo = sorted({(r['loteria'], r['fecha_dia']) for r in db.execute("""SELECT loteria, fecha_dia FROM tripletas
+                    WHERE ticket_id=%s AND anulado=0""", (t['id'],)).fetchall()})
+            for lot_t, _ in en_riesgo:
+                db.bloquear(f'riesgo_{lot_t}')
+            db.execute("UPDATE tripletas SET anulado=1, faltante=NULL WHERE ticket_id=%s",(t['id'],))
+            for lot_t, dia_t in en_riesgo:
+                escribir_riesgo_tripletas(db, dia_t, lot_t)
             db.commit()
         log_audit('ANULACION', f"Ticket serial:{serial} anulado")
+        publicar_evento('ticket', {'id': t['id'], 'accion': 'anulacion'})
         return jsonify({'status':'ok','mensaje':'Ticket anulado correctamente'})
     except Exception as e:
         return jsonify({'error':str(e)}),500
@@ -1731,8 +4037,10 @@ def caja_historico():
         with get_db() as db:
             ag = db.execute("SELECT comision FROM agencias WHERE id=%s",(session['user_id'],)).fetchone()
             com_pct = ag['comision'] if ag else COMISION_AGENCIA
-            tickets = db.execute("SELECT * FROM tickets WHERE agencia_id=%s AND anulado=0 ORDER BY id DESC LIMIT 2000",
-                                (session['user_id'],)).fetchall()
+            db.con_archivo(fi, ff)
+            tickets = db.execute(f"""SELECT * FROM {db.tabla('tickets')} WHERE agencia_id=%s AND anulado=0
+                                     AND fecha_dia >= %s AND fecha_dia <= %s ORDER BY id DESC LIMIT 2000""",
+                                (session['user_id'], fi, ff)).fetchall()
             dias={}; tv=0; tp=0
             for t in tickets:
                 dt=parse_fecha(t['fecha'])
@@ -1769,6 +4077,8 @@ def caja_historico():
                 'balance':round(tv-tp-tc,2)
             }
         })
+    except RangoArchivoError as e:
+        return jsonify({'error':str(e)}),400
     except Exception as e:
         return jsonify({'error':str(e)}),500
 
@@ -1782,7 +4092,7 @@ def caja_historico():
 def secuencia_sugerida():
     try:
         loteria = request.args.get('loteria', 'peru')
-        fecha = ahora_venezuela().strftime("%d/%m/%Y") if loteria == 'plus' else ahora_peru().strftime("%d/%m/%Y")
+        fecha = ahora_loteria(loteria).strftime("%d/%m/%Y")
         with get_db() as db:
             todos = db.execute("""
                 SELECT animal, hora FROM resultados
@@ -1815,7 +4125,7 @@ def guardar_resultado():
         loteria = request.form.get('loteria','peru').strip()
         if animal not in ANIMALES:
             return jsonify({'error':'Animal inválido'}),400
-        horarios_validos = HORARIOS_PLUS if loteria == 'plus' else HORARIOS_PERU
+        horarios_validos = horarios_de(loteria)
         if hora not in horarios_validos:
             return jsonify({'error':'Hora inválida para esta lotería'}),400
         if fi:
@@ -1853,26 +4163,29 @@ def guardar_resultado():
             ).fetchone()
             if ya_salio:
                 nombre_animal = ANIMALES[animal]
-                lot_label = 'PLUS' if loteria=='plus' else 'PERU'
+                lot_label = etiqueta_loteria(loteria)
                 return jsonify({
                     'error': f'⚠️ El animal {animal}-{nombre_animal} ya salió hoy en {lot_label} en el sorteo de {ya_salio["hora"]}. '
                              f'Un animal no puede repetirse el mismo día.'
                 }), 400
+            previo = db.execute("SELECT animal FROM resultados WHERE fecha=%s AND hora=%s AND loteria=%s",
+                                (fecha, hora, loteria)).fetchone()
+            motivo = 'correccion' if previo and previo['animal'] != animal else 'manual'
             if USE_SQLITE:
-                db.execute("INSERT OR REPLACE INTO resultados (fecha,hora,animal,loteria) VALUES (?,?,?,?)",
-                    (fecha, hora, animal, loteria))
+                db.execute("INSERT OR REPLACE INTO resultados (fecha,hora,animal,loteria,hora_min) VALUES (?,?,?,?,?)",
+                    (fecha, hora, animal, loteria, hora_a_min(hora)))
             else:
-                db.execute("""INSERT INTO resultados (fecha,hora,animal,loteria) VALUES (%s,%s,%s,%s)
+                db.execute("""INSERT INTO resultados (fecha,hora,animal,loteria,hora_min) VALUES (%s,%s,%s,%s,%s)
                     ON CONFLICT(fecha,hora,loteria) DO UPDATE SET animal=EXCLUDED.animal""",
-                    (fecha, hora, animal, loteria))
+                    (fecha, hora, animal, loteria, hora_a_min(hora)))
             db.commit()
 
-        lot_label = 'PLUS' if loteria=='plus' else 'PERU'
+        lot_label = etiqueta_loteria(loteria)
         log_audit('RESULTADO', f"Loteria:{lot_label} Fecha:{fecha} Hora:{hora} Animal:{animal} ({ANIMALES[animal]}) [MANUAL]")
 
-        # ── NUEVO v4.1: actualizar bloqueos después de guardar ────────────────
-        registrar_bloqueos_historicos(fecha, loteria)
-        verificar_y_bloquear_tripletas(fecha, loteria)
+        publicar_evento('resultado', {'fecha': fecha, 'hora': hora, 'loteria': loteria,
+                                      'animal': animal, 'modo': 'manual'})
+        encolar_post_sorteo(fecha, loteria, hora, motivo)
 
         return jsonify({'status':'ok','mensaje':f'[{lot_label}] {hora} = {animal} ({ANIMALES[animal]})','fecha':fecha})
     except Exception as e:
@@ -1902,9 +4215,9 @@ def borrar_resultado():
                 (fecha, hora, loteria)
             )
             db.commit()
-        # Recalcular bloqueos históricos y tripletas tras borrar
-        registrar_bloqueos_historicos(fecha, loteria)
-        verificar_y_bloquear_tripletas(fecha, loteria)
+        publicar_evento('resultado', {'fecha': fecha, 'hora': hora, 'loteria': loteria,
+                                      'animal': None, 'borrado': True})
+        encolar_post_sorteo(fecha, loteria, hora, 'borrado')
         log_audit('BORRAR_RESULTADO', f"Resultado borrado: {fecha} {hora} {loteria}")
         return jsonify({'status': 'ok', 'mensaje': f'Resultado {hora} borrado'})
     except Exception as e:
@@ -1919,6 +4232,7 @@ def toggle_autosorteo():
         if nuevo_estado not in ('on', 'off'):
             return jsonify({'error': 'Estado inválido'}), 400
         set_config('auto_sorteo', nuevo_estado)
+        publicar_evento('autosorteo', {'estado': nuevo_estado})
         estado_label = 'ACTIVADO ✅' if nuevo_estado == 'on' else 'DESACTIVADO ⛔'
         log_audit('AUTO_SORTEO_TOGGLE', f"Auto-sorteo {estado_label}")
         return jsonify({'status': 'ok', 'estado': nuevo_estado, 'mensaje': f'Auto-sorteo {estado_label}'})
@@ -1931,6 +4245,24 @@ def estado_autosorteo():
     estado = get_config('auto_sorteo', 'off')
     return jsonify({'estado': estado})
 
+@app.route('/admin/metricas')
+@admin_required
+def metricas():
+    """Métricas de este worker: cache de reportes y liderazgo del scheduler."""
+    try:
+        with get_db() as db:
+            lider = db.execute("SELECT pid, host, started, heartbeat FROM scheduler_lock WHERE id=1").fetchone()
+    except Exception:
+        lider = None
+    return jsonify({'pid': os.getpid(), 'cache_reportes': _cache_reportes.estado(),
+                    'recuperacion': _metricas_recuperacion,
+                    'scheduler': {'es_lider': _lider_scheduler.es_lider, 'lider': dict(lider) if lider else None},
+                    'sqlite': {'perfil': SQLITE_PERFIL, 'pragmas': pragmas_sqlite(), **_metricas_sqlite} if USE_SQLITE else None,
+                    'replica': dict(_estado_replica, activa=REPLICA_ACTIVA, retraso_max=REPLICA_RETRASO_MAX),
+                    'post_sorteo': _pipeline_post_sorteo.estado(),
+                    'trabajos_reporte': {'hilos': REPORTES_HILOS, 'cola_max': REPORTES_COLA_MAX,
+                                         'en_curso': _pool_reportes['en_curso'] if _pool_reportes['pid'] == os.getpid() else 0}})
+
 @app.route('/admin/forzar-autosorteo', methods=['POST'])
 @admin_required
 def forzar_autosorteo():
@@ -1938,10 +4270,12 @@ def forzar_autosorteo():
         data = request.get_json() or {}
         hora = data.get('hora')
         loteria = data.get('loteria', 'peru')
-        horarios_validos = HORARIOS_PLUS if loteria == 'plus' else HORARIOS_PERU
+        horarios_validos = horarios_de(loteria)
         if hora not in horarios_validos:
             return jsonify({'error': 'Hora inválida'}), 400
-        ejecutar_auto_sorteo(hora, loteria)
+        res = correr_sorteo(hora, loteria, 'forzado')
+        if res.get('resultado') in ('timeout', 'omitido'):
+            return jsonify({'error': res['error']}), 504 if res['resultado'] == 'timeout' else 409
         fecha_hoy = ahora_peru().strftime("%d/%m/%Y")
         with get_db() as db:
             res = db.execute(
@@ -1961,6 +4295,29 @@ def forzar_autosorteo():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/admin/sorteo-ejecuciones')
+@admin_required
+def sorteo_ejecuciones():
+    try:
+        fecha = request.args.get('fecha')
+        loteria = request.args.get('loteria')
+        limite = min(int(request.args.get('limite', 50)), 500)
+        filtros, params = [], []
+        if fecha:
+            filtros.append("fecha=%s")
+            params.append(datetime.strptime(fecha, "%Y-%m-%d").strftime("%d/%m/%Y"))
+        if loteria:
+            filtros.append("loteria=%s")
+            params.append(loteria)
+        where = f"WHERE {' AND '.join(filtros)}" if filtros else ""
+        with get_db() as db:
+            rows = db.execute(f"""SELECT id, fecha, loteria, hora, origen, inicio, fin, ms, resultado, animal,
+                    total_vendido, premio, error, pid, host
+                FROM sorteo_ejecuciones {where} ORDER BY id DESC LIMIT %s""", (*params, limite)).fetchall()
+        return jsonify({'status': 'ok', 'ejecuciones': [dict(r, nombre=ANIMALES.get(r['animal'])) for r in rows]})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ── NUEVO v4.1: Rutas de bloqueos automáticos ─────────────────────────────────
 
 @app.route('/admin/bloqueos-estado')
@@ -2058,6 +4415,7 @@ def desbloquear_historico():
                     (numero, loteria, clave_excluido)
                 )
             db.commit()
+        publicar_evento('bloqueos', {'loteria': loteria})
         log_audit('DESBLOQUEO_HIST', f"Número {numero}-{ANIMALES.get(numero,'?')} desbloqueado del histórico ({loteria.upper()})")
         return jsonify({'status': 'ok', 'mensaje': f'Número {numero}-{ANIMALES.get(numero,"?")} desbloqueado — puede salir hoy'})
     except Exception as e:
@@ -2077,6 +4435,7 @@ def desbloquear_tripleta():
                 (numero, loteria, hoy)
             )
             db.commit()
+        publicar_evento('bloqueos', {'loteria': loteria})
         log_audit('DESBLOQUEO_TRIP', f"Número {numero}-{ANIMALES.get(numero,'?')} desbloqueado de bloqueo tripleta ({loteria.upper()})")
         return jsonify({'status': 'ok', 'mensaje': f'Número {numero}-{ANIMALES.get(numero,"?")} desbloqueado — ahora puede salir manualmente'})
     except Exception as e:
@@ -2098,7 +4457,7 @@ def reporte_7030():
             except:
                 fecha = ahora_peru().strftime("%d/%m/%Y")
 
-        horarios = HORARIOS_PLUS if loteria == 'plus' else HORARIOS_PERU
+        horarios = horarios_de(loteria)
 
         with get_db() as db:
             acum_rows = db.execute("""
@@ -2117,12 +4476,11 @@ def reporte_7030():
             res_map = {r['hora']: r['animal'] for r in res_rows}
 
             total_por_hora = db.execute("""
-                SELECT jg.hora, COALESCE(SUM(jg.monto), 0) as total
-                FROM jugadas jg
-                JOIN tickets tk ON jg.ticket_id = tk.id
-                WHERE SUBSTR(tk.fecha, 1, 10) = %s AND jg.loteria=%s AND tk.anulado=0
-                GROUP BY jg.hora
-            """, (fecha, loteria)).fetchall()
+                SELECT hora, COALESCE(SUM(monto), 0) as total
+                FROM jugadas
+                WHERE fecha_dia=%s AND loteria=%s AND anulado=0
+                GROUP BY hora
+            """, (a_dia_iso(fecha), loteria)).fetchall()
             vendido_map = {r['hora']: float(r['total']) for r in total_por_hora}
 
         sorteos = []
@@ -2150,35 +4508,38 @@ def reporte_7030():
                     try:
                         with get_db() as db2:
                             ap_row = db2.execute("""
-                                SELECT COALESCE(SUM(jg.monto),0) as ap
-                                FROM jugadas jg JOIN tickets tk ON jg.ticket_id=tk.id
-                                WHERE jg.hora=%s AND jg.seleccion=%s AND jg.tipo='animal'
-                                AND jg.loteria=%s AND tk.anulado=0 AND SUBSTR(tk.fecha, 1, 10) = %s
-                            """, (hora, animal, loteria, fecha)).fetchone()
+                                SELECT COALESCE(SUM(monto),0) as ap
+                                FROM jugadas
+                                WHERE fecha_dia=%s AND lot_cod=%s AND hora_min=%s AND tipo_cod=%s AND sel_cod=%s
+                                AND anulado=0
+                            """, (a_dia_iso(fecha), LOT_COD.get(loteria), hora_a_min(hora),
+                                  TIPO_COD['animal'], SEL_COD.get(animal))).fetchone()
                             ap_animal = float(ap_row['ap']) if ap_row else 0
-                        mult = 70 if animal == '40' else 35
+                        pagos = pagos_de(loteria)
+                        mult = pagos['lechuza'] if animal == '40' else pagos['animal']
                         premio = round(ap_animal * mult, 2)
                         try:
                             with get_db() as db3:
                                 esp_rows = db3.execute("""
-                                    SELECT jg.seleccion, COALESCE(SUM(jg.monto),0) as monto
-                                    FROM jugadas jg JOIN tickets tk ON jg.ticket_id=tk.id
-                                    WHERE jg.hora=%s AND jg.tipo='especial' AND jg.loteria=%s
-                                    AND tk.anulado=0 AND SUBSTR(tk.fecha, 1, 10) = %s
-                                    GROUP BY jg.seleccion
-                                """, (hora, loteria, fecha)).fetchall()
-                            esp_map_h = {r['seleccion']: float(r['monto']) for r in esp_rows}
+                                    SELECT sel_cod, COALESCE(SUM(monto),0) as monto
+                                    FROM jugadas
+                                    WHERE fecha_dia=%s AND lot_cod=%s AND hora_min=%s AND tipo_cod=%s
+                                    AND anulado=0
+                                    GROUP BY sel_cod
+                                """, (a_dia_iso(fecha), LOT_COD.get(loteria), hora_a_min(hora),
+                                      TIPO_COD['especial'])).fetchall()
+                            esp_map_h = {sel_txt(r['sel_cod']): float(r['monto']) for r in esp_rows}
                             if animal not in ['0','00']:
                                 num = int(animal)
                                 rojos_set = set(ROJOS)
                                 if animal in rojos_set:
-                                    premio += esp_map_h.get('ROJO', 0) * 2
+                                    premio += esp_map_h.get('ROJO', 0) * pagos['especial']
                                 else:
-                                    premio += esp_map_h.get('NEGRO', 0) * 2
+                                    premio += esp_map_h.get('NEGRO', 0) * pagos['especial']
                                 if num % 2 == 0:
-                                    premio += esp_map_h.get('PAR', 0) * 2
+                                    premio += esp_map_h.get('PAR', 0) * pagos['especial']
                                 else:
-                                    premio += esp_map_h.get('IMPAR', 0) * 2
+                                    premio += esp_map_h.get('IMPAR', 0) * pagos['especial']
                             premio = round(premio, 2)
                         except:
                             pass
@@ -2234,21 +4595,24 @@ def reporte_7030():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/resultados-fecha-admin', methods=['POST'])
+@app.route('/api/resultados-fecha-admin', methods=['GET','POST'])
 @admin_required
 def resultados_fecha_admin():
-    data = request.get_json() or {}
+    data = request.args if request.method == 'GET' else (request.get_json() or {})
     fs = data.get('fecha')
     loteria = data.get('loteria', 'peru')
-    horarios = HORARIOS_PLUS if loteria == 'plus' else HORARIOS_PERU
-    try: fecha_str = datetime.strptime(fs,"%Y-%m-%d").strftime("%d/%m/%Y")
-    except: fecha_str = ahora_peru().strftime("%d/%m/%Y")
-    with get_db() as db:
-        rows = db.execute("SELECT hora,animal FROM resultados WHERE fecha=%s AND loteria=%s",(fecha_str, loteria)).fetchall()
-    rd={r['hora']:{'animal':r['animal'],'nombre':ANIMALES.get(r['animal'],'?')} for r in rows}
-    for h in horarios:
-        if h not in rd: rd[h]=None
-    return jsonify({'status':'ok','fecha_consulta':fecha_str,'resultados':rd})
+    horarios = horarios_de(loteria)
+    try: fecha_obj = datetime.strptime(fs,"%Y-%m-%d")
+    except: fecha_obj = ahora_peru()
+    fecha_str = fecha_obj.strftime("%d/%m/%Y")
+    def construir():
+        with get_db() as db:
+            rows = db.execute("SELECT hora,animal FROM resultados WHERE fecha=%s AND loteria=%s",(fecha_str, loteria)).fetchall()
+        rd={r['hora']:{'animal':r['animal'],'nombre':ANIMALES.get(r['animal'],'?')} for r in rows}
+        for h in horarios:
+            if h not in rd: rd[h]=None
+        return jsonify({'status':'ok','fecha_consulta':fecha_str,'resultados':rd})
+    return responder_resultados(f"admin|{fecha_str}|{loteria}", fecha_obj, (loteria,), construir, revalidar=True)
 
 @app.route('/admin/lista-admins')
 @superadmin_required
@@ -2402,7 +4766,7 @@ def eliminar_agencia():
 def get_topes():
     try:
         loteria = request.args.get('loteria', 'peru')
-        horarios = HORARIOS_PLUS if loteria == 'plus' else HORARIOS_PERU
+        horarios = horarios_de(loteria)
         hora = request.args.get('hora', horarios[0])
         hoy = ahora_peru().strftime("%d/%m/%Y")
         with get_db() as db:
@@ -2411,14 +4775,12 @@ def get_topes():
                 (hora, loteria)
             ).fetchall()
             jugadas_rows = db.execute("""
-                SELECT jg.seleccion, COALESCE(SUM(jg.monto),0) as apostado
-                FROM jugadas jg
-                JOIN tickets tk ON jg.ticket_id=tk.id
-                WHERE jg.hora=%s AND jg.tipo='animal' AND jg.loteria=%s AND tk.anulado=0 AND SUBSTR(tk.fecha, 1, 10) = %s
-                GROUP BY jg.seleccion
-                ORDER BY jg.seleccion
-            """, (hora, loteria, hoy)).fetchall()
-        apostado_map = {r['seleccion']: r['apostado'] for r in jugadas_rows}
+                SELECT sel_cod, COALESCE(SUM(monto),0) as apostado
+                FROM jugadas
+                WHERE fecha_dia=%s AND lot_cod=%s AND hora_min=%s AND tipo_cod=%s AND anulado=0
+                GROUP BY sel_cod
+            """, (a_dia_iso(hoy), LOT_COD.get(loteria), hora_a_min(hora), TIPO_COD['animal'])).fetchall()
+        apostado_map = {sel_txt(r['sel_cod']): r['apostado'] for r in jugadas_rows}
         topes_map = {r['numero']: r['monto_tope'] for r in topes_rows}
         numeros = sorted(set(list(topes_map.keys()) + list(apostado_map.keys())), key=lambda x: int(x) if x.isdigit() else -1)
         result = []
@@ -2444,7 +4806,7 @@ def guardar_tope():
         numero = str(data.get('numero',''))
         monto = float(data.get('monto', 0))
         loteria = data.get('loteria', 'peru')
-        horarios_validos = HORARIOS_PLUS if loteria == 'plus' else HORARIOS_PERU
+        horarios_validos = horarios_de(loteria)
         if hora not in horarios_validos:
             return jsonify({'error':'Hora inválida'}),400
         if numero not in ANIMALES:
@@ -2474,7 +4836,7 @@ def limpiar_topes():
         data = request.get_json() or {}
         hora = data.get('hora')
         loteria = data.get('loteria', 'peru')
-        horarios_validos = HORARIOS_PLUS if loteria == 'plus' else HORARIOS_PERU
+        horarios_validos = horarios_de(loteria)
         if hora not in horarios_validos:
             return jsonify({'error':'Hora inválida'}),400
         with get_db() as db:
@@ -2491,51 +4853,61 @@ def riesgo():
     try:
         hoy = ahora_peru().strftime("%d/%m/%Y")
         loteria = request.args.get('loteria', 'peru')
-        horarios = HORARIOS_PLUS if loteria == 'plus' else HORARIOS_PERU
-        now = ahora_venezuela() if loteria == 'plus' else ahora_peru()
-        am  = now.hour*60+now.minute
+        horarios = horarios_de(loteria)
+        am  = reloj_sorteos.minuto(loteria)
+        mins = _MIN_SORTEO.get(loteria) or _MIN_SORTEO['peru']
         hora_param = request.args.get('hora', '').strip()
         if hora_param and hora_param in horarios:
             sorteo = hora_param
         else:
             sorteo = None
             for h in horarios:
-                m = hora_a_min(h)
+                m = mins[h]
                 if am >= m-MINUTOS_BLOQUEO and am < m+60:
                     sorteo = h; break
             if not sorteo:
                 for h in horarios:
-                    if (hora_a_min(h)-am) > MINUTOS_BLOQUEO:
+                    if (mins[h]-am) > MINUTOS_BLOQUEO:
                         sorteo = h; break
             if not sorteo:
                 sorteo = horarios[-1]
+        dia = a_dia_iso(hoy)
         with get_db() as db:
-            _sc,_scp=_scope_and(db,'tk')
+            _sc,_scp=_scope_and(db,'jg')
             _own=_ids_agencias_admin(db); _own=set(_own) if _own is not None else None
             agencias_hora = db.execute("""
-                SELECT DISTINCT ag.id, ag.nombre_agencia, ag.usuario
+                SELECT ag.id, ag.nombre_agencia, ag.usuario
                 FROM agencias ag
-                JOIN tickets tk ON ag.id=tk.agencia_id
-                JOIN jugadas jg ON tk.id=jg.ticket_id
-                WHERE jg.hora=%s AND jg.loteria=%s AND tk.anulado=0 AND SUBSTR(tk.fecha, 1, 10) = %s
+                WHERE ag.id IN (SELECT jg.agencia_id FROM jugadas jg
+                                WHERE jg.fecha_dia=%s AND jg.lot_cod=%s AND jg.hora_min=%s AND jg.anulado=0)
                 ORDER BY ag.nombre_agencia
-            """, (sorteo, loteria, hoy)).fetchall()
-            jugadas_rows = db.execute("""
-                SELECT jg.seleccion, COALESCE(SUM(jg.monto),0) as apostado
+            """, (dia, LOT_COD.get(loteria), hora_a_min(sorteo))).fetchall()
+            jugadas_rows = [{'seleccion': sel_txt(r['sel_cod']), 'apostado': r['apostado']} for r in db.execute("""
+                SELECT jg.sel_cod, COALESCE(SUM(jg.monto),0) as apostado
                 FROM jugadas jg
-                JOIN tickets tk ON jg.ticket_id=tk.id
-                WHERE jg.hora=%s AND jg.tipo='animal' AND jg.loteria=%s AND tk.anulado=0 AND SUBSTR(tk.fecha, 1, 10) = %s"""+_sc+"""
-                GROUP BY jg.seleccion
-                ORDER BY jg.seleccion
-            """, tuple([sorteo, loteria, hoy]+_scp)).fetchall()
+                WHERE jg.fecha_dia=%s AND jg.lot_cod=%s AND jg.hora_min=%s AND jg.tipo_cod=%s AND jg.anulado=0"""+_sc+"""
+                GROUP BY jg.sel_cod
+            """, tuple([dia, LOT_COD.get(loteria), hora_a_min(sorteo), TIPO_COD['animal']]+_scp)).fetchall()]
             topes_rows = db.execute("SELECT numero, monto_tope FROM topes WHERE hora=%s AND loteria=%s", (sorteo, loteria)).fetchall()
             topes_map = {r['numero']: r['monto_tope'] for r in topes_rows}
+            if not _sc:
+                riesgo_trip = get_riesgo_tripletas(db, hoy, loteria)
+            else:
+                pago_trip = pagos_de(loteria)['tripleta']
+                riesgo_trip = {r['faltante']: {'tripletas': r['n'], 'apostado': round(float(r['apostado']), 2),
+                                               'premio': round(float(r['apostado']) * pago_trip, 2)}
+                               for r in db.execute("""
+                    SELECT tr.faltante, COUNT(*) as n, COALESCE(SUM(tr.monto),0) as apostado
+                    FROM tripletas tr
+                    WHERE tr.fecha_dia=%s AND tr.loteria=%s AND tr.anulado=0 AND tr.faltante IS NOT NULL"""+_scope_and(db,'tr')[0]+"""
+                    GROUP BY tr.faltante
+                """, tuple([dia, loteria]+_scp)).fetchall()}
         total = sum(r['apostado'] for r in jugadas_rows)
         riesgo_d = {}
         for r in jugadas_rows:
             sel = r['seleccion']
             monto = r['apostado']
-            mult = PAGO_LECHUZA if sel=="40" else PAGO_ANIMAL_NORMAL
+            mult = pagos_de(loteria)['lechuza'] if sel=="40" else pagos_de(loteria)['animal']
             riesgo_d[sel] = {
                 'nombre': ANIMALES.get(sel, sel),
                 'apostado': round(monto, 2),
@@ -2552,12 +4924,97 @@ def riesgo():
             'presupuesto_70': round(total * 0.70, 2),
             'minutos_cierre': MINUTOS_BLOQUEO,
             'agencias_hora': [dict(a) for a in agencias_hora if _own is None or a['id'] in _own],
+            'tripletas': sorted([dict(v, animal=k, nombre=ANIMALES.get(k, k)) for k, v in riesgo_trip.items()],
+                                key=lambda x: -x['premio']),
+            'riesgo_tripletas_total': round(sum(v['premio'] for v in riesgo_trip.values()), 2),
             'hora_seleccionada': sorteo,
             'loteria': loteria
         })
     except Exception as e:
         return jsonify({'error':str(e)}),500
 
+# ─── Matriz de exposición del día ────────────────────────────────────────────
+# /admin/riesgo-matriz entrega de una vez lo apostado (hora × animal) y los
+# especiales de todos los sorteos del día con una sola consulta agrupada. Los
+# montos van en céntimos enteros, las filas en el orden de horarios_de() y las
+# columnas en el de ANIMALES_MATRIZ / ESPECIALES_MATRIZ. La versión es la de
+# version_ventas(); con ?desde=<versión> se devuelven solo las celdas que
+# cambiaron si esa versión sigue en memoria, si no la matriz completa.
+RIESGO_MATRIZ_VERSIONES = int(os.environ.get('RIESGO_MATRIZ_VERSIONES', '32'))
+ANIMALES_MATRIZ   = list(ANIMALES)
+ESPECIALES_MATRIZ = ['ROJO', 'NEGRO', 'PAR', 'IMPAR']
+_matrices_riesgo = OrderedDict()
+_matrices_lock   = threading.Lock()
+
+def matriz_riesgo(db, dia, loteria, sc='', scp=()):
+    """{'apostado': [[céntimos por animal] por hora], 'especiales': [[céntimos por especial] por hora]}."""
+    horas = horarios_de(loteria)
+    fila = {_MIN_SORTEO[loteria][h]: i for i, h in enumerate(horas)}
+    col_an = {SEL_COD[a]: j for j, a in enumerate(ANIMALES_MATRIZ)}
+    col_esp = {SEL_COD[e]: j for j, e in enumerate(ESPECIALES_MATRIZ)}
+    apostado = [[0] * len(ANIMALES_MATRIZ) for _ in horas]
+    especiales = [[0] * len(ESPECIALES_MATRIZ) for _ in horas]
+    for r in db.execute("""
+        SELECT jg.hora_min, jg.tipo_cod, jg.sel_cod, COALESCE(SUM(jg.monto),0) as apostado
+        FROM jugadas jg
+        WHERE jg.fecha_dia=%s AND jg.lot_cod=%s AND jg.anulado=0"""+sc+"""
+        GROUP BY jg.hora_min, jg.tipo_cod, jg.sel_cod
+    """, tuple([dia, LOT_COD.get(loteria)] + list(scp))).fetchall():
+        i = fila.get(r['hora_min'])
+        if i is None:
+            continue
+        cent = int(round(float(r['apostado']) * 100))
+        if r['tipo_cod'] == TIPO_COD['animal'] and r['sel_cod'] in col_an:
+            apostado[i][col_an[r['sel_cod']]] = cent
+        elif r['tipo_cod'] == TIPO_COD['especial'] and r['sel_cod'] in col_esp:
+            especiales[i][col_esp[r['sel_cod']]] = cent
+    return {'apostado': apostado, 'especiales': especiales}
+
+def _delta_matriz(previa, actual):
+    """Celdas cambiadas como [k, fila, columna, céntimos]; k=0 animales, k=1 especiales."""
+    out = []
+    for k, nombre in enumerate(('apostado', 'especiales')):
+        for i, (fa, fb) in enumerate(zip(previa[nombre], actual[nombre])):
+            out += [[k, i, j, b] for j, (a, b) in enumerate(zip(fa, fb)) if a != b]
+    return out
+
+@app.route('/admin/riesgo-matriz')
+@superadmin_required
+@solo_lectura
+def riesgo_matriz():
+    try:
+        loteria = request.args.get('loteria', 'peru')
+        if loteria not in LOTERIAS:
+            return jsonify({'error': 'Lotería inválida'}), 400
+        hoy = ahora_peru().strftime("%d/%m/%Y")
+        dia = a_dia_iso(hoy)
+        version = '.'.join(str(v) for v in version_ventas())
+        desde = request.args.get('desde', '').strip()
+        with get_db() as db:
+            _sc, _scp = _scope_and(db, 'jg')
+            base = (dia, loteria, tuple(_scp))
+            with _matrices_lock:
+                actual = _matrices_riesgo.get(base + (version,))
+                previa = _matrices_riesgo.get(base + (desde,)) if desde else None
+            if actual is None:
+                actual = matriz_riesgo(db, dia, loteria, _sc, _scp)
+                with _matrices_lock:
+                    _matrices_riesgo[base + (version,)] = actual
+                    while len(_matrices_riesgo) > RIESGO_MATRIZ_VERSIONES:
+                        _matrices_riesgo.popitem(last=False)
+            res = {r['hora']: r['animal'] for r in db.execute(
+                "SELECT hora, animal FROM resultados WHERE fecha=%s AND loteria=%s", (hoy, loteria)).fetchall()}
+        out = {'version': version, 'loteria': loteria, 'fecha': hoy,
+               'resultados': [res.get(h) for h in horarios_de(loteria)]}
+        if previa is not None:
+            out['delta'] = _delta_matriz(previa, actual) if desde != version else []
+        else:
+            out.update(actual, horas=horarios_de(loteria), animales=ANIMALES_MATRIZ,
+                       especiales_cols=ESPECIALES_MATRIZ, pagos=pagos_de(loteria), unidad=100)
+        return jsonify(out)
+    except Exception as e:
+        return jsonify({'error':str(e)}),500
+
 @app.route('/admin/riesgo-agencia', methods=['POST'])
 @superadmin_required
 def riesgo_agencia():
@@ -2565,40 +5022,48 @@ def riesgo_agencia():
         data = request.get_json() or {}
         agencia_id = data.get('agencia_id')
         hora = data.get('hora')
+        loteria = data.get('loteria', 'peru')
         if not agencia_id or not hora:
             return jsonify({'error':'Parámetros requeridos'}),400
+        if loteria not in LOTERIAS:
+            return jsonify({'error':'Lotería inválida'}),400
         hoy = ahora_peru().strftime("%d/%m/%Y")
         with get_db() as db:
             _ag = db.execute("SELECT admin_id FROM agencias WHERE id=%s",(agencia_id,)).fetchone()
             if _ag and not session.get('es_superadmin') and (_ag['admin_id'] or 0) != session.get('user_id'):
                 return jsonify({'error':'Esta agencia pertenece a otro administrador'}),403
-            jugadas = db.execute("""
-                SELECT jg.seleccion, jg.tipo, COALESCE(SUM(jg.monto),0) as apostado, COUNT(*) as cnt
-                FROM jugadas jg
-                JOIN tickets tk ON jg.ticket_id=tk.id
-                WHERE tk.agencia_id=%s AND jg.hora=%s AND tk.anulado=0 AND SUBSTR(tk.fecha, 1, 10) = %s
-                GROUP BY jg.seleccion, jg.tipo
-                ORDER BY jg.seleccion
-            """, (agencia_id, hora, hoy)).fetchall()
+            jugadas = [{'seleccion': sel_txt(r['sel_cod']), 'tipo': tipo_txt(r['tipo_cod']),
+                        'apostado': r['apostado'], 'cnt': r['cnt']} for r in db.execute("""
+                SELECT sel_cod, tipo_cod, COALESCE(SUM(monto),0) as apostado, COUNT(*) as cnt
+                FROM jugadas
+                WHERE agencia_id=%s AND fecha_dia=%s AND lot_cod=%s AND hora_min=%s AND anulado=0
+                GROUP BY sel_cod, tipo_cod
+            """, (agencia_id, a_dia_iso(hoy), LOT_COD[loteria], hora_a_min(hora))).fetchall()]
+            jugadas.sort(key=lambda j: j['seleccion'])
             ag = db.execute("SELECT nombre_agencia FROM agencias WHERE id=%s", (agencia_id,)).fetchone()
+        pagos = pagos_de(loteria)
         result = []
         for j in jugadas:
-            mult = PAGO_LECHUZA if j['seleccion']=="40" else PAGO_ANIMAL_NORMAL
+            if j['tipo'] == 'animal':
+                mult = pagos['lechuza'] if j['seleccion']=="40" else pagos['animal']
+            else:
+                mult = pagos['especial']
             nombre = ANIMALES.get(j['seleccion'], j['seleccion']) if j['tipo']=='animal' else j['seleccion']
             result.append({
                 'seleccion': j['seleccion'],
                 'nombre': nombre,
                 'tipo': j['tipo'],
                 'apostado': round(j['apostado'], 2),
-                'pagaria': round(j['apostado']*mult, 2) if j['tipo']=='animal' else 0,
+                'pagaria': round(j['apostado']*mult, 2),
                 'tickets': j['cnt']
             })
-        return jsonify({'status':'ok','jugadas':result,'agencia':ag['nombre_agencia'] if ag else '?','hora':hora})
+        return jsonify({'status':'ok','jugadas':result,'agencia':ag['nombre_agencia'] if ag else '?','hora':hora,'loteria':loteria})
     except Exception as e:
         return jsonify({'error':str(e)}),500
 
 @app.route('/admin/reporte-agencia-horas', methods=['POST'])
 @admin_required
+@solo_lectura
 def reporte_agencia_horas():
     try:
         data = request.get_json() or {}
@@ -2613,35 +5078,41 @@ def reporte_agencia_horas():
             ag = db.execute("SELECT nombre_agencia, usuario, admin_id FROM agencias WHERE id=%s", (agencia_id,)).fetchone()
             if ag and not session.get('es_superadmin') and (ag['admin_id'] or 0) != session.get('user_id'):
                 return jsonify({'error':'Esta agencia pertenece a otro administrador'}),403
-            jugadas_rows = db.execute("""
-                SELECT jg.hora, jg.seleccion, jg.tipo, jg.monto, tk.fecha, tk.serial
-                FROM jugadas jg
-                JOIN tickets tk ON jg.ticket_id=tk.id
-                WHERE tk.agencia_id=%s AND tk.anulado=0
-                ORDER BY tk.fecha DESC
-            """, (agencia_id,)).fetchall()
+            db.con_archivo(fi, ff)
+            filas = db.execute(f"""
+                SELECT lot_cod, hora_min, tipo_cod, sel_cod,
+                       COALESCE(SUM(monto),0) as apostado, COUNT(*) as cnt
+                FROM {db.tabla('jugadas')}
+                WHERE agencia_id=%s AND fecha_dia BETWEEN %s AND %s AND anulado=0
+                GROUP BY lot_cod, hora_min, tipo_cod, sel_cod
+            """, (agencia_id, dti.strftime("%Y-%m-%d"), dtf.strftime("%Y-%m-%d"))).fetchall()
+        lot_de_cod = {cod: lot for lot, cod in LOT_COD.items()}
         por_hora = {}
-        for j in jugadas_rows:
-            dt = parse_fecha(j['fecha'])
-            if not dt or dt<dti or dt>dtf: continue
-            h = j['hora']
-            if h not in por_hora:
-                por_hora[h] = {'hora': h, 'total': 0, 'jugadas': [], 'conteo': 0}
-            nombre = ANIMALES.get(j['seleccion'], j['seleccion']) if j['tipo']=='animal' else j['seleccion']
-            por_hora[h]['total'] = round(por_hora[h]['total'] + j['monto'], 2)
-            por_hora[h]['conteo'] += 1
-            found = next((x for x in por_hora[h]['jugadas'] if x['seleccion']==j['seleccion'] and x['tipo']==j['tipo']), None)
-            if found:
-                found['apostado'] = round(found['apostado'] + j['monto'], 2)
-                found['cnt'] += 1
-            else:
-                por_hora[h]['jugadas'].append({'seleccion':j['seleccion'],'nombre':nombre,'tipo':j['tipo'],'apostado':round(j['monto'],2),'cnt':1})
+        for r in filas:
+            lot = lot_de_cod.get(r['lot_cod'], 'peru')
+            clave = (lot, r['hora_min'])
+            if clave not in por_hora:
+                hora = next((h for h, m in _MIN_SORTEO[lot].items() if m == r['hora_min']), None)
+                if hora is None:
+                    hr, mn = divmod(r['hora_min'] or 0, 60)
+                    hora = f"{(hr % 12) or 12:02d}:{mn:02d} {'PM' if hr >= 12 else 'AM'}"
+                por_hora[clave] = {'hora': hora, 'loteria': lot, 'etiqueta': etiqueta_loteria(lot),
+                                   'total': 0, 'jugadas': [], 'conteo': 0}
+            entry = por_hora[clave]
+            sel, tipo = sel_txt(r['sel_cod']), tipo_txt(r['tipo_cod'])
+            apostado = float(r['apostado'])
+            entry['total'] += apostado
+            entry['conteo'] += r['cnt']
+            entry['jugadas'].append({'seleccion': sel, 'tipo': tipo,
+                                     'nombre': ANIMALES.get(sel, sel) if tipo == 'animal' else sel,
+                                     'apostado': round(apostado, 2), 'cnt': r['cnt']})
+        orden = {lot: i for i, lot in enumerate(LOTERIAS)}
         resumen = []
-        for h in HORARIOS_PERU:
-            if h in por_hora:
-                entry = por_hora[h]
-                entry['jugadas'].sort(key=lambda x: int(x['seleccion']) if x['seleccion'].isdigit() else -1)
-                resumen.append(entry)
+        for clave in sorted(por_hora, key=lambda k: (orden.get(k[0], len(orden)), k[1] or 0)):
+            entry = por_hora[clave]
+            entry['total'] = round(entry['total'], 2)
+            entry['jugadas'].sort(key=lambda x: int(x['seleccion']) if x['seleccion'].isdigit() else -1)
+            resumen.append(entry)
         return jsonify({
             'status':'ok',
             'agencia': ag['nombre_agencia'] if ag else '?',
@@ -2649,11 +5120,14 @@ def reporte_agencia_horas():
             'resumen': resumen,
             'total_general': round(sum(x['total'] for x in resumen), 2)
         })
+    except RangoArchivoError as e:
+        return jsonify({'error':str(e)}),400
     except Exception as e:
         return jsonify({'error':str(e)}),500
 
 @app.route('/admin/audit-logs', methods=['POST'])
 @admin_required
+@solo_lectura
 def get_audit_logs():
     try:
         data = request.get_json() or {}
@@ -2682,12 +5156,13 @@ def get_audit_logs():
                 'detalle': r['detalle'] or '',
                 'ip': r['ip'] or ''
             })
-        return jsonify({'status':'ok','logs':result,'total':len(result)})
+        return jsonify({'status':'ok','logs':tabla(result),'total':len(result)})
     except Exception as e:
         return jsonify({'error':str(e)}),500
 
 @app.route('/admin/reporte-agencias')
 @admin_required
+@reporte_cacheado()
 def reporte_agencias():
     try:
         hoy = ahora_peru().strftime("%d/%m/%Y")
@@ -2731,6 +5206,7 @@ def reporte_agencias():
 
 @app.route('/admin/tripletas-hoy')
 @admin_required
+@reporte_cacheado()
 def tripletas_hoy():
     try:
         hoy=ahora_peru().strftime("%d/%m/%Y")
@@ -2741,17 +5217,14 @@ def tripletas_hoy():
                 JOIN tickets tk ON tr.ticket_id=tk.id
                 WHERE tr.fecha=%s
             """,(hoy,)).fetchall()
-            res_rows_peru=db.execute("SELECT hora,animal FROM resultados WHERE fecha=%s AND loteria='peru'",(hoy,)).fetchall()
-            res_rows_plus=db.execute("SELECT hora,animal FROM resultados WHERE fecha=%s AND loteria='plus'",(hoy,)).fetchall()
-            res_dia_peru={r['hora']:r['animal'] for r in res_rows_peru}
-            res_dia_plus={r['hora']:r['animal'] for r in res_rows_plus}
+            res_hoy=resultados_por_loteria(db, hoy)
             ags={ag['id']:ag['nombre_agencia'] for ag in db.execute("SELECT id,nombre_agencia FROM agencias").fetchall()}
             _own=_ids_agencias_admin(db); _own=set(_own) if _own is not None else None
         out=[]; ganadoras=0
         for tr in trips:
             if _own is not None and tr['agencia_id'] not in _own: continue
             lot_tr = tr['loteria'] if 'loteria' in tr.keys() else 'peru'
-            res_dia = res_dia_plus if lot_tr == 'plus' else res_dia_peru
+            res_dia = res_hoy[lot_tr]
             nums={tr['animal1'],tr['animal2'],tr['animal3']}
             fecha_compra_dt = parse_fecha(tr['fecha_ticket'])
             hora_compra_str = fecha_compra_dt.strftime("%I:%M %p").lstrip('0') if fecha_compra_dt else '?'
@@ -2767,7 +5240,7 @@ def tripletas_hoy():
                 'animal1':tr['animal1'],'animal2':tr['animal2'],'animal3':tr['animal3'],
                 'nombres':[ANIMALES.get(tr['animal1'],''),ANIMALES.get(tr['animal2'],''),ANIMALES.get(tr['animal3'],'')],
                 'monto':tr['monto'],
-                'premio':tr['monto']*PAGO_TRIPLETA if gano else 0,
+                'premio':tr['monto']*pagos_de(lot_tr)['tripleta'] if gano else 0,
                 'gano':gano,
                 'salieron':salidos,
                 'pagado':bool(tr['pagado']),
@@ -2778,7 +5251,7 @@ def tripletas_hoy():
                 'sorteos_totales': len(res_dia)
             })
         return jsonify({
-            'tripletas':out,
+            'tripletas':tabla(out),
             'total':len(out),
             'ganadoras':ganadoras,
             'total_premios':sum(x['premio'] for x in out)
@@ -2788,6 +5261,7 @@ def tripletas_hoy():
 
 @app.route('/admin/exportar-csv', methods=['POST'])
 @admin_required
+@solo_lectura
 def exportar_csv():
     try:
         data=request.get_json()
@@ -2797,7 +5271,8 @@ def exportar_csv():
         dtf=datetime.strptime(ff,"%Y-%m-%d").replace(hour=23,minute=59)
         with get_db() as db:
             ags=_filtrar_ags(db.execute("SELECT * FROM agencias WHERE es_admin=0").fetchall())
-            all_t=db.execute("SELECT * FROM tickets WHERE anulado=0 ORDER BY id DESC LIMIT 50000").fetchall()
+            db.con_archivo(fi,ff)
+            all_t=db.stream(f"SELECT id, fecha, agencia_id, total, pagado FROM {db.tabla('tickets')} WHERE anulado=0 AND fecha_dia >= %s AND fecha_dia <= %s ORDER BY id DESC",(fi,ff))
             stats={ag['id']:{
                 'nombre':ag['nombre_agencia'],
                 'usuario':ag['usuario'],
@@ -2839,11 +5314,14 @@ def exportar_csv():
             mimetype='text/csv',
             headers={'Content-Disposition':f'attachment; filename=reporte_{fi}_{ff}.csv'}
         )
+    except RangoArchivoError as e:
+        return jsonify({'error':str(e)}),400
     except Exception as e:
         return jsonify({'error':str(e)}),500
 
 @app.route('/admin/estadisticas-rango', methods=['POST'])
 @admin_required
+@solo_lectura
 def estadisticas_rango():
     try:
         data=request.get_json()
@@ -2854,7 +5332,8 @@ def estadisticas_rango():
         dti=datetime.strptime(fi,"%Y-%m-%d")
         dtf=datetime.strptime(ff,"%Y-%m-%d").replace(hour=23,minute=59)
         with get_db() as db:
-            all_t=db.execute("SELECT * FROM tickets WHERE anulado=0 ORDER BY id DESC LIMIT 10000").fetchall()
+            db.con_archivo(fi,ff)
+            all_t=db.stream(f"SELECT id, fecha, agencia_id, total FROM {db.tabla('tickets')} WHERE anulado=0 AND fecha_dia >= %s AND fecha_dia <= %s ORDER BY id DESC",(fi,ff))
             _own=_ids_agencias_admin(db); _own=set(_own) if _own is not None else None
             dias={}; total_v=total_p=total_t=0
             for t in all_t:
@@ -2878,10 +5357,10 @@ def estadisticas_rango():
                     prem+=calcular_premio_ticket(tid,db)
                 total_p+=prem
                 _sc,_scp=_scope_and(db,'tk')
-                trip_row=db.execute("""
+                trip_row=db.execute(f"""
                     SELECT COALESCE(SUM(tr.monto),0) as total_trip
-                    FROM tripletas tr
-                    JOIN tickets tk ON tr.ticket_id=tk.id
+                    FROM {db.tabla('tripletas')} tr
+                    JOIN {db.tabla('tickets')} tk ON tr.ticket_id=tk.id
                     WHERE SUBSTR(tr.fecha,1,10)=%s AND tk.anulado=0"""+_sc+"""
                 """, tuple([d['fecha_raw']]+_scp)).fetchone()
                 trip_monto=round(float(trip_row['total_trip']),2) if trip_row else 0
@@ -2908,11 +5387,15 @@ def estadisticas_rango():
                 'tickets':total_t
             }
         })
+    except RangoArchivoError as e:
+        return jsonify({'error':str(e)}),400
     except Exception as e:
         return jsonify({'error':str(e)}),500
 
 @app.route('/admin/reporte-agencias-rango', methods=['POST'])
 @admin_required
+@solo_lectura
+@reporte_cacheado()
 def reporte_agencias_rango():
     try:
         data=request.get_json()
@@ -2924,7 +5407,8 @@ def reporte_agencias_rango():
         dtf=datetime.strptime(ff,"%Y-%m-%d").replace(hour=23,minute=59)
         with get_db() as db:
             ags=_filtrar_ags(db.execute("SELECT * FROM agencias WHERE es_admin=0").fetchall())
-            all_t=db.execute("SELECT * FROM tickets WHERE anulado=0 ORDER BY id DESC LIMIT 50000").fetchall()
+            db.con_archivo(fi,ff)
+            all_t=db.stream(f"SELECT id, fecha, agencia_id, total, pagado FROM {db.tabla('tickets')} WHERE anulado=0 AND fecha_dia >= %s AND fecha_dia <= %s ORDER BY id DESC",(fi,ff))
             stats={ag['id']:{
                 'nombre':ag['nombre_agencia'],
                 'usuario':ag['usuario'],
@@ -2964,13 +5448,95 @@ def reporte_agencias_rango():
             'balance':round(sum(x['balance'] for x in out),2)
         }
         return jsonify({
-            'agencias':out,
+            'agencias':tabla(out),
             'total':total,
             'periodo':{'inicio':fi,'fin':ff}
         })
+    except RangoArchivoError as e:
+        return jsonify({'error':str(e)}),400
     except Exception as e:
         return jsonify({'error':str(e)}),500
 
+@app.route('/admin/reportes/trabajos', methods=['POST'])
+@admin_required
+def crear_trabajo_reporte():
+    try:
+        data = request.get_json() or {}
+        tipo = data.get('tipo')
+        if tipo not in TRABAJOS_REPORTE:
+            return jsonify({'error': 'Tipo de reporte inválido'}), 400
+        tid = encolar_trabajo_reporte(tipo, data.get('parametros') or {})
+        if not tid:
+            return jsonify({'error': 'Hay demasiados reportes en proceso, intente en unos minutos'}), 429
+        return jsonify({'status': 'ok', 'id': tid, 'estado': 'pendiente'}), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/reportes/trabajos', methods=['GET'])
+@admin_required
+def lista_trabajos_reporte():
+    try:
+        with get_db() as db:
+            rows = db.execute("""SELECT id, tipo, parametros, estado, progreso, error, creado, terminado, expira
+                FROM trabajos_reporte WHERE usuario_id=%s AND expira >= %s ORDER BY creado DESC LIMIT 20""",
+                (session.get('user_id'), time.time())).fetchall()
+        return jsonify({'status': 'ok', 'trabajos': [_trabajo_json(r) for r in rows]})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/reportes/trabajos/<tid>', methods=['GET'])
+@admin_required
+def estado_trabajo_reporte(tid):
+    try:
+        with get_db() as db:
+            r = _trabajo_visible(db, tid)
+        if not r:
+            return jsonify({'error': 'Trabajo no encontrado'}), 404
+        return jsonify(_trabajo_json(r))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/reportes/trabajos/<tid>/descarga', methods=['GET'])
+@admin_required
+def descargar_trabajo_reporte(tid):
+    try:
+        with get_db() as db:
+            r = _trabajo_visible(db, tid, "id, tipo, parametros, estado, creado, expira, resultado, mimetype")
+        if not r or r['expira'] < time.time():
+            return jsonify({'error': 'Trabajo no encontrado o expirado'}), 404
+        if r['estado'] != 'listo':
+            return jsonify({'error': 'El reporte aún no está listo', 'estado': r['estado']}), 409
+        resp = Response(r['resultado'], mimetype=r['mimetype'])
+        if r['tipo'] == 'exportar_csv':
+            p = json.loads(r['parametros'] or '{}')
+            resp.headers['Content-Disposition'] = f"attachment; filename=reporte_{p.get('fecha_inicio')}_{p.get('fecha_fin')}.csv"
+        return resp
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/admin/liquidaciones', methods=['GET'])
+@admin_required
+def get_liquidaciones():
+    try:
+        fecha = request.args.get('fecha') or ahora_peru().strftime("%Y-%m-%d")
+        loteria = request.args.get('loteria', 'peru')
+        with get_db() as db:
+            ids = _ids_agencias_admin(db)
+            rows = db.execute("""SELECT lq.hora, lq.agencia_id, ag.nombre_agencia, lq.animal,
+                    lq.apostado, lq.premios, lq.ganadoras, lq.calculado
+                FROM liquidaciones lq LEFT JOIN agencias ag ON ag.id = lq.agencia_id
+                WHERE lq.fecha_dia=%s AND lq.loteria=%s ORDER BY lq.hora, lq.agencia_id""",
+                (fecha, loteria)).fetchall()
+            etapas = db.execute("""SELECT hora, motivo, etapa, estado, intentos, ms, error, creado
+                FROM post_sorteo_etapas WHERE fecha=%s AND loteria=%s ORDER BY id DESC LIMIT 100""",
+                (datetime.strptime(fecha, "%Y-%m-%d").strftime("%d/%m/%Y"), loteria)).fetchall()
+        if ids is not None:
+            rows = [r for r in rows if r['agencia_id'] in ids]
+        return jsonify({'status': 'ok', 'fecha': fecha, 'loteria': loteria,
+                        'liquidaciones': rows, 'etapas': etapas if ids is None else []})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/admin/numeros-bloqueados', methods=['GET'])
 @admin_required
 def get_numeros_bloqueados():
@@ -3018,74 +5584,85 @@ def toggle_numero_bloqueado():
                     )
                 accion = 'bloqueado'
             db.commit()
+        publicar_evento('bloqueos', {'loteria': loteria})
         log_audit(f"Número {numero} {accion} en {loteria}")
         return jsonify({'status': 'ok', 'accion': accion, 'numero': numero})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/public/resultados-hoy')
+@solo_lectura
 def public_resultados_hoy():
     try:
-        hoy_peru = ahora_peru().strftime("%d/%m/%Y")
+        ahora = ahora_peru()
+        hoy_peru = ahora.strftime("%d/%m/%Y")
         hoy_ven  = ahora_venezuela().strftime("%d/%m/%Y")
-        with get_db() as db:
-            peru_rows = db.execute(
-                "SELECT hora, animal FROM resultados WHERE fecha=%s AND loteria='peru'", (hoy_peru,)
-            ).fetchall()
-            plus_rows = db.execute(
-                "SELECT hora, animal FROM resultados WHERE fecha=%s AND loteria='plus'", (hoy_ven,)
-            ).fetchall()
-        def hora_to_24h(hora_str):
-            try:
-                dt = datetime.strptime(hora_str.strip(), "%I:%M %p")
-                return dt.strftime("%H:%M")
-            except:
-                return hora_str
-        peru_map  = {hora_to_24h(r['hora']): r['animal'] for r in peru_rows}
-        plus_map  = {hora_to_24h(r['hora']): r['animal'] for r in plus_rows}
-        return jsonify({
-            'status': 'ok',
-            'fecha_peru': hoy_peru,
-            'fecha_venezuela': hoy_ven,
-            'peru': peru_map,
-            'venezuela': plus_map,
-            'updated_at': ahora_peru().strftime("%d/%m/%Y %I:%M %p")
-        }), 200, {'Access-Control-Allow-Origin': '*', 'Cache-Control': 'no-cache'}
+        def construir():
+            with get_db() as db:
+                peru_rows = db.execute(
+                    "SELECT hora, animal FROM resultados WHERE fecha=%s AND loteria='peru'", (hoy_peru,)
+                ).fetchall()
+                plus_rows = db.execute(
+                    "SELECT hora, animal FROM resultados WHERE fecha=%s AND loteria='plus'", (hoy_ven,)
+                ).fetchall()
+            def hora_to_24h(hora_str):
+                try:
+                    dt = datetime.strptime(hora_str.strip(), "%I:%M %p")
+                    return dt.strftime("%H:%M")
+                except:
+                    return hora_str
+            peru_map  = {hora_to_24h(r['hora']): r['animal'] for r in peru_rows}
+            plus_map  = {hora_to_24h(r['hora']): r['animal'] for r in plus_rows}
+            return jsonify({
+                'status': 'ok',
+                'fecha_peru': hoy_peru,
+                'fecha_venezuela': hoy_ven,
+                'peru': peru_map,
+                'venezuela': plus_map,
+                'updated_at': ahora_peru().strftime("%d/%m/%Y %I:%M %p")
+            })
+        return responder_resultados(f"pub-hoy|{hoy_peru}|{hoy_ven}", ahora, ('peru', 'plus'),
+                                    construir, publico=True)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/public/resultados-fecha')
+@solo_lectura
 def public_resultados_fecha():
     try:
         fecha_param = request.args.get('fecha')
         if not fecha_param:
-            fecha_peru = ahora_peru().strftime("%d/%m/%Y")
+            fecha_dt   = ahora_peru()
+            fecha_peru = fecha_dt.strftime("%d/%m/%Y")
             fecha_ven  = ahora_venezuela().strftime("%d/%m/%Y")
         else:
-            dt = datetime.strptime(fecha_param, "%Y-%m-%d")
-            fecha_peru = dt.strftime("%d/%m/%Y")
-            fecha_ven  = dt.strftime("%d/%m/%Y")
-        with get_db() as db:
-            peru_rows = db.execute(
-                "SELECT hora, animal FROM resultados WHERE fecha=%s AND loteria='peru'", (fecha_peru,)
-            ).fetchall()
-            plus_rows = db.execute(
-                "SELECT hora, animal FROM resultados WHERE fecha=%s AND loteria='plus'", (fecha_ven,)
-            ).fetchall()
-        def hora_to_24h(hora_str):
-            try:
-                dt = datetime.strptime(hora_str.strip(), "%I:%M %p")
-                return dt.strftime("%H:%M")
-            except:
-                return hora_str
-        peru_map = {hora_to_24h(r['hora']): r['animal'] for r in peru_rows}
-        plus_map = {hora_to_24h(r['hora']): r['animal'] for r in plus_rows}
-        return jsonify({
-            'status': 'ok',
-            'fecha': fecha_param or ahora_peru().strftime("%Y-%m-%d"),
-            'peru': peru_map,
-            'venezuela': plus_map,
-        }), 200, {'Access-Control-Allow-Origin': '*', 'Cache-Control': 'no-cache'}
+            fecha_dt   = datetime.strptime(fecha_param, "%Y-%m-%d")
+            fecha_peru = fecha_dt.strftime("%d/%m/%Y")
+            fecha_ven  = fecha_dt.strftime("%d/%m/%Y")
+        def construir():
+            with get_db() as db:
+                peru_rows = db.execute(
+                    "SELECT hora, animal FROM resultados WHERE fecha=%s AND loteria='peru'", (fecha_peru,)
+                ).fetchall()
+                plus_rows = db.execute(
+                    "SELECT hora, animal FROM resultados WHERE fecha=%s AND loteria='plus'", (fecha_ven,)
+                ).fetchall()
+            def hora_to_24h(hora_str):
+                try:
+                    dt = datetime.strptime(hora_str.strip(), "%I:%M %p")
+                    return dt.strftime("%H:%M")
+                except:
+                    return hora_str
+            peru_map = {hora_to_24h(r['hora']): r['animal'] for r in peru_rows}
+            plus_map = {hora_to_24h(r['hora']): r['animal'] for r in plus_rows}
+            return jsonify({
+                'status': 'ok',
+                'fecha': fecha_param or ahora_peru().strftime("%Y-%m-%d"),
+                'peru': peru_map,
+                'venezuela': plus_map,
+            })
+        return responder_resultados(f"pub-fecha|{fecha_peru}|{fecha_ven}", fecha_dt, ('peru', 'plus'),
+                                    construir, publico=True)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -3162,814 +5739,36 @@ body{background:#050a12;min-height:100vh;display:flex;align-items:center;justify
 </div></body></html>'''
 
 
-POS_HTML = r'''<!DOCTYPE html>
-<html><head>
-<meta charset="UTF-8">
-<meta name="viewport" content="width=device-width,initial-scale=1.0,maximum-scale=1,user-scalable=no">
-<title>{{agencia}} — POS</title>
-<link href="https://fonts.googleapis.com/css2?family=Oswald:wght@400;600;700&family=Rajdhani:wght@500;600&display=swap" rel="stylesheet">
-<style>
-:root{--bg:#f0f4f8;--panel:#ffffff;--card:#f8fafc;--border:#e2e8f0;--gold:#c47b00;--blue:#1d4ed8;--teal:#0284c7;--red:#dc2626;--red-bg:#fef2f2;--red-border:#fca5a5;--negro:#1e3a5f;--negro-bg:#eff6ff;--negro-border:#bfdbfe;--verde:#166534;--verde-bg:#f0fdf4;--verde-border:#bbf7d0;--green:#16a34a;--orange:#ea580c;--purple:#7c3aed;--text:#1e293b;--text2:#64748b}
-*{box-sizing:border-box;margin:0;padding:0;-webkit-tap-highlight-color:transparent;user-select:none}
-html,body{height:100%;overflow:hidden}
-body{background:var(--bg);color:var(--text);font-family:'Rajdhani',sans-serif;font-size:14px;display:flex;flex-direction:column}
-.topbar{background:#1e293b;border-bottom:3px solid #f5a623;padding:0 10px;height:36px;display:flex;align-items:center;justify-content:space-between;flex-shrink:0}
-.brand{font-family:'Oswald',sans-serif;font-size:1rem;font-weight:700;letter-spacing:2px;color:#fff}.brand em{color:var(--gold);font-style:normal}
-.agent-name{color:#8ab0e0;font-size:.78rem;letter-spacing:1px;margin-left:10px}
-.top-right{display:flex;align-items:center;gap:5px}
-.clock{color:#f5a623;font-family:'Oswald',sans-serif;font-size:.8rem;background:#334155;padding:2px 6px;border-radius:3px;border:1px solid #475569;white-space:nowrap}
-.tbtn{padding:4px 8px;border:none;background:#334155;color:#e2e8f0;border-radius:3px;cursor:pointer;font-size:.68rem;font-family:'Oswald',sans-serif;font-weight:700;letter-spacing:1px;white-space:nowrap}
-.tbtn:hover{background:#475569;color:#fff}.tbtn.exit{background:#991b1b;color:#fff}.tbtn.exit:hover{background:#b91c1c}
-.layout{display:flex;flex:1;overflow:hidden;gap:0;min-height:0}
-.left-panel{display:flex;flex-direction:column;width:55%;border-right:2px solid var(--border);overflow:hidden;background:#ffffff;min-height:0}
-.especiales-bar{display:flex;gap:4px;padding:5px 6px;background:#f1f5f9;border-bottom:2px solid var(--border);flex-shrink:0}
-.esp-btn{flex:1;padding:9px 4px;text-align:center;border-radius:4px;cursor:pointer;font-family:'Oswald',sans-serif;font-size:.82rem;font-weight:700;letter-spacing:1px;border:2px solid transparent;transition:all .15s}
-.esp-btn.rojo{background:#cc1a1a;border-color:#ff2a2a;color:#fff}.esp-btn.rojo.sel{background:#ff1a1a;border-color:#ff6060;box-shadow:0 0 12px rgba(255,40,40,.5)}.esp-btn.rojo:hover{background:#e02020;border-color:#ff4040}
-.esp-btn.negro{background:#1a2a5a;border-color:#2a4090;color:#c0d8ff}.esp-btn.negro.sel{background:#2a3a80;border-color:#4060d0;box-shadow:0 0 12px rgba(60,100,240,.5)}.esp-btn.negro:hover{background:#223070;border-color:#3050c0}
-.esp-btn.par{background:#0a7a90;border-color:#00c4d8;color:#fff}.esp-btn.par.sel{background:#00a0c0;border-color:#00e8ff;box-shadow:0 0 12px rgba(0,200,220,.5)}.esp-btn.par:hover{background:#0a8aa0;border-color:#00d0e8}
-.esp-btn.impar{background:#6a20a0;border-color:#9a40d0;color:#fff}.esp-btn.impar.sel{background:#8030c0;border-color:#c060ff;box-shadow:0 0 12px rgba(160,80,240,.5)}.esp-btn.impar:hover{background:#7a28b0;border-color:#b050e8}
-.manual-box{padding:6px;background:#f1f5f9;border-bottom:2px solid #e2e8f0}
-.manual-input{width:100%;padding:8px;background:#fff;border:2px solid #0284c7;border-radius:4px;color:#c47b00;font-family:'Oswald',sans-serif;font-size:1rem;letter-spacing:1px;text-transform:uppercase}
-.manual-input:focus{outline:none;border-color:#7c3aed}
-.manual-label{color:#64748b;font-size:.65rem;font-family:'Oswald',sans-serif;letter-spacing:1px;margin-bottom:4px;display:flex;justify-content:space-between}
-.manual-label span{color:#f5a623}
-.animals-scroll{flex:1;overflow-y:auto;padding:4px 5px;min-height:0}
-.animals-grid{display:grid;grid-template-columns:repeat(7,1fr);gap:3px}
-.acard{border-radius:5px;padding:8px 3px;text-align:center;cursor:pointer;transition:all .12s;border:2px solid transparent;position:relative;min-height:54px;display:flex;flex-direction:column;align-items:center;justify-content:center}
-.acard:active{transform:scale(.95)}
-.acard.cv{background:#166534;border-color:#166534}.acard.cv .anum{color:#ffffff}.acard.cv .anom{color:#f0fff0}.acard.cv:hover{background:#15803d;border-color:#15803d}.acard.cv.sel{box-shadow:0 0 8px rgba(2,132,199,.4);transform:scale(1.05);border-color:#0284c7!important}
-.acard.cr{background:#780606;border-color:#780606}.acard.cr .anum{color:#ffffff}.acard.cr .anom{color:#fff5f5}.acard.cr:hover{background:#991b1b;border-color:#991b1b}.acard.cr.sel{box-shadow:0 0 8px rgba(2,132,199,.4);transform:scale(1.05);border-color:#0284c7!important}
-.acard.cn{background:#000000;border-color:#000000}.acard.cn .anum{color:#ffffff}.acard.cn .anom{color:#f8f8ff}.acard.cn:hover{background:#1e293b;border-color:#1e293b}.acard.cn.sel{box-shadow:0 0 8px rgba(2,132,199,.4);transform:scale(1.05);border-color:#0284c7!important}
-.acard.cl{background:#fef9c3;border-color:#d97706}.acard.cl .anum{color:#000000}.acard.cl .anom{color:#92400e}.acard.cl:hover{background:#fef08a;border-color:#b45309}.acard.cl.sel{box-shadow:0 0 8px rgba(2,132,199,.4);transform:scale(1.05);border-color:#0284c7!important}
-.acard.sel::after{content:'v';position:absolute;top:0;right:2px;font-size:.6rem;color:#fff;font-weight:700}
-.anum{font-size:.9rem;font-weight:700;font-family:'Oswald',sans-serif;line-height:1.1}
-.anom{font-size:.72rem;font-weight:600;line-height:1.2;margin-top:2px;overflow:hidden;text-overflow:ellipsis;white-space:nowrap;max-width:100%}
-.right-panel{width:45%;display:flex;flex-direction:column;overflow-y:auto;background:#f8fafc;padding:6px;min-height:0}
-.rsec{padding:6px 8px;border-bottom:1px solid var(--border)}
-.rlabel{font-family:'Oswald',sans-serif;font-size:.65rem;font-weight:600;color:#64748b;letter-spacing:2px;text-transform:uppercase;margin-bottom:4px}
-.horas-grid{display:grid;grid-template-columns:repeat(3,1fr);gap:3px}
-.hbtn{padding:6px 2px;text-align:center;background:#f1f5f9;border:2px solid #cbd5e1;border-radius:3px;cursor:pointer;font-size:.72rem;font-family:'Oswald',sans-serif;color:#475569;transition:all .15s;line-height:1.2}
-.hbtn:hover{background:#0284c7;border-color:#0284c7;color:#fff}.hbtn.sel{background:#0284c7;border-color:#0369a1;color:#fff;font-weight:700}.hbtn.bloq{background:#fee2e2;border-color:#fca5a5;color:#ef4444;cursor:not-allowed;opacity:.7}
-.hbtn .hperu{font-size:.82rem;font-weight:700}.hbtn .hven{font-size:.68rem;color:#94a3b8}.hbtn.sel .hven{color:#e0f2fe}
-.horas-btns-row{display:flex;gap:3px;margin-top:3px}
-.hsel-btn{flex:1;padding:5px;font-size:.65rem;background:#e2e8f0;border:2px solid #cbd5e1;color:#475569;border-radius:3px;cursor:pointer;font-family:'Oswald',sans-serif;font-weight:700;text-align:center;transition:all .15s}
-.hsel-btn:hover{background:#0284c7;border-color:#0284c7;color:#fff}
-.monto-sec{padding:5px 8px;border-bottom:1px solid var(--border)}
-.presets{display:flex;flex-wrap:wrap;gap:3px;margin-bottom:4px}
-.mpre{padding:7px 10px;background:#e2e8f0;border:2px solid #cbd5e1;border-radius:3px;color:#1e293b;cursor:pointer;font-size:.82rem;font-family:'Oswald',sans-serif;font-weight:700;transition:all .15s}
-.mpre:hover,.mpre:active{background:#0284c7;border-color:#0284c7;color:#fff}
-.monto-input-wrap{display:flex;align-items:center;gap:4px}
-.monto-label{color:#f5a623;font-size:.85rem;font-weight:700;font-family:'Oswald',sans-serif;letter-spacing:1px;white-space:nowrap}
-.monto-input{flex:1;padding:9px 8px;background:#fff;border:2px solid #d97706;border-radius:3px;color:#c47b00;font-size:1.1rem;font-family:'Oswald',sans-serif;font-weight:700;text-align:center;letter-spacing:1px}
-.monto-input:focus{outline:none;border-color:#f59e0b;box-shadow:0 0 8px rgba(245,158,11,.25)}
-.ticket-sec{padding:4px 8px;border-top:2px solid #d97706;background:#fffbeb;display:flex;flex-direction:column;flex-shrink:0}
-.ticket-list{overflow-y:auto;min-height:60px;max-height:220px;background:#fff;border:1px solid #e2e8f0;border-radius:4px;padding:4px;margin-bottom:4px}
-.ti{display:flex;align-items:center;gap:3px;padding:4px;border-bottom:1px solid #f1f5f9;font-size:.7rem}
-.ti-desc{flex:1;color:#1e293b;overflow:hidden;text-overflow:ellipsis;white-space:nowrap;font-size:.68rem}
-.ti-hora{color:#0284c7;font-size:.65rem;min-width:38px;font-family:'Oswald',sans-serif;font-weight:700}
-.ti-monto{color:#16a34a;font-weight:700;font-family:'Oswald',sans-serif;min-width:30px;text-align:right;font-size:.7rem}
-.ti-del{background:#dc2626;border:none;color:#fff;cursor:pointer;font-size:.55rem;padding:2px 4px;border-radius:2px}
-.ti-del:hover{background:#b91c1c}
-.ticket-empty{color:#94a3b8;text-align:center;padding:20px;font-size:.72rem;letter-spacing:2px}
-.ticket-total{text-align:right;padding:5px 6px;font-family:'Oswald',sans-serif;color:#c47b00;font-size:.95rem;font-weight:700;border-top:2px solid #d97706;background:#fffbeb}
-.actions-sec{padding:5px 8px;display:flex;flex-direction:column;gap:3px;flex-shrink:0}
-.btn-add{width:100%;padding:11px;background:#1a3a90;color:#fff;border:2px solid #4070d0;border-radius:4px;font-family:'Oswald',sans-serif;font-weight:700;font-size:.88rem;letter-spacing:2px;cursor:pointer;transition:all .15s}
-.btn-add:hover{background:#2050c0;border-color:#60a0ff}
-.btn-wa{width:100%;padding:11px;background:#16a34a;color:#fff;border:2px solid #22c55e;border-radius:4px;font-family:'Oswald',sans-serif;font-weight:700;font-size:.88rem;letter-spacing:2px;cursor:pointer;transition:all .15s}
-.btn-wa:hover{background:#15803d}.btn-wa:disabled{background:#dcfce7;border-color:#bbf7d0;color:#86efac;cursor:not-allowed}
-.btns-row{display:grid;grid-template-columns:1fr 1fr;gap:3px}.btns-row2{display:grid;grid-template-columns:1fr 1fr 1fr;gap:3px}
-.abtn{padding:10px 4px;text-align:center;border-radius:4px;cursor:pointer;font-family:'Oswald',sans-serif;font-size:.75rem;font-weight:700;letter-spacing:1px;border:2px solid;transition:all .15s;white-space:nowrap;color:#fff}
-.abtn.res{background:#006080;border-color:#00b8d8}.abtn.res:hover{background:#0080a8;border-color:#00e0ff}
-.abtn.caja{background:#166534;border-color:#22c55e}.abtn.caja:hover{background:#15803d;border-color:#4ade80}
-.abtn.pagar{background:#854d0e;border-color:#f59e0b}.abtn.pagar:hover{background:#a16207;border-color:#fbbf24}
-.abtn.trip{background:#6b21a8;border-color:#a855f7}.abtn.trip:hover{background:#7e22ce;border-color:#c084fc}
-.abtn.anular{background:#991b1b;border-color:#ef4444}.abtn.anular:hover{background:#b91c1c;border-color:#ff6060}
-.abtn.borrar{background:#7c2d12;border-color:#f97316}.abtn.borrar:hover{background:#9a3412;border-color:#fb923c}
-.abtn.rep{background:#1e40af;border-color:#3b82f6}.abtn.rep:hover{background:#2563eb;border-color:#60a5fa}
-.modal{display:none;position:fixed;inset:0;background:rgba(0,0,0,.7);z-index:1000;overflow-y:auto;padding:8px;align-items:flex-start;justify-content:center}
-.modal.open{display:flex}
-.mc{background:#ffffff;border:2px solid #e2e8f0;border-radius:6px;width:100%;max-width:640px;margin:auto;box-shadow:0 8px 30px rgba(0,0,0,.15)}
-.mh{display:flex;justify-content:space-between;align-items:center;padding:10px 14px;border-bottom:2px solid #0284c7;background:#f0f9ff}
-.mh h3{font-family:'Oswald',sans-serif;color:#0284c7;font-size:.85rem;letter-spacing:2px}
-.mbody{padding:14px 16px}
-.btn-close{background:#7f1d1d;color:#fff;border:2px solid #dc2626;border-radius:3px;padding:5px 12px;cursor:pointer;font-size:.78rem;font-family:'Oswald',sans-serif;font-weight:700;letter-spacing:1px}
-.btn-close:hover{background:#991b1b}
-.frow{display:flex;gap:6px;flex-wrap:wrap;margin-bottom:8px}
-.frow input,.frow select{flex:1;min-width:110px;padding:8px 10px;background:#f8fafc;border:2px solid #cbd5e1;border-radius:3px;color:#1e293b;font-family:'Rajdhani',sans-serif;font-size:.85rem;font-weight:600}
-.frow input:focus,.frow select:focus{outline:none;border-color:#0284c7}
-.btn-q{width:100%;padding:10px;background:#1d4ed8;color:#fff;border:2px solid #3b82f6;border-radius:3px;font-weight:700;font-family:'Oswald',sans-serif;letter-spacing:2px;cursor:pointer;margin-bottom:8px;font-size:.78rem}
-.btn-q:hover{background:#2563eb}
-.ri{display:flex;justify-content:space-between;align-items:center;padding:7px 10px;margin:3px 0;background:#f8fafc;border-radius:3px;border-left:3px solid #e2e8f0;font-size:.78rem}
-.ri.ok{border-left-color:#16a34a;background:#f0fdf4}
-.ri-hora{color:#fbbf24;font-weight:700;font-family:'Oswald',sans-serif;font-size:.82rem}
-.ri-animal{color:#4ade80;font-weight:700}
-.tcard{background:#f8fafc;padding:10px;margin:5px 0;border-radius:4px;border-left:3px solid #e2e8f0;font-size:.75rem;border:1px solid #e2e8f0}
-.tcard.gano{border-left-color:#16a34a;background:#f0fdf4}.tcard.pte{border-left-color:#f59e0b;background:#fffbeb}
-.ts{color:#0284c7;font-weight:700;font-family:'Oswald',sans-serif}
-.badge{display:inline-block;padding:2px 6px;border-radius:3px;font-size:.62rem;font-weight:700;font-family:'Oswald',sans-serif;letter-spacing:1px;color:#fff}
-.badge.p{background:#16a34a;border:1px solid #22c55e}.badge.g{background:#854d0e;border:1px solid #f59e0b}.badge.n{background:#1e40af;border:1px solid #3b82f6}
-.jrow{display:flex;justify-content:space-between;align-items:center;padding:3px 8px;margin:2px 0;border-radius:3px;background:#f1f5f9;border-left:3px solid #e2e8f0;font-size:.73rem}
-.jrow.gano{background:#f0fdf4;border-left-color:#16a34a}
-.trip-row{display:flex;justify-content:space-between;align-items:center;padding:5px 8px;margin:2px 0;border-radius:3px;background:#faf5ff;border-left:3px solid #7c3aed;font-size:.73rem}
-.trip-row.gano{background:#060418;border-left-color:#c084fc}
-.sbox{background:#f8fafc;border-radius:3px;padding:10px;margin:6px 0;border:1px solid #e2e8f0}
-.srow{display:flex;justify-content:space-between;padding:4px 0;border-bottom:1px solid #f1f5f9;font-size:.75rem}.srow:last-child{border-bottom:none}
-.sl{color:#64748b}.sv{color:#c47b00;font-weight:700;font-family:'Oswald',sans-serif}
-.caja-grid{display:grid;grid-template-columns:1fr 1fr;gap:8px;margin:10px 0}
-.cg{background:#f8fafc;border:2px solid #e2e8f0;border-radius:3px;padding:10px;text-align:center}
-.cgl{color:#64748b;font-size:.6rem;letter-spacing:2px;margin-bottom:3px;font-family:'Oswald',sans-serif}
-.cgv{color:#c47b00;font-size:1rem;font-weight:700;font-family:'Oswald',sans-serif}.cgv.g{color:#16a34a}.cgv.r{color:#dc2626}
-.trip-slots{display:flex;gap:8px;margin-bottom:12px}
-.tslot{flex:1;background:#faf5ff;border:2px solid #c4b5fd;border-radius:4px;padding:8px;text-align:center;cursor:pointer;min-height:46px;display:flex;flex-direction:column;align-items:center;justify-content:center;transition:all .15s}
-.tslot.act{border-color:#7c3aed;box-shadow:0 0 12px rgba(124,58,237,.3);background:#ede9fe}.tslot.fill{border-color:#7c3aed;background:#f5f3ff}
-.tslot .snum{font-size:.9rem;font-weight:700;font-family:'Oswald',sans-serif;color:#7c3aed}
-.tslot .snom{font-size:.58rem;color:#6d28d9}.tslot .sph{font-size:.65rem;color:#7c3aed;letter-spacing:1px}
-.trip-modal-grid{display:grid;grid-template-columns:repeat(7,1fr);gap:4px;margin-top:12px;max-height:300px;overflow-y:auto;padding:4px}
-.trip-modal-grid .acard{padding:6px 2px}
-.toast{position:fixed;bottom:10px;left:50%;transform:translateX(-50%);padding:8px 18px;border-radius:4px;font-family:'Oswald',sans-serif;font-size:.78rem;letter-spacing:1px;font-weight:700;z-index:9999;display:none;max-width:90%;text-align:center}
-.toast.ok{background:#16a34a;color:#fff;border:2px solid #22c55e}.toast.err{background:#dc2626;color:#fff;border:2px solid #ef4444}
-::-webkit-scrollbar{width:4px;height:4px}::-webkit-scrollbar-track{background:#f1f5f9}::-webkit-scrollbar-thumb{background:#cbd5e1;border-radius:2px}::-webkit-scrollbar-thumb:hover{background:#94a3b8}
-.rep-info{background:#0a1a30;border:1px solid #1a4a80;border-radius:4px;padding:10px;margin-bottom:12px;font-size:.8rem;color:#80b0e0}
-.rep-item{display:flex;align-items:center;gap:8px;padding:6px;background:#060c1a;border-radius:3px;margin-bottom:6px;border:1px solid #1a2a40}
-.rep-item select{flex:1;padding:6px;background:#0a1828;border:1px solid #2a4a80;color:#fbbf24;font-family:'Rajdhani',sans-serif;font-size:.85rem}
-.rep-item input[type="number"]{width:80px;padding:6px;background:#0a1828;border:1px solid #d97706;color:#fbbf24;font-family:'Oswald',sans-serif;text-align:center}
-@media(max-width:599px){html,body{overflow:auto}.layout{flex-direction:column}.left-panel{width:100%;border-right:none;border-bottom:2px solid var(--border);max-height:60vh}.right-panel{width:100%}.animals-grid{grid-template-columns:repeat(7,1fr)}.trip-modal-grid{grid-template-columns:repeat(7,1fr)}.topbar .agent-name{display:none}}
-@media(min-width:600px) and (max-width:900px){.animals-grid{grid-template-columns:repeat(7,1fr)}.trip-modal-grid{grid-template-columns:repeat(7,1fr)}}
-</style></head><body>
-<div class="topbar">
-  <div style="display:flex;align-items:center"><div class="brand">ZOO<em>LO</em></div><div class="agent-name">{{agencia}}</div></div>
-  <div class="top-right">
-    <div class="clock" id="clock">--:--</div>
-    <button class="tbtn" onclick="openMod('mod-consultas')">Consultas</button>
-    <button class="tbtn" onclick="openMod('mod-archivo')">Archivo</button>
-    <button class="tbtn exit" onclick="location.href='/logout'">SALIR</button>
-  </div>
-</div>
-<div id="offline-banner" style="display:none;background:#fef2f2;border-bottom:2px solid #ef4444;padding:6px 14px;align-items:center;justify-content:center;gap:10px;flex-shrink:0">
-  <span style="color:#dc2626;font-family:'Oswald',sans-serif;font-size:.82rem;letter-spacing:2px;font-weight:700">SIN CONEXION — VENTA BLOQUEADA</span>
-</div>
-<div class="layout">
-  <div class="left-panel">
-    <div class="especiales-bar">
-      <div class="esp-btn rojo" id="esp-ROJO" onclick="selEsp('ROJO')">ROJO</div>
-      <div class="esp-btn negro" id="esp-NEGRO" onclick="selEsp('NEGRO')">NEGRO</div>
-      <div class="esp-btn par" id="esp-PAR" onclick="selEsp('PAR')">PAR</div>
-      <div class="esp-btn impar" id="esp-IMPAR" onclick="selEsp('IMPAR')">IMPAR</div>
-    </div>
-    <div class="manual-box">
-      <div class="manual-label"><span>JUGADA MANUAL</span><span style="font-size:.6rem;color:#4a6090">Ej: 2.25.36.14.11</span></div>
-      <div style="display:flex;gap:4px">
-        <input type="text" class="manual-input" id="manual-input" placeholder="1.5.6.12 o 5,6,8,40" style="flex:1" onpaste="handleManualPaste(event)" onkeyup="handleManualKeyup(event)">
-        <button style="padding:6px 10px;background:#1a3a70;border:1px solid #2060c0;color:#80c0ff;font-size:.75rem;font-family:'Oswald',sans-serif;cursor:pointer;border-radius:3px;white-space:nowrap" onclick="confirmarManual()">OK</button>
-      </div>
-    </div>
-    <div class="animals-scroll"><div class="animals-grid" id="animals-grid"></div></div>
-    <div class="ticket-sec">
-      <div class="rlabel" style="padding:4px 0 2px;color:#854d0e;letter-spacing:2px">TICKET EN ELABORACION</div>
-      <div class="ticket-list" id="ticket-list"><div class="ticket-empty">TICKET VACIO</div></div>
-      <div id="ticket-total" style="display:none" class="ticket-total"></div>
-    </div>
-  </div>
-  <div class="right-panel">
-    <div class="rsec">
-      <div style="display:flex;gap:4px;margin-bottom:6px">
-        <button id="tab-peru" onclick="cambiarLoteria('peru')" style="flex:1;padding:7px 4px;background:#1a3a90;border:2px solid #4070d0;border-radius:4px;color:#fff;font-family:'Oswald',sans-serif;font-size:.72rem;font-weight:700;letter-spacing:1px;cursor:pointer;transition:all .15s" class="active">ZOOLO PERU</button>
-        <button id="tab-plus" onclick="cambiarLoteria('plus')" style="flex:1;padding:7px 4px;background:#3b0764;border:2px solid #a855f7;border-radius:4px;color:#fff;font-family:'Oswald',sans-serif;font-size:.72rem;font-weight:700;letter-spacing:1px;cursor:pointer;transition:all .15s">ZOOLO PLUS</button>
-      </div>
-      <div class="rlabel" id="horas-label">PERU - 11 Sorteos</div>
-      <div class="horas-grid" id="horas-grid"></div>
-      <div class="horas-btns-row"><button class="hsel-btn" onclick="selTodos()">Todos</button><button class="hsel-btn" onclick="limpiarH()">Limpiar</button></div>
-    </div>
-    <div class="monto-sec">
-      <div class="presets">
-        <button class="mpre" onclick="setM(.5)">0.5</button><button class="mpre" onclick="setM(1)">1</button><button class="mpre" onclick="setM(2)">2</button><button class="mpre" onclick="setM(5)">5</button><button class="mpre" onclick="setM(10)">10</button><button class="mpre" onclick="setM(20)">20</button><button class="mpre" onclick="setM(50)">50</button>
-      </div>
-      <div class="monto-input-wrap"><span class="monto-label">S/</span><input type="number" class="monto-input" id="monto" value="1" min="0.5" step="0.5"></div>
-    </div>
-    <div class="actions-sec">
-      <button class="btn-add" onclick="agregar()">+ AGREGAR AL TICKET</button>
-      <button class="btn-wa" onclick="vender()" id="btn-wa" disabled>ENVIAR POR WHATSAPP</button>
-      <div class="btns-row"><div class="abtn res" onclick="openResultados()">RESULTADOS</div><div class="abtn caja" onclick="openCaja()">CAJA</div></div>
-      <div class="btns-row"><div class="abtn pagar" onclick="openPagar()">PAGAR</div><div class="abtn anular" onclick="openAnular()">ANULAR</div></div>
-      <div class="btns-row2"><div class="abtn trip" onclick="openTripletaModal()">TRIPLETA</div><div class="abtn rep" onclick="openRepetirModal()">REPETIR</div><div class="abtn borrar" onclick="borrarTodo()">BORRAR</div></div>
-    </div>
-  </div>
-</div>
-<div class="toast" id="toast"></div>
-<div class="modal" id="mod-repetir"><div class="mc"><div class="mh"><h3>REPETIR TICKET</h3><button class="btn-close" onclick="closeMod('mod-repetir')">X</button></div><div class="mbody"><div class="frow"><input type="text" id="rep-serial" placeholder="Serial del ticket" style="flex:2"><button class="btn-q" onclick="cargarTicketRepetir()" style="flex:1;margin:0">CARGAR</button></div><div id="rep-contenido"></div></div></div></div>
-<div class="modal" id="mod-tripleta"><div class="mc"><div class="mh" style="border-color:#7c3aed;background:linear-gradient(135deg,#1a0a30,#0c1a3a)"><h3 style="color:#e0d0ff;font-family:'Oswald',sans-serif;letter-spacing:2px">TRIPLETA x60</h3><button class="btn-close" onclick="closeMod('mod-tripleta')">X</button></div><div class="mbody">
-<div style="display:flex;gap:0;border:2px solid #2a3a6a;border-radius:6px;overflow:hidden;margin-bottom:14px">
-  <button id="trip-tab-peru" onclick="selTripLoteria('peru')" style="flex:1;padding:10px 6px;font-family:'Oswald',sans-serif;font-size:.8rem;letter-spacing:1px;cursor:pointer;border:none;transition:all .2s;background:#0c2461;color:#90b8ff">ZOOLO PERU<br><span style="font-size:.62rem;opacity:.8">11 sorteos</span></button>
-  <button id="trip-tab-plus" onclick="selTripLoteria('plus')" style="flex:1;padding:10px 6px;font-family:'Oswald',sans-serif;font-size:.8rem;letter-spacing:1px;cursor:pointer;border:none;transition:all .2s;background:#1a0540;color:#c084fc">ZOOLO PLUS<br><span style="font-size:.62rem;opacity:.8">12 sorteos</span></button>
-</div>
-<div class="trip-slots"><div class="tslot act" id="tms0" onclick="activarSlotModal(0)"><div class="sph">ANIMAL 1</div></div><div class="tslot" id="tms1" onclick="activarSlotModal(1)"><div class="sph">ANIMAL 2</div></div><div class="tslot" id="tms2" onclick="activarSlotModal(2)"><div class="sph">ANIMAL 3</div></div></div>
-<div class="trip-modal-grid" id="trip-modal-grid"></div>
-<div style="margin-top:12px;padding-top:12px;border-top:1px solid var(--border)"><div style="color:var(--purple);font-size:.75rem;margin-bottom:6px;font-family:'Oswald',sans-serif;letter-spacing:1px">MONTO TRIPLETA</div><div class="monto-input-wrap"><span class="monto-label">S/</span><input type="number" class="monto-input" id="monto-tripleta" value="1" min="0.5" step="0.5"></div></div>
-<div style="display:flex;gap:8px;margin-top:12px"><button class="btn-q" id="trip-btn-agregar" style="flex:1" onclick="agregarTripletaModal()">AGREGAR AL TICKET</button><button class="btn-close" style="flex:1;background:#1e3050;border-color:#4080c0;color:#90c0ff" onclick="closeMod('mod-tripleta')">CANCELAR</button></div>
-</div></div></div>
-<div class="modal" id="mod-resultados"><div class="mc"><div class="mh"><h3>RESULTADOS</h3><button class="btn-close" onclick="closeMod('mod-resultados')">X</button></div><div class="mbody"><div class="frow"><input type="date" id="res-fecha"></div><button class="btn-q" onclick="cargarResultados()">VER RESULTADOS</button><div id="res-titulo" style="color:var(--teal);font-family:'Oswald',sans-serif;letter-spacing:2px;text-align:center;margin-bottom:8px;font-size:.8rem"></div><div id="res-lista" style="max-height:340px;overflow-y:auto"></div></div></div></div>
-<div class="modal" id="mod-consultas"><div class="mc"><div class="mh"><h3>CONSULTAS</h3><button class="btn-close" onclick="closeMod('mod-consultas')">X</button></div><div class="mbody"><div class="frow"><input type="date" id="mt-ini"><input type="date" id="mt-fin"><select id="mt-estado"><option value="todos">Todos</option><option value="pagados">Pagados</option><option value="pendientes">Pendientes</option><option value="por_pagar">Con Premio</option></select></div><button class="btn-q" onclick="consultarTickets()">BUSCAR</button><div id="mt-resumen" style="display:none;background:rgba(0,180,216,.06);border:1px solid #0a4050;border-radius:3px;padding:8px;margin-bottom:8px;color:var(--teal);font-size:.78rem;font-family:'Oswald',sans-serif;letter-spacing:1px"></div><div id="mt-lista" style="max-height:400px;overflow-y:auto"><p style="color:var(--text2);text-align:center;padding:20px;letter-spacing:2px;font-size:.75rem">USE LOS FILTROS Y BUSQUE</p></div></div></div></div>
-<div class="modal" id="mod-archivo"><div class="mc"><div class="mh"><h3>ARCHIVO — CAJA HISTORICO</h3><button class="btn-close" onclick="closeMod('mod-archivo')">X</button></div><div class="mbody"><div class="frow"><input type="date" id="ar-ini"><input type="date" id="ar-fin"></div><button class="btn-q" onclick="cajaHist()">VER HISTORICO</button><div id="ar-res"></div></div></div></div>
-<div class="modal" id="mod-pagar"><div class="mc"><div class="mh"><h3>VERIFICAR / PAGAR</h3><button class="btn-close" onclick="closeMod('mod-pagar')">X</button></div><div class="mbody"><div class="frow"><input type="text" id="pag-serial" placeholder="Serial del ticket"></div><button class="btn-q" onclick="verificarTicket()">VERIFICAR</button><div id="pag-res"></div></div></div></div>
-<div class="modal" id="mod-anular"><div class="mc"><div class="mh"><h3>ANULAR TICKET</h3><button class="btn-close" onclick="closeMod('mod-anular')">X</button></div><div class="mbody"><div class="frow"><input type="text" id="an-serial" placeholder="Serial del ticket"></div><button class="btn-q" style="background:linear-gradient(135deg,#3a1010,#280808);border-color:#6b1515;color:#e05050" onclick="anularTicket()">ANULAR</button><div id="an-res"></div></div></div></div>
-<div class="modal" id="mod-caja"><div class="mc"><div class="mh"><h3>CAJA HOY</h3><button class="btn-close" onclick="closeMod('mod-caja')">X</button></div><div class="mbody" id="caja-body"></div></div></div>
-<script>
-const ANIMALES = {{ animales | tojson }};
-const COLORES  = {{ colores | tojson }};
-const HPERU = {{ horarios_peru | tojson }};
-const HPLUS = {{ horarios_plus | tojson }};
-const ROJOS = ["1","3","5","7","9","12","14","16","18","19","21","23","25","27","30","32","34","36","37","39"];
-const ORDEN = ['00','0','1','2','3','4','5','6','7','8','9','10','11','12','13','14','15','16','17','18','19','20','21','22','23','24','25','26','27','28','29','30','31','32','33','34','35','36','37','38','39','40'];
-let carrito=[],horasSel=[],horasSelPlus=[],animalesSel=[],espSel=null,horasBloq=[],horasBloqPlus=[],loteriaActiva='peru',tripSlotModal=0,tripAnimModal=[null,null,null];
-function init(){renderAnimales();renderHoras();renderTripModalGrid();actualizarBloq();setInterval(actualizarBloq,30000);setInterval(actualizarClock,1000);setInterval(verificarConexion,10000);actualizarClock();verificarConexion();let hoy=new Date().toISOString().split('T')[0];['res-fecha','mt-ini','mt-fin','ar-ini','ar-fin'].forEach(id=>{let el=document.getElementById(id);if(el)el.value=hoy});}
-let _sinConexion=false;
-function verificarConexion(){fetch('/api/hora-actual',{cache:'no-store'}).then(r=>{if(r.ok&&_sinConexion){_sinConexion=false;document.getElementById('offline-banner').style.display='none';document.getElementById('btn-wa').disabled=window._carritoLen===0;}}).catch(()=>{_sinConexion=true;document.getElementById('offline-banner').style.display='flex';document.getElementById('btn-wa').disabled=true;});}
-function actualizarClock(){let now=new Date(),utcMs=now.getTime()+now.getTimezoneOffset()*60000,peruMs=utcMs-5*3600000,peru=new Date(peruMs),h=peru.getHours(),m=peru.getMinutes(),ap=h>=12?'PM':'AM';h=h%12||12;document.getElementById('clock').textContent=h+':'+String(m).padStart(2,'0')+' '+ap+' LIMA';}
-function actualizarBloq(){fetch('/api/hora-actual').then(r=>r.json()).then(d=>{horasBloq=d.bloqueadas||[];horasBloqPlus=d.bloqueadas_plus||[];horasSel=horasSel.filter(h=>!horasBloq.includes(h));horasSelPlus=horasSelPlus.filter(h=>!horasBloqPlus.includes(h));renderHoras();}).catch(()=>{});}
-function getCardClass(k){if(k==='40')return 'cl';let c=COLORES[k];if(c==='verde')return 'cv';if(c==='rojo')return 'cr';return 'cn';}
-function renderAnimales(){let g=document.getElementById('animals-grid');g.innerHTML='';ORDEN.forEach(k=>{if(!ANIMALES[k])return;let d=document.createElement('div');d.className='acard '+getCardClass(k);d.dataset.k=k;d.innerHTML='<div class="anum">'+k+'</div><div class="anom">'+ANIMALES[k]+'</div>';d.onclick=()=>toggleAnimal(k,d);g.appendChild(d);});}
-function toggleAnimal(k,el){let i=animalesSel.indexOf(k);if(i>=0){animalesSel.splice(i,1);el.classList.remove('sel');}else{animalesSel.push(k);el.classList.add('sel');}}
-function handleManualPaste(e){e.preventDefault();let texto=(e.clipboardData||window.clipboardData).getData('text');document.getElementById('manual-input').value=texto;procesarManual(texto);}
-function handleManualKeyup(e){let val=e.target.value;if(e.key==='Enter'){procesarManual(val);e.target.value='';}}
-function procesarManual(texto){if(!texto||!texto.trim())return;let nums=texto.split(/[.,\-;\s\n\/|]+/).map(x=>x.trim()).filter(x=>x!=='');let validos=[],invalidos=[];nums.forEach(n=>{let num=n==='00'?'00':n.replace(/^0+/,'')||'0';if(ANIMALES[num]!==undefined){if(!validos.includes(num))validos.push(num);}else invalidos.push(n);});if(!validos.length){toast('No se encontraron numeros validos','err');return;}validos.forEach(k=>{if(!animalesSel.includes(k))animalesSel.push(k);let card=document.querySelector('.acard[data-k="'+k+'"]');if(card)card.classList.add('sel');});let msg='Seleccionados: '+validos.map(k=>k+'-'+ANIMALES[k]).join(', ');if(invalidos.length)msg+=' | Ignorados: '+invalidos.join(',');toast(msg,'ok');document.getElementById('manual-input').value='';}
-function confirmarManual(){let val=document.getElementById('manual-input').value;if(val.trim())procesarManual(val);}
-function selEsp(v){if(espSel===v){espSel=null;document.getElementById('esp-'+v).classList.remove('sel');}else{if(espSel)document.getElementById('esp-'+espSel).classList.remove('sel');espSel=v;animalesSel=[];document.querySelectorAll('.animals-grid .acard').forEach(c=>c.classList.remove('sel'));document.getElementById('esp-'+v).classList.add('sel');}}
-function renderHoras(){let g=document.getElementById('horas-grid');g.innerHTML='';let isPlus=loteriaActiva==='plus',lista=isPlus?HPLUS:HPERU,bloq=isPlus?horasBloqPlus:horasBloq,sel=isPlus?horasSelPlus:horasSel;lista.forEach(h=>{let b=document.createElement('div');b.className='hbtn';let isBloq=bloq.includes(h),isSel=sel.includes(h);if(isBloq)b.classList.add('bloq');if(isSel)b.classList.add('sel');b.innerHTML='<div class="hperu">'+h.replace(':00','')+'</div>';if(!isBloq)b.onclick=()=>toggleH(h);g.appendChild(b);});}
-function toggleH(h){let isPlus=loteriaActiva==='plus',arr=isPlus?horasSelPlus:horasSel,i=arr.indexOf(h);if(i>=0)arr.splice(i,1);else arr.push(h);renderHoras();}
-function selTodos(){if(loteriaActiva==='plus')horasSelPlus=HPLUS.filter(h=>!horasBloqPlus.includes(h));else horasSel=HPERU.filter(h=>!horasBloq.includes(h));renderHoras();}
-function limpiarH(){if(loteriaActiva==='plus')horasSelPlus=[];else horasSel=[];renderHoras();}
-function cambiarLoteria(lot){loteriaActiva=lot;let lbl=lot==='plus'?'PLUS - 12 Sorteos':'PERU - 11 Sorteos';document.getElementById('horas-label').textContent=lbl;renderHoras();}
-function openTripletaModal(){tripAnimModal=[null,null,null];tripSlotModal=0;actualizarSlotsModal();renderTripModalGrid();selTripLoteria(loteriaActiva||'peru');openMod('mod-tripleta');}
-function selTripLoteria(lot){window.tripLoteriaModal=lot;let tabPeru=document.getElementById('trip-tab-peru'),tabPlus=document.getElementById('trip-tab-plus'),btn=document.getElementById('trip-btn-agregar');if(lot==='plus'){tabPlus.style.background='#6b21a8';tabPlus.style.color='#f3e8ff';tabPlus.style.fontWeight='700';tabPeru.style.background='#0c1020';tabPeru.style.color='#4a6090';tabPeru.style.fontWeight='normal';btn.style.background='linear-gradient(135deg,#6b21a8,#4c1d95)';btn.style.borderColor='#a855f7';btn.style.color='#f3e8ff';btn.textContent='AGREGAR ZOOLO PLUS';}else{tabPeru.style.background='#0c4a9e';tabPeru.style.color='#e0f0ff';tabPeru.style.fontWeight='700';tabPlus.style.background='#0c1020';tabPlus.style.color='#4a6090';tabPlus.style.fontWeight='normal';btn.style.background='linear-gradient(135deg,#166534,#14532d)';btn.style.borderColor='#22c55e';btn.style.color='#dcfce7';btn.textContent='AGREGAR ZOOLO PERU';}}
-function renderTripModalGrid(){let g=document.getElementById('trip-modal-grid');if(!g)return;g.innerHTML='';ORDEN.forEach(k=>{if(!ANIMALES[k])return;let d=document.createElement('div');d.className='acard '+getCardClass(k);d.innerHTML='<div class="anum">'+k+'</div><div class="anom">'+ANIMALES[k]+'</div>';d.onclick=()=>selTripAnimModal(k);g.appendChild(d);});}
-function activarSlotModal(i){tripSlotModal=i;actualizarSlotsModal();}
-function selTripAnimModal(k){let otro=tripAnimModal.findIndex((x,idx)=>x===k&&idx!==tripSlotModal);if(otro>=0){toast('Animal ya seleccionado','err');return;}tripAnimModal[tripSlotModal]=k;actualizarSlotsModal();if(tripSlotModal<2){let nextEmpty=tripAnimModal.findIndex(x=>x===null,tripSlotModal+1);if(nextEmpty===-1)nextEmpty=tripSlotModal+1;if(nextEmpty<3)tripSlotModal=nextEmpty;}actualizarSlotsModal();}
-function actualizarSlotsModal(){for(let i=0;i<3;i++){let s=document.getElementById('tms'+i),k=tripAnimModal[i];if(k){s.innerHTML='<div class="snum">'+k+'</div><div class="snom">'+ANIMALES[k].substring(0,6)+'</div>';s.className='tslot fill'+(i===tripSlotModal?' act':'');s.onclick=()=>{tripAnimModal[i]=null;activarSlotModal(i);};}else{s.innerHTML='<div class="sph">ANIMAL '+(i+1)+'</div>';s.className='tslot'+(i===tripSlotModal?' act':'');s.onclick=()=>activarSlotModal(i);}}}
-function agregarTripletaModal(){if(tripAnimModal.includes(null)){toast('Selecciona los 3 animales','err');return;}let monto=parseFloat(document.getElementById('monto-tripleta').value)||0;if(monto<=0){toast('Monto invalido','err');return;}let lot=window.tripLoteriaModal||loteriaActiva||'peru',sel=tripAnimModal.join(','),desc=tripAnimModal.map(n=>n+'-'+ANIMALES[n].substring(0,4)).join(' ');carrito.push({tipo:'tripleta',hora:'TODO DIA',seleccion:sel,monto,desc:'TRIP '+desc,loteria:lot});renderCarrito();closeMod('mod-tripleta');toast('Tripleta agregada','ok');}
-function openRepetirModal(){document.getElementById('rep-serial').value='';document.getElementById('rep-contenido').innerHTML='';openMod('mod-repetir');}
-function cargarTicketRepetir(){let serial=document.getElementById('rep-serial').value.trim();if(!serial){toast('Ingrese serial','err');return;}fetch('/api/repetir-ticket',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({serial:serial})}).then(r=>r.json()).then(d=>{if(d.error){toast(d.error,'err');return;}mostrarEditorRepetir(d);}).catch(()=>toast('Error al cargar ticket','err'));}
-function mostrarEditorRepetir(data){let html='<div class="rep-info"><div>Ticket Original: '+data.ticket_original.serial+'</div><div>Total: S/'+data.ticket_original.total+'</div></div>';data.jugadas.forEach((j,idx)=>{if(j.tipo==='tripleta'){html+='<div class="rep-item"><span style="color:#c084fc;font-family:\'Oswald\',sans-serif;min-width:60px">TRIP</span><span style="flex:1;color:#e0a0ff">'+j.animal1+'-'+j.animal2+'-'+j.animal3+'</span><input type="number" id="rep-m-'+idx+'" value="'+j.monto+'" min="0.5" step="0.5"><button class="btn-close" style="padding:4px 8px;font-size:.7rem" onclick="agregarItemRepetir('+idx+',\'tripleta\',\''+j.animal1+','+j.animal2+','+j.animal3+'\',\''+(j.loteria||'peru')+'\')">+</button></div>';}else{let horaOpts=HPERU.map(h=>'<option value="'+h+'" '+(horasBloq.includes(h)?'disabled':'')+'>'+h+(horasBloq.includes(h)?' (CERRADO)':'')+'</option>').join('');html+='<div class="rep-item"><span style="color:#4ade80;font-family:\'Oswald\',sans-serif;min-width:60px">'+j.seleccion+'</span><select id="rep-h-'+idx+'">'+horaOpts+'</select><input type="number" id="rep-m-'+idx+'" value="'+j.monto+'" min="0.5" step="0.5"><button class="btn-close" style="padding:4px 8px;font-size:.7rem" onclick="agregarItemRepetir('+idx+',\''+j.tipo+'\',\''+j.seleccion+'\')">+</button></div>';}});html+='<button class="btn-q" onclick="agregarTodoRepetir()" style="margin-top:12px;background:#166534;border-color:#22c55e">AGREGAR TODO</button>';document.getElementById('rep-contenido').innerHTML=html;data.jugadas.forEach((j,idx)=>{if(j.tipo!=='tripleta'){let sel=document.getElementById('rep-h-'+idx);if(sel){for(let opt of sel.options){if(opt.value===j.hora&&!opt.disabled){sel.value=j.hora;break;}}}}});}
-function agregarItemRepetir(idx,tipo,seleccion,loteria){let monto=parseFloat(document.getElementById('rep-m-'+idx).value)||0;if(monto<=0){toast('Monto invalido','err');return;}if(tipo==='tripleta'){let nums=seleccion.split(','),desc=nums.map(n=>n+'-'+ANIMALES[n].substring(0,4)).join(' '),lot=loteria||'peru';carrito.push({tipo:'tripleta',hora:'TODO DIA',seleccion:seleccion,monto,desc:'TRIP '+desc,loteria:lot});toast('Tripleta agregada','ok');}else{let hora=document.getElementById('rep-h-'+idx).value;if(!hora){toast('Seleccione horario','err');return;}if(horasBloq.includes(hora)){toast('Ese horario ya cerro','err');return;}let nombre=tipo==='animal'?ANIMALES[seleccion]:seleccion;carrito.push({tipo:tipo,hora:hora,seleccion:seleccion,monto:monto,desc:tipo==='animal'?seleccion+'-'+nombre:'ESP '+seleccion});toast('Jugada agregada','ok');}renderCarrito();}
-function agregarTodoRepetir(){let btns=document.querySelectorAll('#rep-contenido .rep-item button');btns.forEach(btn=>btn.click());}
-function setM(v){document.getElementById('monto').value=v;}
-function agregar(){let monto=parseFloat(document.getElementById('monto').value)||0;if(monto<=0){toast('Monto invalido','err');return;}let lot=loteriaActiva,sel=lot==='plus'?horasSelPlus:horasSel;if(espSel){if(sel.length===0){toast('Seleccione horario','err');return;}sel.forEach(h=>{let labels={'ROJO':'ROJO x2','NEGRO':'NEGRO x2','PAR':'PAR x2','IMPAR':'IMPAR x2'};carrito.push({tipo:'especial',hora:h,seleccion:espSel,monto,desc:labels[espSel],loteria:lot});});renderCarrito();toast('Especial agregado','ok');return;}if(animalesSel.length===0){toast('Seleccione animal(es)','err');return;}if(sel.length===0){toast('Seleccione horario(s)','err');return;}sel.forEach(h=>{animalesSel.forEach(k=>{carrito.push({tipo:'animal',hora:h,seleccion:k,monto,desc:k+'-'+ANIMALES[k],loteria:lot});});});animalesSel=[];document.querySelectorAll('.animals-grid .acard').forEach(c=>c.classList.remove('sel'));document.getElementById('manual-input').value='';renderCarrito();toast('Jugadas agregadas ('+lot.toUpperCase()+')','ok');}
-function renderCarrito(){let list=document.getElementById('ticket-list'),tot=document.getElementById('ticket-total');window._carritoLen=carrito.length;document.getElementById('btn-wa').disabled=(carrito.length===0||_sinConexion);if(!carrito.length){list.innerHTML='<div class="ticket-empty">TICKET VACIO</div>';tot.style.display='none';return;}let html='',total=0;carrito.forEach((it,i)=>{total+=it.monto;let lot=it.loteria||'peru',isTrip=it.tipo==='tripleta';let lotLabel=lot==='plus'?'<span style="background:#4c1d95;border:1px solid #a855f7;color:#e9d5ff;font-size:.58rem;font-family:\'Oswald\',sans-serif;padding:1px 5px;border-radius:3px;flex-shrink:0">PLUS</span>':'<span style="background:#0c2461;border:1px solid #3b9eff;color:#bae6fd;font-size:.58rem;font-family:\'Oswald\',sans-serif;padding:1px 5px;border-radius:3px;flex-shrink:0">PERU</span>';let horaLabel=it.hora==='TODO DIA'?'x60':it.hora.replace(':00','').replace(' ','');html+='<div class="ti"><span class="ti-hora">'+horaLabel+'</span>'+lotLabel+'<span class="ti-desc">'+it.desc+'</span><span class="ti-monto">'+it.monto+'</span><button class="ti-del" onclick="quitarItem('+i+')">X</button></div>';});list.innerHTML=html;tot.style.display='block';tot.textContent='TOTAL: S/ '+total.toFixed(2);}
-function quitarItem(i){carrito.splice(i,1);renderCarrito();}
-function borrarTodo(){carrito=[];animalesSel=[];espSel=null;horasSel=[];horasSelPlus=[];document.querySelectorAll('.acard').forEach(c=>c.classList.remove('sel'));document.querySelectorAll('.esp-btn').forEach(e=>e.classList.remove('sel'));renderCarrito();toast('Ticket borrado','err');}
-async function vender(){if(!carrito.length){toast('Ticket vacio','err');return;}let btn=document.getElementById('btn-wa');btn.disabled=true;btn.textContent='PROCESANDO...';try{let r=await fetch('/api/procesar-venta',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({jugadas:carrito.map(c=>({hora:c.hora,seleccion:c.seleccion,monto:c.monto,tipo:c.tipo,loteria:c.loteria||'peru'}))})});let d=await r.json();if(d.error){toast(d.error,'err');}else{window.open(d.url_whatsapp,'_blank');toast('Ticket #'+d.ticket_id+' generado!','ok');carrito=[];animalesSel=[];if(espSel){document.getElementById('esp-'+espSel).classList.remove('sel');espSel=null;}horasSel=[];horasSelPlus=[];document.getElementById('manual-input').value='';renderCarrito();renderAnimales();renderHoras();}}catch(e){toast('Error de conexion','err');}finally{btn.disabled=false;btn.textContent='ENVIAR POR WHATSAPP';}}
-function openResultados(){if(!document.getElementById('res-fecha').value)document.getElementById('res-fecha').value=new Date().toISOString().split('T')[0];openMod('mod-resultados');cargarResultados();}
-function cargarResultados(){let f=document.getElementById('res-fecha').value;if(!f)return;let c=document.getElementById('res-lista');c.innerHTML='<p style="color:var(--text2);text-align:center;padding:10px;font-size:.75rem">CARGANDO...</p>';Promise.all([fetch('/api/resultados-fecha',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha:f,loteria:'peru'})}).then(r=>r.json()),fetch('/api/resultados-fecha',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha:f,loteria:'plus'})}).then(r=>r.json())]).then(([dp,dpl])=>{let html='<div style="color:#0ea5e9;font-family:\'Oswald\',sans-serif;font-size:.72rem;letter-spacing:2px;padding:4px 0 6px;border-bottom:1px solid #e2e8f0;margin-bottom:4px">ZOOLO PERU (11 SORTEOS)</div>';HPERU.forEach(h=>{let res=dp.resultados[h];html+='<div class="ri '+(res?'ok':'')+'"><span class="ri-hora">'+h.replace(':00 AM',' AM').replace(':00 PM',' PM')+'</span>'+(res?'<span class="ri-animal">'+res.animal+' - '+res.nombre+'</span>':'<span style="color:#4a6090;font-size:.78rem">PENDIENTE</span>')+'</div>';});html+='<div style="color:#a855f7;font-family:\'Oswald\',sans-serif;font-size:.72rem;letter-spacing:2px;padding:8px 0 6px;border-bottom:1px solid #e2e8f0;margin-top:10px;margin-bottom:4px">ZOOLO PLUS (12 SORTEOS)</div>';HPLUS.forEach(h=>{let res=dpl.resultados[h];html+='<div class="ri '+(res?'ok':'')+'"><span class="ri-hora">'+h.replace(':00 AM',' AM').replace(':00 PM',' PM')+'</span>'+(res?'<span class="ri-animal">'+res.animal+' - '+res.nombre+'</span>':'<span style="color:#4a6090;font-size:.78rem">PENDIENTE</span>')+'</div>';});c.innerHTML=html;}).catch(()=>{c.innerHTML='<p style="color:var(--red);text-align:center;padding:12px">Error de conexion</p>';});}
-function consultarTickets(){let ini=document.getElementById('mt-ini').value,fin=document.getElementById('mt-fin').value,est=document.getElementById('mt-estado').value;if(!ini||!fin){toast('Seleccione fechas','err');return;}let lista=document.getElementById('mt-lista');lista.innerHTML='<p style="color:#6090c0;text-align:center;padding:15px;font-size:.75rem">CARGANDO...</p>';fetch('/api/mis-tickets',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha_inicio:ini,fecha_fin:fin,estado:est})}).then(r=>r.json()).then(d=>{if(d.error){lista.innerHTML='<p style="color:#f87171;text-align:center">'+d.error+'</p>';return;}let res=document.getElementById('mt-resumen');res.style.display='block';res.textContent=d.totales.cantidad+' TICKET(S) - TOTAL: S/ '+d.totales.ventas.toFixed(2);if(!d.tickets.length){lista.innerHTML='<p style="color:#4a6090;text-align:center;padding:20px;font-size:.75rem">SIN RESULTADOS</p>';return;}let html='';d.tickets.forEach(t=>{let bc=t.pagado?'p':(t.premio_calculado>0?'g':'n'),bt=t.pagado?'PAGADO':(t.premio_calculado>0?'GANADOR':'PENDIENTE'),tc=t.pagado?'gano':(t.premio_calculado>0?'pte':'');html+='<div class="tcard '+tc+'"><div style="display:flex;justify-content:space-between;align-items:flex-start;gap:6px;margin-bottom:6px"><div><div class="ts">#'+t.serial+'</div><div style="color:#4a6090;font-size:.7rem">'+t.fecha+'</div></div><div style="text-align:right"><span class="badge '+bc+'">'+bt+'</span><div style="color:#fbbf24;font-family:\'Oswald\',sans-serif;font-size:.9rem;margin-top:3px;font-weight:700">S/'+t.total+'</div>'+(t.premio_calculado>0?'<div style="color:#4ade80;font-size:.82rem;font-weight:700;font-family:\'Oswald\',sans-serif">PREMIO: S/'+t.premio_calculado.toFixed(2)+'</div>':'')+'</div></div></div>';});lista.innerHTML=html;}).catch(()=>{lista.innerHTML='<p style="color:#f87171;text-align:center">Error de conexion</p>';});}
-function cajaHist(){let ini=document.getElementById('ar-ini').value,fin=document.getElementById('ar-fin').value;if(!ini||!fin){toast('Seleccione fechas','err');return;}let c=document.getElementById('ar-res');c.innerHTML='<p style="color:var(--text2);text-align:center;padding:10px;font-size:.75rem">CARGANDO...</p>';fetch('/api/caja-historico',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha_inicio:ini,fecha_fin:fin})}).then(r=>r.json()).then(d=>{if(d.error){c.innerHTML='<p style="color:var(--red)">'+d.error+'</p>';return;}let html='<div class="sbox">';d.resumen_por_dia.forEach(dia=>{let col=dia.balance>=0?'var(--green)':'var(--red)';html+='<div class="srow"><span class="sl">'+dia.fecha+'</span><span style="font-size:.72rem;color:var(--text2)">V:'+dia.ventas+'</span><span class="sv" style="color:'+col+'">S/'+dia.balance.toFixed(2)+'</span></div>';});html+='</div><div class="sbox"><div class="srow"><span class="sl">Ventas</span><span class="sv">S/'+d.totales.ventas.toFixed(2)+'</span></div><div class="srow"><span class="sl">Premios</span><span class="sv" style="color:var(--red)">S/'+d.totales.premios.toFixed(2)+'</span></div><div class="srow"><span class="sl">Comision</span><span class="sv">S/'+d.totales.comision.toFixed(2)+'</span></div><div class="srow"><span class="sl">Balance</span><span class="sv" style="color:'+(d.totales.balance>=0?'var(--green)':'var(--red)')+'">S/'+d.totales.balance.toFixed(2)+'</span></div></div>';c.innerHTML=html;});}
-function openCaja(){openMod('mod-caja');fetch('/api/caja').then(r=>r.json()).then(d=>{if(d.error)return;let bc=d.balance>=0?'g':'r';document.getElementById('caja-body').innerHTML='<div class="caja-grid"><div class="cg"><div class="cgl">VENTAS</div><div class="cgv">S/'+d.ventas.toFixed(2)+'</div></div><div class="cg"><div class="cgl">PREMIOS PAGADOS</div><div class="cgv r">S/'+d.premios.toFixed(2)+'</div></div><div class="cg"><div class="cgl">COMISION</div><div class="cgv">S/'+d.comision.toFixed(2)+'</div></div><div class="cg"><div class="cgl">BALANCE</div><div class="cgv '+bc+'">S/'+d.balance.toFixed(2)+'</div></div></div><div class="sbox"><div class="srow"><span class="sl">Tickets vendidos</span><span class="sv">'+d.total_tickets+'</span></div><div class="srow"><span class="sl">Con premio pendiente</span><span class="sv" style="color:#c08020">'+d.tickets_pendientes+'</span></div></div>';});}
-function openPagar(){openMod('mod-pagar');document.getElementById('pag-serial').value='';document.getElementById('pag-res').innerHTML='';}
-function verificarTicket(){let s=document.getElementById('pag-serial').value.trim();if(!s)return;let c=document.getElementById('pag-res');fetch('/api/verificar-ticket',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({serial:s})}).then(r=>r.json()).then(d=>{if(d.error){c.innerHTML='<div style="background:var(--red-bg);color:var(--red);padding:10px;border-radius:3px;text-align:center;margin-top:8px;border:1px solid var(--red-border)">X '+d.error+'</div>';return;}let col=d.total_ganado>0?'var(--green)':'var(--text2)';c.innerHTML='<div style="border:1px solid '+col+';border-radius:4px;padding:14px;margin-top:10px"><div style="color:var(--teal);font-family:\'Oswald\',sans-serif;letter-spacing:2px;margin-bottom:10px">TICKET #'+s+'</div><div style="display:flex;justify-content:space-between;align-items:center;margin-bottom:12px"><span style="color:var(--text2);font-size:.8rem">PREMIO</span><span style="color:'+col+';font-family:\'Oswald\',sans-serif;font-size:1.2rem;font-weight:700">S/'+d.total_ganado.toFixed(2)+'</span></div>'+(d.total_ganado>0?'<button onclick="pagarTicket('+d.ticket_id+','+d.total_ganado+')" style="width:100%;padding:11px;background:linear-gradient(135deg,#0a3020,#062018);color:var(--green);border:1px solid #0d5a2a;border-radius:3px;font-weight:700;cursor:pointer;font-family:\'Oswald\',sans-serif;letter-spacing:2px;font-size:.85rem">CONFIRMAR PAGO S/'+d.total_ganado.toFixed(2)+'</button>':'<div style="color:var(--text2);text-align:center;font-size:.8rem;padding:6px">SIN PREMIO</div>')+'</div>';});}
-function pagarTicket(tid,m){if(!confirm('Confirmar pago S/'+m+'?'))return;fetch('/api/pagar-ticket',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({ticket_id:tid})}).then(r=>r.json()).then(d=>{if(d.status==='ok'){toast('Ticket pagado','ok');closeMod('mod-pagar');}else toast(d.error||'Error','err');});}
-function openAnular(){openMod('mod-anular');document.getElementById('an-serial').value='';document.getElementById('an-res').innerHTML='';}
-function anularTicket(){let s=document.getElementById('an-serial').value.trim();if(!s)return;fetch('/api/anular-ticket',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({serial:s})}).then(r=>r.json()).then(d=>{let c=document.getElementById('an-res');if(d.status==='ok')c.innerHTML='<div style="background:#062012;color:var(--green);padding:10px;border-radius:3px;text-align:center;margin-top:8px;border:1px solid #0d5a2a">'+d.mensaje+'</div>';else c.innerHTML='<div style="background:var(--red-bg);color:var(--red);padding:10px;border-radius:3px;text-align:center;margin-top:8px;border:1px solid var(--red-border)">'+d.error+'</div>';});}
-function openMod(id){document.getElementById(id).classList.add('open');}
-function closeMod(id){document.getElementById(id).classList.remove('open');}
-document.querySelectorAll('.modal').forEach(m=>{m.addEventListener('click',e=>{if(e.target===m)m.classList.remove('open');});});
-function toast(msg,tipo){let t=document.getElementById('toast');t.textContent=msg;t.className='toast '+tipo;t.style.display='block';clearTimeout(window._tt);window._tt=setTimeout(()=>t.style.display='none',2800);}
-document.addEventListener('DOMContentLoaded',init);
-</script>
-</body></html>'''
-
-ADMIN_HTML = r'''<!DOCTYPE html>
-<html><head>
-<meta charset="UTF-8"><meta name="viewport" content="width=device-width,initial-scale=1">
-<title>ZOOLO ADMIN v4.1</title>
-<link href="https://fonts.googleapis.com/css2?family=Oswald:wght@400;600;700&family=Rajdhani:wght@500;600&display=swap" rel="stylesheet">
-<style>
-:root{--bg:#050a12;--panel:#0a1020;--card:#060e1c;--border:#1a2a4a;--gold:#f5a623;--blue:#2060d0;--teal:#00c8e8;--red:#e05050;--red-bg:rgba(220,40,40,.08);--red-border:rgba(200,40,40,.2);--green:#2ecc71;--orange:#f5a623;--text:#c0d8f0;--text2:#3a5080}
-*{box-sizing:border-box;margin:0;padding:0}
-body{background:var(--bg);color:var(--text);font-family:'Rajdhani',sans-serif;font-size:14px}
-.topbar{background:#030810;border-bottom:3px solid var(--gold);padding:0 16px;height:44px;display:flex;align-items:center;justify-content:space-between}
-.brand{font-family:'Oswald',sans-serif;font-size:1.2rem;font-weight:700;letter-spacing:3px;color:#fff}.brand em{color:var(--gold);font-style:normal}
-.tbtn{padding:6px 14px;border:1px solid var(--border);background:var(--card);color:var(--text);border-radius:3px;cursor:pointer;font-size:.72rem;font-family:'Oswald',sans-serif;font-weight:700;letter-spacing:1px}
-.tbtn:hover{background:var(--border);color:#fff}.tbtn.exit{border-color:#4a1010;color:var(--red)}.tbtn.exit:hover{background:#3a0808;border-color:var(--red)}
-.tabs{display:flex;gap:2px;padding:8px 12px;background:#030810;border-bottom:1px solid var(--border);overflow-x:auto;white-space:nowrap}
-.tab{padding:8px 14px;background:var(--card);border:1px solid var(--border);border-radius:3px;cursor:pointer;font-family:'Oswald',sans-serif;font-size:.72rem;font-weight:700;letter-spacing:1px;color:var(--text2);transition:all .2s}
-.tab:hover{background:var(--border);color:var(--text)}.tab.active{background:var(--blue);border-color:var(--teal);color:#fff;box-shadow:0 0 12px rgba(32,96,208,.3)}
-.tc{display:none;padding:12px;max-width:1200px;margin:0 auto}.tc.active{display:block}
-.card{background:var(--panel);border:1px solid var(--border);border-radius:6px;padding:14px;margin-bottom:12px}
-.card-title{font-family:'Oswald',sans-serif;font-size:.75rem;font-weight:700;letter-spacing:2px;color:var(--gold);border-bottom:1px solid var(--border);padding-bottom:8px;margin-bottom:12px}
-label{display:block;color:var(--text2);font-size:.68rem;letter-spacing:2px;margin-bottom:4px;font-family:'Oswald',sans-serif}
-input,select{width:100%;padding:9px 10px;background:var(--card);border:1px solid var(--border);border-radius:3px;color:var(--text);font-family:'Rajdhani',sans-serif;font-size:.88rem}
-input:focus,select:focus{outline:none;border-color:var(--blue)}
-.btn{padding:9px 18px;background:var(--blue);color:#fff;border:1px solid #4080e0;border-radius:3px;cursor:pointer;font-family:'Oswald',sans-serif;font-weight:700;letter-spacing:1px;font-size:.75rem}
-.btn:hover{background:#2a6ae8;border-color:#60a0ff}.btn.red{background:#4a0808;border-color:var(--red);color:var(--red)}.btn.red:hover{background:#6a0a0a}.btn.green{background:#0a3a18;border-color:var(--green);color:var(--green)}.btn.green:hover{background:#0e4a20}.btn.gold{background:#3a2000;border-color:var(--gold);color:var(--gold)}.btn.gold:hover{background:#4a2800}
-.btn-block{width:100%;margin-top:8px}
-.grid2{display:grid;grid-template-columns:1fr 1fr;gap:12px}
-.grid3{display:grid;grid-template-columns:1fr 1fr 1fr;gap:12px}
-.frow{display:flex;gap:8px;flex-wrap:wrap;margin-bottom:10px}
-.frow .fg{flex:1;min-width:120px}
-.fg{margin-bottom:10px}
-.tag{display:inline-block;padding:2px 7px;border-radius:3px;font-size:.65rem;font-weight:700;font-family:'Oswald',sans-serif;letter-spacing:1px}
-.tag.ok{background:#0a2a14;color:var(--green);border:1px solid #1a5a28}.tag.err{background:#2a0808;color:var(--red);border:1px solid #4a1010}.tag.warn{background:#2a1a00;color:var(--gold);border:1px solid #5a3000}.tag.info{background:#0a1a30;color:var(--teal);border:1px solid #1a4060}
-.tbl{width:100%;border-collapse:collapse;font-size:.75rem}
-.tbl th{background:#060c18;color:var(--text2);text-align:left;padding:7px 10px;border-bottom:2px solid var(--border);font-family:'Oswald',sans-serif;font-weight:700;letter-spacing:1px;font-size:.65rem}
-.tbl td{padding:7px 10px;border-bottom:1px solid var(--border);vertical-align:middle}
-.tbl tr:hover td{background:rgba(30,60,120,.1)}
-.animals-mini-grid{display:grid;grid-template-columns:repeat(7,1fr);gap:4px}
-.amg-card{background:var(--card);border:1px solid var(--border);border-radius:3px;padding:5px 3px;text-align:center;cursor:pointer;transition:all .12s}
-.amg-card:hover{background:#1a2a4a;border-color:var(--teal)}.amg-card.sel{background:#0a2a10;border-color:var(--green)}
-.amg-card .anum{font-size:.72rem;font-weight:700;font-family:'Oswald',sans-serif;color:#fff}
-.amg-card .anom{font-size:.55rem;color:var(--text2)}
-.stat-box{background:var(--card);border:1px solid var(--border);border-radius:4px;padding:10px;text-align:center}
-.stat-label{color:var(--text2);font-size:.6rem;letter-spacing:2px;margin-bottom:3px;font-family:'Oswald',sans-serif}
-.stat-val{color:var(--gold);font-family:'Oswald',sans-serif;font-size:1.1rem;font-weight:700}
-.stat-val.g{color:var(--green)}.stat-val.r{color:var(--red)}.stat-val.t{color:var(--teal)}
-.msg{padding:9px 12px;border-radius:3px;margin-bottom:10px;font-size:.8rem;display:none}
-.msg.ok{background:rgba(46,204,113,.08);color:var(--green);border:1px solid rgba(46,204,113,.25)}
-.msg.err{background:var(--red-bg);color:var(--red);border:1px solid var(--red-border)}
-.riesgo-bar{height:16px;border-radius:3px;background:#0a1828;overflow:hidden;position:relative;margin:2px 0}
-.riesgo-fill{height:100%;border-radius:3px;transition:width .4s;min-width:2px}
-.loteria-tabs{display:flex;gap:4px;margin-bottom:12px}
-.lot-tab{flex:1;padding:9px 6px;text-align:center;border-radius:4px;cursor:pointer;font-family:'Oswald',sans-serif;font-size:.75rem;font-weight:700;letter-spacing:1px;border:2px solid var(--border);color:var(--text2);transition:all .2s}
-.lot-tab.peru.active{background:#0c2461;border-color:#3b82f6;color:#bae6fd}
-.lot-tab.plus.active{background:#2e1065;border-color:#a855f7;color:#e9d5ff}
-.lot-tab:hover{background:var(--border);color:var(--text)}
-.toggle-btn{display:inline-flex;align-items:center;gap:8px;padding:10px 20px;border-radius:5px;cursor:pointer;font-family:'Oswald',sans-serif;font-size:.85rem;font-weight:700;letter-spacing:2px;border:2px solid;transition:all .3s}
-.toggle-btn.on{background:#0a3018;border-color:#22c55e;color:#4ade80;box-shadow:0 0 20px rgba(34,197,94,.2)}
-.toggle-btn.off{background:#1a0808;border-color:#ef4444;color:#f87171}
-.toggle-btn:hover{opacity:.85}
-.reporte-7030-table{width:100%;border-collapse:collapse;font-size:.74rem}
-.reporte-7030-table th{background:#060c18;color:var(--text2);padding:7px 8px;border-bottom:2px solid var(--border);font-family:'Oswald',sans-serif;font-size:.62rem;letter-spacing:1px;text-align:right}
-.reporte-7030-table th:first-child,.reporte-7030-table th:nth-child(2){text-align:left}
-.reporte-7030-table td{padding:6px 8px;border-bottom:1px solid var(--border);text-align:right;vertical-align:middle}
-.reporte-7030-table td:first-child,.reporte-7030-table td:nth-child(2){text-align:left}
-.reporte-7030-table tr:hover td{background:rgba(30,60,120,.1)}
-.reporte-7030-table tr.pte td{opacity:.5}
-.reporte-7030-table tfoot td{font-family:'Oswald',sans-serif;font-weight:700;font-size:.72rem;background:#060c18;border-top:2px solid var(--border);padding:8px}
-.modo-badge{display:inline-block;padding:2px 6px;border-radius:3px;font-size:.6rem;font-family:'Oswald',sans-serif;font-weight:700}
-.modo-badge.auto{background:#0a2a14;color:#4ade80;border:1px solid #166534}
-.modo-badge.manual{background:#1a1a00;color:#fbbf24;border:1px solid #854d0e}
-.modo-badge.pte{background:#0a0a1a;color:#4a6090;border:1px solid #1a2a4a}
-</style></head><body>
-<div class="topbar">
-  <div class="brand">ZOO<em>LO</em> <span style="font-size:.75rem;color:var(--text2);font-weight:400;letter-spacing:1px">ADMIN v4.1</span></div>
-  <div style="display:flex;gap:6px">
-    <div id="clock-admin" style="color:var(--gold);font-family:'Oswald',sans-serif;font-size:.8rem;background:var(--card);padding:4px 10px;border-radius:3px;border:1px solid var(--border)">--:-- LIMA</div>
-    <button class="tbtn exit" onclick="location.href='/logout'">SALIR</button>
-  </div>
-</div>
-<div class="tabs">
-  <div class="tab active" onclick="showTab('resultados')">📊 RESULTADOS</div>
-  <div class="tab"{% if not es_superadmin %} style="display:none"{% endif %} onclick="showTab('riesgo')">⚡ RIESGO</div>
-  <div class="tab"{% if not es_superadmin %} style="display:none"{% endif %} onclick="showTab('setentaytreinta')">📈 70/30</div>
-  <div class="tab" onclick="showTab('agencias')">🏢 AGENCIAS</div>
-  <div class="tab" onclick="showTab('topes')">🔒 TOPES</div>
-  <div class="tab" onclick="showTab('reportes')">💼 REPORTES</div>
-  <div class="tab" onclick="showTab('tripletas')">🎯 TRIPLETAS</div>
-  <div class="tab" onclick="showTab('auditoria')">📋 AUDITORÍA</div>
-  {% if es_superadmin %}<div class="tab" onclick="showTab('admins')">👑 ADMINS</div>{% endif %}
-</div>
-
-<!-- TAB RESULTADOS -->
-<div id="tc-resultados" class="tc active">
-  <div class="card"{% if not es_superadmin %} style="display:none"{% endif %}>
-    <div style="display:flex;justify-content:space-between;align-items:center;flex-wrap:wrap;gap:8px;margin-bottom:12px">
-      <div class="card-title" style="border:none;padding:0;margin:0">📊 CARGAR RESULTADO</div>
-      <div style="display:flex;align-items:center;gap:10px">
-        <span style="color:var(--text2);font-size:.7rem;font-family:'Oswald',sans-serif;letter-spacing:1px">AUTO-SORTEO:</span>
-        <button class="toggle-btn off" id="toggle-auto-btn" onclick="toggleAutoSorteo()">⏸ DESACTIVADO</button>
-      </div>
-    </div>
-    <div class="loteria-tabs">
-      <div class="lot-tab peru active" id="lot-res-peru" onclick="selLotRes('peru')">🇵🇪 ZOOLO PERU</div>
-      <div class="lot-tab plus" id="lot-res-plus" onclick="selLotRes('plus')">🎰 ZOOLO PLUS</div>
-    </div>
-    <div class="frow">
-      <div class="fg"><label>FECHA</label><input type="date" id="res-fecha" onchange="cargarResultadosAdmin()"></div>
-      <div class="fg"><label>HORA SORTEO</label><select id="res-hora"></select></div>
-      <div class="fg"><label>ANIMAL (0-40)</label>
-        <div class="animals-mini-grid" id="amg"></div>
-      </div>
-    </div>
-    <div style="margin-bottom:10px">
-      <div style="display:flex;justify-content:space-between;align-items:center;margin-bottom:6px">
-        <span style="color:var(--red);font-family:Oswald,sans-serif;font-size:.75rem;font-weight:700">🚫 NÚMEROS BLOQUEADOS (manual permanente)</span>
-        <div style="display:flex;gap:6px">
-          <button onclick="selLotBloq('peru')" id="bloq-btn-peru" class="tag info" style="cursor:pointer;font-size:.6rem;padding:2px 8px">PERÚ</button>
-          <button onclick="selLotBloq('plus')" id="bloq-btn-plus" class="tag" style="cursor:pointer;font-size:.6rem;padding:2px 8px;border-color:#7c3aed;color:#c084fc">PLUS</button>
-        </div>
-      </div>
-      <div id="bloq-grid" style="display:grid;grid-template-columns:repeat(7,1fr);gap:3px;margin-bottom:6px"></div>
-      <div id="bloq-info" style="font-size:.62rem;color:var(--text2);text-align:center">Toca un número para bloquearlo / desbloquearlo permanentemente</div>
-    </div>
-    <div id="animal-sel-preview" style="margin-bottom:10px;color:var(--gold);font-family:'Oswald',sans-serif;font-size:.85rem;min-height:20px;text-align:center"></div>
-    <div id="msg-res" class="msg"></div>
-    <div style="display:flex;gap:8px">
-      <button class="btn btn-block" onclick="guardarResultado()">✅ GUARDAR RESULTADO</button>
-      <button class="btn btn-block" style="background:#3a2000;border-color:var(--gold);color:var(--gold)" onclick="forzarAutoSorteo()">⚡ AUTO-SORTEAR HORA</button>
-    </div>
-  </div>
-
-  <!-- NUEVO v4.1: Panel de bloqueos automáticos -->
-  <div class="card"{% if not es_superadmin %} style="display:none"{% endif %}>
-    <div style="display:flex;justify-content:space-between;align-items:center;margin-bottom:10px">
-      <div class="card-title" style="border:none;padding:0;margin:0">🔐 BLOQUEOS AUTOMÁTICOS HOY</div>
-      <button class="btn" style="padding:4px 10px;font-size:.65rem" onclick="cargarBloqueos()">🔄 Actualizar</button>
-    </div>
-    <div class="loteria-tabs" style="margin-bottom:8px">
-      <div class="lot-tab peru active" id="lot-bloq-auto-peru" onclick="selLotBloqAuto('peru')">🇵🇪 PERU</div>
-      <div class="lot-tab plus" id="lot-bloq-auto-plus" onclick="selLotBloqAuto('plus')">🎰 PLUS</div>
-    </div>
-    <div id="bloq-auto-body">
-      <div style="color:var(--text2);text-align:center;padding:12px;font-size:.72rem;letter-spacing:1px">Cargando bloqueos...</div>
-    </div>
-  </div>
-
-  <div class="card">
-    <div class="card-title">📋 RESULTADOS DEL DÍA</div>
-    <div id="resultados-hoy-peru">
-      <div style="color:var(--text2);font-size:.7rem;font-family:'Oswald',sans-serif;letter-spacing:2px;margin-bottom:6px">🇵🇪 PERÚ</div>
-      <div id="res-lista-peru" style="display:grid;grid-template-columns:repeat(auto-fill,minmax(130px,1fr));gap:4px"></div>
-    </div>
-    <div id="resultados-hoy-plus" style="margin-top:12px">
-      <div style="color:#a855f7;font-size:.7rem;font-family:'Oswald',sans-serif;letter-spacing:2px;margin-bottom:6px">🎰 PLUS</div>
-      <div id="res-lista-plus" style="display:grid;grid-template-columns:repeat(auto-fill,minmax(130px,1fr));gap:4px"></div>
-    </div>
-  </div>
-</div>
-
-<!-- TAB RIESGO -->
-<div id="tc-riesgo" class="tc">
-  <div class="card">
-    <div class="card-title">⚡ MONITOR DE RIESGO EN TIEMPO REAL</div>
-    <div class="loteria-tabs">
-      <div class="lot-tab peru active" id="lot-riesgo-peru" onclick="selLotRiesgo('peru')">🇵🇪 ZOOLO PERU</div>
-      <div class="lot-tab plus" id="lot-riesgo-plus" onclick="selLotRiesgo('plus')">🎰 ZOOLO PLUS</div>
-    </div>
-    <div class="frow">
-      <div class="fg"><label>SORTEO</label><select id="risk-hora"></select></div>
-      <div class="fg" style="align-self:flex-end"><button class="btn" onclick="cargarRiesgo()">🔄 ACTUALIZAR</button></div>
-    </div>
-    <div id="riesgo-summary" style="display:grid;grid-template-columns:repeat(4,1fr);gap:8px;margin-bottom:12px"></div>
-    <div style="margin-bottom:8px;display:flex;justify-content:space-between;align-items:center">
-      <div class="card-title" style="border:none;margin:0;padding:0">APUESTAS POR ANIMAL</div>
-      <div id="riesgo-agencias-btn" style="display:none"><select id="riesgo-agencia-sel" style="width:auto;padding:4px 8px;font-size:.72rem" onchange="verRiesgoAgencia()"><option value="">-- Filtrar por agencia --</option></select></div>
-    </div>
-    <div id="riesgo-tabla"></div>
-  </div>
-</div>
-
-<!-- TAB 70/30 -->
-<div id="tc-setentaytreinta" class="tc">
-  <div class="card">
-    <div class="card-title">📈 REPORTE 70/30 POR JORNADA</div>
-    <div class="loteria-tabs">
-      <div class="lot-tab peru active" id="lot-7030-peru" onclick="selLot7030('peru')">🇵🇪 ZOOLO PERU</div>
-      <div class="lot-tab plus" id="lot-7030-plus" onclick="selLot7030('plus')">🎰 ZOOLO PLUS</div>
-    </div>
-    <div class="frow">
-      <div class="fg"><label>FECHA</label><input type="date" id="fecha-7030"></div>
-      <div class="fg" style="align-self:flex-end"><button class="btn" onclick="cargar7030()">📊 VER REPORTE</button></div>
-    </div>
-  </div>
-  <div id="res-7030"></div>
-</div>
-
-<!-- TAB AGENCIAS -->
-<div id="tc-agencias" class="tc">
-  <div class="grid2">
-    <div class="card">
-      <div class="card-title">➕ NUEVA AGENCIA</div>
-      <div class="fg"><label>USUARIO</label><input type="text" id="ag-user"></div>
-      <div class="fg"><label>CONTRASEÑA</label><input type="password" id="ag-pass"></div>
-      <div class="fg"><label>NOMBRE</label><input type="text" id="ag-nombre"></div>
-      <div class="fg"><label>BANCO (opcional)</label><input type="text" id="ag-banco"></div>
-      <div id="msg-ag" class="msg"></div>
-      <button class="btn btn-block green" onclick="crearAgencia()">CREAR AGENCIA</button>
-    </div>
-    <div class="card">
-      <div class="card-title">🏢 AGENCIAS ACTIVAS</div>
-      <button class="btn btn-block" style="margin-bottom:10px" onclick="listarAgencias()">🔄 ACTUALIZAR LISTA</button>
-      <div id="ag-lista"></div>
-    </div>
-  </div>
-</div>
-
-<!-- TAB TOPES -->
-<div id="tc-topes" class="tc">
-  <div class="card">
-    <div class="card-title">🔒 GESTIÓN DE TOPES</div>
-    <div class="loteria-tabs">
-      <div class="lot-tab peru active" id="lot-topes-peru" onclick="selLotTopes('peru')">🇵🇪 ZOOLO PERU</div>
-      <div class="lot-tab plus" id="lot-topes-plus" onclick="selLotTopes('plus')">🎰 ZOOLO PLUS</div>
-    </div>
-    <div class="frow">
-      <div class="fg"><label>HORA</label><select id="tope-hora"></select></div>
-      <div class="fg" style="align-self:flex-end">
-        <button class="btn" onclick="cargarTopes()">VER TOPES</button>
-        {% if es_superadmin %}<button class="btn red" style="margin-left:6px" onclick="limpiarTopes()">LIMPIAR TODO</button>{% endif %}
-      </div>
-    </div>
-    <div id="topes-body"></div>
-  </div>
-</div>
-
-<!-- TAB REPORTES -->
-<div id="tc-reportes" class="tc">
-  <div class="card">
-    <div class="card-title">💼 REPORTE HOY</div>
-    <div style="display:flex;gap:8px;margin-bottom:10px">
-      <button class="btn" onclick="cargarReporteHoy()">📊 REPORTE DEL DÍA</button>
-      <button class="btn gold" onclick="location.href='/admin/exportar-csv';return false" id="btn-csv" style="opacity:.5" disabled>📥 EXPORTAR CSV</button>
-    </div>
-    <div id="rep-hoy"></div>
-  </div>
-  <div class="card">
-    <div class="card-title">📅 REPORTE POR PERÍODO</div>
-    <div class="frow">
-      <div class="fg"><label>INICIO</label><input type="date" id="rep-ini"></div>
-      <div class="fg"><label>FIN</label><input type="date" id="rep-fin"></div>
-    </div>
-    <div style="display:flex;gap:8px;flex-wrap:wrap">
-      <button class="btn" onclick="cargarEstadisticas()">📈 ESTADÍSTICAS</button>
-      <button class="btn gold" onclick="exportarCSV()">📥 EXPORTAR CSV</button>
-      <button class="btn" style="background:#1a0a30;border-color:#a855f7;color:#c084fc" onclick="cargarReporteAgencias()">🏢 POR AGENCIA</button>
-    </div>
-    <div id="rep-periodo"></div>
-  </div>
-</div>
-
-<!-- TAB TRIPLETAS -->
-<div id="tc-tripletas" class="tc">
-  <div class="card">
-    <div class="card-title">🎯 TRIPLETAS HOY</div>
-    <button class="btn btn-block" onclick="cargarTripletas()">🔄 CARGAR TRIPLETAS</button>
-    <div id="trip-body" style="margin-top:10px"></div>
-  </div>
-</div>
-
-<!-- TAB AUDITORÍA -->
-<div id="tc-auditoria" class="tc">
-  <div class="card">
-    <div class="card-title">📋 AUDITORÍA DEL SISTEMA</div>
-    <div class="frow">
-      <div class="fg"><label>INICIO</label><input type="date" id="aud-ini"></div>
-      <div class="fg"><label>FIN</label><input type="date" id="aud-fin"></div>
-      <div class="fg"><label>BUSCAR</label><input type="text" id="aud-filtro" placeholder="acción, usuario..."></div>
-    </div>
-    <button class="btn btn-block" onclick="cargarAudit()">CARGAR LOGS</button>
-    <div id="aud-body" style="margin-top:10px;max-height:500px;overflow-y:auto"></div>
-  </div>
-</div>
-
-{% if es_superadmin %}
-<!-- TAB ADMINS (solo super-admin) -->
-<div id="tc-admins" class="tc">
-  <div class="grid2">
-    <div class="card">
-      <div class="card-title">&#128081; NUEVO ADMINISTRADOR</div>
-      <div class="fg"><label>USUARIO</label><input type="text" id="adm-user"></div>
-      <div class="fg"><label>CONTRASE&Ntilde;A</label><input type="password" id="adm-pass"></div>
-      <div class="fg"><label>NOMBRE</label><input type="text" id="adm-nombre"></div>
-      <div id="msg-adm" class="msg"></div>
-      <button class="btn btn-block green" onclick="crearAdmin()">CREAR ADMINISTRADOR</button>
-      <div style="color:var(--text2);font-size:.68rem;margin-top:8px;line-height:1.4">Cada administrador solo ver&aacute; y gestionar&aacute; las agencias que le pertenezcan. Para pasarle agencias existentes, ve a la pesta&ntilde;a AGENCIAS y usa "Reasignar due&ntilde;o".</div>
-    </div>
-    <div class="card">
-      <div class="card-title">&#128081; ADMINISTRADORES</div>
-      <button class="btn btn-block" style="margin-bottom:10px" onclick="listarAdmins()">&#128260; ACTUALIZAR</button>
-      <div id="adm-lista"></div>
-    </div>
-  </div>
-</div>
-{% endif %}
-
-<script>
-const ANIMALES = {{ animales | tojson }};
-const HPERU = {{ horarios | tojson }};
-const HPLUS = {{ horarios_plus | tojson }};
-const ES_SUPER = {{ 'true' if es_superadmin else 'false' }};
-const ORDEN = ['00','0','1','2','3','4','5','6','7','8','9','10','11','12','13','14','15','16','17','18','19','20','21','22','23','24','25','26','27','28','29','30','31','32','33','34','35','36','37','38','39','40'];
-let animalSel=null,lotRes='peru',lotRiesgo='peru',lotTopes='peru',lot7030='peru',_lotBloqAuto='peru';
-
-function showTab(id){
-  document.querySelectorAll('.tab').forEach(t=>t.classList.remove('active'));
-  document.querySelectorAll('.tc').forEach(t=>t.classList.remove('active'));
-  document.getElementById('tc-'+id).classList.add('active');
-  let tabs=document.querySelectorAll('.tab');
-  let tabMap={resultados:0,riesgo:1,setentaytreinta:2,agencias:3,topes:4,reportes:5,tripletas:6,auditoria:7,admins:8};
-  if(tabMap[id]!==undefined)tabs[tabMap[id]].classList.add('active');
-  if(id==='riesgo'){fillHorasRiesgo();cargarRiesgo();}
-  if(id==='tripletas')cargarTripletas();
-  if(id==='agencias')listarAgencias();
-  if(id==='admins')listarAdmins();
-}
-
-function actualizarClockAdmin(){let now=new Date(),utcMs=now.getTime()+now.getTimezoneOffset()*60000,peruMs=utcMs-5*3600000,peru=new Date(peruMs),h=peru.getHours(),m=peru.getMinutes(),ap=h>=12?'PM':'AM';h=h%12||12;document.getElementById('clock-admin').textContent=h+':'+String(m).padStart(2,'0')+' '+ap+' · LIMA';}
-setInterval(actualizarClockAdmin,1000);actualizarClockAdmin();
-
-let _secuencias={'peru':[],'plus':[]};
-function renderAMG(){let g=document.getElementById('amg');g.innerHTML='';ORDEN.forEach(k=>{if(!ANIMALES[k])return;let d=document.createElement('div');d.className='amg-card'+(k===animalSel?' sel':'');d.innerHTML='<div class="anum">'+k+'</div><div class="anom">'+ANIMALES[k].substring(0,5)+'</div>';d.onclick=()=>{animalSel=k;renderAMG();document.getElementById('animal-sel-preview').textContent='✅ '+k+' — '+ANIMALES[k];};g.appendChild(d);});}
-
-function cargarSecuencia(){fetch('/admin/secuencia-sugerida?loteria='+lotRes).then(r=>r.json()).then(d=>{if(d.status==='ok'&&d.sugeridos.length){_secuencias[lotRes]=d.sugeridos.map(x=>x.num);}else{_secuencias[lotRes]=[];}}).catch(()=>{});}
-
-function cargarResultadosAdmin(){let f=document.getElementById('res-fecha').value;if(!f)return;Promise.all([
-fetch('/api/resultados-fecha-admin',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha:f,loteria:'peru'})}).then(r=>r.json()),
-fetch('/api/resultados-fecha-admin',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha:f,loteria:'plus'})}).then(r=>r.json())
-]).then(([dp,dpl])=>{
-  let renderLista=(data,lista,horarios,lot)=>{
-    lista.innerHTML='';
-    horarios.forEach(function(h){
-      var res=data[h];
-      var d=document.createElement('div');
-      d.style.cssText='padding:5px 8px;border-radius:3px;font-size:.72rem;display:flex;align-items:center;gap:4px;background:'+(res?'rgba(46,204,113,.06)':'var(--card)')+';border:1px solid '+(res?'rgba(46,204,113,.2)':'var(--border)');
-      var hs=document.createElement('span');hs.style.cssText='color:var(--teal);font-family:Oswald,sans-serif;font-size:.7rem;font-weight:700;min-width:46px';hs.textContent=h.replace(':00 ','');
-      var rs=document.createElement('span');rs.style.cssText='flex:1;font-weight:'+(res?'700':'400')+';color:'+(res?'#4ade80':'var(--text2)')+';font-size:'+(res?'.72rem':'.65rem');rs.textContent=res?res.animal+' - '+res.nombre:'PENDIENTE';
-      d.appendChild(hs);d.appendChild(rs);
-      if(res){
-        (function(hora,loteria){
-          var be=document.createElement('button');be.textContent='Editar';be.style.cssText='background:rgba(251,191,36,.15);border:1px solid rgba(251,191,36,.3);color:var(--gold);border-radius:3px;padding:2px 6px;font-size:.58rem;cursor:pointer';be.onclick=function(){editarResultado(hora,loteria);};
-          var bd=document.createElement('button');bd.textContent='Borrar';bd.style.cssText='background:rgba(231,76,60,.15);border:1px solid rgba(231,76,60,.3);color:var(--red);border-radius:3px;padding:2px 6px;font-size:.58rem;cursor:pointer';bd.onclick=function(){borrarResultado(hora,loteria);};
-          d.appendChild(be);d.appendChild(bd);
-        })(h,lot);
-      }
-      lista.appendChild(d);
-    });
-  };
-  renderLista(dp.resultados,document.getElementById('res-lista-peru'),HPERU,'peru');
-  renderLista(dpl.resultados,document.getElementById('res-lista-plus'),HPLUS,'plus');
-  cargarBloqueos();
-}).catch(()=>{});}
-
-function borrarResultado(hora,lot){if(!confirm('¿Borrar resultado de '+hora+' ('+lot.toUpperCase()+')?'))return;let fecha=document.getElementById('res-fecha').value;fetch('/admin/borrar-resultado',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({hora:hora,fecha:fecha,loteria:lot})}).then(r=>r.json()).then(d=>{if(d.status==='ok'){showMsg('msg-res','✅ '+d.mensaje,'ok');cargarResultadosAdmin();}else showMsg('msg-res',d.error||'Error','err');}).catch(()=>showMsg('msg-res','Error de conexión','err'));}
-function editarResultado(hora,lot){if(lot==='peru'){selLotRes('peru');}else{selLotRes('plus');}let sel=document.getElementById('res-hora');for(let i=0;i<sel.options.length;i++){if(sel.options[i].value===hora){sel.selectedIndex=i;break;}}document.getElementById('res-hora').scrollIntoView({behavior:'smooth',block:'center'});showMsg('msg-res','✏️ Selecciona el animal nuevo y guarda','ok');}
-function guardarResultado(){let hora=document.getElementById('res-hora').value,fecha=document.getElementById('res-fecha').value,animal=animalSel,loteria=lotRes;if(!animal){showMsg('msg-res','Selecciona un animal','err');return;}if(!hora){showMsg('msg-res','Selecciona la hora','err');return;}let fd=new FormData();fd.append('hora',hora);fd.append('animal',animal);fd.append('loteria',loteria);if(fecha)fd.append('fecha',fecha);fetch('/admin/guardar-resultado',{method:'POST',body:fd}).then(r=>r.json()).then(d=>{if(d.status==='ok'){showMsg('msg-res','✅ '+d.mensaje+' ['+d.fecha+']','ok');animalSel=null;renderAMG();document.getElementById('animal-sel-preview').textContent='';cargarResultadosAdmin();}else showMsg('msg-res',d.error,'err');}).catch(()=>showMsg('msg-res','Error','err'));}
-function forzarAutoSorteo(){let hora=document.getElementById('res-hora').value,loteria=lotRes;if(!hora){showMsg('msg-res','Selecciona la hora','err');return;}if(!confirm('¿Ejecutar auto-sorteo para '+hora+' ('+loteria.toUpperCase()+')? Esto elegirá el animal automáticamente con lógica 70/30.'))return;fetch('/admin/forzar-autosorteo',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({hora:hora,loteria:loteria})}).then(r=>r.json()).then(d=>{if(d.status==='ok'){showMsg('msg-res','✅ Auto-sorteo: '+d.mensaje,'ok');cargarResultadosAdmin();}else showMsg('msg-res',d.error||'Error','err');}).catch(()=>showMsg('msg-res','Error de conexión','err'));}
-
-function fillHorasRes(){let h=document.getElementById('res-hora');if(!h)return;let lista=lotRes==='plus'?HPLUS:HPERU;h.innerHTML=lista.map(x=>'<option value="'+x+'">'+x+'</option>').join('');if(!h.value&&lista.length)h.value=lista[0];}
-function selLotRes(l){lotRes=l;document.getElementById('lot-res-peru').classList.toggle('active',l==='peru');document.getElementById('lot-res-plus').classList.toggle('active',l==='plus');fillHorasRes();cargarSecuencia();}
-function selLotRiesgo(l){lotRiesgo=l;document.getElementById('lot-riesgo-peru').classList.toggle('active',l==='peru');document.getElementById('lot-riesgo-plus').classList.toggle('active',l==='plus');fillHorasRiesgo();cargarRiesgo();}
-function fillHorasRiesgo(){let s=document.getElementById('risk-hora');if(!s)return;let lista=lotRiesgo==='plus'?HPLUS:HPERU;s.innerHTML=lista.map(x=>'<option value="'+x+'">'+x+'</option>').join('');if(!s.value&&lista.length)s.value=lista[0];}
-
-function cargarRiesgo(){let hora=document.getElementById('risk-hora').value,lot=lotRiesgo;if(!hora)return;fetch('/admin/riesgo?hora='+encodeURIComponent(hora)+'&loteria='+lot).then(r=>r.json()).then(d=>{
-  let sm=document.getElementById('riesgo-summary');
-  sm.innerHTML='<div class="stat-box"><div class="stat-label">TOTAL APOSTADO</div><div class="stat-val">S/'+d.total_apostado.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">PRESUPUESTO 70%</div><div class="stat-val t">S/'+d.presupuesto_70.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">SORTEO OBJETIVO</div><div class="stat-val">'+(d.sorteo_objetivo||hora)+'</div></div><div class="stat-box"><div class="stat-label">LOTE</div><div class="stat-val">'+lot.toUpperCase()+'</div></div>';
-  let agSel=document.getElementById('riesgo-agencia-sel');agSel.innerHTML='<option value="">-- Filtrar por agencia --</option>';if(d.agencias_hora&&d.agencias_hora.length){d.agencias_hora.forEach(a=>{let opt=document.createElement('option');opt.value=a.id;opt.textContent=a.nombre_agencia;agSel.appendChild(opt);});document.getElementById('riesgo-agencias-btn').style.display='block';}else{document.getElementById('riesgo-agencias-btn').style.display='none';}
-  window._riesgoHora=hora;window._riesgoLot=lot;
-  if(!d.riesgo||Object.keys(d.riesgo).length===0){document.getElementById('riesgo-tabla').innerHTML='<div style="color:var(--text2);text-align:center;padding:20px;font-size:.75rem">SIN APUESTAS EN ESTE SORTEO</div>';return;}
-  let entries=Object.entries(d.riesgo).sort((a,b)=>b[1].apostado-a[1].apostado);
-  let html='<table class="tbl"><thead><tr><th>N°</th><th>Animal</th><th>Apostado</th><th>Pagaría</th><th>%</th><th>Tope</th><th>%Bar</th></tr></thead><tbody>';
-  let maxPag=Math.max(...entries.map(([_,v])=>v.pagaria));
-  entries.forEach(([k,v])=>{let pct=Math.min(100,maxPag>0?v.pagaria/maxPag*100:0);let col=pct>80?'var(--red)':pct>50?'var(--gold)':'var(--green)';let topeStr=v.libre?'<span class="tag info">LIBRE</span>':'<span style="color:'+(v.apostado>v.tope*.9?'var(--red)':'var(--text)')+';font-family:\'Oswald\',sans-serif;font-size:.75rem">S/'+v.tope+'</span>';let lech=v.es_lechuza?'<span class="tag warn" style="margin-left:4px">x70</span>':'';html+='<tr><td style="font-family:\'Oswald\',sans-serif;color:var(--gold)">'+k+'</td><td>'+v.nombre+lech+'</td><td style="color:var(--teal);font-family:\'Oswald\',sans-serif">S/'+v.apostado.toFixed(2)+'</td><td style="color:'+col+';font-family:\'Oswald\',sans-serif;font-weight:700">S/'+v.pagaria.toFixed(2)+'</td><td style="color:var(--text2)">'+v.porcentaje+'%</td><td>'+topeStr+'</td><td><div class="riesgo-bar"><div class="riesgo-fill" style="width:'+pct+'%;background:'+col+'"></div></div></td></tr>';});
-  html+='</tbody></table>';document.getElementById('riesgo-tabla').innerHTML=html;}).catch(()=>{});}
-
-function verRiesgoAgencia(){let agId=document.getElementById('riesgo-agencia-sel').value,hora=window._riesgoHora;if(!agId||!hora)return;fetch('/admin/riesgo-agencia',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({agencia_id:agId,hora:hora})}).then(r=>r.json()).then(d=>{if(d.error){alert(d.error);return;}let html='<div style="background:var(--card);border:1px solid var(--border);border-radius:4px;padding:10px;margin-top:8px"><div style="color:var(--gold);font-family:\'Oswald\',sans-serif;font-size:.75rem;margin-bottom:8px">'+d.agencia+' — '+d.hora+'</div><table class="tbl"><thead><tr><th>Animal/Esp.</th><th>Apostado</th><th>Pagaría</th><th>Tickets</th></tr></thead><tbody>';d.jugadas.forEach(j=>{html+='<tr><td style="color:var(--teal)">'+j.seleccion+' '+j.nombre+'</td><td style="font-family:\'Oswald\',sans-serif;color:var(--gold)">S/'+j.apostado.toFixed(2)+'</td><td style="color:'+(j.pagaria>0?'var(--red)':'var(--text2)')+'">S/'+j.pagaria.toFixed(2)+'</td><td>'+j.tickets+'</td></tr>';});html+='</tbody></table></div>';document.getElementById('riesgo-tabla').insertAdjacentHTML('afterend',html);}).catch(()=>{});}
-
-function selLot7030(l){lot7030=l;document.getElementById('lot-7030-peru').classList.toggle('active',l==='peru');document.getElementById('lot-7030-plus').classList.toggle('active',l==='plus');}
-function cargar7030(){let f=document.getElementById('fecha-7030').value,lot=lot7030;fetch('/admin/reporte-7030',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha:f||null,loteria:lot})}).then(r=>r.json()).then(d=>{if(d.error){document.getElementById('res-7030').innerHTML='<div class="card"><div style="color:var(--red);padding:12px">'+d.error+'</div></div>';return;}
-let totales=d.totales,sorteos=d.sorteos;
-let html='<div class="card"><div class="card-title">📊 '+lot7030.toUpperCase()+' — '+d.fecha+'</div><div style="display:grid;grid-template-columns:repeat(4,1fr);gap:8px;margin-bottom:14px"><div class="stat-box"><div class="stat-label">TOTAL VENDIDO</div><div class="stat-val">S/'+totales.vendido.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">PRESUPUESTO 70%</div><div class="stat-val t">S/'+totales.presupuesto_70.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">PREMIOS PAGADOS</div><div class="stat-val r">S/'+totales.premio_pagado.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">CASA 30% BRUTO</div><div class="stat-val g">S/'+totales.para_casa_30.toFixed(2)+'</div></div></div><div style="display:grid;grid-template-columns:1fr 1fr 1fr;gap:8px;margin-bottom:14px"><div class="stat-box"><div class="stat-label">ACUM. FIN JORNADA</div><div class="stat-val">S/'+Math.abs(totales.acumulado_fin_jornada).toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">% PAGADO</div><div class="stat-val '+(totales.pct_pagado>70?'r':'g')+'">'+totales.pct_pagado+'%</div></div><div class="stat-box"><div class="stat-label">% CASA</div><div class="stat-val g">'+totales.pct_casa+'%</div></div></div><div style="overflow-x:auto"><table class="reporte-7030-table"><thead><tr><th>HORA</th><th>ANIMAL</th><th>VENDIDO</th><th>70%</th><th>ACUM.REC.</th><th>PRES.TOTAL</th><th>PREMIO</th><th>ACUM.GEN.</th><th>CASA 30%</th><th>MODO</th></tr></thead><tbody>';
-sorteos.forEach(s=>{let modoBadge=s.modo==='auto'?'<span class="modo-badge auto">AUTO</span>':s.modo==='manual'?'<span class="modo-badge manual">MANUAL</span>':'<span class="modo-badge pte">PEND.</span>';let animalStr=s.animal?'<span style="color:#4ade80;font-weight:700">'+s.animal+' — '+s.nombre+'</span>':'<span style="color:var(--text2)">—</span>';let pres_col=s.premio_pagado>s.presupuesto_total?'style="color:var(--red)"':'';html+='<tr class="'+((!s.realizado)?'pte':'')+'"><td style="color:var(--teal);font-family:\'Oswald\',sans-serif;font-size:.7rem;font-weight:700">'+s.hora.replace(':00 ','')+'</td><td>'+animalStr+'</td><td>S/'+s.vendido.toFixed(2)+'</td><td style="color:var(--teal)">S/'+s.presupuesto_70.toFixed(2)+'</td><td style="color:#a855f7">S/'+s.acum_recibido.toFixed(2)+'</td><td style="color:var(--gold)" '+pres_col+'>S/'+s.presupuesto_total.toFixed(2)+'</td><td style="color:var(--red)">S/'+s.premio_pagado.toFixed(2)+'</td><td style="color:var(--green)">S/'+s.acum_generado.toFixed(2)+'</td><td style="color:#22c55e">S/'+s.para_casa_30.toFixed(2)+'</td><td>'+modoBadge+'</td></tr>';});
-html+='</tbody><tfoot><tr><td colspan="2" style="color:var(--gold)">TOTALES</td><td>S/'+totales.vendido.toFixed(2)+'</td><td style="color:var(--teal)">S/'+totales.presupuesto_70.toFixed(2)+'</td><td>—</td><td>—</td><td style="color:var(--red)">S/'+totales.premio_pagado.toFixed(2)+'</td><td>—</td><td style="color:var(--green)">S/'+totales.para_casa_30.toFixed(2)+'</td><td></td></tr></tfoot></table></div></div>';
-document.getElementById('res-7030').innerHTML=html;}).catch(e=>document.getElementById('res-7030').innerHTML='<div class="card"><div style="color:var(--red)">Error: '+e+'</div></div>');}
-
-function listarAgencias(){
-  var doRender=function(adminsMap){
-    fetch('/admin/lista-agencias').then(function(r){return r.json();}).then(function(ags){
-      var html='';
-      if(!ags.length){document.getElementById('ag-lista').innerHTML='<div style="color:var(--text2);text-align:center;padding:20px">Sin agencias</div>';return;}
-      window._agMap={};
-      ags.forEach(function(ag){
-        window._agMap[ag.id]=ag.nombre_agencia;
-        var topeStr=ag.tope_taquilla?'S/'+ag.tope_taquilla:'Sin limite';
-        var bancoStr=ag.nombre_banco?'<div style="color:#a0b0c0;font-size:.68rem">Banco: '+ag.nombre_banco+'</div>':'';
-        var estadoTag='<span class="tag '+(ag.activa?'ok':'err')+'">'+(ag.activa?'ACTIVA':'INACTIVA')+'</span>';
-        var duenoStr='',reasignStr='';
-        if(ES_SUPER){
-          var dnom=(adminsMap&&adminsMap[ag.admin_id])?adminsMap[ag.admin_id]:(ag.admin_id?('ID '+ag.admin_id):'Sin asignar');
-          duenoStr='<div style="color:#c084fc;font-size:.66rem">Dueno: '+dnom+'</div>';
-          var opts='';for(var k in adminsMap){opts+='<option value="'+k+'" '+(String(k)===String(ag.admin_id)?'selected':'')+'>'+adminsMap[k]+'</option>';}
-          reasignStr='<div style="display:flex;gap:4px;margin-top:5px;align-items:center"><span style="color:var(--text2);font-size:.62rem">Dueno:</span><select id="owner-'+ag.id+'" style="flex:1;padding:4px;font-size:.7rem">'+opts+'</select><button class="btn" style="padding:4px 10px;font-size:.65rem;background:#1a0a30;border-color:#a855f7;color:#c084fc" onclick="reasignarDueno('+ag.id+')">Reasignar</button></div>';
-        }
-        html+='<div style="background:var(--card);border:1px solid var(--border);border-radius:4px;padding:10px;margin-bottom:8px"><div style="display:flex;justify-content:space-between;align-items:flex-start;margin-bottom:8px"><div><div style="color:var(--gold);font-weight:700">'+ag.nombre_agencia+'</div><div style="color:var(--text2);font-size:.72rem">'+ag.usuario+' | Com: '+(ag.comision*100).toFixed(0)+'% | Tope: '+topeStr+'</div>'+bancoStr+duenoStr+'</div><div>'+estadoTag+'</div></div><div style="display:grid;grid-template-columns:repeat(4,1fr);gap:5px"><input id="nb-'+ag.id+'" placeholder="Banco" value="'+(ag.nombre_banco||'')+'" style="padding:4px;font-size:.7rem"><input id="pass-'+ag.id+'" placeholder="Nueva clave" type="password" style="padding:4px;font-size:.7rem"><input id="com-'+ag.id+'" placeholder="Comision%" value="'+(ag.comision*100).toFixed(0)+'" type="number" step="1" style="padding:4px;font-size:.7rem"><input id="tope-'+ag.id+'" placeholder="Tope taquilla" value="'+(ag.tope_taquilla||0)+'" type="number" step="10" style="padding:4px;font-size:.7rem"></div>'+reasignStr+'<div style="display:flex;gap:4px;margin-top:5px;flex-wrap:wrap"><button class="btn" style="padding:4px 10px;font-size:.65rem" onclick="editarAg('+ag.id+')">Guardar</button><button class="btn '+(ag.activa?'red':'green')+'" style="padding:4px 10px;font-size:.65rem" onclick="toggleAg('+ag.id+','+(ag.activa?0:1)+')">'+(ag.activa?'Suspender':'Activar')+'</button><button class="btn" style="padding:4px 10px;font-size:.65rem;background:#1a0a30;border-color:#a855f7;color:#c084fc" onclick="verReporteAgencia('+ag.id+')">Reporte</button><button class="btn red" style="padding:4px 10px;font-size:.65rem" onclick="eliminarAgencia('+ag.id+')">Eliminar</button></div></div>';
-      });
-      document.getElementById('ag-lista').innerHTML=html;
-    });
-  };
-  if(ES_SUPER){fetch('/admin/lista-admins').then(function(r){return r.json();}).then(function(admins){var m={};admins.forEach(function(a){m[a.id]=a.nombre_agencia;});doRender(m);}).catch(function(){doRender({});});}
-  else{doRender({});}
-}
-function crearAgencia(){let u=document.getElementById('ag-user').value.trim(),p=document.getElementById('ag-pass').value.trim(),n=document.getElementById('ag-nombre').value.trim(),nb=document.getElementById('ag-banco').value.trim();if(!u||!p||!n){showMsg('msg-ag','Complete todos los campos requeridos','err');return;}let fd=new FormData();fd.append('usuario',u);fd.append('password',p);fd.append('nombre',n);fd.append('nombre_banco',nb);fetch('/admin/crear-agencia',{method:'POST',body:fd}).then(r=>r.json()).then(d=>{if(d.status==='ok'){showMsg('msg-ag',d.mensaje,'ok');['ag-user','ag-pass','ag-nombre','ag-banco'].forEach(i=>document.getElementById(i).value='');listarAgencias();}else showMsg('msg-ag',d.error,'err');});}
-function editarAg(id){let data={id,nombre_banco:document.getElementById('nb-'+id).value,password:document.getElementById('pass-'+id).value,comision:parseFloat(document.getElementById('com-'+id).value)||0,tope_taquilla:parseFloat(document.getElementById('tope-'+id).value)||0};fetch('/admin/editar-agencia',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(data)}).then(r=>r.json()).then(d=>{if(d.status==='ok')alert('✅ Guardado');else alert(d.error);listarAgencias();});}
-function toggleAg(id,activa){fetch('/admin/editar-agencia',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({id,activa})}).then(r=>r.json()).then(()=>listarAgencias());}
-function eliminarAgencia(id){let nombre=window._agMap&&window._agMap[id]?window._agMap[id]:'Agencia '+id;if(!confirm('¿ELIMINAR la agencia "'+nombre+'"?\n\nEsta acción es permanente.'))return;fetch('/admin/eliminar-agencia',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({id})}).then(r=>r.json()).then(d=>{if(d.status==='ok'){alert('✅ '+d.mensaje);listarAgencias();}else alert('❌ '+d.error);}).catch(()=>alert('Error de conexión'));}
-function verReporteAgencia(id){let nombre=window._agMap&&window._agMap[id]?window._agMap[id]:'Agencia '+id;let ini=prompt('Fecha inicio (YYYY-MM-DD) para '+nombre+':');if(!ini)return;let fin=prompt('Fecha fin (YYYY-MM-DD):');if(!fin)return;fetch('/admin/reporte-agencia-horas',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({agencia_id:id,fecha_inicio:ini,fecha_fin:fin})}).then(r=>r.json()).then(d=>{if(d.error){alert(d.error);return;}let ventana=window.open('','_blank');let w=ventana.document;w.open();w.write('<html><head><title>Reporte</title></head><body style="font-family:monospace;background:#050a12;color:#c0d8f0;padding:20px">');w.write('<h2 style="color:#f5a623">'+nombre+' ('+d.usuario+')</h2>');w.write('<h3>Total: S/'+d.total_general+'</h3>');d.resumen.forEach(function(h){w.write('<h4 style="color:#00c8e8">'+h.hora+' - S/'+h.total+' ('+h.conteo+' jugadas)</h4>');w.write('<table border=1 cellpadding=4 style="border-collapse:collapse;color:#c0d8f0;border-color:#1a2a4a"><tr><th>Animal</th><th>Tipo</th><th>Apostado</th><th>Tickets</th></tr>');h.jugadas.forEach(function(j){w.write('<tr><td>'+j.seleccion+' '+j.nombre+'</td><td>'+j.tipo+'</td><td>S/'+j.apostado+'</td><td>'+j.cnt+'</td></tr>');});w.write('</table><br>');});w.write('</body></html>');w.close();});}
-
-function selLotTopes(l){lotTopes=l;document.getElementById('lot-topes-peru').classList.toggle('active',l==='peru');document.getElementById('lot-topes-plus').classList.toggle('active',l==='plus');fillHorasTopes();cargarTopes();}
-function fillHorasTopes(){let s=document.getElementById('tope-hora'),lista=lotTopes==='plus'?HPLUS:HPERU;s.innerHTML=lista.map(x=>'<option value="'+x+'">'+x+'</option>').join('');}
-function cargarTopes(){let hora=document.getElementById('tope-hora').value,lot=lotTopes;fetch('/admin/topes?hora='+encodeURIComponent(hora)+'&loteria='+lot).then(r=>r.json()).then(d=>{if(d.error){document.getElementById('topes-body').innerHTML='<div style="color:var(--red)">'+d.error+'</div>';return;}let html='<table class="tbl"><thead><tr><th>N°</th><th>Animal</th><th>Apostado Hoy</th><th>Tope</th><th>Disponible</th>'+(ES_SUPER?'<th>Acción</th>':'')+'</tr></thead><tbody>';ORDEN.forEach(k=>{if(!ANIMALES[k])return;let t=d.topes.find(x=>x.numero===k);let apt=t?t.apostado:0,tope=t?t.tope:0,disp=t?t.disponible:null;let dispStr=disp!==null?'<span style="color:'+(disp<10?'var(--red)':disp<50?'var(--gold)':'var(--green)')+';font-family:\'Oswald\',sans-serif">S/'+disp.toFixed(2)+'</span>':'<span class="tag info">LIBRE</span>';html+='<tr><td style="font-family:\'Oswald\',sans-serif;color:var(--gold)">'+k+'</td><td>'+ANIMALES[k]+'</td><td style="color:var(--teal);font-family:\'Oswald\',sans-serif">'+(apt>0?'S/'+apt.toFixed(2):'—')+'</td><td>'+(ES_SUPER?('<input type="number" id="tope-monto-'+k+'" value="'+(tope||'')+'" placeholder="Sin tope" style="width:90px;padding:4px;font-size:.75rem" min="0" step="5">'):('<span style="font-family:Oswald,sans-serif;color:var(--gold)">'+(tope>0?'S/'+tope.toFixed(2):'—')+'</span>'))+'</td><td>'+dispStr+'</td>'+(ES_SUPER?('<td><button class="btn" style="padding:3px 8px;font-size:.65rem" onclick="guardarTope(\''+k+'\',\''+hora+'\',\''+lot+'\')">💾</button>'+(tope>0?'<button class="btn red" style="padding:3px 8px;font-size:.65rem;margin-left:4px" onclick="liberarTope(\''+k+'\',\''+hora+'\',\''+lot+'\')">✕</button>':'&nbsp;')+'</td>'):'')+'</tr>';});html+='</tbody></table>';document.getElementById('topes-body').innerHTML=html;});}function guardarTope(num,hora,lot){if(!ES_SUPER){alert('Solo el administrador principal puede modificar topes');return;}let monto=parseFloat(document.getElementById('tope-monto-'+num).value)||0;fetch('/admin/topes/guardar',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({hora,numero:num,monto,loteria:lot})}).then(r=>r.json()).then(d=>{if(d.status==='ok')cargarTopes();else alert(d.error);});}
-function liberarTope(num,hora,lot){if(!ES_SUPER)return;fetch('/admin/topes/guardar',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({hora,numero:num,monto:0,loteria:lot})}).then(r=>r.json()).then(d=>{if(d.status==='ok')cargarTopes();});}
-function limpiarTopes(){if(!ES_SUPER){alert('Solo el administrador principal puede modificar topes');return;}let hora=document.getElementById('tope-hora').value,lot=lotTopes;if(!confirm('¿Eliminar TODOS los topes de '+hora+' ('+lot+')?'))return;fetch('/admin/topes/limpiar',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({hora,loteria:lot})}).then(r=>r.json()).then(d=>{if(d.status==='ok')cargarTopes();else alert(d.error);});}
-
-function cargarReporteHoy(){fetch('/admin/reporte-agencias').then(r=>r.json()).then(d=>{let html='<table class="tbl"><thead><tr><th>Agencia</th><th>Tickets</th><th>Ventas</th><th>Premios Pagados</th><th>Pendientes</th><th>Total Premios</th><th>Comision</th><th>Balance</th></tr></thead><tbody>';d.agencias.forEach(a=>{let bc=a.balance>=0?'var(--green)':'var(--red)';let pend=a.premios_pendientes||0;html+='<tr><td><span style="color:var(--gold)">'+a.nombre+'</span><br><span style="color:var(--text2);font-size:.65rem">'+a.usuario+'</span></td><td>'+a.tickets+'</td><td>S/'+a.ventas.toFixed(2)+'</td><td style="color:var(--red)">S/'+a.premios_pagados.toFixed(2)+'</td><td style="color:var(--gold)">'+(pend>0?'S/'+pend.toFixed(2):'—')+'</td><td style="color:var(--red);font-weight:700">S/'+a.premios_total.toFixed(2)+'</td><td>S/'+a.comision.toFixed(2)+'</td><td style="color:'+bc+';font-weight:700">S/'+a.balance.toFixed(2)+'</td></tr>';});html+='<tfoot><tr><td colspan="2" style="color:var(--gold)">GLOBAL</td><td>S/'+d.global.ventas.toFixed(2)+'</td><td style="color:var(--red)">S/'+d.global.pagos.toFixed(2)+'</td><td></td><td></td><td>S/'+d.global.comisiones.toFixed(2)+'</td><td style="color:'+(d.global.balance>=0?'var(--green)':'var(--red)')+';font-weight:700">S/'+d.global.balance.toFixed(2)+'</td></tr></tfoot></table>';document.getElementById('rep-hoy').innerHTML=html;document.getElementById('btn-csv').disabled=false;document.getElementById('btn-csv').style.opacity=1;});}
-function cargarEstadisticas(){let ini=document.getElementById('rep-ini').value,fin=document.getElementById('rep-fin').value;if(!ini||!fin){alert('Seleccione fechas');return;}fetch('/admin/estadisticas-rango',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha_inicio:ini,fecha_fin:fin})}).then(r=>r.json()).then(d=>{let t=d.totales;let vAnim=Math.round((t.ventas-(t.tripletas||0))*100)/100;let html='<div style="display:grid;grid-template-columns:repeat(2,1fr);gap:8px;margin:12px 0"><div class="stat-box"><div class="stat-label">VENTAS ANIMALES</div><div class="stat-val">S/'+vAnim.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">TRIPLETAS</div><div class="stat-val" style="color:#c084fc">S/'+(t.tripletas||0).toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">TOTAL INGRESOS</div><div class="stat-val" style="color:var(--gold)">S/'+t.ventas.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">PREMIOS</div><div class="stat-val r">S/'+t.premios.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">COMISIONES</div><div class="stat-val">S/'+t.comisiones.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">BALANCE</div><div class="stat-val" style="color:'+(t.balance>=0?'var(--green)':'var(--red)')+'">S/'+t.balance.toFixed(2)+'</div></div></div>';html+='<table class="tbl"><thead><tr><th>Fecha</th><th>Tickets</th><th>V.Animales</th><th style="color:#c084fc">Tripletas</th><th style="color:var(--gold)">Total</th><th>Premios</th><th>Comisiones</th><th>Balance</th></tr></thead><tbody>';d.resumen_por_dia.forEach(function(r){var bc=r.balance>=0?'var(--green)':'var(--red)';var va=Math.round((r.ventas-(r.tripletas||0))*100)/100;html+='<tr><td>'+r.fecha+'</td><td>'+r.tickets+'</td><td>S/'+va.toFixed(2)+'</td><td style="color:#c084fc">S/'+(r.tripletas||0).toFixed(2)+'</td><td style="color:var(--gold);font-weight:700">S/'+r.ventas.toFixed(2)+'</td><td style="color:var(--red)">S/'+r.premios.toFixed(2)+'</td><td>S/'+r.comisiones.toFixed(2)+'</td><td style="color:'+bc+';font-weight:700">S/'+r.balance.toFixed(2)+'</td></tr>';});html+='</tbody></table>';document.getElementById('rep-periodo').innerHTML=html;});}
-function cargarReporteAgencias(){let ini=document.getElementById('rep-ini').value,fin=document.getElementById('rep-fin').value;if(!ini||!fin){alert('Seleccione fechas');return;}fetch('/admin/reporte-agencias-rango',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha_inicio:ini,fecha_fin:fin})}).then(r=>r.json()).then(d=>{let html='<div style="display:grid;grid-template-columns:repeat(4,1fr);gap:8px;margin:12px 0"><div class="stat-box"><div class="stat-label">TOTAL VENTAS</div><div class="stat-val">S/'+d.total.ventas.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">PREMIOS</div><div class="stat-val r">S/'+d.total.premios.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">COMISIONES</div><div class="stat-val">S/'+d.total.comision.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">BALANCE</div><div class="stat-val '+(d.total.balance>=0?'g':'r')+'">S/'+d.total.balance.toFixed(2)+'</div></div></div>';html+='<table class="tbl"><thead><tr><th>Agencia</th><th>Tickets</th><th>Ventas</th><th>% del Total</th><th>Premios</th><th>Comisión</th><th>Balance</th></tr></thead><tbody>';d.agencias.forEach(a=>{let bc=a.balance>=0?'var(--green)':'var(--red)';html+='<tr><td><span style="color:var(--gold)">'+a.nombre+'</span><br><span style="color:var(--text2);font-size:.65rem">'+a.usuario+'</span></td><td>'+a.tickets+'</td><td>S/'+a.ventas.toFixed(2)+'</td><td style="color:var(--text2)">'+(a.porcentaje_ventas||0)+'%</td><td style="color:var(--red)">S/'+a.premios_teoricos.toFixed(2)+'</td><td>S/'+a.comision.toFixed(2)+'</td><td style="color:'+bc+';font-family:\'Oswald\',sans-serif">S/'+a.balance.toFixed(2)+'</td></tr>';});html+='</tbody></table>';document.getElementById('rep-periodo').innerHTML=html;});}
-function exportarCSV(){let ini=document.getElementById('rep-ini').value,fin=document.getElementById('rep-fin').value;if(!ini||!fin){alert('Seleccione fechas');return;}fetch('/admin/exportar-csv',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha_inicio:ini,fecha_fin:fin})}).then(r=>r.blob()).then(blob=>{let a=document.createElement('a');a.href=URL.createObjectURL(blob);a.download='reporte_'+ini+'_'+fin+'.csv';a.click();});}
-
-function cargarTripletas(){fetch('/admin/tripletas-hoy').then(r=>r.json()).then(d=>{let html='<div style="display:grid;grid-template-columns:repeat(3,1fr);gap:8px;margin-bottom:12px"><div class="stat-box"><div class="stat-label">TOTAL</div><div class="stat-val">'+d.total+'</div></div><div class="stat-box"><div class="stat-label">GANADORAS</div><div class="stat-val g">'+d.ganadoras+'</div></div><div class="stat-box"><div class="stat-label">PREMIOS</div><div class="stat-val r">S/'+(d.total_premios||0).toFixed(2)+'</div></div></div>';if(!d.tripletas.length){html+='<div style="color:var(--text2);text-align:center;padding:20px">Sin tripletas hoy</div>';document.getElementById('trip-body').innerHTML=html;return;}html+='<table class="tbl"><thead><tr><th>Serial</th><th>Agencia</th><th>Animales</th><th>Monto</th><th>Hora</th><th>Validez</th><th>Salieron</th><th>Faltan</th><th>Premio</th><th>Estado</th></tr></thead><tbody>';d.tripletas.forEach(function(t){let lotLabel=t.loteria==='plus'?'<span class="tag" style="background:#2e1065;color:#c084fc;border-color:#7c3aed">PLUS</span>':'<span class="tag info">PERÚ</span>';let ans=t.nombres.map(function(n,i){return t['animal'+(i+1)]+'-'+n;}).join(' • ');let animSet=[t.animal1,t.animal2,t.animal3];let salSet=t.salieron||[];let faltanArr=animSet.filter(function(a){return salSet.indexOf(a)<0;});let salStr=salSet.length?salSet.map(function(a){return a+'-'+(ANIMALES[a]||a);}).join(', '):'<span style="color:var(--text2)">Ninguno</span>';let faltanStr=faltanArr.length?faltanArr.map(function(a){return'<span style="color:var(--gold)">'+a+'-'+(ANIMALES[a]||a)+'</span>';}).join(', '):'<span style="color:var(--green)">✅ Todos</span>';let validezStr=t.sorteos_validos+'/'+t.sorteos_totales+' sorteos';html+='<tr style="'+(t.gano?'background:rgba(46,204,113,.04)':'')+'"><td style="color:var(--teal);font-size:.7rem">'+t.serial+'</td><td style="font-size:.72rem">'+t.agencia+'<br>'+lotLabel+'</td><td style="font-size:.72rem;color:#c084fc">'+ans+'</td><td style="color:var(--gold)">S/'+t.monto+'</td><td style="font-size:.68rem;color:var(--text2)">'+t.hora_compra+'</td><td style="font-size:.68rem;color:#6090c0">'+validezStr+'</td><td style="font-size:.72rem;color:#4ade80">'+salStr+'</td><td style="font-size:.72rem">'+faltanStr+'</td><td style="color:var(--red)">'+(t.gano?'S/'+t.premio.toFixed(2):'—')+'</td><td><span class="tag '+(t.gano?(t.pagado?'ok':'warn'):'err')+'">'+(t.gano?(t.pagado?'PAGADO':'PENDIENTE'):'NO GANÓ')+'</span></td></tr>';});html+='</tbody></table>';document.getElementById('trip-body').innerHTML=html;});}
-
-function cargarAudit(){let ini=document.getElementById('aud-ini').value,fin=document.getElementById('aud-fin').value,filtro=document.getElementById('aud-filtro').value;fetch('/admin/audit-logs',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha_inicio:ini,fecha_fin:fin,filtro,limit:500})}).then(r=>r.json()).then(d=>{let html='<table class="tbl"><thead><tr><th>Fecha</th><th>Agencia</th><th>Acción</th><th>Detalle</th><th>IP</th></tr></thead><tbody>';d.logs.forEach(l=>{let colorAccion=l.accion.includes('DESBLOQUEO')?'#f59e0b':l.accion.includes('AUTO')&&l.accion.includes('TOGGLE')?'var(--teal)':l.accion.includes('PAGO')?'var(--green)':l.accion.includes('ANUL')?'var(--red)':l.accion.includes('RESUL')?'var(--gold)':l.accion.includes('ELIMINAR')?'var(--red)':'var(--text)';html+='<tr><td style="font-size:.68rem;color:var(--text2);white-space:nowrap">'+l.fecha+'</td><td style="font-size:.72rem">'+l.agencia+'</td><td><span class="tag info" style="color:'+colorAccion+'">'+l.accion+'</span></td><td style="font-size:.7rem;max-width:300px;overflow:hidden;text-overflow:ellipsis">'+l.detalle+'</td><td style="font-size:.7rem;color:var(--text2)">'+l.ip+'</td></tr>';});html+='</tbody></table>';document.getElementById('aud-body').innerHTML=html;});}
-
-function showMsg(id,msg,tipo){let el=document.getElementById(id);el.textContent=msg;el.className='msg '+tipo;el.style.display='block';clearTimeout(el._t);el._t=setTimeout(()=>el.style.display='none',4000);}
-
-// ── Bloqueados manuales permanentes ──────────────────────────────────────────
-var _lotBloq='peru';
-var _bloqueados=[];
-function selLotBloq(lot){_lotBloq=lot;document.getElementById('bloq-btn-peru').className='tag '+(lot==='peru'?'info active':'');document.getElementById('bloq-btn-plus').className='tag';document.getElementById('bloq-btn-plus').style.cssText='cursor:pointer;font-size:.6rem;padding:2px 8px;border-color:#7c3aed;color:'+(lot==='plus'?'#fff':'#c084fc')+';background:'+(lot==='plus'?'#7c3aed':'transparent');cargarBloqueados();}
-function cargarBloqueados(){fetch('/admin/numeros-bloqueados?loteria='+_lotBloq).then(function(r){return r.json();}).then(function(d){_bloqueados=d.bloqueados||[];renderBloqGrid();}).catch(function(){});}
-function renderBloqGrid(){var g=document.getElementById('bloq-grid');if(!g)return;g.innerHTML='';var orden=['00','0'];for(var i=1;i<=40;i++) orden.push(String(i));orden.forEach(function(k){if(!ANIMALES[k])return;var bloq=_bloqueados.indexOf(k)>=0;var btn=document.createElement('button');btn.style.cssText='padding:3px 2px;border-radius:3px;font-size:.58rem;cursor:pointer;text-align:center;line-height:1.2;'+(bloq?'background:rgba(231,76,60,.25);border:1px solid var(--red);color:var(--red);':'background:var(--card);border:1px solid var(--border);color:var(--text);');btn.innerHTML='<div style="font-weight:700">'+k+'</div><div style="font-size:.5rem;opacity:.8">'+ANIMALES[k].substring(0,4)+'</div>'+(bloq?'<div style="font-size:.45rem;color:var(--red)">🚫</div>':'');btn.onclick=(function(num){return function(){toggleBloqueado(num);};})(k);g.appendChild(btn);});var count=_bloqueados.length;var info=document.getElementById('bloq-info');if(info) info.textContent=count>0?'Bloqueados permanentes ('+_lotBloq.toUpperCase()+'): '+_bloqueados.join(', '):'Sin números bloqueados permanentemente en '+_lotBloq.toUpperCase();}
-function toggleBloqueado(numero){fetch('/admin/numeros-bloqueados/toggle',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({numero:numero,loteria:_lotBloq})}).then(function(r){return r.json();}).then(function(d){if(d.status==='ok'){if(d.accion==='bloqueado'){_bloqueados.push(d.numero);}else{_bloqueados=_bloqueados.filter(function(n){return n!==d.numero;});}renderBloqGrid();}}).catch(function(){});}
-
-// ── NUEVO v4.1: Bloqueos automáticos (histórico + tripleta) ──────────────────
-function selLotBloqAuto(lot){_lotBloqAuto=lot;document.getElementById('lot-bloq-auto-peru').classList.toggle('active',lot==='peru');document.getElementById('lot-bloq-auto-plus').classList.toggle('active',lot==='plus');cargarBloqueos();}
-
-function cargarBloqueos(){
-  if(!ES_SUPER)return;
-  fetch('/admin/bloqueos-estado?loteria='+_lotBloqAuto)
-    .then(function(r){return r.json();})
-    .then(function(d){
-      if(d.error){document.getElementById('bloq-auto-body').innerHTML='<div style="color:var(--red)">'+d.error+'</div>';return;}
-      var html='';
-      // Históricos
-      html+='<div style="margin-bottom:10px">';
-      html+='<div style="color:#f59e0b;font-family:Oswald,sans-serif;font-size:.72rem;letter-spacing:1px;margin-bottom:5px">📅 BLOQUEADOS POR HISTÓRICO — Salieron ayer, no pueden salir hoy</div>';
-      if(d.historicos.length===0){html+='<div style="color:var(--text2);font-size:.68rem;padding:4px 6px;background:var(--card);border-radius:3px">✅ Sin bloqueos históricos</div>';}
-      else{d.historicos.forEach(function(b){html+='<div style="display:flex;align-items:center;gap:6px;padding:5px 8px;background:rgba(245,158,11,.08);border:1px solid rgba(245,158,11,.25);border-radius:3px;margin-bottom:3px"><span style="color:var(--gold);font-family:Oswald,sans-serif;font-weight:700;min-width:32px;font-size:.85rem">'+b.numero+'</span><span style="flex:1;font-size:.78rem">'+b.nombre+'</span><button onclick="desbloquearHistorico(\''+b.numero+'\')" style="padding:3px 10px;background:rgba(245,158,11,.15);border:1px solid #f59e0b;color:#f59e0b;border-radius:3px;font-size:.65rem;cursor:pointer;font-family:Oswald,sans-serif;font-weight:700">DESBLOQUEAR</button></div>';});}
-      html+='</div>';
-      // Tripletas
-      html+='<div>';
-      html+='<div style="color:#ef4444;font-family:Oswald,sans-serif;font-size:.72rem;letter-spacing:1px;margin-bottom:5px">🎯 BLOQUEADOS POR TRIPLETA EN RIESGO — 2/3 animales ya salieron</div>';
-      if(d.tripleta.length===0){html+='<div style="color:var(--text2);font-size:.68rem;padding:4px 6px;background:var(--card);border-radius:3px">✅ Sin tripletas en riesgo</div>';}
-      else{d.tripleta.forEach(function(b){html+='<div style="display:flex;align-items:center;gap:6px;padding:5px 8px;background:rgba(239,68,68,.08);border:1px solid rgba(239,68,68,.35);border-radius:3px;margin-bottom:3px"><span style="color:var(--red);font-family:Oswald,sans-serif;font-weight:700;min-width:32px;font-size:.85rem">'+b.numero+'</span><span style="flex:1;font-size:.78rem">'+b.nombre+'</span><span style="font-size:.6rem;color:#6090c0;white-space:nowrap;margin-right:4px">'+b.serial+' ('+b.animales+')</span><button onclick="desbloquearTripleta(\''+b.numero+'\')" style="padding:3px 10px;background:rgba(239,68,68,.15);border:1px solid #ef4444;color:#ef4444;border-radius:3px;font-size:.65rem;cursor:pointer;font-family:Oswald,sans-serif;font-weight:700">DESBLOQUEAR</button></div>';});}
-      html+='</div>';
-      document.getElementById('bloq-auto-body').innerHTML=html;
-    }).catch(function(){document.getElementById('bloq-auto-body').innerHTML='<div style="color:var(--red);font-size:.72rem;padding:8px">Error al cargar bloqueos</div>';});
-}
-
-function desbloquearHistorico(numero){
-  if(!confirm('¿Desbloquear '+numero+'-'+ANIMALES[numero]+'?\n\nEste número salió ayer pero podrá salir hoy si lo desbloqueas.'))return;
-  fetch('/admin/desbloquear-historico',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({numero:numero,loteria:_lotBloqAuto})})
-  .then(function(r){return r.json();})
-  .then(function(d){if(d.status==='ok'){showMsg('msg-res','✅ '+d.mensaje,'ok');cargarBloqueos();}else showMsg('msg-res','❌ '+d.error,'err');})
-  .catch(function(){showMsg('msg-res','Error de conexión','err');});
-}
-
-function desbloquearTripleta(numero){
-  if(!confirm('⚠️ ATENCIÓN: Desbloquear '+numero+'-'+ANIMALES[numero]+'.\n\n'+'Si este número sale como resultado, UNA O VARIAS TRIPLETAS GANARÁN.\n\n¿Confirmas el desbloqueo?'))return;
-  fetch('/admin/desbloquear-tripleta',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({numero:numero,loteria:_lotBloqAuto})})
-  .then(function(r){return r.json();})
-  .then(function(d){if(d.status==='ok'){showMsg('msg-res','✅ '+d.mensaje,'ok');cargarBloqueos();}else showMsg('msg-res','❌ '+d.error,'err');})
-  .catch(function(){showMsg('msg-res','Error de conexión','err');});
-}
-
-// ── Toggle auto-sorteo ────────────────────────────────────────────────────────
-function actualizarEstadoToggle(estado){var btn=document.getElementById('toggle-auto-btn');if(!btn)return;if(estado==='on'){btn.className='toggle-btn on';btn.textContent='▶ ACTIVADO';}else{btn.className='toggle-btn off';btn.textContent='⏸ DESACTIVADO';}}
-function cargarEstadoAutoSorteo(){fetch('/admin/estado-autosorteo').then(function(r){return r.json();}).then(function(d){actualizarEstadoToggle(d.estado);}).catch(function(){});}
-function toggleAutoSorteo(){var btn=document.getElementById('toggle-auto-btn');var nuevoEstado=btn.classList.contains('on')?'off':'on';fetch('/admin/toggle-autosorteo',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({estado:nuevoEstado})}).then(function(r){return r.json();}).then(function(d){if(d.status==='ok'){actualizarEstadoToggle(d.estado);showMsg('msg-res',d.mensaje,'ok');}else showMsg('msg-res',d.error||'Error','err');}).catch(function(){showMsg('msg-res','Error de conexión','err');});}
-
-function listarAdmins(){fetch('/admin/lista-admins').then(function(r){return r.json();}).then(function(admins){var html='';if(!admins.length){document.getElementById('adm-lista').innerHTML='<div style="color:var(--text2);text-align:center;padding:20px">Sin administradores</div>';return;}admins.forEach(function(a){var superTag=a.es_superadmin?'<span class="tag warn">SUPER</span>':'<span class="tag info">ADMIN</span>';var delBtn=a.es_superadmin?'':'<button class="btn red" style="padding:4px 10px;font-size:.65rem" onclick="eliminarAdmin('+a.id+',\''+String(a.nombre_agencia).replace(/\x27/g,"")+'\')">Eliminar</button>';html+='<div style="background:var(--card);border:1px solid var(--border);border-radius:4px;padding:10px;margin-bottom:8px"><div style="display:flex;justify-content:space-between;align-items:center"><div><div style="color:var(--gold);font-weight:700">'+a.nombre_agencia+' '+superTag+'</div><div style="color:var(--text2);font-size:.72rem">'+a.usuario+' &middot; '+a.agencias+' agencia(s)</div></div><div>'+delBtn+'</div></div></div>';});document.getElementById('adm-lista').innerHTML=html;}).catch(function(){});}
-function crearAdmin(){var u=document.getElementById('adm-user').value.trim(),p=document.getElementById('adm-pass').value.trim(),n=document.getElementById('adm-nombre').value.trim();if(!u||!p||!n){showMsg('msg-adm','Complete todos los campos','err');return;}var fd=new FormData();fd.append('usuario',u);fd.append('password',p);fd.append('nombre',n);fetch('/admin/crear-admin',{method:'POST',body:fd}).then(function(r){return r.json();}).then(function(d){if(d.status==='ok'){showMsg('msg-adm',d.mensaje,'ok');['adm-user','adm-pass','adm-nombre'].forEach(function(i){document.getElementById(i).value='';});listarAdmins();}else showMsg('msg-adm',d.error,'err');});}
-function eliminarAdmin(id,nombre){if(!confirm('Eliminar al administrador "'+nombre+'"?'))return;fetch('/admin/eliminar-admin',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({id:id})}).then(function(r){return r.json();}).then(function(d){if(d.status==='ok'){alert(d.mensaje);listarAdmins();}else alert(d.error);});}
-function reasignarDueno(id){var sel=document.getElementById('owner-'+id);if(!sel)return;fetch('/admin/editar-agencia',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({id:id,admin_id:parseInt(sel.value)})}).then(function(r){return r.json();}).then(function(d){if(d.status==='ok'){alert('Dueno actualizado');listarAgencias();}else alert(d.error);});}
-function init(){
-  let hoy=new Date().toISOString().split('T')[0];
-  document.getElementById('res-fecha').value=hoy;
-  document.getElementById('rep-ini').value=hoy;
-  document.getElementById('rep-fin').value=hoy;
-  document.getElementById('aud-ini').value=hoy;
-  document.getElementById('aud-fin').value=hoy;
-  document.getElementById('fecha-7030').value=hoy;
-  fillHorasRes();fillHorasRiesgo();fillHorasTopes();
-  renderAMG();
-  cargarResultadosAdmin();
-  cargarEstadoAutoSorteo();
-  cargarBloqueados();
-  cargarBloqueos();
-  cargarSecuencia();
-  setInterval(cargarEstadoAutoSorteo,30000);
-  setInterval(cargarBloqueos,60000);
-}
-document.addEventListener('DOMContentLoaded',init);
-</script>
-</body></html>'''
-
 # ═══════════════════════════════════════════════════════════════════════════════
 # ARRANQUE
 # ═══════════════════════════════════════════════════════════════════════════════
-if __name__ == '__main__':
-    init_db()
-    _db_ready = True
-    iniciar_scheduler()
+# `python app.py scheduler` corre solo los sorteos; con SCHEDULER_EN_WEB=0 los
+# workers web no compiten por el liderazgo y no ejecutan ningún job.
+# `python app.py archivar [YYYY-MM ...]` pasa meses cerrados al archivo.
+# `python app.py migrar` aplica las migraciones de esquema pendientes; con
+# MIGRAR_AL_INICIAR=0 los workers no migran al importar (solo en el deploy).
+if __name__ == '__main__' and sys.argv[1:2] == ['scheduler']:
+    ejecutar_scheduler_dedicado()
+elif __name__ == '__main__' and sys.argv[1:2] == ['archivar']:
+    # python app.py archivar [YYYY-MM ...]
+    migrar()
+    archivar_meses(sys.argv[2:] or None)
+elif __name__ == '__main__' and sys.argv[1:2] == ['migrar']:
+    logger.info(f"[MIGRAR] Esquema en v{migrar()}")
+elif __name__ == '__main__':
+    migrar()
+    if SCHEDULER_EN_WEB:
+        iniciar_scheduler()
     port = int(os.environ.get('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=False)
 else:
-    try:
-        iniciar_scheduler()
-    except Exception as e:
-        logger.error(f"[SCHEDULER] Error al iniciar: {e}")
+    if MIGRAR_AL_INICIAR:
+        try:
+            migrar()
+        except Exception as e:
+            logger.error(f"[MIGRAR] Error migrando el esquema: {e}")
+    if SCHEDULER_EN_WEB:
+        try:
+            iniciar_scheduler()
+        except Exception as e:
+            logger.error(f"[SCHEDULER] Error al iniciar: {e}")
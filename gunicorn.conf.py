@@ -0,0 +1,18 @@
+# Configuración de gunicorn. Se carga sola al correr `gunicorn app:app` desde
+# la raíz del proyecto (o con -c gunicorn.conf.py).
+#
+# /api/eventos (SSE) deja abierta una conexión por terminal POS y por panel
+# admin durante EVENTOS_STREAM_MAX_SEG. Con workers sync cada una ocupa un
+# worker entero y la venta se detiene; con gthread cada stream ocupa un hilo.
+# Los hilos por worker se calculan con TERMINALES_POS (terminales conectadas a
+# la vez) más margen para las peticiones normales.
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', '2'))
+worker_class = 'gthread'
+terminales = int(os.environ.get('TERMINALES_POS', '300'))
+threads = int(os.environ.get('GUNICORN_THREADS', str(-(-terminales // workers) + 32)))
+
+# El stream de eventos solo se activa con esta configuración; sin ella POS y
+# admin siguen con polling. EVENTOS_SSE=0 lo apaga sin tocar el archivo.
+raw_env = [f"EVENTOS_SSE={os.environ.get('EVENTOS_SSE', '1')}"]
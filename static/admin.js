@@ -0,0 +1,237 @@
+const ANIMALES = ZOOLO_DATOS.animales;
+const HPERU = ZOOLO_DATOS.horarios_peru;
+const HPLUS = ZOOLO_DATOS.horarios_plus;
+const ES_SUPER = ZOOLO_SESION.es_superadmin;
+const ORDEN = ['00','0','1','2','3','4','5','6','7','8','9','10','11','12','13','14','15','16','17','18','19','20','21','22','23','24','25','26','27','28','29','30','31','32','33','34','35','36','37','38','39','40'];
+let animalSel=null,lotRes='peru',lotRiesgo='peru',lotTopes='peru',lot7030='peru',_lotBloqAuto='peru';
+
+function showTab(id){
+  document.querySelectorAll('.tab').forEach(t=>t.classList.remove('active'));
+  document.querySelectorAll('.tc').forEach(t=>t.classList.remove('active'));
+  document.getElementById('tc-'+id).classList.add('active');
+  let tabs=document.querySelectorAll('.tab');
+  let tabMap={resultados:0,riesgo:1,setentaytreinta:2,agencias:3,topes:4,reportes:5,tripletas:6,auditoria:7,admins:8};
+  if(tabMap[id]!==undefined)tabs[tabMap[id]].classList.add('active');
+  if(id==='riesgo'){fillHorasRiesgo();cargarRiesgo();}
+  if(id==='tripletas')cargarTripletas();
+  if(id==='agencias')listarAgencias();
+  if(id==='admins')listarAdmins();
+}
+
+function actualizarClockAdmin(){let now=new Date(),utcMs=now.getTime()+now.getTimezoneOffset()*60000,peruMs=utcMs-5*3600000,peru=new Date(peruMs),h=peru.getHours(),m=peru.getMinutes(),ap=h>=12?'PM':'AM';h=h%12||12;document.getElementById('clock-admin').textContent=h+':'+String(m).padStart(2,'0')+' '+ap+' · LIMA';}
+setInterval(actualizarClockAdmin,1000);actualizarClockAdmin();
+
+let _secuencias={'peru':[],'plus':[]};
+function renderAMG(){let g=document.getElementById('amg');g.innerHTML='';ORDEN.forEach(k=>{if(!ANIMALES[k])return;let d=document.createElement('div');d.className='amg-card'+(k===animalSel?' sel':'');d.innerHTML='<div class="anum">'+k+'</div><div class="anom">'+ANIMALES[k].substring(0,5)+'</div>';d.onclick=()=>{animalSel=k;renderAMG();document.getElementById('animal-sel-preview').textContent='✅ '+k+' — '+ANIMALES[k];};g.appendChild(d);});}
+
+function cargarSecuencia(){fetch('/admin/secuencia-sugerida?loteria='+lotRes).then(r=>r.json()).then(d=>{if(d.status==='ok'&&d.sugeridos.length){_secuencias[lotRes]=d.sugeridos.map(x=>x.num);}else{_secuencias[lotRes]=[];}}).catch(()=>{});}
+
+function cargarResultadosAdmin(){let f=document.getElementById('res-fecha').value;if(!f)return;Promise.all([
+fetch('/api/resultados-fecha-admin?fecha='+f+'&loteria=peru').then(r=>r.json()),
+fetch('/api/resultados-fecha-admin?fecha='+f+'&loteria=plus').then(r=>r.json())
+]).then(([dp,dpl])=>{
+  let renderLista=(data,lista,horarios,lot)=>{
+    lista.innerHTML='';
+    horarios.forEach(function(h){
+      var res=data[h];
+      var d=document.createElement('div');
+      d.style.cssText='padding:5px 8px;border-radius:3px;font-size:.72rem;display:flex;align-items:center;gap:4px;background:'+(res?'rgba(46,204,113,.06)':'var(--card)')+';border:1px solid '+(res?'rgba(46,204,113,.2)':'var(--border)');
+      var hs=document.createElement('span');hs.style.cssText='color:var(--teal);font-family:Oswald,sans-serif;font-size:.7rem;font-weight:700;min-width:46px';hs.textContent=h.replace(':00 ','');
+      var rs=document.createElement('span');rs.style.cssText='flex:1;font-weight:'+(res?'700':'400')+';color:'+(res?'#4ade80':'var(--text2)')+';font-size:'+(res?'.72rem':'.65rem');rs.textContent=res?res.animal+' - '+res.nombre:'PENDIENTE';
+      d.appendChild(hs);d.appendChild(rs);
+      if(res){
+        (function(hora,loteria){
+          var be=document.createElement('button');be.textContent='Editar';be.style.cssText='background:rgba(251,191,36,.15);border:1px solid rgba(251,191,36,.3);color:var(--gold);border-radius:3px;padding:2px 6px;font-size:.58rem;cursor:pointer';be.onclick=function(){editarResultado(hora,loteria);};
+          var bd=document.createElement('button');bd.textContent='Borrar';bd.style.cssText='background:rgba(231,76,60,.15);border:1px solid rgba(231,76,60,.3);color:var(--red);border-radius:3px;padding:2px 6px;font-size:.58rem;cursor:pointer';bd.onclick=function(){borrarResultado(hora,loteria);};
+          d.appendChild(be);d.appendChild(bd);
+        })(h,lot);
+      }
+      lista.appendChild(d);
+    });
+  };
+  renderLista(dp.resultados,document.getElementById('res-lista-peru'),HPERU,'peru');
+  renderLista(dpl.resultados,document.getElementById('res-lista-plus'),HPLUS,'plus');
+  cargarBloqueos();
+}).catch(()=>{});}
+
+function borrarResultado(hora,lot){if(!confirm('¿Borrar resultado de '+hora+' ('+lot.toUpperCase()+')?'))return;let fecha=document.getElementById('res-fecha').value;fetch('/admin/borrar-resultado',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({hora:hora,fecha:fecha,loteria:lot})}).then(r=>r.json()).then(d=>{if(d.status==='ok'){showMsg('msg-res','✅ '+d.mensaje,'ok');cargarResultadosAdmin();}else showMsg('msg-res',d.error||'Error','err');}).catch(()=>showMsg('msg-res','Error de conexión','err'));}
+function editarResultado(hora,lot){if(lot==='peru'){selLotRes('peru');}else{selLotRes('plus');}let sel=document.getElementById('res-hora');for(let i=0;i<sel.options.length;i++){if(sel.options[i].value===hora){sel.selectedIndex=i;break;}}document.getElementById('res-hora').scrollIntoView({behavior:'smooth',block:'center'});showMsg('msg-res','✏️ Selecciona el animal nuevo y guarda','ok');}
+function guardarResultado(){let hora=document.getElementById('res-hora').value,fecha=document.getElementById('res-fecha').value,animal=animalSel,loteria=lotRes;if(!animal){showMsg('msg-res','Selecciona un animal','err');return;}if(!hora){showMsg('msg-res','Selecciona la hora','err');return;}let fd=new FormData();fd.append('hora',hora);fd.append('animal',animal);fd.append('loteria',loteria);if(fecha)fd.append('fecha',fecha);fetch('/admin/guardar-resultado',{method:'POST',body:fd}).then(r=>r.json()).then(d=>{if(d.status==='ok'){showMsg('msg-res','✅ '+d.mensaje+' ['+d.fecha+']','ok');animalSel=null;renderAMG();document.getElementById('animal-sel-preview').textContent='';cargarResultadosAdmin();}else showMsg('msg-res',d.error,'err');}).catch(()=>showMsg('msg-res','Error','err'));}
+function forzarAutoSorteo(){let hora=document.getElementById('res-hora').value,loteria=lotRes;if(!hora){showMsg('msg-res','Selecciona la hora','err');return;}if(!confirm('¿Ejecutar auto-sorteo para '+hora+' ('+loteria.toUpperCase()+')? Esto elegirá el animal automáticamente con lógica 70/30.'))return;fetch('/admin/forzar-autosorteo',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({hora:hora,loteria:loteria})}).then(r=>r.json()).then(d=>{if(d.status==='ok'){showMsg('msg-res','✅ Auto-sorteo: '+d.mensaje,'ok');cargarResultadosAdmin();}else showMsg('msg-res',d.error||'Error','err');}).catch(()=>showMsg('msg-res','Error de conexión','err'));}
+
+function fillHorasRes(){let h=document.getElementById('res-hora');if(!h)return;let lista=lotRes==='plus'?HPLUS:HPERU;h.innerHTML=lista.map(x=>'<option value="'+x+'">'+x+'</option>').join('');if(!h.value&&lista.length)h.value=lista[0];}
+function selLotRes(l){lotRes=l;document.getElementById('lot-res-peru').classList.toggle('active',l==='peru');document.getElementById('lot-res-plus').classList.toggle('active',l==='plus');fillHorasRes();cargarSecuencia();}
+function selLotRiesgo(l){lotRiesgo=l;document.getElementById('lot-riesgo-peru').classList.toggle('active',l==='peru');document.getElementById('lot-riesgo-plus').classList.toggle('active',l==='plus');fillHorasRiesgo();cargarRiesgo();}
+function fillHorasRiesgo(){let s=document.getElementById('risk-hora');if(!s)return;let lista=lotRiesgo==='plus'?HPLUS:HPERU;s.innerHTML=lista.map(x=>'<option value="'+x+'">'+x+'</option>').join('');if(!s.value&&lista.length)s.value=lista[0];}
+
+function cargarRiesgo(){let hora=document.getElementById('risk-hora').value,lot=lotRiesgo;if(!hora)return;cargarMatrizRiesgo();fetch('/admin/riesgo?hora='+encodeURIComponent(hora)+'&loteria='+lot).then(r=>r.json()).then(d=>{
+  let sm=document.getElementById('riesgo-summary');
+  sm.innerHTML='<div class="stat-box"><div class="stat-label">TOTAL APOSTADO</div><div class="stat-val">S/'+d.total_apostado.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">PRESUPUESTO 70%</div><div class="stat-val t">S/'+d.presupuesto_70.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">SORTEO OBJETIVO</div><div class="stat-val">'+(d.sorteo_objetivo||hora)+'</div></div><div class="stat-box"><div class="stat-label">LOTE</div><div class="stat-val">'+lot.toUpperCase()+'</div></div>';
+  let agSel=document.getElementById('riesgo-agencia-sel');agSel.innerHTML='<option value="">-- Filtrar por agencia --</option>';if(d.agencias_hora&&d.agencias_hora.length){d.agencias_hora.forEach(a=>{let opt=document.createElement('option');opt.value=a.id;opt.textContent=a.nombre_agencia;agSel.appendChild(opt);});document.getElementById('riesgo-agencias-btn').style.display='block';}else{document.getElementById('riesgo-agencias-btn').style.display='none';}
+  window._riesgoHora=hora;window._riesgoLot=lot;pintarRiesgoTripletas(d);
+  if(!d.riesgo||Object.keys(d.riesgo).length===0){document.getElementById('riesgo-tabla').innerHTML='<div style="color:var(--text2);text-align:center;padding:20px;font-size:.75rem">SIN APUESTAS EN ESTE SORTEO</div>';return;}
+  let entries=Object.entries(d.riesgo).sort((a,b)=>b[1].apostado-a[1].apostado);
+  let html='<table class="tbl"><thead><tr><th>N°</th><th>Animal</th><th>Apostado</th><th>Pagaría</th><th>%</th><th>Tope</th><th>%Bar</th></tr></thead><tbody>';
+  let maxPag=Math.max(...entries.map(([_,v])=>v.pagaria));
+  entries.forEach(([k,v])=>{let pct=Math.min(100,maxPag>0?v.pagaria/maxPag*100:0);let col=pct>80?'var(--red)':pct>50?'var(--gold)':'var(--green)';let topeStr=v.libre?'<span class="tag info">LIBRE</span>':'<span style="color:'+(v.apostado>v.tope*.9?'var(--red)':'var(--text)')+';font-family:\'Oswald\',sans-serif;font-size:.75rem">S/'+v.tope+'</span>';let lech=v.es_lechuza?'<span class="tag warn" style="margin-left:4px">x70</span>':'';html+='<tr><td style="font-family:\'Oswald\',sans-serif;color:var(--gold)">'+k+'</td><td>'+v.nombre+lech+'</td><td style="color:var(--teal);font-family:\'Oswald\',sans-serif">S/'+v.apostado.toFixed(2)+'</td><td style="color:'+col+';font-family:\'Oswald\',sans-serif;font-weight:700">S/'+v.pagaria.toFixed(2)+'</td><td style="color:var(--text2)">'+v.porcentaje+'%</td><td>'+topeStr+'</td><td><div class="riesgo-bar"><div class="riesgo-fill" style="width:'+pct+'%;background:'+col+'"></div></div></td></tr>';});
+  html+='</tbody></table>';document.getElementById('riesgo-tabla').innerHTML=html;}).catch(()=>{});}
+
+function pintarRiesgoTripletas(d){let el=document.getElementById('riesgo-tripletas'),t=d.tripletas||[];document.getElementById('riesgo-trip-total').textContent=t.length?'— S/'+d.riesgo_tripletas_total.toFixed(2):'';if(!t.length){el.innerHTML='<div style="color:var(--text2);text-align:center;padding:12px;font-size:.75rem">NINGUNA TRIPLETA CON 2 ACIERTOS</div>';return;}let html='<table class="tbl"><thead><tr><th>N°</th><th>Animal</th><th>Tripletas</th><th>Apostado</th><th>Pagaría si sale</th></tr></thead><tbody>';t.forEach(v=>{html+='<tr><td style="font-family:\'Oswald\',sans-serif;color:var(--gold)">'+v.animal+'</td><td>'+v.nombre+'</td><td>'+v.tripletas+'</td><td style="color:var(--teal);font-family:\'Oswald\',sans-serif">S/'+v.apostado.toFixed(2)+'</td><td style="color:var(--red);font-family:\'Oswald\',sans-serif;font-weight:700">S/'+v.premio.toFixed(2)+'</td></tr>';});el.innerHTML=html+'</tbody></table>';}
+let _matriz=null;
+function cargarMatrizRiesgo(){let lot=lotRiesgo,q='/admin/riesgo-matriz?loteria='+lot;if(_matriz&&_matriz.loteria===lot)q+='&desde='+encodeURIComponent(_matriz.version);fetch(q).then(r=>r.json()).then(d=>{if(d.error)return;if(d.apostado){_matriz=d;}else if(d.delta&&_matriz&&_matriz.loteria===lot){d.delta.forEach(([k,i,j,v])=>{(k?_matriz.especiales:_matriz.apostado)[i][j]=v;});_matriz.version=d.version;_matriz.resultados=d.resultados;}else return;pintarMatrizRiesgo();}).catch(()=>{});}
+function pintarMatrizRiesgo(){let m=_matriz,el=document.getElementById('riesgo-matriz');if(!el||!m)return;let p=m.pagos,u=m.unidad,max=0;let pag=m.apostado.map(f=>f.map((c,j)=>c*(m.animales[j]==='40'?p.lechuza:p.animal)/u));pag.forEach(f=>f.forEach(v=>{if(v>max)max=v;}));let html='<table class="tbl matriz-riesgo"><thead><tr><th>Sorteo</th>'+m.animales.map(a=>'<th title="'+(ANIMALES[a]||a)+'">'+a+'</th>').join('')+m.especiales_cols.map(e=>'<th>'+e+'</th>').join('')+'<th>Total</th></tr></thead><tbody>';m.horas.forEach((h,i)=>{let tot=(m.apostado[i].reduce((a,b)=>a+b,0)+m.especiales[i].reduce((a,b)=>a+b,0))/u,sal=m.resultados[i];html+='<tr><td style="white-space:nowrap;font-family:\'Oswald\',sans-serif;color:var(--gold)">'+h+(sal?' <span class="tag info">'+sal+'</span>':'')+'</td>';m.animales.forEach((a,j)=>{let v=pag[i][j],pct=max>0?v/max:0,bg=v>0?'rgba(231,76,60,'+(.12+.78*pct).toFixed(2)+')':'transparent';html+='<td title="'+a+' '+(ANIMALES[a]||'')+' — apostado S/'+(m.apostado[i][j]/u).toFixed(2)+', pagaría S/'+v.toFixed(2)+'" style="background:'+bg+(sal===a?';outline:2px solid var(--gold)':'')+'">'+(v>0?Math.round(v):'')+'</td>';});m.especiales[i].forEach(c=>{html+='<td style="color:var(--teal)">'+(c?Math.round(c/u):'')+'</td>';});html+='<td style="color:var(--gold);font-family:\'Oswald\',sans-serif">S/'+tot.toFixed(2)+'</td></tr>';});el.innerHTML=html+'</tbody></table>';}
+setInterval(()=>{let t=document.getElementById('tc-riesgo');if(t&&t.classList.contains('active'))cargarMatrizRiesgo();},20000);
+function verRiesgoAgencia(){let agId=document.getElementById('riesgo-agencia-sel').value,hora=window._riesgoHora;if(!agId||!hora)return;fetch('/admin/riesgo-agencia',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({agencia_id:agId,hora:hora,loteria:window._riesgoLot||'peru'})}).then(r=>r.json()).then(d=>{if(d.error){alert(d.error);return;}let html='<div style="background:var(--card);border:1px solid var(--border);border-radius:4px;padding:10px;margin-top:8px"><div style="color:var(--gold);font-family:\'Oswald\',sans-serif;font-size:.75rem;margin-bottom:8px">'+d.agencia+' — '+d.hora+'</div><table class="tbl"><thead><tr><th>Animal/Esp.</th><th>Apostado</th><th>Pagaría</th><th>Tickets</th></tr></thead><tbody>';d.jugadas.forEach(j=>{html+='<tr><td style="color:var(--teal)">'+j.seleccion+' '+j.nombre+'</td><td style="font-family:\'Oswald\',sans-serif;color:var(--gold)">S/'+j.apostado.toFixed(2)+'</td><td style="color:'+(j.pagaria>0?'var(--red)':'var(--text2)')+'">S/'+j.pagaria.toFixed(2)+'</td><td>'+j.tickets+'</td></tr>';});html+='</tbody></table></div>';document.getElementById('riesgo-tabla').insertAdjacentHTML('afterend',html);}).catch(()=>{});}
+
+function cargarEjecuciones(){let f=document.getElementById('fecha-ejec').value;fetch('/admin/sorteo-ejecuciones?loteria='+lot7030+(f?'&fecha='+f:'')).then(r=>r.json()).then(d=>{let c=document.getElementById('ejec-sorteos');if(d.error){c.innerHTML='<div style="color:var(--red);padding:10px">'+d.error+'</div>';return;}if(!d.ejecuciones.length){c.innerHTML='<div style="color:var(--text2);padding:10px">Sin ejecuciones registradas</div>';return;}let col={ok:'var(--green)',existente:'var(--text2)',omitido:'var(--gold)'};let html='<div style="overflow-x:auto"><table class="tbl"><thead><tr><th>Fecha</th><th>Hora</th><th>Origen</th><th>Inicio (UTC)</th><th>Duración</th><th>Resultado</th><th>Animal</th><th>Vendido</th><th>Premio</th></tr></thead><tbody>';d.ejecuciones.forEach(e=>{html+='<tr><td>'+e.fecha+'</td><td>'+e.hora+'</td><td>'+(e.origen||'')+'</td><td>'+(e.inicio||'').slice(11,19)+'</td><td>'+(e.ms!=null?Math.round(e.ms)+' ms':'')+'</td><td style="color:'+(col[e.resultado]||'var(--red)')+'" title="'+(e.error||'')+'">'+e.resultado+'</td><td>'+(e.animal?e.animal+' '+(e.nombre||''):'—')+'</td><td>'+(e.total_vendido!=null?'S/'+e.total_vendido.toFixed(2):'')+'</td><td>'+(e.premio!=null?'S/'+e.premio.toFixed(2):'')+'</td></tr>';});html+='</tbody></table></div>';c.innerHTML=html;}).catch(e=>{document.getElementById('ejec-sorteos').innerHTML='<div style="color:var(--red)">Error: '+e+'</div>';});}
+function selLot7030(l){lot7030=l;document.getElementById('lot-7030-peru').classList.toggle('active',l==='peru');document.getElementById('lot-7030-plus').classList.toggle('active',l==='plus');}
+function cargar7030(){let f=document.getElementById('fecha-7030').value,lot=lot7030;fetch('/admin/reporte-7030',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha:f||null,loteria:lot})}).then(r=>r.json()).then(d=>{if(d.error){document.getElementById('res-7030').innerHTML='<div class="card"><div style="color:var(--red);padding:12px">'+d.error+'</div></div>';return;}
+let totales=d.totales,sorteos=d.sorteos;
+let html='<div class="card"><div class="card-title">📊 '+lot7030.toUpperCase()+' — '+d.fecha+'</div><div style="display:grid;grid-template-columns:repeat(4,1fr);gap:8px;margin-bottom:14px"><div class="stat-box"><div class="stat-label">TOTAL VENDIDO</div><div class="stat-val">S/'+totales.vendido.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">PRESUPUESTO 70%</div><div class="stat-val t">S/'+totales.presupuesto_70.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">PREMIOS PAGADOS</div><div class="stat-val r">S/'+totales.premio_pagado.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">CASA 30% BRUTO</div><div class="stat-val g">S/'+totales.para_casa_30.toFixed(2)+'</div></div></div><div style="display:grid;grid-template-columns:1fr 1fr 1fr;gap:8px;margin-bottom:14px"><div class="stat-box"><div class="stat-label">ACUM. FIN JORNADA</div><div class="stat-val">S/'+Math.abs(totales.acumulado_fin_jornada).toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">% PAGADO</div><div class="stat-val '+(totales.pct_pagado>70?'r':'g')+'">'+totales.pct_pagado+'%</div></div><div class="stat-box"><div class="stat-label">% CASA</div><div class="stat-val g">'+totales.pct_casa+'%</div></div></div><div style="overflow-x:auto"><table class="reporte-7030-table"><thead><tr><th>HORA</th><th>ANIMAL</th><th>VENDIDO</th><th>70%</th><th>ACUM.REC.</th><th>PRES.TOTAL</th><th>PREMIO</th><th>ACUM.GEN.</th><th>CASA 30%</th><th>MODO</th></tr></thead><tbody>';
+sorteos.forEach(s=>{let modoBadge=s.modo==='auto'?'<span class="modo-badge auto">AUTO</span>':s.modo==='manual'?'<span class="modo-badge manual">MANUAL</span>':'<span class="modo-badge pte">PEND.</span>';let animalStr=s.animal?'<span style="color:#4ade80;font-weight:700">'+s.animal+' — '+s.nombre+'</span>':'<span style="color:var(--text2)">—</span>';let pres_col=s.premio_pagado>s.presupuesto_total?'style="color:var(--red)"':'';html+='<tr class="'+((!s.realizado)?'pte':'')+'"><td style="color:var(--teal);font-family:\'Oswald\',sans-serif;font-size:.7rem;font-weight:700">'+s.hora.replace(':00 ','')+'</td><td>'+animalStr+'</td><td>S/'+s.vendido.toFixed(2)+'</td><td style="color:var(--teal)">S/'+s.presupuesto_70.toFixed(2)+'</td><td style="color:#a855f7">S/'+s.acum_recibido.toFixed(2)+'</td><td style="color:var(--gold)" '+pres_col+'>S/'+s.presupuesto_total.toFixed(2)+'</td><td style="color:var(--red)">S/'+s.premio_pagado.toFixed(2)+'</td><td style="color:var(--green)">S/'+s.acum_generado.toFixed(2)+'</td><td style="color:#22c55e">S/'+s.para_casa_30.toFixed(2)+'</td><td>'+modoBadge+'</td></tr>';});
+html+='</tbody><tfoot><tr><td colspan="2" style="color:var(--gold)">TOTALES</td><td>S/'+totales.vendido.toFixed(2)+'</td><td style="color:var(--teal)">S/'+totales.presupuesto_70.toFixed(2)+'</td><td>—</td><td>—</td><td style="color:var(--red)">S/'+totales.premio_pagado.toFixed(2)+'</td><td>—</td><td style="color:var(--green)">S/'+totales.para_casa_30.toFixed(2)+'</td><td></td></tr></tfoot></table></div></div>';
+document.getElementById('res-7030').innerHTML=html;}).catch(e=>document.getElementById('res-7030').innerHTML='<div class="card"><div style="color:var(--red)">Error: '+e+'</div></div>');}
+
+function listarAgencias(){
+  var doRender=function(adminsMap){
+    fetch('/admin/lista-agencias').then(function(r){return r.json();}).then(function(ags){
+      var html='';
+      if(!ags.length){document.getElementById('ag-lista').innerHTML='<div style="color:var(--text2);text-align:center;padding:20px">Sin agencias</div>';return;}
+      window._agMap={};
+      ags.forEach(function(ag){
+        window._agMap[ag.id]=ag.nombre_agencia;
+        var topeStr=ag.tope_taquilla?'S/'+ag.tope_taquilla:'Sin limite';
+        var bancoStr=ag.nombre_banco?'<div style="color:#a0b0c0;font-size:.68rem">Banco: '+ag.nombre_banco+'</div>':'';
+        var estadoTag='<span class="tag '+(ag.activa?'ok':'err')+'">'+(ag.activa?'ACTIVA':'INACTIVA')+'</span>';
+        var duenoStr='',reasignStr='';
+        if(ES_SUPER){
+          var dnom=(adminsMap&&adminsMap[ag.admin_id])?adminsMap[ag.admin_id]:(ag.admin_id?('ID '+ag.admin_id):'Sin asignar');
+          duenoStr='<div style="color:#c084fc;font-size:.66rem">Dueno: '+dnom+'</div>';
+          var opts='';for(var k in adminsMap){opts+='<option value="'+k+'" '+(String(k)===String(ag.admin_id)?'selected':'')+'>'+adminsMap[k]+'</option>';}
+          reasignStr='<div style="display:flex;gap:4px;margin-top:5px;align-items:center"><span style="color:var(--text2);font-size:.62rem">Dueno:</span><select id="owner-'+ag.id+'" style="flex:1;padding:4px;font-size:.7rem">'+opts+'</select><button class="btn" style="padding:4px 10px;font-size:.65rem;background:#1a0a30;border-color:#a855f7;color:#c084fc" onclick="reasignarDueno('+ag.id+')">Reasignar</button></div>';
+        }
+        html+='<div style="background:var(--card);border:1px solid var(--border);border-radius:4px;padding:10px;margin-bottom:8px"><div style="display:flex;justify-content:space-between;align-items:flex-start;margin-bottom:8px"><div><div style="color:var(--gold);font-weight:700">'+ag.nombre_agencia+'</div><div style="color:var(--text2);font-size:.72rem">'+ag.usuario+' | Com: '+(ag.comision*100).toFixed(0)+'% | Tope: '+topeStr+'</div>'+bancoStr+duenoStr+'</div><div>'+estadoTag+'</div></div><div style="display:grid;grid-template-columns:repeat(4,1fr);gap:5px"><input id="nb-'+ag.id+'" placeholder="Banco" value="'+(ag.nombre_banco||'')+'" style="padding:4px;font-size:.7rem"><input id="pass-'+ag.id+'" placeholder="Nueva clave" type="password" style="padding:4px;font-size:.7rem"><input id="com-'+ag.id+'" placeholder="Comision%" value="'+(ag.comision*100).toFixed(0)+'" type="number" step="1" style="padding:4px;font-size:.7rem"><input id="tope-'+ag.id+'" placeholder="Tope taquilla" value="'+(ag.tope_taquilla||0)+'" type="number" step="10" style="padding:4px;font-size:.7rem"></div>'+reasignStr+'<div style="display:flex;gap:4px;margin-top:5px;flex-wrap:wrap"><button class="btn" style="padding:4px 10px;font-size:.65rem" onclick="editarAg('+ag.id+')">Guardar</button><button class="btn '+(ag.activa?'red':'green')+'" style="padding:4px 10px;font-size:.65rem" onclick="toggleAg('+ag.id+','+(ag.activa?0:1)+')">'+(ag.activa?'Suspender':'Activar')+'</button><button class="btn" style="padding:4px 10px;font-size:.65rem;background:#1a0a30;border-color:#a855f7;color:#c084fc" onclick="verReporteAgencia('+ag.id+')">Reporte</button><button class="btn red" style="padding:4px 10px;font-size:.65rem" onclick="eliminarAgencia('+ag.id+')">Eliminar</button></div></div>';
+      });
+      document.getElementById('ag-lista').innerHTML=html;
+    });
+  };
+  if(ES_SUPER){fetch('/admin/lista-admins').then(function(r){return r.json();}).then(function(admins){var m={};admins.forEach(function(a){m[a.id]=a.nombre_agencia;});doRender(m);}).catch(function(){doRender({});});}
+  else{doRender({});}
+}
+function crearAgencia(){let u=document.getElementById('ag-user').value.trim(),p=document.getElementById('ag-pass').value.trim(),n=document.getElementById('ag-nombre').value.trim(),nb=document.getElementById('ag-banco').value.trim();if(!u||!p||!n){showMsg('msg-ag','Complete todos los campos requeridos','err');return;}let fd=new FormData();fd.append('usuario',u);fd.append('password',p);fd.append('nombre',n);fd.append('nombre_banco',nb);fetch('/admin/crear-agencia',{method:'POST',body:fd}).then(r=>r.json()).then(d=>{if(d.status==='ok'){showMsg('msg-ag',d.mensaje,'ok');['ag-user','ag-pass','ag-nombre','ag-banco'].forEach(i=>document.getElementById(i).value='');listarAgencias();}else showMsg('msg-ag',d.error,'err');});}
+function editarAg(id){let data={id,nombre_banco:document.getElementById('nb-'+id).value,password:document.getElementById('pass-'+id).value,comision:parseFloat(document.getElementById('com-'+id).value)||0,tope_taquilla:parseFloat(document.getElementById('tope-'+id).value)||0};fetch('/admin/editar-agencia',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify(data)}).then(r=>r.json()).then(d=>{if(d.status==='ok')alert('✅ Guardado');else alert(d.error);listarAgencias();});}
+function toggleAg(id,activa){fetch('/admin/editar-agencia',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({id,activa})}).then(r=>r.json()).then(()=>listarAgencias());}
+function eliminarAgencia(id){let nombre=window._agMap&&window._agMap[id]?window._agMap[id]:'Agencia '+id;if(!confirm('¿ELIMINAR la agencia "'+nombre+'"?\n\nEsta acción es permanente.'))return;fetch('/admin/eliminar-agencia',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({id})}).then(r=>r.json()).then(d=>{if(d.status==='ok'){alert('✅ '+d.mensaje);listarAgencias();}else alert('❌ '+d.error);}).catch(()=>alert('Error de conexión'));}
+function verReporteAgencia(id){let nombre=window._agMap&&window._agMap[id]?window._agMap[id]:'Agencia '+id;let ini=prompt('Fecha inicio (YYYY-MM-DD) para '+nombre+':');if(!ini)return;let fin=prompt('Fecha fin (YYYY-MM-DD):');if(!fin)return;fetch('/admin/reporte-agencia-horas',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({agencia_id:id,fecha_inicio:ini,fecha_fin:fin})}).then(r=>r.json()).then(d=>{if(d.error){alert(d.error);return;}let ventana=window.open('','_blank');let w=ventana.document;w.open();w.write('<html><head><title>Reporte</title></head><body style="font-family:monospace;background:#050a12;color:#c0d8f0;padding:20px">');w.write('<h2 style="color:#f5a623">'+nombre+' ('+d.usuario+')</h2>');w.write('<h3>Total: S/'+d.total_general+'</h3>');d.resumen.forEach(function(h){w.write('<h4 style="color:#00c8e8">'+(h.etiqueta?h.etiqueta+' ':'')+h.hora+' - S/'+h.total+' ('+h.conteo+' jugadas)</h4>');w.write('<table border=1 cellpadding=4 style="border-collapse:collapse;color:#c0d8f0;border-color:#1a2a4a"><tr><th>Animal</th><th>Tipo</th><th>Apostado</th><th>Tickets</th></tr>');h.jugadas.forEach(function(j){w.write('<tr><td>'+j.seleccion+' '+j.nombre+'</td><td>'+j.tipo+'</td><td>S/'+j.apostado+'</td><td>'+j.cnt+'</td></tr>');});w.write('</table><br>');});w.write('</body></html>');w.close();});}
+
+function selLotTopes(l){lotTopes=l;document.getElementById('lot-topes-peru').classList.toggle('active',l==='peru');document.getElementById('lot-topes-plus').classList.toggle('active',l==='plus');fillHorasTopes();cargarTopes();}
+function fillHorasTopes(){let s=document.getElementById('tope-hora'),lista=lotTopes==='plus'?HPLUS:HPERU;s.innerHTML=lista.map(x=>'<option value="'+x+'">'+x+'</option>').join('');}
+function cargarTopes(){let hora=document.getElementById('tope-hora').value,lot=lotTopes;fetch('/admin/topes?hora='+encodeURIComponent(hora)+'&loteria='+lot).then(r=>r.json()).then(d=>{if(d.error){document.getElementById('topes-body').innerHTML='<div style="color:var(--red)">'+d.error+'</div>';return;}let html='<table class="tbl"><thead><tr><th>N°</th><th>Animal</th><th>Apostado Hoy</th><th>Tope</th><th>Disponible</th>'+(ES_SUPER?'<th>Acción</th>':'')+'</tr></thead><tbody>';ORDEN.forEach(k=>{if(!ANIMALES[k])return;let t=d.topes.find(x=>x.numero===k);let apt=t?t.apostado:0,tope=t?t.tope:0,disp=t?t.disponible:null;let dispStr=disp!==null?'<span style="color:'+(disp<10?'var(--red)':disp<50?'var(--gold)':'var(--green)')+';font-family:\'Oswald\',sans-serif">S/'+disp.toFixed(2)+'</span>':'<span class="tag info">LIBRE</span>';html+='<tr><td style="font-family:\'Oswald\',sans-serif;color:var(--gold)">'+k+'</td><td>'+ANIMALES[k]+'</td><td style="color:var(--teal);font-family:\'Oswald\',sans-serif">'+(apt>0?'S/'+apt.toFixed(2):'—')+'</td><td>'+(ES_SUPER?('<input type="number" id="tope-monto-'+k+'" value="'+(tope||'')+'" placeholder="Sin tope" style="width:90px;padding:4px;font-size:.75rem" min="0" step="5">'):('<span style="font-family:Oswald,sans-serif;color:var(--gold)">'+(tope>0?'S/'+tope.toFixed(2):'—')+'</span>'))+'</td><td>'+dispStr+'</td>'+(ES_SUPER?('<td><button class="btn" style="padding:3px 8px;font-size:.65rem" onclick="guardarTope(\''+k+'\',\''+hora+'\',\''+lot+'\')">💾</button>'+(tope>0?'<button class="btn red" style="padding:3px 8px;font-size:.65rem;margin-left:4px" onclick="liberarTope(\''+k+'\',\''+hora+'\',\''+lot+'\')">✕</button>':'&nbsp;')+'</td>'):'')+'</tr>';});html+='</tbody></table>';document.getElementById('topes-body').innerHTML=html;});}function guardarTope(num,hora,lot){if(!ES_SUPER){alert('Solo el administrador principal puede modificar topes');return;}let monto=parseFloat(document.getElementById('tope-monto-'+num).value)||0;fetch('/admin/topes/guardar',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({hora,numero:num,monto,loteria:lot})}).then(r=>r.json()).then(d=>{if(d.status==='ok')cargarTopes();else alert(d.error);});}
+function liberarTope(num,hora,lot){if(!ES_SUPER)return;fetch('/admin/topes/guardar',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({hora,numero:num,monto:0,loteria:lot})}).then(r=>r.json()).then(d=>{if(d.status==='ok')cargarTopes();});}
+function limpiarTopes(){if(!ES_SUPER){alert('Solo el administrador principal puede modificar topes');return;}let hora=document.getElementById('tope-hora').value,lot=lotTopes;if(!confirm('¿Eliminar TODOS los topes de '+hora+' ('+lot+')?'))return;fetch('/admin/topes/limpiar',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({hora,loteria:lot})}).then(r=>r.json()).then(d=>{if(d.status==='ok')cargarTopes();else alert(d.error);});}
+
+function desColumnar(t){if(!t||Array.isArray(t))return t||[];let out=new Array(t.n);for(let i=0;i<t.n;i++){let o={};for(let c=0;c<t.columnas.length;c++)o[t.columnas[c]]=t.datos[c][i];out[i]=o;}return out;}
+function cargarReporteHoy(){fetch('/admin/reporte-agencias').then(r=>r.json()).then(d=>{let html='<table class="tbl"><thead><tr><th>Agencia</th><th>Tickets</th><th>Ventas</th><th>Premios Pagados</th><th>Pendientes</th><th>Total Premios</th><th>Comision</th><th>Balance</th></tr></thead><tbody>';d.agencias.forEach(a=>{let bc=a.balance>=0?'var(--green)':'var(--red)';let pend=a.premios_pendientes||0;html+='<tr><td><span style="color:var(--gold)">'+a.nombre+'</span><br><span style="color:var(--text2);font-size:.65rem">'+a.usuario+'</span></td><td>'+a.tickets+'</td><td>S/'+a.ventas.toFixed(2)+'</td><td style="color:var(--red)">S/'+a.premios_pagados.toFixed(2)+'</td><td style="color:var(--gold)">'+(pend>0?'S/'+pend.toFixed(2):'—')+'</td><td style="color:var(--red);font-weight:700">S/'+a.premios_total.toFixed(2)+'</td><td>S/'+a.comision.toFixed(2)+'</td><td style="color:'+bc+';font-weight:700">S/'+a.balance.toFixed(2)+'</td></tr>';});html+='<tfoot><tr><td colspan="2" style="color:var(--gold)">GLOBAL</td><td>S/'+d.global.ventas.toFixed(2)+'</td><td style="color:var(--red)">S/'+d.global.pagos.toFixed(2)+'</td><td></td><td></td><td>S/'+d.global.comisiones.toFixed(2)+'</td><td style="color:'+(d.global.balance>=0?'var(--green)':'var(--red)')+';font-weight:700">S/'+d.global.balance.toFixed(2)+'</td></tr></tfoot></table>';document.getElementById('rep-hoy').innerHTML=html;document.getElementById('btn-csv').disabled=false;document.getElementById('btn-csv').style.opacity=1;});}
+function cargarEstadisticas(){let ini=document.getElementById('rep-ini').value,fin=document.getElementById('rep-fin').value;if(!ini||!fin){alert('Seleccione fechas');return;}trabajoReporte('estadisticas_rango',{fecha_inicio:ini,fecha_fin:fin},'rep-periodo',r=>r.json().then(d=>{let t=d.totales;let vAnim=Math.round((t.ventas-(t.tripletas||0))*100)/100;let html='<div style="display:grid;grid-template-columns:repeat(2,1fr);gap:8px;margin:12px 0"><div class="stat-box"><div class="stat-label">VENTAS ANIMALES</div><div class="stat-val">S/'+vAnim.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">TRIPLETAS</div><div class="stat-val" style="color:#c084fc">S/'+(t.tripletas||0).toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">TOTAL INGRESOS</div><div class="stat-val" style="color:var(--gold)">S/'+t.ventas.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">PREMIOS</div><div class="stat-val r">S/'+t.premios.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">COMISIONES</div><div class="stat-val">S/'+t.comisiones.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">BALANCE</div><div class="stat-val" style="color:'+(t.balance>=0?'var(--green)':'var(--red)')+'">S/'+t.balance.toFixed(2)+'</div></div></div>';html+='<table class="tbl"><thead><tr><th>Fecha</th><th>Tickets</th><th>V.Animales</th><th style="color:#c084fc">Tripletas</th><th style="color:var(--gold)">Total</th><th>Premios</th><th>Comisiones</th><th>Balance</th></tr></thead><tbody>';d.resumen_por_dia.forEach(function(r){var bc=r.balance>=0?'var(--green)':'var(--red)';var va=Math.round((r.ventas-(r.tripletas||0))*100)/100;html+='<tr><td>'+r.fecha+'</td><td>'+r.tickets+'</td><td>S/'+va.toFixed(2)+'</td><td style="color:#c084fc">S/'+(r.tripletas||0).toFixed(2)+'</td><td style="color:var(--gold);font-weight:700">S/'+r.ventas.toFixed(2)+'</td><td style="color:var(--red)">S/'+r.premios.toFixed(2)+'</td><td>S/'+r.comisiones.toFixed(2)+'</td><td style="color:'+bc+';font-weight:700">S/'+r.balance.toFixed(2)+'</td></tr>';});html+='</tbody></table>';document.getElementById('rep-periodo').innerHTML=html;}));}
+function cargarReporteAgencias(){let ini=document.getElementById('rep-ini').value,fin=document.getElementById('rep-fin').value;if(!ini||!fin){alert('Seleccione fechas');return;}trabajoReporte('agencias_rango',{fecha_inicio:ini,fecha_fin:fin,formato:'columnar'},'rep-periodo',r=>r.json().then(d=>{d.agencias=desColumnar(d.agencias);let html='<div style="display:grid;grid-template-columns:repeat(4,1fr);gap:8px;margin:12px 0"><div class="stat-box"><div class="stat-label">TOTAL VENTAS</div><div class="stat-val">S/'+d.total.ventas.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">PREMIOS</div><div class="stat-val r">S/'+d.total.premios.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">COMISIONES</div><div class="stat-val">S/'+d.total.comision.toFixed(2)+'</div></div><div class="stat-box"><div class="stat-label">BALANCE</div><div class="stat-val '+(d.total.balance>=0?'g':'r')+'">S/'+d.total.balance.toFixed(2)+'</div></div></div>';html+='<table class="tbl"><thead><tr><th>Agencia</th><th>Tickets</th><th>Ventas</th><th>% del Total</th><th>Premios</th><th>Comisión</th><th>Balance</th></tr></thead><tbody>';d.agencias.forEach(a=>{let bc=a.balance>=0?'var(--green)':'var(--red)';html+='<tr><td><span style="color:var(--gold)">'+a.nombre+'</span><br><span style="color:var(--text2);font-size:.65rem">'+a.usuario+'</span></td><td>'+a.tickets+'</td><td>S/'+a.ventas.toFixed(2)+'</td><td style="color:var(--text2)">'+(a.porcentaje_ventas||0)+'%</td><td style="color:var(--red)">S/'+a.premios_teoricos.toFixed(2)+'</td><td>S/'+a.comision.toFixed(2)+'</td><td style="color:'+bc+';font-family:\'Oswald\',sans-serif">S/'+a.balance.toFixed(2)+'</td></tr>';});html+='</tbody></table>';document.getElementById('rep-periodo').innerHTML=html;}));}
+function exportarCSV(){let ini=document.getElementById('rep-ini').value,fin=document.getElementById('rep-fin').value;if(!ini||!fin){alert('Seleccione fechas');return;}trabajoReporte('exportar_csv',{fecha_inicio:ini,fecha_fin:fin},null,r=>r.blob().then(blob=>{let a=document.createElement('a');a.href=URL.createObjectURL(blob);a.download='reporte_'+ini+'_'+fin+'.csv';a.click();}));}
+var _trabajos={};
+function trabajoReporte(tipo,parametros,destino,alListo){let el=destino?document.getElementById(destino):null;if(el)el.innerHTML='<div style="color:var(--text2);padding:10px">⏳ Generando reporte...</div>';fetch('/admin/reportes/trabajos',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({tipo:tipo,parametros:parametros})}).then(r=>r.json()).then(d=>{if(d.error){if(el)el.innerHTML='';alert(d.error);return;}let push=_esAdmin&&_esAdmin.readyState===1;_trabajos[d.id]={el:el,listo:alListo,timer:setInterval(()=>consultarTrabajo(d.id),push?10000:2000)};}).catch(()=>{if(el)el.innerHTML='';alert('Error de conexión');});}
+function consultarTrabajo(id){fetch('/admin/reportes/trabajos/'+id).then(r=>r.json()).then(actualizarTrabajo).catch(()=>{});}
+function actualizarTrabajo(d){let t=_trabajos[d.id];if(!t)return;if(d.estado==='listo'){clearInterval(t.timer);delete _trabajos[d.id];fetch('/admin/reportes/trabajos/'+d.id+'/descarga').then(t.listo);}else if(d.estado==='error'){clearInterval(t.timer);delete _trabajos[d.id];if(t.el)t.el.innerHTML='';alert('Error en reporte: '+(d.error||''));}else if(t.el){t.el.innerHTML='<div style="color:var(--text2);padding:10px">⏳ Generando reporte... '+(d.progreso||0)+'%</div>';}}
+
+function cargarTripletas(){fetch('/admin/tripletas-hoy?formato=columnar').then(r=>r.json()).then(d=>{d.tripletas=desColumnar(d.tripletas);let html='<div style="display:grid;grid-template-columns:repeat(3,1fr);gap:8px;margin-bottom:12px"><div class="stat-box"><div class="stat-label">TOTAL</div><div class="stat-val">'+d.total+'</div></div><div class="stat-box"><div class="stat-label">GANADORAS</div><div class="stat-val g">'+d.ganadoras+'</div></div><div class="stat-box"><div class="stat-label">PREMIOS</div><div class="stat-val r">S/'+(d.total_premios||0).toFixed(2)+'</div></div></div>';if(!d.tripletas.length){html+='<div style="color:var(--text2);text-align:center;padding:20px">Sin tripletas hoy</div>';document.getElementById('trip-body').innerHTML=html;return;}html+='<table class="tbl"><thead><tr><th>Serial</th><th>Agencia</th><th>Animales</th><th>Monto</th><th>Hora</th><th>Validez</th><th>Salieron</th><th>Faltan</th><th>Premio</th><th>Estado</th></tr></thead><tbody>';d.tripletas.forEach(function(t){let lotLabel=t.loteria==='plus'?'<span class="tag" style="background:#2e1065;color:#c084fc;border-color:#7c3aed">PLUS</span>':'<span class="tag info">PERÚ</span>';let ans=t.nombres.map(function(n,i){return t['animal'+(i+1)]+'-'+n;}).join(' • ');let animSet=[t.animal1,t.animal2,t.animal3];let salSet=t.salieron||[];let faltanArr=animSet.filter(function(a){return salSet.indexOf(a)<0;});let salStr=salSet.length?salSet.map(function(a){return a+'-'+(ANIMALES[a]||a);}).join(', '):'<span style="color:var(--text2)">Ninguno</span>';let faltanStr=faltanArr.length?faltanArr.map(function(a){return'<span style="color:var(--gold)">'+a+'-'+(ANIMALES[a]||a)+'</span>';}).join(', '):'<span style="color:var(--green)">✅ Todos</span>';let validezStr=t.sorteos_validos+'/'+t.sorteos_totales+' sorteos';html+='<tr style="'+(t.gano?'background:rgba(46,204,113,.04)':'')+'"><td style="color:var(--teal);font-size:.7rem">'+t.serial+'</td><td style="font-size:.72rem">'+t.agencia+'<br>'+lotLabel+'</td><td style="font-size:.72rem;color:#c084fc">'+ans+'</td><td style="color:var(--gold)">S/'+t.monto+'</td><td style="font-size:.68rem;color:var(--text2)">'+t.hora_compra+'</td><td style="font-size:.68rem;color:#6090c0">'+validezStr+'</td><td style="font-size:.72rem;color:#4ade80">'+salStr+'</td><td style="font-size:.72rem">'+faltanStr+'</td><td style="color:var(--red)">'+(t.gano?'S/'+t.premio.toFixed(2):'—')+'</td><td><span class="tag '+(t.gano?(t.pagado?'ok':'warn'):'err')+'">'+(t.gano?(t.pagado?'PAGADO':'PENDIENTE'):'NO GANÓ')+'</span></td></tr>';});html+='</tbody></table>';document.getElementById('trip-body').innerHTML=html;});}
+
+function cargarAudit(){let ini=document.getElementById('aud-ini').value,fin=document.getElementById('aud-fin').value,filtro=document.getElementById('aud-filtro').value;fetch('/admin/audit-logs',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha_inicio:ini,fecha_fin:fin,filtro,limit:500,formato:'columnar'})}).then(r=>r.json()).then(d=>{d.logs=desColumnar(d.logs);let html='<table class="tbl"><thead><tr><th>Fecha</th><th>Agencia</th><th>Acción</th><th>Detalle</th><th>IP</th></tr></thead><tbody>';d.logs.forEach(l=>{let colorAccion=l.accion.includes('DESBLOQUEO')?'#f59e0b':l.accion.includes('AUTO')&&l.accion.includes('TOGGLE')?'var(--teal)':l.accion.includes('PAGO')?'var(--green)':l.accion.includes('ANUL')?'var(--red)':l.accion.includes('RESUL')?'var(--gold)':l.accion.includes('ELIMINAR')?'var(--red)':'var(--text)';html+='<tr><td style="font-size:.68rem;color:var(--text2);white-space:nowrap">'+l.fecha+'</td><td style="font-size:.72rem">'+l.agencia+'</td><td><span class="tag info" style="color:'+colorAccion+'">'+l.accion+'</span></td><td style="font-size:.7rem;max-width:300px;overflow:hidden;text-overflow:ellipsis">'+l.detalle+'</td><td style="font-size:.7rem;color:var(--text2)">'+l.ip+'</td></tr>';});html+='</tbody></table>';document.getElementById('aud-body').innerHTML=html;});}
+
+function showMsg(id,msg,tipo){let el=document.getElementById(id);el.textContent=msg;el.className='msg '+tipo;el.style.display='block';clearTimeout(el._t);el._t=setTimeout(()=>el.style.display='none',4000);}
+
+// ── Bloqueados manuales permanentes ──────────────────────────────────────────
+var _lotBloq='peru';
+var _bloqueados=[];
+function selLotBloq(lot){_lotBloq=lot;document.getElementById('bloq-btn-peru').className='tag '+(lot==='peru'?'info active':'');document.getElementById('bloq-btn-plus').className='tag';document.getElementById('bloq-btn-plus').style.cssText='cursor:pointer;font-size:.6rem;padding:2px 8px;border-color:#7c3aed;color:'+(lot==='plus'?'#fff':'#c084fc')+';background:'+(lot==='plus'?'#7c3aed':'transparent');cargarBloqueados();}
+function cargarBloqueados(){fetch('/admin/numeros-bloqueados?loteria='+_lotBloq).then(function(r){return r.json();}).then(function(d){_bloqueados=d.bloqueados||[];renderBloqGrid();}).catch(function(){});}
+function renderBloqGrid(){var g=document.getElementById('bloq-grid');if(!g)return;g.innerHTML='';var orden=['00','0'];for(var i=1;i<=40;i++) orden.push(String(i));orden.forEach(function(k){if(!ANIMALES[k])return;var bloq=_bloqueados.indexOf(k)>=0;var btn=document.createElement('button');btn.style.cssText='padding:3px 2px;border-radius:3px;font-size:.58rem;cursor:pointer;text-align:center;line-height:1.2;'+(bloq?'background:rgba(231,76,60,.25);border:1px solid var(--red);color:var(--red);':'background:var(--card);border:1px solid var(--border);color:var(--text);');btn.innerHTML='<div style="font-weight:700">'+k+'</div><div style="font-size:.5rem;opacity:.8">'+ANIMALES[k].substring(0,4)+'</div>'+(bloq?'<div style="font-size:.45rem;color:var(--red)">🚫</div>':'');btn.onclick=(function(num){return function(){toggleBloqueado(num);};})(k);g.appendChild(btn);});var count=_bloqueados.length;var info=document.getElementById('bloq-info');if(info) info.textContent=count>0?'Bloqueados permanentes ('+_lotBloq.toUpperCase()+'): '+_bloqueados.join(', '):'Sin números bloqueados permanentemente en '+_lotBloq.toUpperCase();}
+function toggleBloqueado(numero){fetch('/admin/numeros-bloqueados/toggle',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({numero:numero,loteria:_lotBloq})}).then(function(r){return r.json();}).then(function(d){if(d.status==='ok'){if(d.accion==='bloqueado'){_bloqueados.push(d.numero);}else{_bloqueados=_bloqueados.filter(function(n){return n!==d.numero;});}renderBloqGrid();}}).catch(function(){});}
+
+// ── NUEVO v4.1: Bloqueos automáticos (histórico + tripleta) ──────────────────
+function selLotBloqAuto(lot){_lotBloqAuto=lot;document.getElementById('lot-bloq-auto-peru').classList.toggle('active',lot==='peru');document.getElementById('lot-bloq-auto-plus').classList.toggle('active',lot==='plus');cargarBloqueos();}
+
+function cargarBloqueos(){
+  if(!ES_SUPER)return;
+  fetch('/admin/bloqueos-estado?loteria='+_lotBloqAuto)
+    .then(function(r){return r.json();})
+    .then(function(d){
+      if(d.error){document.getElementById('bloq-auto-body').innerHTML='<div style="color:var(--red)">'+d.error+'</div>';return;}
+      var html='';
+      // Históricos
+      html+='<div style="margin-bottom:10px">';
+      html+='<div style="color:#f59e0b;font-family:Oswald,sans-serif;font-size:.72rem;letter-spacing:1px;margin-bottom:5px">📅 BLOQUEADOS POR HISTÓRICO — Salieron ayer, no pueden salir hoy</div>';
+      if(d.historicos.length===0){html+='<div style="color:var(--text2);font-size:.68rem;padding:4px 6px;background:var(--card);border-radius:3px">✅ Sin bloqueos históricos</div>';}
+      else{d.historicos.forEach(function(b){html+='<div style="display:flex;align-items:center;gap:6px;padding:5px 8px;background:rgba(245,158,11,.08);border:1px solid rgba(245,158,11,.25);border-radius:3px;margin-bottom:3px"><span style="color:var(--gold);font-family:Oswald,sans-serif;font-weight:700;min-width:32px;font-size:.85rem">'+b.numero+'</span><span style="flex:1;font-size:.78rem">'+b.nombre+'</span><button onclick="desbloquearHistorico(\''+b.numero+'\')" style="padding:3px 10px;background:rgba(245,158,11,.15);border:1px solid #f59e0b;color:#f59e0b;border-radius:3px;font-size:.65rem;cursor:pointer;font-family:Oswald,sans-serif;font-weight:700">DESBLOQUEAR</button></div>';});}
+      html+='</div>';
+      // Tripletas
+      html+='<div>';
+      html+='<div style="color:#ef4444;font-family:Oswald,sans-serif;font-size:.72rem;letter-spacing:1px;margin-bottom:5px">🎯 BLOQUEADOS POR TRIPLETA EN RIESGO — 2/3 animales ya salieron</div>';
+      if(d.tripleta.length===0){html+='<div style="color:var(--text2);font-size:.68rem;padding:4px 6px;background:var(--card);border-radius:3px">✅ Sin tripletas en riesgo</div>';}
+      else{d.tripleta.forEach(function(b){html+='<div style="display:flex;align-items:center;gap:6px;padding:5px 8px;background:rgba(239,68,68,.08);border:1px solid rgba(239,68,68,.35);border-radius:3px;margin-bottom:3px"><span style="color:var(--red);font-family:Oswald,sans-serif;font-weight:700;min-width:32px;font-size:.85rem">'+b.numero+'</span><span style="flex:1;font-size:.78rem">'+b.nombre+'</span><span style="font-size:.6rem;color:#6090c0;white-space:nowrap;margin-right:4px">'+b.serial+' ('+b.animales+')</span><button onclick="desbloquearTripleta(\''+b.numero+'\')" style="padding:3px 10px;background:rgba(239,68,68,.15);border:1px solid #ef4444;color:#ef4444;border-radius:3px;font-size:.65rem;cursor:pointer;font-family:Oswald,sans-serif;font-weight:700">DESBLOQUEAR</button></div>';});}
+      html+='</div>';
+      document.getElementById('bloq-auto-body').innerHTML=html;
+    }).catch(function(){document.getElementById('bloq-auto-body').innerHTML='<div style="color:var(--red);font-size:.72rem;padding:8px">Error al cargar bloqueos</div>';});
+}
+
+function desbloquearHistorico(numero){
+  if(!confirm('¿Desbloquear '+numero+'-'+ANIMALES[numero]+'?\n\nEste número salió ayer pero podrá salir hoy si lo desbloqueas.'))return;
+  fetch('/admin/desbloquear-historico',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({numero:numero,loteria:_lotBloqAuto})})
+  .then(function(r){return r.json();})
+  .then(function(d){if(d.status==='ok'){showMsg('msg-res','✅ '+d.mensaje,'ok');cargarBloqueos();}else showMsg('msg-res','❌ '+d.error,'err');})
+  .catch(function(){showMsg('msg-res','Error de conexión','err');});
+}
+
+function desbloquearTripleta(numero){
+  if(!confirm('⚠️ ATENCIÓN: Desbloquear '+numero+'-'+ANIMALES[numero]+'.\n\n'+'Si este número sale como resultado, UNA O VARIAS TRIPLETAS GANARÁN.\n\n¿Confirmas el desbloqueo?'))return;
+  fetch('/admin/desbloquear-tripleta',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({numero:numero,loteria:_lotBloqAuto})})
+  .then(function(r){return r.json();})
+  .then(function(d){if(d.status==='ok'){showMsg('msg-res','✅ '+d.mensaje,'ok');cargarBloqueos();}else showMsg('msg-res','❌ '+d.error,'err');})
+  .catch(function(){showMsg('msg-res','Error de conexión','err');});
+}
+
+// ── Toggle auto-sorteo ────────────────────────────────────────────────────────
+function actualizarEstadoToggle(estado){var btn=document.getElementById('toggle-auto-btn');if(!btn)return;if(estado==='on'){btn.className='toggle-btn on';btn.textContent='▶ ACTIVADO';}else{btn.className='toggle-btn off';btn.textContent='⏸ DESACTIVADO';}}
+function cargarEstadoAutoSorteo(){fetch('/admin/estado-autosorteo').then(function(r){return r.json();}).then(function(d){actualizarEstadoToggle(d.estado);}).catch(function(){});}
+function toggleAutoSorteo(){var btn=document.getElementById('toggle-auto-btn');var nuevoEstado=btn.classList.contains('on')?'off':'on';fetch('/admin/toggle-autosorteo',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({estado:nuevoEstado})}).then(function(r){return r.json();}).then(function(d){if(d.status==='ok'){actualizarEstadoToggle(d.estado);showMsg('msg-res',d.mensaje,'ok');}else showMsg('msg-res',d.error||'Error','err');}).catch(function(){showMsg('msg-res','Error de conexión','err');});}
+
+function listarAdmins(){fetch('/admin/lista-admins').then(function(r){return r.json();}).then(function(admins){var html='';if(!admins.length){document.getElementById('adm-lista').innerHTML='<div style="color:var(--text2);text-align:center;padding:20px">Sin administradores</div>';return;}admins.forEach(function(a){var superTag=a.es_superadmin?'<span class="tag warn">SUPER</span>':'<span class="tag info">ADMIN</span>';var delBtn=a.es_superadmin?'':'<button class="btn red" style="padding:4px 10px;font-size:.65rem" onclick="eliminarAdmin('+a.id+',\''+String(a.nombre_agencia).replace(/\x27/g,"")+'\')">Eliminar</button>';html+='<div style="background:var(--card);border:1px solid var(--border);border-radius:4px;padding:10px;margin-bottom:8px"><div style="display:flex;justify-content:space-between;align-items:center"><div><div style="color:var(--gold);font-weight:700">'+a.nombre_agencia+' '+superTag+'</div><div style="color:var(--text2);font-size:.72rem">'+a.usuario+' &middot; '+a.agencias+' agencia(s)</div></div><div>'+delBtn+'</div></div></div>';});document.getElementById('adm-lista').innerHTML=html;}).catch(function(){});}
+function crearAdmin(){var u=document.getElementById('adm-user').value.trim(),p=document.getElementById('adm-pass').value.trim(),n=document.getElementById('adm-nombre').value.trim();if(!u||!p||!n){showMsg('msg-adm','Complete todos los campos','err');return;}var fd=new FormData();fd.append('usuario',u);fd.append('password',p);fd.append('nombre',n);fetch('/admin/crear-admin',{method:'POST',body:fd}).then(function(r){return r.json();}).then(function(d){if(d.status==='ok'){showMsg('msg-adm',d.mensaje,'ok');['adm-user','adm-pass','adm-nombre'].forEach(function(i){document.getElementById(i).value='';});listarAdmins();}else showMsg('msg-adm',d.error,'err');});}
+function eliminarAdmin(id,nombre){if(!confirm('Eliminar al administrador "'+nombre+'"?'))return;fetch('/admin/eliminar-admin',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({id:id})}).then(function(r){return r.json();}).then(function(d){if(d.status==='ok'){alert(d.mensaje);listarAdmins();}else alert(d.error);});}
+function reasignarDueno(id){var sel=document.getElementById('owner-'+id);if(!sel)return;fetch('/admin/editar-agencia',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({id:id,admin_id:parseInt(sel.value)})}).then(function(r){return r.json();}).then(function(d){if(d.status==='ok'){alert('Dueno actualizado');listarAgencias();}else alert(d.error);});}
+function init(){
+  let hoy=new Date().toISOString().split('T')[0];
+  document.getElementById('res-fecha').value=hoy;
+  document.getElementById('rep-ini').value=hoy;
+  document.getElementById('rep-fin').value=hoy;
+  document.getElementById('aud-ini').value=hoy;
+  document.getElementById('aud-fin').value=hoy;
+  document.getElementById('fecha-7030').value=hoy;
+  fillHorasRes();fillHorasRiesgo();fillHorasTopes();
+  renderAMG();
+  cargarResultadosAdmin();
+  cargarEstadoAutoSorteo();
+  cargarBloqueados();
+  cargarBloqueos();
+  cargarSecuencia();
+  conectarEventosAdmin();
+}
+var _esAdmin=null;
+function conectarEventosAdmin(){
+  if(!window.EventSource||document.body.dataset.sse!=='1'){setInterval(cargarEstadoAutoSorteo,30000);setInterval(cargarBloqueos,60000);return;}
+  _esAdmin=new EventSource('/api/eventos');
+  _esAdmin.onerror=function(){if(_esAdmin.readyState===2)setTimeout(conectarEventosAdmin,10000);};
+  _esAdmin.addEventListener('autosorteo',function(e){actualizarEstadoToggle(JSON.parse(e.data).estado);});
+  _esAdmin.addEventListener('bloqueos',function(){cargarBloqueos();});
+  _esAdmin.addEventListener('post_sorteo',function(){cargarBloqueos();let t=document.getElementById('tc-riesgo');if(t&&t.classList.contains('active'))cargarMatrizRiesgo();});
+  _esAdmin.addEventListener('resultado',function(){cargarBloqueos();cargarResultadosAdmin();cargarSecuencia();});
+  _esAdmin.addEventListener('reporte',function(e){actualizarTrabajo(JSON.parse(e.data));});
+  _esAdmin.addEventListener('reconectar',function(){_esAdmin.close();conectarEventosAdmin();});
+}
+document.addEventListener('DOMContentLoaded',init);
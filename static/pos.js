@@ -0,0 +1,77 @@
+const ANIMALES = ZOOLO_DATOS.animales;
+const COLORES  = ZOOLO_DATOS.colores;
+const HPERU = ZOOLO_DATOS.horarios_peru;
+const HPLUS = ZOOLO_DATOS.horarios_plus;
+const ROJOS = ["1","3","5","7","9","12","14","16","18","19","21","23","25","27","30","32","34","36","37","39"];
+const ORDEN = ['00','0','1','2','3','4','5','6','7','8','9','10','11','12','13','14','15','16','17','18','19','20','21','22','23','24','25','26','27','28','29','30','31','32','33','34','35','36','37','38','39','40'];
+let carrito=[],horasSel=[],horasSelPlus=[],animalesSel=[],espSel=null,horasBloq=[],horasBloqPlus=[],loteriaActiva='peru',tripSlotModal=0,tripAnimModal=[null,null,null];
+function init(){guardarCola(leerCola());mostrarRecibos();vaciarCola();setInterval(vaciarCola,30000);window.addEventListener('online',vaciarCola);renderAnimales();renderHoras();renderTripModalGrid();conectarEventos();setInterval(actualizarClock,1000);actualizarClock();let hoy=new Date().toISOString().split('T')[0];['res-fecha','mt-ini','mt-fin','ar-ini','ar-fin'].forEach(id=>{let el=document.getElementById(id);if(el)el.value=hoy});}
+let _sinConexion=false;
+function marcarConexion(ok){if(ok&&_sinConexion){_sinConexion=false;document.getElementById('offline-banner').style.display='none';vaciarCola();}else if(!ok){_sinConexion=true;document.getElementById('offline-banner').style.display='flex';}}
+// ── Cola de ventas sin conexión: se guardan en el equipo y se envían en lote al volver ──
+// La cola y los recibos van por agencia: otra sesión en el mismo equipo no envía ni ve ventas ajenas.
+const AGENCIA_ID=document.body.dataset.agencia||'';
+const COLA_KEY='zoolo_cola_ventas_'+AGENCIA_ID,RECIBOS_KEY='zoolo_recibos_cola_'+AGENCIA_ID;let _vaciando=false;
+function leerCola(){try{return (JSON.parse(localStorage.getItem(COLA_KEY))||[]).filter(v=>v.agencia===AGENCIA_ID);}catch(e){return [];}}
+function leerRecibos(){try{return JSON.parse(localStorage.getItem(RECIBOS_KEY))||[];}catch(e){return [];}}
+function guardarRecibos(l){localStorage.setItem(RECIBOS_KEY,JSON.stringify(l));}
+function mostrarRecibos(){let l=leerRecibos(),el=document.getElementById('recibos-lista');if(!el)return;if(!l.length){closeMod('mod-recibos');return;}el.innerHTML=l.map((x,i)=>'<div class="tcard"><div style="display:flex;justify-content:space-between;align-items:center;gap:6px"><div><div class="ts">#'+x.serial+'</div><div style="color:#4a6090;font-size:.7rem">Ticket #'+x.ticket_id+' — vendido sin conexion '+new Date(x.creado).toLocaleTimeString()+'</div></div><div style="text-align:right"><div style="color:#fbbf24;font-family:\'Oswald\',sans-serif;font-size:.9rem;font-weight:700">S/'+x.total+'</div><button class="btn-q" style="margin:4px 0 0;padding:4px 10px" onclick="enviarRecibo('+i+')">ENVIAR</button></div></div></div>').join('');openMod('mod-recibos');}
+function enviarRecibo(i){let l=leerRecibos(),x=l[i];if(!x)return;window.open(x.url_whatsapp,'_blank');l.splice(i,1);guardarRecibos(l);mostrarRecibos();}
+function guardarCola(c){localStorage.setItem(COLA_KEY,JSON.stringify(c));let el=document.getElementById('cola-ventas');if(el)el.textContent=c.length?' — '+c.length+' EN COLA':'';}
+function nuevaClave(){return (window.crypto&&crypto.randomUUID)?crypto.randomUUID():Date.now().toString(36)+'-'+Math.random().toString(36).slice(2,12);}
+function encolarVenta(jugadas){let c=leerCola();c.push({clave:nuevaClave(),agencia:AGENCIA_ID,jugadas:jugadas,creado:Date.now()});guardarCola(c);toast('Sin conexion: venta guardada en cola ('+c.length+')','ok');}
+async function vaciarCola(){let c=leerCola();if(!c.length||_vaciando)return;_vaciando=true;try{let r=await fetch('/api/procesar-ventas-lote',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({tickets:c.slice(0,100).map(v=>({clave:v.clave,jugadas:v.jugadas}))})});if(!r.ok)return;let d=await r.json(),res={},ok=0,rech=[];(d.resultados||[]).forEach(x=>res[x.clave]=x);let rec=leerRecibos();guardarCola(leerCola().filter(v=>{let x=res[v.clave];if(!x)return true;if(x.status==='rechazado')rech.push(x.error);else{ok++;rec.push({ticket_id:x.ticket_id,serial:x.serial,total:x.total,url_whatsapp:x.url_whatsapp,creado:v.creado});}return false;}));guardarRecibos(rec);if(ok)mostrarRecibos();if(rech.length)toast('Cola: '+ok+' enviadas, '+rech.length+' rechazadas — '+rech[0],'err');else if(ok)toast('Cola: '+ok+' venta(s) registradas','ok');if(leerCola().length)setTimeout(vaciarCola,1000);}catch(e){}finally{_vaciando=false;}}
+function verificarConexion(){fetch('/api/hora-actual',{cache:'no-store'}).then(r=>{if(r.ok)marcarConexion(true);}).catch(()=>marcarConexion(false));}
+let _es=null;
+function conectarEventos(){if(!window.EventSource||document.body.dataset.sse!=='1'){actualizarBloq();setInterval(actualizarBloq,30000);setInterval(verificarConexion,10000);verificarConexion();return;}_es=new EventSource('/api/eventos');_es.onopen=()=>marcarConexion(true);_es.onerror=()=>{if(_es.readyState===2){marcarConexion(false);setTimeout(conectarEventos,10000);}else if(_es.readyState!==1)marcarConexion(false);};_es.addEventListener('cierre',e=>aplicarCierre(JSON.parse(e.data)));_es.addEventListener('reconectar',()=>{_es.close();conectarEventos();});}
+function actualizarClock(){let now=new Date(),utcMs=now.getTime()+now.getTimezoneOffset()*60000,peruMs=utcMs-5*3600000,peru=new Date(peruMs),h=peru.getHours(),m=peru.getMinutes(),ap=h>=12?'PM':'AM';h=h%12||12;document.getElementById('clock').textContent=h+':'+String(m).padStart(2,'0')+' '+ap+' LIMA';}
+function aplicarCierre(d){horasBloq=d.bloqueadas||[];horasBloqPlus=d.bloqueadas_plus||[];horasSel=horasSel.filter(h=>!horasBloq.includes(h));horasSelPlus=horasSelPlus.filter(h=>!horasBloqPlus.includes(h));renderHoras();}
+function actualizarBloq(){fetch('/api/hora-actual').then(r=>r.json()).then(aplicarCierre).catch(()=>{});}
+function getCardClass(k){if(k==='40')return 'cl';let c=COLORES[k];if(c==='verde')return 'cv';if(c==='rojo')return 'cr';return 'cn';}
+function renderAnimales(){let g=document.getElementById('animals-grid');g.innerHTML='';ORDEN.forEach(k=>{if(!ANIMALES[k])return;let d=document.createElement('div');d.className='acard '+getCardClass(k);d.dataset.k=k;d.innerHTML='<div class="anum">'+k+'</div><div class="anom">'+ANIMALES[k]+'</div>';d.onclick=()=>toggleAnimal(k,d);g.appendChild(d);});}
+function toggleAnimal(k,el){let i=animalesSel.indexOf(k);if(i>=0){animalesSel.splice(i,1);el.classList.remove('sel');}else{animalesSel.push(k);el.classList.add('sel');}}
+function handleManualPaste(e){e.preventDefault();let texto=(e.clipboardData||window.clipboardData).getData('text');document.getElementById('manual-input').value=texto;procesarManual(texto);}
+function handleManualKeyup(e){let val=e.target.value;if(e.key==='Enter'){procesarManual(val);e.target.value='';}}
+function procesarManual(texto){if(!texto||!texto.trim())return;let nums=texto.split(/[.,\-;\s\n\/|]+/).map(x=>x.trim()).filter(x=>x!=='');let validos=[],invalidos=[];nums.forEach(n=>{let num=n==='00'?'00':n.replace(/^0+/,'')||'0';if(ANIMALES[num]!==undefined){if(!validos.includes(num))validos.push(num);}else invalidos.push(n);});if(!validos.length){toast('No se encontraron numeros validos','err');return;}validos.forEach(k=>{if(!animalesSel.includes(k))animalesSel.push(k);let card=document.querySelector('.acard[data-k="'+k+'"]');if(card)card.classList.add('sel');});let msg='Seleccionados: '+validos.map(k=>k+'-'+ANIMALES[k]).join(', ');if(invalidos.length)msg+=' | Ignorados: '+invalidos.join(',');toast(msg,'ok');document.getElementById('manual-input').value='';}
+function confirmarManual(){let val=document.getElementById('manual-input').value;if(val.trim())procesarManual(val);}
+function selEsp(v){if(espSel===v){espSel=null;document.getElementById('esp-'+v).classList.remove('sel');}else{if(espSel)document.getElementById('esp-'+espSel).classList.remove('sel');espSel=v;animalesSel=[];document.querySelectorAll('.animals-grid .acard').forEach(c=>c.classList.remove('sel'));document.getElementById('esp-'+v).classList.add('sel');}}
+function renderHoras(){let g=document.getElementById('horas-grid');g.innerHTML='';let isPlus=loteriaActiva==='plus',lista=isPlus?HPLUS:HPERU,bloq=isPlus?horasBloqPlus:horasBloq,sel=isPlus?horasSelPlus:horasSel;lista.forEach(h=>{let b=document.createElement('div');b.className='hbtn';let isBloq=bloq.includes(h),isSel=sel.includes(h);if(isBloq)b.classList.add('bloq');if(isSel)b.classList.add('sel');b.innerHTML='<div class="hperu">'+h.replace(':00','')+'</div>';if(!isBloq)b.onclick=()=>toggleH(h);g.appendChild(b);});}
+function toggleH(h){let isPlus=loteriaActiva==='plus',arr=isPlus?horasSelPlus:horasSel,i=arr.indexOf(h);if(i>=0)arr.splice(i,1);else arr.push(h);renderHoras();}
+function selTodos(){if(loteriaActiva==='plus')horasSelPlus=HPLUS.filter(h=>!horasBloqPlus.includes(h));else horasSel=HPERU.filter(h=>!horasBloq.includes(h));renderHoras();}
+function limpiarH(){if(loteriaActiva==='plus')horasSelPlus=[];else horasSel=[];renderHoras();}
+function cambiarLoteria(lot){loteriaActiva=lot;let lbl=lot==='plus'?'PLUS - 12 Sorteos':'PERU - 11 Sorteos';document.getElementById('horas-label').textContent=lbl;renderHoras();}
+function openTripletaModal(){tripAnimModal=[null,null,null];tripSlotModal=0;actualizarSlotsModal();renderTripModalGrid();selTripLoteria(loteriaActiva||'peru');openMod('mod-tripleta');}
+function selTripLoteria(lot){window.tripLoteriaModal=lot;let tabPeru=document.getElementById('trip-tab-peru'),tabPlus=document.getElementById('trip-tab-plus'),btn=document.getElementById('trip-btn-agregar');if(lot==='plus'){tabPlus.style.background='#6b21a8';tabPlus.style.color='#f3e8ff';tabPlus.style.fontWeight='700';tabPeru.style.background='#0c1020';tabPeru.style.color='#4a6090';tabPeru.style.fontWeight='normal';btn.style.background='linear-gradient(135deg,#6b21a8,#4c1d95)';btn.style.borderColor='#a855f7';btn.style.color='#f3e8ff';btn.textContent='AGREGAR ZOOLO PLUS';}else{tabPeru.style.background='#0c4a9e';tabPeru.style.color='#e0f0ff';tabPeru.style.fontWeight='700';tabPlus.style.background='#0c1020';tabPlus.style.color='#4a6090';tabPlus.style.fontWeight='normal';btn.style.background='linear-gradient(135deg,#166534,#14532d)';btn.style.borderColor='#22c55e';btn.style.color='#dcfce7';btn.textContent='AGREGAR ZOOLO PERU';}}
+function renderTripModalGrid(){let g=document.getElementById('trip-modal-grid');if(!g)return;g.innerHTML='';ORDEN.forEach(k=>{if(!ANIMALES[k])return;let d=document.createElement('div');d.className='acard '+getCardClass(k);d.innerHTML='<div class="anum">'+k+'</div><div class="anom">'+ANIMALES[k]+'</div>';d.onclick=()=>selTripAnimModal(k);g.appendChild(d);});}
+function activarSlotModal(i){tripSlotModal=i;actualizarSlotsModal();}
+function selTripAnimModal(k){let otro=tripAnimModal.findIndex((x,idx)=>x===k&&idx!==tripSlotModal);if(otro>=0){toast('Animal ya seleccionado','err');return;}tripAnimModal[tripSlotModal]=k;actualizarSlotsModal();if(tripSlotModal<2){let nextEmpty=tripAnimModal.findIndex(x=>x===null,tripSlotModal+1);if(nextEmpty===-1)nextEmpty=tripSlotModal+1;if(nextEmpty<3)tripSlotModal=nextEmpty;}actualizarSlotsModal();}
+function actualizarSlotsModal(){for(let i=0;i<3;i++){let s=document.getElementById('tms'+i),k=tripAnimModal[i];if(k){s.innerHTML='<div class="snum">'+k+'</div><div class="snom">'+ANIMALES[k].substring(0,6)+'</div>';s.className='tslot fill'+(i===tripSlotModal?' act':'');s.onclick=()=>{tripAnimModal[i]=null;activarSlotModal(i);};}else{s.innerHTML='<div class="sph">ANIMAL '+(i+1)+'</div>';s.className='tslot'+(i===tripSlotModal?' act':'');s.onclick=()=>activarSlotModal(i);}}}
+function agregarTripletaModal(){if(tripAnimModal.includes(null)){toast('Selecciona los 3 animales','err');return;}let monto=parseFloat(document.getElementById('monto-tripleta').value)||0;if(monto<=0){toast('Monto invalido','err');return;}let lot=window.tripLoteriaModal||loteriaActiva||'peru',sel=tripAnimModal.join(','),desc=tripAnimModal.map(n=>n+'-'+ANIMALES[n].substring(0,4)).join(' ');carrito.push({tipo:'tripleta',hora:'TODO DIA',seleccion:sel,monto,desc:'TRIP '+desc,loteria:lot});renderCarrito();closeMod('mod-tripleta');toast('Tripleta agregada','ok');}
+function openRepetirModal(){document.getElementById('rep-serial').value='';document.getElementById('rep-contenido').innerHTML='';openMod('mod-repetir');}
+function cargarTicketRepetir(){let serial=document.getElementById('rep-serial').value.trim();if(!serial){toast('Ingrese serial','err');return;}fetch('/api/repetir-ticket',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({serial:serial})}).then(r=>r.json()).then(d=>{if(d.error){toast(d.error,'err');return;}mostrarEditorRepetir(d);}).catch(()=>toast('Error al cargar ticket','err'));}
+function mostrarEditorRepetir(data){let html='<div class="rep-info"><div>Ticket Original: '+data.ticket_original.serial+'</div><div>Total: S/'+data.ticket_original.total+'</div></div>';data.jugadas.forEach((j,idx)=>{if(j.tipo==='tripleta'){html+='<div class="rep-item"><span style="color:#c084fc;font-family:\'Oswald\',sans-serif;min-width:60px">TRIP</span><span style="flex:1;color:#e0a0ff">'+j.animal1+'-'+j.animal2+'-'+j.animal3+'</span><input type="number" id="rep-m-'+idx+'" value="'+j.monto+'" min="0.5" step="0.5"><button class="btn-close" style="padding:4px 8px;font-size:.7rem" onclick="agregarItemRepetir('+idx+',\'tripleta\',\''+j.animal1+','+j.animal2+','+j.animal3+'\',\''+(j.loteria||'peru')+'\')">+</button></div>';}else{let horaOpts=HPERU.map(h=>'<option value="'+h+'" '+(horasBloq.includes(h)?'disabled':'')+'>'+h+(horasBloq.includes(h)?' (CERRADO)':'')+'</option>').join('');html+='<div class="rep-item"><span style="color:#4ade80;font-family:\'Oswald\',sans-serif;min-width:60px">'+j.seleccion+'</span><select id="rep-h-'+idx+'">'+horaOpts+'</select><input type="number" id="rep-m-'+idx+'" value="'+j.monto+'" min="0.5" step="0.5"><button class="btn-close" style="padding:4px 8px;font-size:.7rem" onclick="agregarItemRepetir('+idx+',\''+j.tipo+'\',\''+j.seleccion+'\')">+</button></div>';}});html+='<button class="btn-q" onclick="agregarTodoRepetir()" style="margin-top:12px;background:#166534;border-color:#22c55e">AGREGAR TODO</button>';document.getElementById('rep-contenido').innerHTML=html;data.jugadas.forEach((j,idx)=>{if(j.tipo!=='tripleta'){let sel=document.getElementById('rep-h-'+idx);if(sel){for(let opt of sel.options){if(opt.value===j.hora&&!opt.disabled){sel.value=j.hora;break;}}}}});}
+function agregarItemRepetir(idx,tipo,seleccion,loteria){let monto=parseFloat(document.getElementById('rep-m-'+idx).value)||0;if(monto<=0){toast('Monto invalido','err');return;}if(tipo==='tripleta'){let nums=seleccion.split(','),desc=nums.map(n=>n+'-'+ANIMALES[n].substring(0,4)).join(' '),lot=loteria||'peru';carrito.push({tipo:'tripleta',hora:'TODO DIA',seleccion:seleccion,monto,desc:'TRIP '+desc,loteria:lot});toast('Tripleta agregada','ok');}else{let hora=document.getElementById('rep-h-'+idx).value;if(!hora){toast('Seleccione horario','err');return;}if(horasBloq.includes(hora)){toast('Ese horario ya cerro','err');return;}let nombre=tipo==='animal'?ANIMALES[seleccion]:seleccion;carrito.push({tipo:tipo,hora:hora,seleccion:seleccion,monto:monto,desc:tipo==='animal'?seleccion+'-'+nombre:'ESP '+seleccion});toast('Jugada agregada','ok');}renderCarrito();}
+function agregarTodoRepetir(){let btns=document.querySelectorAll('#rep-contenido .rep-item button');btns.forEach(btn=>btn.click());}
+function setM(v){document.getElementById('monto').value=v;}
+function agregar(){let monto=parseFloat(document.getElementById('monto').value)||0;if(monto<=0){toast('Monto invalido','err');return;}let lot=loteriaActiva,sel=lot==='plus'?horasSelPlus:horasSel;if(espSel){if(sel.length===0){toast('Seleccione horario','err');return;}sel.forEach(h=>{let labels={'ROJO':'ROJO x2','NEGRO':'NEGRO x2','PAR':'PAR x2','IMPAR':'IMPAR x2'};carrito.push({tipo:'especial',hora:h,seleccion:espSel,monto,desc:labels[espSel],loteria:lot});});renderCarrito();toast('Especial agregado','ok');return;}if(animalesSel.length===0){toast('Seleccione animal(es)','err');return;}if(sel.length===0){toast('Seleccione horario(s)','err');return;}sel.forEach(h=>{animalesSel.forEach(k=>{carrito.push({tipo:'animal',hora:h,seleccion:k,monto,desc:k+'-'+ANIMALES[k],loteria:lot});});});animalesSel=[];document.querySelectorAll('.animals-grid .acard').forEach(c=>c.classList.remove('sel'));document.getElementById('manual-input').value='';renderCarrito();toast('Jugadas agregadas ('+lot.toUpperCase()+')','ok');}
+function renderCarrito(){let list=document.getElementById('ticket-list'),tot=document.getElementById('ticket-total');window._carritoLen=carrito.length;document.getElementById('btn-wa').disabled=(carrito.length===0);if(!carrito.length){list.innerHTML='<div class="ticket-empty">TICKET VACIO</div>';tot.style.display='none';return;}let html='',total=0;carrito.forEach((it,i)=>{total+=it.monto;let lot=it.loteria||'peru',isTrip=it.tipo==='tripleta';let lotLabel=lot==='plus'?'<span style="background:#4c1d95;border:1px solid #a855f7;color:#e9d5ff;font-size:.58rem;font-family:\'Oswald\',sans-serif;padding:1px 5px;border-radius:3px;flex-shrink:0">PLUS</span>':'<span style="background:#0c2461;border:1px solid #3b9eff;color:#bae6fd;font-size:.58rem;font-family:\'Oswald\',sans-serif;padding:1px 5px;border-radius:3px;flex-shrink:0">PERU</span>';let horaLabel=it.hora==='TODO DIA'?'x60':it.hora.replace(':00','').replace(' ','');html+='<div class="ti"><span class="ti-hora">'+horaLabel+'</span>'+lotLabel+'<span class="ti-desc">'+it.desc+'</span><span class="ti-monto">'+it.monto+'</span><button class="ti-del" onclick="quitarItem('+i+')">X</button></div>';});list.innerHTML=html;tot.style.display='block';tot.textContent='TOTAL: S/ '+total.toFixed(2);}
+function quitarItem(i){carrito.splice(i,1);renderCarrito();}
+function borrarTodo(){carrito=[];animalesSel=[];espSel=null;horasSel=[];horasSelPlus=[];document.querySelectorAll('.acard').forEach(c=>c.classList.remove('sel'));document.querySelectorAll('.esp-btn').forEach(e=>e.classList.remove('sel'));renderCarrito();toast('Ticket borrado','err');}
+function limpiarVenta(){carrito=[];animalesSel=[];if(espSel){document.getElementById('esp-'+espSel).classList.remove('sel');espSel=null;}horasSel=[];horasSelPlus=[];document.getElementById('manual-input').value='';renderCarrito();renderAnimales();renderHoras();}
+async function vender(){if(!carrito.length){toast('Ticket vacio','err');return;}let jugadas=carrito.map(c=>({hora:c.hora,seleccion:c.seleccion,monto:c.monto,tipo:c.tipo,loteria:c.loteria||'peru'}));if(_sinConexion){encolarVenta(jugadas);limpiarVenta();return;}let btn=document.getElementById('btn-wa');btn.disabled=true;btn.textContent='PROCESANDO...';try{let r=await fetch('/api/procesar-venta',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({jugadas:jugadas})});let d=await r.json();if(d.error){toast(d.error,'err');}else{window.open(d.url_whatsapp,'_blank');toast('Ticket #'+d.ticket_id+' generado!','ok');limpiarVenta();}}catch(e){marcarConexion(false);encolarVenta(jugadas);limpiarVenta();}finally{btn.disabled=false;btn.textContent='ENVIAR POR WHATSAPP';}}
+function openResultados(){if(!document.getElementById('res-fecha').value)document.getElementById('res-fecha').value=new Date().toISOString().split('T')[0];openMod('mod-resultados');cargarResultados();}
+function cargarResultados(){let f=document.getElementById('res-fecha').value;if(!f)return;let c=document.getElementById('res-lista');c.innerHTML='<p style="color:var(--text2);text-align:center;padding:10px;font-size:.75rem">CARGANDO...</p>';Promise.all([fetch('/api/resultados-fecha?fecha='+f+'&loteria=peru').then(r=>r.json()),fetch('/api/resultados-fecha?fecha='+f+'&loteria=plus').then(r=>r.json())]).then(([dp,dpl])=>{let html='<div style="color:#0ea5e9;font-family:\'Oswald\',sans-serif;font-size:.72rem;letter-spacing:2px;padding:4px 0 6px;border-bottom:1px solid #e2e8f0;margin-bottom:4px">ZOOLO PERU (11 SORTEOS)</div>';HPERU.forEach(h=>{let res=dp.resultados[h];html+='<div class="ri '+(res?'ok':'')+'"><span class="ri-hora">'+h.replace(':00 AM',' AM').replace(':00 PM',' PM')+'</span>'+(res?'<span class="ri-animal">'+res.animal+' - '+res.nombre+'</span>':'<span style="color:#4a6090;font-size:.78rem">PENDIENTE</span>')+'</div>';});html+='<div style="color:#a855f7;font-family:\'Oswald\',sans-serif;font-size:.72rem;letter-spacing:2px;padding:8px 0 6px;border-bottom:1px solid #e2e8f0;margin-top:10px;margin-bottom:4px">ZOOLO PLUS (12 SORTEOS)</div>';HPLUS.forEach(h=>{let res=dpl.resultados[h];html+='<div class="ri '+(res?'ok':'')+'"><span class="ri-hora">'+h.replace(':00 AM',' AM').replace(':00 PM',' PM')+'</span>'+(res?'<span class="ri-animal">'+res.animal+' - '+res.nombre+'</span>':'<span style="color:#4a6090;font-size:.78rem">PENDIENTE</span>')+'</div>';});c.innerHTML=html;}).catch(()=>{c.innerHTML='<p style="color:var(--red);text-align:center;padding:12px">Error de conexion</p>';});}
+function consultarTickets(){let ini=document.getElementById('mt-ini').value,fin=document.getElementById('mt-fin').value,est=document.getElementById('mt-estado').value;if(!ini||!fin){toast('Seleccione fechas','err');return;}let lista=document.getElementById('mt-lista');lista.innerHTML='<p style="color:#6090c0;text-align:center;padding:15px;font-size:.75rem">CARGANDO...</p>';fetch('/api/mis-tickets',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha_inicio:ini,fecha_fin:fin,estado:est})}).then(r=>r.json()).then(d=>{if(d.error){lista.innerHTML='<p style="color:#f87171;text-align:center">'+d.error+'</p>';return;}let res=document.getElementById('mt-resumen');res.style.display='block';res.textContent=d.totales.cantidad+' TICKET(S) - TOTAL: S/ '+d.totales.ventas.toFixed(2);if(!d.tickets.length){lista.innerHTML='<p style="color:#4a6090;text-align:center;padding:20px;font-size:.75rem">SIN RESULTADOS</p>';return;}let html='';d.tickets.forEach(t=>{let bc=t.pagado?'p':(t.premio_calculado>0?'g':'n'),bt=t.pagado?'PAGADO':(t.premio_calculado>0?'GANADOR':'PENDIENTE'),tc=t.pagado?'gano':(t.premio_calculado>0?'pte':'');html+='<div class="tcard '+tc+'"><div style="display:flex;justify-content:space-between;align-items:flex-start;gap:6px;margin-bottom:6px"><div><div class="ts">#'+t.serial+'</div><div style="color:#4a6090;font-size:.7rem">'+t.fecha+'</div></div><div style="text-align:right"><span class="badge '+bc+'">'+bt+'</span><div style="color:#fbbf24;font-family:\'Oswald\',sans-serif;font-size:.9rem;margin-top:3px;font-weight:700">S/'+t.total+'</div>'+(t.premio_calculado>0?'<div style="color:#4ade80;font-size:.82rem;font-weight:700;font-family:\'Oswald\',sans-serif">PREMIO: S/'+t.premio_calculado.toFixed(2)+'</div>':'')+'</div></div></div>';});lista.innerHTML=html;}).catch(()=>{lista.innerHTML='<p style="color:#f87171;text-align:center">Error de conexion</p>';});}
+function cajaHist(){let ini=document.getElementById('ar-ini').value,fin=document.getElementById('ar-fin').value;if(!ini||!fin){toast('Seleccione fechas','err');return;}let c=document.getElementById('ar-res');c.innerHTML='<p style="color:var(--text2);text-align:center;padding:10px;font-size:.75rem">CARGANDO...</p>';fetch('/api/caja-historico',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({fecha_inicio:ini,fecha_fin:fin})}).then(r=>r.json()).then(d=>{if(d.error){c.innerHTML='<p style="color:var(--red)">'+d.error+'</p>';return;}let html='<div class="sbox">';d.resumen_por_dia.forEach(dia=>{let col=dia.balance>=0?'var(--green)':'var(--red)';html+='<div class="srow"><span class="sl">'+dia.fecha+'</span><span style="font-size:.72rem;color:var(--text2)">V:'+dia.ventas+'</span><span class="sv" style="color:'+col+'">S/'+dia.balance.toFixed(2)+'</span></div>';});html+='</div><div class="sbox"><div class="srow"><span class="sl">Ventas</span><span class="sv">S/'+d.totales.ventas.toFixed(2)+'</span></div><div class="srow"><span class="sl">Premios</span><span class="sv" style="color:var(--red)">S/'+d.totales.premios.toFixed(2)+'</span></div><div class="srow"><span class="sl">Comision</span><span class="sv">S/'+d.totales.comision.toFixed(2)+'</span></div><div class="srow"><span class="sl">Balance</span><span class="sv" style="color:'+(d.totales.balance>=0?'var(--green)':'var(--red)')+'">S/'+d.totales.balance.toFixed(2)+'</span></div></div>';c.innerHTML=html;});}
+function openCaja(){openMod('mod-caja');fetch('/api/caja').then(r=>r.json()).then(d=>{if(d.error)return;let bc=d.balance>=0?'g':'r';document.getElementById('caja-body').innerHTML='<div class="caja-grid"><div class="cg"><div class="cgl">VENTAS</div><div class="cgv">S/'+d.ventas.toFixed(2)+'</div></div><div class="cg"><div class="cgl">PREMIOS PAGADOS</div><div class="cgv r">S/'+d.premios.toFixed(2)+'</div></div><div class="cg"><div class="cgl">COMISION</div><div class="cgv">S/'+d.comision.toFixed(2)+'</div></div><div class="cg"><div class="cgl">BALANCE</div><div class="cgv '+bc+'">S/'+d.balance.toFixed(2)+'</div></div></div><div class="sbox"><div class="srow"><span class="sl">Tickets vendidos</span><span class="sv">'+d.total_tickets+'</span></div><div class="srow"><span class="sl">Con premio pendiente</span><span class="sv" style="color:#c08020">'+d.tickets_pendientes+'</span></div></div>';});}
+function serialValido(s){if(!/^\d+$/.test(s))return false;if(s.length===13)return true;if(s.length<15)return false;let t=0;for(let i=s.length-2,k=0;i>=0;i--,k++){let n=+s[i];if(k%2===0){n*=2;if(n>9)n-=9;}t+=n;}return (10-t%10)%10===+s[s.length-1];}
+function openPagar(){openMod('mod-pagar');document.getElementById('pag-serial').value='';document.getElementById('pag-res').innerHTML='';}
+function verificarTicket(){let s=document.getElementById('pag-serial').value.trim();if(!s)return;if(!serialValido(s)){toast('Serial invalido, revise los digitos','err');return;}let c=document.getElementById('pag-res');fetch('/api/verificar-ticket',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({serial:s})}).then(r=>r.json()).then(d=>{if(d.error){c.innerHTML='<div style="background:var(--red-bg);color:var(--red);padding:10px;border-radius:3px;text-align:center;margin-top:8px;border:1px solid var(--red-border)">X '+d.error+'</div>';return;}let col=d.total_ganado>0?'var(--green)':'var(--text2)';c.innerHTML='<div style="border:1px solid '+col+';border-radius:4px;padding:14px;margin-top:10px"><div style="color:var(--teal);font-family:\'Oswald\',sans-serif;letter-spacing:2px;margin-bottom:10px">TICKET #'+s+'</div><div style="display:flex;justify-content:space-between;align-items:center;margin-bottom:12px"><span style="color:var(--text2);font-size:.8rem">PREMIO</span><span style="color:'+col+';font-family:\'Oswald\',sans-serif;font-size:1.2rem;font-weight:700">S/'+d.total_ganado.toFixed(2)+'</span></div>'+(d.total_ganado>0?'<button onclick="pagarTicket('+d.ticket_id+','+d.total_ganado+')" style="width:100%;padding:11px;background:linear-gradient(135deg,#0a3020,#062018);color:var(--green);border:1px solid #0d5a2a;border-radius:3px;font-weight:700;cursor:pointer;font-family:\'Oswald\',sans-serif;letter-spacing:2px;font-size:.85rem">CONFIRMAR PAGO S/'+d.total_ganado.toFixed(2)+'</button>':'<div style="color:var(--text2);text-align:center;font-size:.8rem;padding:6px">SIN PREMIO</div>')+'</div>';});}
+function pagarTicket(tid,m){if(!confirm('Confirmar pago S/'+m+'?'))return;fetch('/api/pagar-ticket',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({ticket_id:tid})}).then(r=>r.json()).then(d=>{if(d.status==='ok'){toast('Ticket pagado','ok');closeMod('mod-pagar');}else toast(d.error||'Error','err');});}
+function openAnular(){openMod('mod-anular');document.getElementById('an-serial').value='';document.getElementById('an-res').innerHTML='';}
+function anularTicket(){let s=document.getElementById('an-serial').value.trim();if(!s)return;if(!serialValido(s)){toast('Serial invalido, revise los digitos','err');return;}fetch('/api/anular-ticket',{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({serial:s})}).then(r=>r.json()).then(d=>{let c=document.getElementById('an-res');if(d.status==='ok')c.innerHTML='<div style="background:#062012;color:var(--green);padding:10px;border-radius:3px;text-align:center;margin-top:8px;border:1px solid #0d5a2a">'+d.mensaje+'</div>';else c.innerHTML='<div style="background:var(--red-bg);color:var(--red);padding:10px;border-radius:3px;text-align:center;margin-top:8px;border:1px solid var(--red-border)">'+d.error+'</div>';});}
+function openMod(id){document.getElementById(id).classList.add('open');}
+function closeMod(id){document.getElementById(id).classList.remove('open');}
+document.querySelectorAll('.modal').forEach(m=>{m.addEventListener('click',e=>{if(e.target===m)m.classList.remove('open');});});
+function toast(msg,tipo){let t=document.getElementById('toast');t.textContent=msg;t.className='toast '+tipo;t.style.display='block';clearTimeout(window._tt);window._tt=setTimeout(()=>t.style.display='none',2800);}
+document.addEventListener('DOMContentLoaded',init);